@@ -4,6 +4,7 @@ import sys
 from types import SimpleNamespace
 
 from ixhardware import TRUENAS_UNKNOWN, get_chassis_hardware, parse_dmi
+from truenas_api_client import Client
 
 from middlewared.plugins.tunables import zfs_parameter_value
 from middlewared.utils.db import query_table, update_table
@@ -25,6 +26,16 @@ def zfs_parameter(tunable_name):
     return decorator
 
 
+def invalidate_datastore_cache():
+    # We write to the database directly, a running middleware might have cached the old tunables
+    try:
+        with Client() as c:
+            c.call("datastore.invalidate", ["system_tunable"])
+    except Exception:
+        # Middleware is not running, there is nothing to invalidate
+        pass
+
+
 @zfs_parameter("zfs_dirty_data_max_max")
 def guess_vfs_zfs_dirty_data_max_max(context):
     if context.hardware.startswith("M"):
@@ -106,4 +117,5 @@ if __name__ == "__main__":
                 changed_values = True
 
     if changed_values:
+        invalidate_datastore_cache()
         sys.exit(2)
@@ -46,6 +46,7 @@ class EnclosureStatusAlertSource(AlertSource):
     products = (ProductType.SCALE_ENTERPRISE,)
     failover_related = True
     run_on_backup_node = False
+    run_timeout = 120
     bad = ("critical", "noncritical", "unknown", "unrecoverable")
     bad_elements: list | list[tuple[BadElement, int]] = list()
 
@@ -47,6 +47,7 @@ class IPMISELSpaceLeftAlertClass(AlertClass):
 
 class IPMISELAlertSource(AlertSource):
     schedule = IntervalSchedule(timedelta(minutes=5))
+    run_timeout = 120
     dismissed_datetime_kv_key = "alert:ipmi_sel:dismissed_datetime"
 
     async def get_sensor_values(self):
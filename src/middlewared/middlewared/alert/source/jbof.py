@@ -57,6 +57,7 @@ class JBOFAlertSource(AlertSource):
     products = (ProductType.SCALE_ENTERPRISE,)
     run_on_backup_node = False
     schedule = IntervalSchedule(datetime.timedelta(minutes=5))
+    run_timeout = 120
 
     def produce_alerts(self, jbof_config, jbof_data, alerts):
         for jbof in jbof_config:
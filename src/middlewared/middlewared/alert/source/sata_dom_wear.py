@@ -28,6 +28,7 @@ class SATADOMWearCriticalAlertClass(AlertClass):
 class SATADOMWearAlertSource(AlertSource):
     schedule = IntervalSchedule(timedelta(hours=1))
     products = (ProductType.SCALE_ENTERPRISE,)
+    run_timeout = 120
 
     async def check(self):
         dmi = await self.middleware.call("system.dmidecode_info")
@@ -9,6 +9,8 @@ class SmartdAlertClass(AlertClass):
 
 
 class SmartdAlertSource(ThreadedAlertSource):
+    run_timeout = 60
+
     def check_sync(self):
         if self.middleware.call_sync("datastore.query", "services.services", [("srv_service", "=", "smartd"),
                                                                               ("srv_enable", "=", True)]):
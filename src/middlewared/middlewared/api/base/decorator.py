@@ -1,8 +1,10 @@
 import asyncio
 import functools
+import time
 from typing import Callable
 
-from .handler.accept import accept_params
+from .handler.accept import accept_params, trusted_params
+from .handler.stats import validation_stats
 from ..base.model import BaseModel
 from middlewared.schema.processor import calculate_args_index
 
@@ -77,23 +79,45 @@ def api_method(
 
         args_index = calculate_args_index(func, audit_callback)
 
+        def accept(args):
+            start = time.perf_counter()
+            try:
+                return list(args[:args_index]) + accept_params(accepts, args[args_index:])
+            finally:
+                validation_stats.record(func.__qualname__, "accept", time.perf_counter() - start)
+
+        def accept_trusted(args):
+            start = time.perf_counter()
+            try:
+                return list(args[:args_index]) + trusted_params(accepts, args[args_index:])
+            finally:
+                validation_stats.record(func.__qualname__, "trusted", time.perf_counter() - start)
+
         if asyncio.iscoroutinefunction(func):
             @functools.wraps(func)
             async def wrapped(*args):
-                args = list(args[:args_index]) + accept_params(accepts, args[args_index:])
+                args = accept(args)
 
                 result = await func(*args)
 
                 return result
+
+            @functools.wraps(func)
+            async def trusted(*args):
+                return await func(*accept_trusted(args))
         else:
             @functools.wraps(func)
             def wrapped(*args):
-                args = list(args[:args_index]) + accept_params(accepts, args[args_index:])
+                args = accept(args)
 
                 result = func(*args)
 
                 return result
 
+            @functools.wraps(func)
+            def trusted(*args):
+                return func(*accept_trusted(args))
+
         if roles:
             if not authorization_required or not authentication_required:
                 raise ValueError('Authentication and authorization must be enabled in order to use roles.')
@@ -126,6 +150,11 @@ def api_method(
         wrapped.new_style_accepts = accepts
         wrapped.new_style_returns = returns
 
+        # Variant that skips arguments validation, used for the calls from trusted (internal) callers. It is called
+        # instead of `wrapped` (i.e. `audit_callback` is checked on it), so it must have all the same attributes.
+        trusted.__dict__.update(wrapped.__dict__)
+        wrapped._trusted = trusted
+
         return wrapped
 
     return wrapper
@@ -1,4 +1,8 @@
-from pydantic_core import ValidationError
+import copy
+import functools
+
+from pydantic import TypeAdapter
+from pydantic_core import PydanticUndefined, ValidationError
 
 from middlewared.api.base.model import BaseModel
 from middlewared.service_exception import CallError, ValidationErrors
@@ -29,6 +33,49 @@ def accept_params(model: type[BaseModel], args: list, *, exclude_unset=False, ex
     return [dump[field] for field in fields]
 
 
+def trusted_params(model: type[BaseModel], args: list) -> list:
+    """
+    Accepts a list of `args` for a method call from a trusted (internal) caller without validating it.
+
+    The caller is responsible for passing the arguments in the form the method would receive them after validation
+    (i.e. complete nested objects). Omitted trailing arguments are set to their defaults. If a required argument is
+    omitted, the arguments are validated as usual (so that the caller gets the same error).
+
+    :param model: `BaseModel` that defines method args.
+    :param args: a list of method args.
+    :return: a list of method args.
+    """
+    defaults = model_default_params(model)
+    if len(args) > len(defaults):
+        raise CallError(f"Too many arguments (expected {len(defaults)}, found {len(args)})")
+
+    missing = defaults[len(args):]
+    if any(default is PydanticUndefined for default in missing):
+        return accept_params(model, args)
+
+    return list(args) + copy.deepcopy(missing)
+
+
+@functools.cache
+def model_default_params(model: type[BaseModel]) -> list:
+    """
+    Serialized default values of `model` fields (`PydanticUndefined` for required fields).
+    """
+    defaults = []
+    for field in model.model_fields.values():
+        if field.is_required():
+            defaults.append(PydanticUndefined)
+        else:
+            defaults.append(TypeAdapter(field.annotation).dump_python(
+                field.get_default(call_default_factory=True),
+                context={"expose_secrets": True},
+                warnings=False,
+                by_alias=True,
+            ))
+
+    return defaults
+
+
 def model_dict_from_list(model: type[BaseModel], args: list) -> dict:
     """
     Converts a list of `args` for a method call to a dictionary using `model`.
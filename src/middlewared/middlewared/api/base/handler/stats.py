@@ -0,0 +1,46 @@
+from dataclasses import dataclass
+import threading
+
+__all__ = ["validation_stats"]
+
+
+@dataclass(slots=True)
+class ValidationTime:
+    count: int = 0
+    total_time: float = 0
+    max_time: float = 0
+
+
+class ValidationStats:
+    """
+    Per-method time spent validating call arguments (`accept`) and results (`result`), and the number of calls
+    from trusted callers that skipped arguments validation (`trusted`).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.methods = {}
+
+    def record(self, method: str, kind: str, elapsed: float):
+        with self.lock:
+            if (stats := self.methods.get((method, kind))) is None:
+                stats = self.methods[(method, kind)] = ValidationTime()
+
+            stats.count += 1
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+
+    def get_stats(self):
+        result = {}
+        with self.lock:
+            for (method, kind), stats in self.methods.items():
+                result.setdefault(method, {})[kind] = {
+                    "count": stats.count,
+                    "total_time": stats.total_time,
+                    "max_time": stats.max_time,
+                }
+
+        return result
+
+
+validation_stats = ValidationStats()
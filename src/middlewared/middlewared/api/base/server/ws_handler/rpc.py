@@ -1,17 +1,17 @@
 import asyncio
 import binascii
-from collections import defaultdict
+from collections import defaultdict, deque
 import enum
 import errno
 import pickle
 import sys
+import threading
 import traceback
 from typing import Any, Callable, TYPE_CHECKING
 
 from aiohttp.http_websocket import WSCloseCode, WSMessage
 from aiohttp.web import WebSocketResponse, WSMsgType
 
-from truenas_api_client import json
 from truenas_api_client.jsonrpc import JSONRPCError
 
 from middlewared.schema import Error
@@ -23,6 +23,7 @@ from middlewared.utils.limits import MsgSizeError, MsgSizeLimit, parse_message
 from middlewared.utils.lock import SoftHardSemaphore, SoftHardSemaphoreLimit
 from middlewared.utils.origin import ConnectionOrigin
 from .base import BaseWebSocketHandler
+from .serializer import default_serializer, serializer_stats, timed_dumps
 from ..app import App
 from ..method import Method
 
@@ -36,6 +37,8 @@ class RpcWebSocketAppEvent(enum.Enum):
 
 
 class RpcWebSocketApp(App):
+    serializer = default_serializer
+
     def __init__(self, middleware: "Middleware", origin: ConnectionOrigin, ws: WebSocketResponse):
         super().__init__(origin)
 
@@ -46,11 +49,91 @@ class RpcWebSocketApp(App):
         self.softhardsemaphore = SoftHardSemaphore(10, 20)
         self.callbacks = defaultdict(list)
         self.subscriptions = {}
+        # Serialized messages waiting to be written by the outbox writer task
+        self.outbox = deque()
+        self.outbox_lock = threading.Lock()
+        self.outbox_writing = False
 
     def send(self, data):
-        asyncio.run_coroutine_threadsafe(self.ws.send_str(json.dumps(data)), self.middleware.loop)
+        """
+        Queue a message to be sent to the client. Can be called from any thread.
+        """
+        self.send_str(self.serializer.dumps(data))
+
+    def send_str(self, data: str):
+        """
+        Queue a serialized message to be sent to the client. Can be called from any thread.
+
+        Messages are written by a single task that drains the outbox, so a burst of responses only wakes up the event
+        loop once and is written back-to-back (in the order the messages were sent).
+        """
+        self.queue_outbox(data, None)
+
+    async def send_frame(self, data: str):
+        """
+        Queue a serialized message and wait until it is written to the client.
+        """
+        written = asyncio.get_running_loop().create_future()
+        self.queue_outbox(data, written)
+        await written
+
+    def queue_outbox(self, data: str, written: asyncio.Future | None):
+        self.outbox.append((data, written))
+        with self.outbox_lock:
+            if self.outbox_writing:
+                return
+
+            self.outbox_writing = True
+
+        self.middleware.loop.call_soon_threadsafe(self.middleware.create_task, self.write_outbox())
+
+    async def serialize_response(self, method: str, response: dict) -> str:
+        """
+        Serialize the response to a `method` call. Responses of the methods that are known to return large results are
+        serialized in a thread.
+        """
+        if offload := serializer_stats.should_offload(method):
+            data, elapsed = await self.middleware.run_in_thread(timed_dumps, self.serializer, response)
+        else:
+            data, elapsed = timed_dumps(self.serializer, response)
+
+        serializer_stats.record(method, len(data), elapsed, offload)
+        return data
+
+    async def write_outbox(self):
+        """
+        The only writer of this connection: responses and events are all sent by this task.
+        """
+        written = None
+        try:
+            while True:
+                with self.outbox_lock:
+                    if not self.outbox:
+                        self.outbox_writing = False
+                        return
+
+                    data, written = self.outbox.popleft()
+
+                await self.ws.send_str(data)
+                if written is not None and not written.done():
+                    written.set_result(None)
+        except Exception as e:
+            if not self.ws.closed:
+                self.middleware.logger.warning("Failed to send messages to %s: %r", self.session_id, e)
+
+            with self.outbox_lock:
+                pending = [written] + [written for data, written in self.outbox]
+                self.outbox.clear()
+                self.outbox_writing = False
+
+            for written in pending:
+                if written is not None and not written.done():
+                    written.set_exception(ConnectionResetError("Failed to send message"))
 
     def send_error(self, id_: Any, code: int, message: str, data: Any = None):
+        self.send(self.error_response(id_, code, message, data))
+
+    def error_response(self, id_: Any, code: int, message: str, data: Any = None):
         error = {
             "jsonrpc": "2.0",
             "error": {
@@ -62,11 +145,15 @@ class RpcWebSocketApp(App):
         if data is not None:
             error["error"]["data"] = data
 
-        self.send(error)
+        return error
 
     def send_truenas_error(self, id_: Any, code: int, message: str, errno_: int, reason: str,
                            exc_info=None, extra: list | None = None):
-        self.send_error(id_, code, message, self.format_truenas_error(errno_, reason, exc_info, extra))
+        self.send(self.truenas_error_response(id_, code, message, errno_, reason, exc_info, extra))
+
+    def truenas_error_response(self, id_: Any, code: int, message: str, errno_: int, reason: str,
+                               exc_info=None, extra: list | None = None):
+        return self.error_response(id_, code, message, self.format_truenas_error(errno_, reason, exc_info, extra))
 
     def format_truenas_error(self, errno_: int, reason: str, exc_info=None, extra: list | None = None):
         return {
@@ -100,8 +187,11 @@ class RpcWebSocketApp(App):
         }
 
     def send_truenas_validation_error(self, id_: Any, exc_info, errors: list):
-        self.send_error(id_, JSONRPCError.INVALID_PARAMS.value, "Invalid params",
-                        self.format_truenas_validation_error(exc_info[1], exc_info, errors))
+        self.send(self.truenas_validation_error_response(id_, exc_info, errors))
+
+    def truenas_validation_error_response(self, id_: Any, exc_info, errors: list):
+        return self.error_response(id_, JSONRPCError.INVALID_PARAMS.value, "Invalid params",
+                                   self.format_truenas_validation_error(exc_info[1], exc_info, errors))
 
     def format_truenas_validation_error(self, exception, exc_info=None, errors: list | None = None):
         return self.format_truenas_error(errno.EINVAL, str(exception), exc_info, errors)
@@ -136,15 +226,30 @@ class RpcWebSocketApp(App):
         return self.session_id + ident
 
     def send_event(self, name: str, event_type: str, **kwargs):
-        if (
-            not any(i in [name, "*"] for i in self.subscriptions.values()) and
+        if not self.event_subscribed(name):
+            return
+
+        self.send_str(self.event_frame(name, event_type, kwargs))
+
+    def event_subscribed(self, name: str):
+        return (
+            any(i in [name, "*"] for i in self.subscriptions.values()) or
             (
-                self.middleware.event_source_manager.short_name_arg(name)[0] not in
+                self.middleware.event_source_manager.short_name_arg(name)[0] in
                 self.middleware.event_source_manager.event_sources
             )
-        ):
-            return
+        )
+
+    def event_frame(self, name: str, event_type: str, kwargs: dict):
+        """
+        Serialized event message. It must only depend on the client class (and not on the client's state) as
+        `Middleware.send_event` shares it between all clients of the same class.
+        """
+        return self.serializer.dumps(
+            self.notification("collection_update", self.event_message(name, event_type, kwargs))
+        )
 
+    def event_message(self, name: str, event_type: str, kwargs: dict):
         event = {
             "msg": event_type.lower(),
             "collection": name,
@@ -158,7 +263,11 @@ class RpcWebSocketApp(App):
         if kwargs:
             event["extra"] = kwargs
 
-        self.send_notification("collection_update", event)
+        return event
+
+    async def close_slow(self):
+        """Disconnect the client because it does not read its events fast enough."""
+        await self.ws.close(code=WSCloseCode.TRY_AGAIN_LATER, message=b"Event queue overflow")
 
     def notify_unsubscribed(self, collection: str, error: Exception | None):
         params = {"collection": collection, "error": None}
@@ -173,11 +282,14 @@ class RpcWebSocketApp(App):
         self.send_notification("notify_unsubscribed", params)
 
     def send_notification(self, method, params):
-        self.send({
+        self.send(self.notification(method, params))
+
+    def notification(self, method, params):
+        return {
             "jsonrpc": "2.0",
             "method": method,
             "params": params,
-        })
+        }
 
 
 class RpcWebSocketHandler(BaseWebSocketHandler):
@@ -283,13 +395,67 @@ class RpcWebSocketHandler(BaseWebSocketHandler):
         except KeyError:
             message["params"] = []
 
-    async def process_message(self, app: RpcWebSocketApp, message: dict):
+    async def process_message(self, app: RpcWebSocketApp, message: dict | list):
+        if isinstance(message, list):
+            asyncio.ensure_future(self.process_batch(app, message))
+            return
+
+        id_, method, error = await self.prepare_call(app, message)
+        if method is None:
+            if error is not None:
+                app.send(error)
+            return
+
+        asyncio.ensure_future(
+            self.process_method_call(app, id_, method, message["params"])
+        )
+
+    async def process_batch(self, app: RpcWebSocketApp, messages: list):
+        """
+        Process a JSON-RPC 2.0 batch. Cf. https://www.jsonrpc.org/specification#batch
+
+        The calls are run concurrently and their responses are sent back in a single array (or not at all if the
+        batch only consists of notifications). Each call still acquires the connection's `SoftHardSemaphore` but no
+        more than its soft limit of calls of a batch are started at once, so that a large batch does not exhaust the
+        hard limit for the other calls of the connection.
+        """
+        if not messages:
+            app.send_error(None, JSONRPCError.INVALID_REQUEST.value, "Empty batch")
+            return
+
+        window = asyncio.Semaphore(app.softhardsemaphore.softlimit)
+
+        async def process(message):
+            id_, method, error = await self.prepare_call(app, message)
+            if method is None:
+                return app.serializer.dumps(error) if error is not None else None
+
+            async with window:
+                if (response := await self.call_method(app, id_, method, message["params"])) is not None:
+                    return await app.serialize_response(method.name, response)
+
+        # Responses are serialized one by one so that they are accounted for (and offloaded) per method
+        responses = await asyncio.gather(*map(process, messages))
+        if responses := [response for response in responses if response is not None]:
+            app.send_str(f"[{','.join(responses)}]")
+
+    async def prepare_call(self, app: RpcWebSocketApp, message: Any) -> tuple[Any, Method | None, dict | None]:
+        """
+        Validate a request object and look up the method it calls.
+
+        :return: request id, method to call (`None` if the request is invalid) and the error response to send for an
+            invalid request (`None` if the request is a notification).
+        """
+        if not isinstance(message, dict):
+            # Can only happen for batch members
+            return None, None, app.error_response(None, JSONRPCError.INVALID_REQUEST.value, "Invalid Request")
+
         try:
             await self.validate_message(message)
         except ValueError as e:
             if (id_ := message.get("id", undefined)) != undefined:
-                app.send_error(id_, JSONRPCError.INVALID_REQUEST.value, str(e))
-            return
+                return id_, None, app.error_response(id_, JSONRPCError.INVALID_REQUEST.value, str(e))
+            return id_, None, None
 
         id_ = message.get("id", undefined)
 
@@ -297,34 +463,40 @@ class RpcWebSocketHandler(BaseWebSocketHandler):
             method = self.methods[message["method"]]
         except KeyError:
             if id_ != undefined:
-                app.send_error(id_, JSONRPCError.METHOD_NOT_FOUND.value, "Method does not exist")
-            return
+                return id_, None, app.error_response(id_, JSONRPCError.METHOD_NOT_FOUND.value,
+                                                     "Method does not exist")
+            return id_, None, None
 
-        asyncio.ensure_future(
-            self.process_method_call(app, id_, method, message["params"])
-        )
+        return id_, method, None
 
     async def process_method_call(self, app: RpcWebSocketApp, id_: Any, method: Method, params: list):
+        if (response := await self.call_method(app, id_, method, params)) is not None:
+            app.send_str(await app.serialize_response(method.name, response))
+
+    async def call_method(self, app: RpcWebSocketApp, id_: Any, method: Method, params: list) -> dict | None:
+        """
+        Call the method and return the response for the client (`None` if the request is a notification).
+        """
         try:
             async with app.softhardsemaphore:
                 result = await method.call(app, params)
         except SoftHardSemaphoreLimit as e:
             if id_ != undefined:
-                app.send_error(id_, JSONRPCError.TRUENAS_TOO_MANY_CONCURRENT_CALLS.value,
-                               f"Maximum number of concurrent calls ({e.args[0]}) has exceeded")
+                return app.error_response(id_, JSONRPCError.TRUENAS_TOO_MANY_CONCURRENT_CALLS.value,
+                                          f"Maximum number of concurrent calls ({e.args[0]}) has exceeded")
         except ValidationError as e:
             if id_ != undefined:
-                app.send_truenas_validation_error(id_, sys.exc_info(), [
+                return app.truenas_validation_error_response(id_, sys.exc_info(), [
                     (e.attribute, e.errmsg, e.errno),
                 ])
         except ValidationErrors as e:
             if id_ != undefined:
-                app.send_truenas_validation_error(id_, sys.exc_info(), list(e))
+                return app.truenas_validation_error_response(id_, sys.exc_info(), list(e))
         except (CallException, Error) as e:
             # CallException and subclasses are the way to gracefully send errors to the client
             if id_ != undefined:
-                app.send_truenas_error(id_, JSONRPCError.TRUENAS_CALL_ERROR.value, "Method call error", e.errno, str(e),
-                                       sys.exc_info(), e.extra)
+                return app.truenas_error_response(id_, JSONRPCError.TRUENAS_CALL_ERROR.value, "Method call error",
+                                                  e.errno, str(e), sys.exc_info(), e.extra)
         except Exception as e:
             adapted = adapt_exception(e)
             if adapted:
@@ -336,17 +508,17 @@ class RpcWebSocketHandler(BaseWebSocketHandler):
                 error = e
                 extra = None
 
-            if id_ != undefined:
-                app.send_truenas_error(id_, JSONRPCError.TRUENAS_CALL_ERROR.value, "Method call error", errno_,
-                                       str(error) or repr(error), sys.exc_info(), extra)
-
             if not adapted and not app.py_exceptions:
                 self.middleware.logger.warning(f"Exception while calling {method.name}(*{method.dump_args(params)!r})",
                                                exc_info=True)
+
+            if id_ != undefined:
+                return app.truenas_error_response(id_, JSONRPCError.TRUENAS_CALL_ERROR.value, "Method call error",
+                                                  errno_, str(error) or repr(error), sys.exc_info(), extra)
         else:
             if id_ != undefined:
-                app.send({
+                return {
                     "jsonrpc": "2.0",
                     "result": result,
                     "id": id_,
-                })
+                }
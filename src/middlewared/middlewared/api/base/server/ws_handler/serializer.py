@@ -0,0 +1,105 @@
+from collections import defaultdict
+from dataclasses import dataclass
+import time
+
+from truenas_api_client import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+__all__ = ["JSONSerializer", "OrjsonSerializer", "default_serializer", "SerializerStats", "serializer_stats",
+           "timed_dumps"]
+
+# Responses of methods whose last response was at least this large (in bytes) are serialized in a thread so that they
+# do not stall the event loop (and all the other clients) while being encoded
+OFFLOAD_THRESHOLD = 256 * 1024
+
+
+class JSONSerializer:
+    name = "json"
+
+    def dumps(self, data) -> str:
+        return json.dumps(data)
+
+
+class OrjsonSerializer(JSONSerializer):
+    """
+    Several times faster than the standard library encoder.
+
+    Objects that have a custom representation in the middleware protocol (datetimes, sets, ...) are still encoded by
+    the `truenas_api_client` encoder. Data that orjson refuses to encode (e.g. integers that do not fit in 64 bits)
+    is encoded by the standard library encoder.
+    """
+    name = "orjson"
+
+    def __init__(self):
+        self.default = json.JSONEncoder().default
+        self.option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, data) -> str:
+        try:
+            return orjson.dumps(data, default=self.default, option=self.option).decode()
+        except orjson.JSONEncodeError:
+            return super().dumps(data)
+
+
+@dataclass(slots=True)
+class MethodSerializerStats:
+    count: int = 0
+    offloaded: int = 0
+    last_size: int = 0
+    max_size: int = 0
+    total_size: int = 0
+    max_time: float = 0
+    total_time: float = 0
+
+
+class SerializerStats:
+    """
+    Per-method size and encoding time of the responses. Only accessed from the event loop.
+    """
+
+    def __init__(self, offload_threshold=OFFLOAD_THRESHOLD):
+        self.offload_threshold = offload_threshold
+        self.methods = defaultdict(MethodSerializerStats)
+
+    def should_offload(self, method: str) -> bool:
+        """
+        Whether the response of `method` is expected to be large enough to be serialized in a thread.
+        """
+        return (stats := self.methods.get(method)) is not None and stats.last_size >= self.offload_threshold
+
+    def record(self, method: str, size: int, elapsed: float, offloaded: bool):
+        stats = self.methods[method]
+        stats.count += 1
+        stats.offloaded += offloaded
+        stats.last_size = size
+        stats.max_size = max(stats.max_size, size)
+        stats.total_size += size
+        stats.max_time = max(stats.max_time, elapsed)
+        stats.total_time += elapsed
+
+    def get_stats(self):
+        return {
+            method: {
+                "count": stats.count,
+                "offloaded": stats.offloaded,
+                "max_size": stats.max_size,
+                "avg_size": stats.total_size // stats.count,
+                "max_time": stats.max_time,
+                "avg_time": stats.total_time / stats.count,
+            }
+            for method, stats in self.methods.items()
+        }
+
+
+def timed_dumps(serializer: JSONSerializer, data) -> tuple[str, float]:
+    start = time.monotonic()
+    frame = serializer.dumps(data)
+    return frame, time.monotonic() - start
+
+
+default_serializer = OrjsonSerializer() if orjson is not None else JSONSerializer()
+serializer_stats = SerializerStats()
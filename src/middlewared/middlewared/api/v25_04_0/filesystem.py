@@ -4,7 +4,8 @@ from middlewared.api.base import (
     NonEmptyString,
     UnixPerm,
     single_argument_args,
-    query_result
+    query_result,
+    query_result_item,
 )
 from pydantic import Field, model_validator
 from typing import Any, Literal, Self
@@ -21,6 +22,8 @@ __all__ = [
     'FilesystemChownArgs', 'FilesystemChownResult',
     'FilesystemSetPermArgs', 'FilesystemSetPermResult',
     'FilesystemListdirArgs', 'FilesystemListdirResult',
+    'FilesystemListdirPageArgs', 'FilesystemListdirPageResult',
+    'FilesystemListdirStreamArgs', 'FilesystemListdirStreamResult',
     'FilesystemMkdirArgs', 'FilesystemMkdirResult',
     'FilesystemStatArgs', 'FilesystemStatResult',
     'FilesystemStatfsArgs', 'FilesystemStatfsResult',
@@ -179,6 +182,42 @@ class FilesystemListdirArgs(BaseModel):
 FilesystemListdirResult = query_result(FilesystemDirEntry)
 
 
+class FilesystemListdirPageOptions(BaseModel):
+    select: list[str | list] = []
+    limit: int = Field(default=1000, ge=1, le=10000)
+    """ Maximum number of entries to return. """
+    cursor: NonEmptyString | None = None
+    """ `cursor` returned by the previous call. Listing starts at the beginning of the directory if it is not set. """
+
+
+class FilesystemListdirPageArgs(BaseModel):
+    path: NonEmptyString
+    query_filters: QueryFilters = []
+    options: FilesystemListdirPageOptions = Field(default=FilesystemListdirPageOptions())
+
+
+class FilesystemListdirPage(BaseModel):
+    entries: list[query_result_item(FilesystemDirEntry)]
+    cursor: NonEmptyString | None
+    """ Opaque value to pass to the next call to retrieve the following entries. `null` if the end of
+    the directory was reached. """
+
+
+class FilesystemListdirPageResult(BaseModel):
+    result: FilesystemListdirPage
+
+
+class FilesystemListdirStreamArgs(BaseModel):
+    path: NonEmptyString
+    query_filters: QueryFilters = []
+    query_options: QueryOptions = QueryOptions()
+
+
+class FilesystemListdirStreamResult(BaseModel):
+    result: int
+    """ Number of entries written. """
+
+
 class FilesystemMkdirOptions(BaseModel):
     mode: UnixPerm = '755'
     raise_chmod_error: bool = True
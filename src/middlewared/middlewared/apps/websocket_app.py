@@ -1,4 +1,4 @@
-from asyncio import AbstractEventLoop, run_coroutine_threadsafe, shield
+from asyncio import AbstractEventLoop, shield
 from binascii import b2a_base64
 from errno import EACCES, EAGAIN, EINVAL, ETOOMANYREFS
 from pickle import dumps as pdumps
@@ -27,7 +27,6 @@ from middlewared.service_exception import (
 from middlewared.utils.debug import get_frame_details
 from middlewared.utils.lock import SoftHardSemaphore, SoftHardSemaphoreLimit
 from middlewared.utils.origin import ConnectionOrigin
-from truenas_api_client import json
 
 __all__ = ("WebSocketApplication",)
 
@@ -58,7 +57,7 @@ class WebSocketApplication(RpcWebSocketApp):
         self.__subscribed = {}
 
     def _send(self, data: dict[str, Any]):
-        run_coroutine_threadsafe(self.response.send_str(json.dumps(data)), loop=self.loop)
+        self.send(data)
 
     def _tb_error(self, exc_info: ExcInfoType) -> dict[str, str | list[dict]]:
         klass, exc, trace = exc_info
@@ -160,12 +159,15 @@ class WebSocketApplication(RpcWebSocketApp):
                         serviceobj, methodobj, self, result
                     )
 
-            self._send(
-                {
-                    "id": message["id"],
-                    "msg": "result",
-                    "result": result,
-                }
+            self.send_str(
+                await self.serialize_response(
+                    message["method"],
+                    {
+                        "id": message["id"],
+                        "msg": "result",
+                        "result": result,
+                    },
+                )
             )
         except SoftHardSemaphoreLimit as e:
             self.send_error(
@@ -243,26 +245,20 @@ class WebSocketApplication(RpcWebSocketApp):
         return self.session_id + ident
 
     def send_event(self, name, event_type, **kwargs):
-        if (
-            not any(i == name or i == "*" for i in self.__subscribed.values())
-            and self.middleware.event_source_manager.short_name_arg(name)[0]
-            not in self.middleware.event_source_manager.event_sources
-        ):
+        if not self.event_subscribed(name):
             return
 
-        event = {
-            "msg": event_type.lower(),
-            "collection": name,
-        }
-        kwargs = kwargs.copy()
-        if "id" in kwargs:
-            event["id"] = kwargs.pop("id")
-        if event_type in ("ADDED", "CHANGED"):
-            if "fields" in kwargs:
-                event["fields"] = kwargs.pop("fields")
-        if kwargs:
-            event["extra"] = kwargs
-        self._send(event)
+        self._send(self.event_message(name, event_type, kwargs))
+
+    def event_subscribed(self, name):
+        return (
+            any(i == name or i == "*" for i in self.__subscribed.values())
+            or self.middleware.event_source_manager.short_name_arg(name)[0]
+            in self.middleware.event_source_manager.event_sources
+        )
+
+    def event_frame(self, name, event_type, kwargs):
+        return self.serializer.dumps(self.event_message(name, event_type, kwargs))
 
     def notify_unsubscribed(self, collection, error):
         error_dict = {}
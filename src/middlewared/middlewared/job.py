@@ -1,6 +1,6 @@
 import asyncio
 import contextlib
-from collections import OrderedDict
+from collections import deque, OrderedDict
 import copy
 import enum
 import errno
@@ -16,12 +16,21 @@ import threading
 from middlewared.service_exception import CallError, ValidationError, ValidationErrors, adapt_exception
 from middlewared.pipe import Pipes
 from middlewared.utils.privilege import credential_is_limited_to_own_jobs, credential_has_full_admin
+from middlewared.utils.procpool import Histogram
 from middlewared.utils.time_utils import utc_now
 
 
 logger = logging.getLogger(__name__)
 
 LOGS_DIR = '/var/log/jobs'
+# Minimum interval (in seconds) between two `core.get_jobs` progress events of the same job
+JOB_PROGRESS_EVENT_INTERVAL = 0.5
+# Maximum number of jobs running at the same time (`None` means unlimited). Jobs often wait for other jobs they have
+# started, so a limit that is too low can deadlock.
+JOBS_MAX_RUNNING = None
+# Maximum number of `LOW` priority jobs running at the same time (`None` means unlimited). These are long-running bulk
+# transfers (replication, cloud sync, rsync) that do not wait for other `LOW` priority jobs.
+JOBS_MAX_RUNNING_LOW_PRIORITY = None
 
 
 def send_job_event(middleware, event_type, job, fields):
@@ -29,6 +38,11 @@ def send_job_event(middleware, event_type, job, fields):
                           should_send_event=partial(should_send_job_event, job))
 
 
+def send_job_progress_event(middleware, job):
+    # Subscribers merge `fields` of a CHANGED event into the job they already have
+    send_job_event(middleware, 'CHANGED', job, {'id': job.id, 'progress': copy.deepcopy(job.progress)})
+
+
 def should_send_job_event(job, wsclient):
     if wsclient.authenticated_credentials:
         return job.credential_can_access(wsclient.authenticated_credentials, JobAccess.READ)
@@ -44,6 +58,69 @@ class State(enum.Enum):
     ABORTED = 5
 
 
+class JobProgressPublisher:
+    """
+    Sends `core.get_jobs` progress events for a job: at most one per `interval` seconds, a burst of progress updates
+    is merged into a single event that carries the latest progress. Only `id` and `progress` fields are sent.
+    """
+
+    def __init__(self, job, interval=JOB_PROGRESS_EVENT_INTERVAL):
+        self.job = job
+        self.interval = interval
+        # `Job.set_progress` can be called from any thread
+        self.lock = threading.Lock()
+        self.last_sent_at = 0
+        self.pending = False
+        self.closed = False
+
+    def publish(self):
+        with self.lock:
+            if self.pending or self.closed:
+                # The scheduled (or the final) event will carry this update
+                return
+
+            now = time.monotonic()
+            if (delay := self.last_sent_at + self.interval - now) > 0:
+                self.pending = True
+            else:
+                self.last_sent_at = now
+
+        if delay > 0:
+            self.job.loop.call_soon_threadsafe(self.job.loop.call_later, delay, self.flush)
+        else:
+            send_job_progress_event(self.job.middleware, self.job)
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+
+            self.pending = False
+            self.last_sent_at = time.monotonic()
+
+        send_job_progress_event(self.job.middleware, self.job)
+
+    def close(self):
+        """
+        Must be called before the final job event (that carries the progress as well) is sent, so that no progress
+        event is sent after it.
+        """
+        with self.lock:
+            self.pending = False
+            self.closed = True
+
+
+class JobPriority(enum.IntEnum):
+    """
+    Jobs that are ready to run are started in the order of their priority (and then in the order they were queued in).
+    This only matters once `JOBS_MAX_RUNNING` jobs are running. If `JOBS_MAX_RUNNING_LOW_PRIORITY` is set, at most that
+    many `LOW` priority jobs run at the same time.
+    """
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
 class JobSharedLock:
     """
     Shared lock for jobs.
@@ -56,7 +133,10 @@ class JobSharedLock:
         self.queue = queue
         self.name = name
         self.jobs = set()
-        self.lock = asyncio.Lock()
+        # Job that holds the lock
+        self.owner = None
+        # Jobs waiting for the lock in FIFO order
+        self.waiting = deque()
 
     def add_job(self, job):
         self.jobs.add(job)
@@ -68,13 +148,26 @@ class JobSharedLock:
         self.jobs.discard(job)
 
     def locked(self):
-        return self.lock.locked()
+        return self.owner is not None
+
+    def acquire(self, job):
+        """
+        Acquire the lock for `job` if it is free and no other job is waiting for it, otherwise queue the job.
+        Returns `True` if the lock was acquired.
+        """
+        if self.owner is None and not self.waiting:
+            self.owner = job
+            return True
 
-    async def acquire(self):
-        return await self.lock.acquire()
+        self.waiting.append(job)
+        return False
 
     def release(self):
-        return self.lock.release()
+        """
+        Release the lock and pass it to the next waiting job (which is returned).
+        """
+        self.owner = self.waiting.popleft() if self.waiting else None
+        return self.owner
 
 
 class JobAccess(enum.Enum):
@@ -83,10 +176,27 @@ class JobAccess(enum.Enum):
 
 
 class JobsQueue:
-    def __init__(self, middleware):
+    """
+    Schedules jobs.
+
+    A job that does not use a lock is ready to run as soon as it is added. A job that uses a lock waits in that lock's
+    FIFO queue and becomes ready when the previous job releases the lock. Ready jobs are started in the order of their
+    `JobPriority` while fewer than `max_running` jobs (and fewer than `max_running_low_priority` `LOW` priority jobs)
+    are running.
+    """
+
+    def __init__(
+        self, middleware, max_running=JOBS_MAX_RUNNING, max_running_low_priority=JOBS_MAX_RUNNING_LOW_PRIORITY,
+    ):
         self.middleware = middleware
         self.deque = JobsDeque()
-        self.queue = []
+        self.max_running = max_running
+        self.max_running_low_priority = max_running_low_priority
+        self.running = 0
+        self.running_low_priority = 0
+
+        # Jobs ready to run (the ones that use a lock already hold it) by priority
+        self.ready = {priority: deque() for priority in JobPriority}
 
         # Event responsible for the job queue schedule loop.
         # This event is set and a new job is potentially ready to run
@@ -95,6 +205,10 @@ class JobsQueue:
         # Shared lock (JobSharedLock) dict
         self.job_locks = {}
 
+        # Time jobs spent waiting to be started
+        self.wait_time = {priority: Histogram() for priority in JobPriority}
+        self.lock_wait_time = Histogram()
+
         self.middleware.event_register('core.get_jobs', 'Updates on job changes.', no_authz_required=True)
 
     def __getitem__(self, item):
@@ -121,13 +235,14 @@ class JobsQueue:
 
     def add(self, job):
         self.handle_lock(job)
-        if job.options["lock_queue_size"] is not None:
+        if job.lock is not None and job.options["lock_queue_size"] is not None:
             if job.options["lock_queue_size"] == 0:
-                for another_job in self.all().values():
-                    if another_job.state == State.RUNNING and another_job.lock is job.lock:
-                        raise CallError("This job is already being performed", errno.EBUSY)
+                if job.lock.owner is not None and job.lock.owner.state == State.RUNNING:
+                    raise CallError("This job is already being performed", errno.EBUSY)
             else:
-                queued_jobs = [another_job for another_job in self.queue if another_job.lock is job.lock]
+                queued_jobs = job.lock.waiting
+                if job.lock.owner is not None and job.lock.owner.state == State.WAITING:
+                    queued_jobs = [job.lock.owner] + list(queued_jobs)
                 if len(queued_jobs) >= job.options["lock_queue_size"]:
                     for queued_job in reversed(queued_jobs):
                         if not credential_is_limited_to_own_jobs(job.credentials):
@@ -142,12 +257,11 @@ class JobsQueue:
                     raise CallError('This job is already being performed by another user', errno.EBUSY)
 
         self.deque.add(job)
-        self.queue.append(job)
+        job.queued_at = time.monotonic()
+        if job.lock is None or job.lock.acquire(job):
+            self.set_ready(job)
         send_job_event(self.middleware, 'ADDED', job, job.__encode__())
 
-        # A job has been added to the queue, let the queue scheduler run
-        self.queue_event.set()
-
         return job
 
     def remove(self, job_id):
@@ -171,15 +285,34 @@ class JobsQueue:
         if job.lock is None:
             return
 
-        # Remove job from lock list and release it so another job can use it
+        # Remove job from lock list and pass the lock to the next job waiting for it
         lock.remove_job(job)
-        lock.release()
+        if (next_job := lock.release()) is not None:
+            self.lock_wait_time.observe(time.monotonic() - next_job.queued_at)
+            self.set_ready(next_job)
 
         if len(lock.get_jobs()) == 0:
             self.job_locks.pop(lock.name)
 
-        # Once a lock is released there could be another job in the queue
-        # waiting for the same lock
+    def set_ready(self, job):
+        self.ready[self.job_priority(job)].append(job)
+        # A job is ready to run, let the queue scheduler run
+        self.queue_event.set()
+
+    def job_priority(self, job):
+        return JobPriority[job.get_priority()]
+
+    def set_limits(self, max_running, max_running_low_priority):
+        self.max_running = max_running
+        self.max_running_low_priority = max_running_low_priority
+        # More jobs might be allowed to run now
+        self.queue_event.set()
+
+    def job_finished(self, job):
+        self.running -= 1
+        if self.job_priority(job) == JobPriority.LOW:
+            self.running_low_priority -= 1
+
         self.queue_event.set()
 
     async def next(self):
@@ -189,29 +322,46 @@ class JobsQueue:
         while True:
             # Awaits a new event to look for a job
             await self.queue_event.wait()
-            found = None
-            for job in self.queue:
-                # Get job in the queue if it has no lock or its not locked
-                if job.lock is None or not job.lock.locked():
-                    found = job
-                    if job.lock:
-                        await job.lock.acquire()
-                    break
-            if found:
-                # Unlocked job found to run
-                self.queue.remove(found)
-                # If there are no more jobs in the queue, clear the event
-                if len(self.queue) == 0:
-                    self.queue_event.clear()
-                return found
-            else:
-                # No jobs available to run, clear the event
-                self.queue_event.clear()
+            if self.max_running is None or self.running < self.max_running:
+                for priority, jobs in self.ready.items():
+                    if (
+                        priority == JobPriority.LOW and
+                        self.max_running_low_priority is not None and
+                        self.running_low_priority >= self.max_running_low_priority
+                    ):
+                        continue
+
+                    if jobs:
+                        job = jobs.popleft()
+                        self.wait_time[priority].observe(time.monotonic() - job.queued_at)
+                        return job
+
+            # No jobs available to run (or too many are running), clear the event
+            self.queue_event.clear()
 
     async def run(self):
         while True:
             job = await self.next()
-            self.middleware.create_task(job.run(self))
+            self.running += 1
+            if self.job_priority(job) == JobPriority.LOW:
+                self.running_low_priority += 1
+
+            self.middleware.create_task(job.run(self)).add_done_callback(lambda task, job=job: self.job_finished(job))
+
+    def get_stats(self):
+        return {
+            "running": self.running,
+            "max_running": self.max_running,
+            "running_low_priority": self.running_low_priority,
+            "max_running_low_priority": self.max_running_low_priority,
+            "ready": {priority.name: len(jobs) for priority, jobs in self.ready.items()},
+            "locks": {
+                name: {"waiting": len(lock.waiting), "locked": lock.locked()}
+                for name, lock in self.job_locks.items()
+            },
+            "wait_time": {priority.name: histogram.to_dict() for priority, histogram in self.wait_time.items()},
+            "lock_wait_time": self.lock_wait_time.to_dict(),
+        }
 
     async def receive(self, job, logs):
         await self.deque.receive(self.middleware, job, logs)
@@ -293,6 +443,10 @@ class Job:
 
         self.id = None
         self.lock = None
+        self.queued_at = None
+        self.progress_publisher = JobProgressPublisher(self)
+        # `dump_args` result (arguments never change, but they can be expensive to redact)
+        self.encoded_arguments = None
         self.result = None
         self.error = None
         self.exception = None
@@ -377,6 +531,16 @@ class Job:
                                 errno.EINVAL)
         return lock_name
 
+    def get_priority(self):
+        priority = self.options.get('priority', 'NORMAL')
+        if callable(priority):
+            try:
+                priority = priority(self.args)
+            except Exception:
+                self.middleware.logger.error("Error handling job priority", exc_info=True)
+                priority = 'NORMAL'
+        return priority
+
     def set_id(self, id_):
         self.id = id_
 
@@ -414,9 +578,9 @@ class Job:
         Sets job completion progress. All arguments are optional and only passed arguments will be changed in the
         whole job progress state.
 
-        Don't change this too often as every time an event is sent. Use :class:`middlewared.job.JobProgressBuffer` to
-        throttle progress reporting if you are receiving it from an external source (e.g. network response reading
-        progress).
+        Progress events are rate-limited by :class:`middlewared.job.JobProgressPublisher`, but `on_progress_cb` is still
+        called every time, so don't change this too often. Use :class:`middlewared.job.JobProgressBuffer` to throttle
+        progress reporting if you are receiving it from an external source (e.g. network response reading progress).
 
         :param percent: Job progress [0-100]. It will be rounded down to an integer as precision is not required here,
             and also to avoid sending extra events when progress is changed from, e.g. 73.11 to 73.64
@@ -439,18 +603,17 @@ class Job:
                 self.progress['extra'] = extra
                 changed = True
 
-        encoded = self.__encode__()
         if self.on_progress_cb:
             try:
-                self.on_progress_cb(encoded)
+                self.on_progress_cb(self.__encode__())
             except Exception:
                 logger.warning('Failed to run on progress callback', exc_info=True)
 
         if changed:
-            send_job_event(self.middleware, 'CHANGED', self, encoded)
+            self.progress_publisher.publish()
 
-        for wrapped in self.wrapped:
-            wrapped.set_progress(**self.progress)
+            for wrapped in self.wrapped:
+                wrapped.set_progress(**self.progress)
 
     async def wait(self, timeout=None, raise_error=False, raise_error_forward_classes=(CallError,)):
         if timeout is None:
@@ -535,6 +698,7 @@ class Job:
             queue.release_lock(self)
             self._finished.set()
             await self.call_on_finish_cb()
+            self.progress_publisher.close()
             send_job_event(self.middleware, 'CHANGED', self, self.__encode__())
             if self.options['transient']:
                 queue.remove(self.id)
@@ -561,9 +725,9 @@ class Job:
             else:
                 rv = await self.middleware.run_in_thread(self.method, *args)
         self.set_result(rv)
-        self.set_state('SUCCESS')
         if self.progress['percent'] != 100:
             self.set_progress(100, '')
+        self.set_state('SUCCESS')
 
     def _logs_path(self):
         return os.path.join(LOGS_DIR, f"{self.id}.log")
@@ -667,7 +831,7 @@ class Job:
         return {
             'id': self.id,
             'method': self.method_name,
-            'arguments': self.middleware.dump_args(self.args, method=self.method),
+            'arguments': self.__encode_arguments(),
             'transient': self.options['transient'],
             'description': self.description,
             'abortable': self.options['abortable'],
@@ -691,6 +855,12 @@ class Job:
             )
         }
 
+    def __encode_arguments(self):
+        if self.encoded_arguments is None:
+            self.encoded_arguments = self.middleware.dump_args(self.args, method=self.method)
+
+        return self.encoded_arguments
+
     @staticmethod
     async def receive(middleware, job_dict, logs):
         service_name, method_name = job_dict['method'].rsplit(".", 1)
@@ -1,5 +1,6 @@
 from .api.base.handler.dump_params import dump_params
 from .api.base.handler.result import serialize_result
+from .api.base.handler.stats import validation_stats
 from .api.base.handler.version import APIVersion, APIVersionsAdapter
 from .api.base.server.api import API
 from .api.base.server.doc import APIDumper
@@ -20,9 +21,11 @@ from .service_exception import CallError, ErrnoMixin
 from .utils import MIDDLEWARE_RUN_DIR, sw_version
 from .utils.audit import audit_username_from_session
 from .utils.debug import get_threads_stacks
+from .utils.event_fanout import EventFanout
 from .utils.limits import MsgSizeError, MsgSizeLimit, parse_message
 from .utils.plugins import LoadPluginsMixin
 from .utils.privilege import credential_has_full_admin
+from .utils.procpool import ProcessPool
 from .utils.profile import profile_wrap
 from .utils.rate_limit.cache import RateLimitCache
 from .utils.service.call import ServiceCallMixin
@@ -42,7 +45,6 @@ from collections import defaultdict
 import argparse
 import asyncio
 import concurrent.futures
-import concurrent.futures.process
 import concurrent.futures.thread
 import contextlib
 from dataclasses import dataclass
@@ -112,6 +114,7 @@ class Middleware(LoadPluginsMixin, ServiceCallMixin):
         multiprocessing.set_start_method('spawn')  # Spawn new processes for ProcessPool instead of forking
         self.__init_procpool()
         self.__wsclients = {}
+        self.__event_fanout = None
         self.role_manager = RoleManager(ROLES)
         self.events = Events(self.role_manager)
         self.event_source_manager = EventSourceManager(self)
@@ -457,10 +460,15 @@ class Middleware(LoadPluginsMixin, ServiceCallMixin):
         self.app.router.add_route('*', f'/_plugins/{plugin_name}/{route}', method)
 
     def register_wsclient(self, client):
+        self.__event_fanout.add(client)
         self.__wsclients[client.session_id] = client
 
     def unregister_wsclient(self, client):
         self.__wsclients.pop(client.session_id)
+        self.__event_fanout.remove(client)
+
+    def get_event_fanout_stats(self):
+        return self.__event_fanout.get_stats()
 
     def register_hook(self, name, method, *, blockable=False, inline=False, order=0, raise_error=False, sync=True):
         """
@@ -594,21 +602,13 @@ class Middleware(LoadPluginsMixin, ServiceCallMixin):
         return await self.run_in_executor(io_thread_pool_executor, method, *args, **kwargs)
 
     def __init_procpool(self):
-        self.__procpool = concurrent.futures.ProcessPoolExecutor(
-            max_workers=5,
-            max_tasks_per_child=20,
-            initializer=functools.partial(worker_init, self.debug_level, self.log_handler)
-        )
+        self.__procpool = ProcessPool(functools.partial(worker_init, self.debug_level, self.log_handler))
 
     async def run_in_proc(self, method, *args, **kwargs):
-        retries = 2
-        for i in range(retries):
-            try:
-                return await self.run_in_executor(self.__procpool, method, *args, **kwargs)
-            except concurrent.futures.process.BrokenProcessPool:
-                if i == retries - 1:
-                    raise
-                self.__init_procpool()
+        return await self.__procpool.run(method.__qualname__, method, *args, **kwargs)
+
+    def get_procpool_stats(self):
+        return self.__procpool.get_stats()
 
     def pipe(self, buffered=False):
         """
@@ -698,7 +698,8 @@ class Middleware(LoadPluginsMixin, ServiceCallMixin):
         return await self.run_in_executor(prepared_call.executor, methodobj, *prepared_call.args)
 
     async def _call_worker(self, name, *args, job=None):
-        return await self.run_in_proc(main_worker, name, args, job)
+        # Calls are queued per service so that i.e. a burst of `zfs.snapshot` calls does not delay `zfs.pool` ones
+        return await self.__procpool.run(name.rsplit('.', 1)[0], main_worker, name, args, job)
 
     def dump_args(self, args, method=None, method_name=None):
         if method is None:
@@ -783,7 +784,11 @@ class Middleware(LoadPluginsMixin, ServiceCallMixin):
             if new_style_returns_model is None:
                 new_style_returns_model = methodobj.new_style_returns
 
-            return serialize_result(new_style_returns_model, result, expose_secrets)
+            start = time.perf_counter()
+            try:
+                return serialize_result(new_style_returns_model, result, expose_secrets)
+            finally:
+                validation_stats.record(methodobj.__qualname__, 'result', time.perf_counter() - start)
 
         if not expose_secrets and hasattr(methodobj, "returns") and methodobj.returns:
             schema = methodobj.returns[0]
@@ -960,11 +965,20 @@ class Middleware(LoadPluginsMixin, ServiceCallMixin):
         self.__audit_logger.debug(message)
 
     async def call(self, name, *params, app=None, audit_callback=None, job_on_progress_cb=None, pipes=None,
-                   profile=False):
+                   profile=False, trusted=False):
+        """
+        Call a method internally.
+
+        :param trusted: the caller passes well-formed (already validated) arguments, so the method can skip
+            validating them. Omitted trailing arguments are still set to their defaults, but nested objects must be
+            complete.
+        """
         serviceobj, methodobj = self.get_method(name)
 
         if mock := self._mock_method(name, params):
             methodobj = mock
+        elif trusted:
+            methodobj = self.get_trusted_method(methodobj)
 
         if profile:
             methodobj = profile_wrap(methodobj)
@@ -974,17 +988,22 @@ class Middleware(LoadPluginsMixin, ServiceCallMixin):
             app=app, audit_callback=audit_callback, job_on_progress_cb=job_on_progress_cb, pipes=pipes,
         )
 
-    def call_sync(self, name, *params, job_on_progress_cb=None, app=None, audit_callback=None, background=False):
+    def call_sync(self, name, *params, job_on_progress_cb=None, app=None, audit_callback=None, background=False,
+                  trusted=False):
         if threading.get_ident() == self.__thread_id:
             raise RuntimeError('You cannot use call_sync from main thread')
 
         if background:
-            return self.loop.call_soon_threadsafe(lambda: self.create_task(self.call(name, *params, app=app)))
+            return self.loop.call_soon_threadsafe(
+                lambda: self.create_task(self.call(name, *params, app=app, trusted=trusted))
+            )
 
         serviceobj, methodobj = self.get_method(name)
 
         if mock := self._mock_method(name, params):
             methodobj = mock
+        elif trusted:
+            methodobj = self.get_trusted_method(methodobj)
 
         prepared_call = self._call_prepare(name, serviceobj, methodobj, params, app=app, audit_callback=audit_callback,
                                            job_on_progress_cb=job_on_progress_cb, in_event_loop=False)
@@ -1082,22 +1101,39 @@ class Middleware(LoadPluginsMixin, ServiceCallMixin):
 
         self.logger.trace(f'Sending event {name!r}:{event_type!r}:{kwargs!r}')
 
+        # The event is serialized here (so that the caller is free to modify `kwargs` afterwards) but only once for
+        # every client class. Writing it to the clients is left to the event fan-out running in the event loop.
+        frames = {}
+        targets = []
         for session_id, wsclient in list(self.__wsclients.items()):
             try:
-                if should_send_event is None or should_send_event(wsclient):
-                    wsclient.send_event(name, event_type, **kwargs)
+                if not wsclient.event_subscribed(name):
+                    continue
+                if should_send_event is not None and not should_send_event(wsclient):
+                    continue
+
+                if (frame := frames.get(type(wsclient))) is None:
+                    frame = frames[type(wsclient)] = wsclient.event_frame(name, event_type, kwargs)
+                targets.append((wsclient, frame))
             except Exception:
                 self.logger.warn('Failed to send event {} to {}'.format(name, session_id), exc_info=True)
 
+        if targets:
+            self.__event_fanout.publish(name, event_type, kwargs.get('id'), kwargs.get('fields') or (), targets)
+
+        # Send event also for internally subscribed plugins
+        if handlers := self.__event_subs.get(name):
+            self.loop.call_soon_threadsafe(self.__run_event_handlers, handlers, event_type, kwargs)
+
+    def __run_event_handlers(self, handlers, event_type, kwargs):
         async def wrap(handler):
             try:
                 await handler(self, event_type, kwargs)
             except Exception:
                 self.logger.error('Unhandled exception in event handler', exc_info=True)
 
-        # Send event also for internally subscribed plugins
-        for handler in self.__event_subs.get(name, []):
-            asyncio.run_coroutine_threadsafe(wrap(handler), loop=self.loop)
+        for handler in handlers:
+            self.create_task(wrap(handler))
 
     def pdb(self):
         import pdb
@@ -1302,6 +1338,7 @@ class Middleware(LoadPluginsMixin, ServiceCallMixin):
 
         set_thread_name('asyncio_loop')
         self.loop = asyncio.get_event_loop()
+        self.__event_fanout = EventFanout(self.loop)
 
         if self.loop_debug:
             self.loop.set_debug(True)
@@ -1379,13 +1416,13 @@ class Middleware(LoadPluginsMixin, ServiceCallMixin):
         await restful_api.register_resources()
         self.create_task(self.jobs.run())
 
-        # Start up middleware worker process pool
-        self.__procpool._start_executor_manager_thread()
-
         self.runner = web.AppRunner(app, handle_signals=False, access_log=None)
         await self.runner.setup()
         await web.UnixSite(self.runner, os.path.join(MIDDLEWARE_RUN_DIR, 'middlewared-internal.sock')).start()
 
+        # Start up middleware worker process pool (workers connect to the internal socket on initialization)
+        self.__procpool.prewarm()
+
         await self.__plugins_setup(setup_funcs)
 
         if await self.call('system.state') == 'READY':
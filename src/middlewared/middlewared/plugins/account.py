@@ -50,10 +50,10 @@ from middlewared.api.current import (
 from middlewared.service import CallError, CRUDService, ValidationErrors, pass_app, private, job
 from middlewared.service_exception import MatchNotFound
 import middlewared.sqlalchemy as sa
-from middlewared.utils import run, filter_list
+from middlewared.utils import run, filter_list, query_fields
 from middlewared.utils.crypto import generate_nt_hash, sha512_crypt
 from middlewared.utils.directoryservices.constants import DSType, DSStatus
-from middlewared.utils.filesystem.copy import copytree, CopyTreeConfig
+from middlewared.utils.filesystem.copy import copytree, CopyTreeConfig, COPYTREE_PARALLEL_WORKERS
 from middlewared.utils.nss import pwd, grp
 from middlewared.utils.nss.nss_common import NssModule
 from middlewared.utils.privilege import credential_has_full_admin, privileges_group_mapping
@@ -175,6 +175,53 @@ def filters_include_ds_accounts(filters):
     return True
 
 
+def ds_accounts_paginated(options):
+    """
+    Local accounts are ordered before directory services accounts (that have larger synthetic ids) unless a different
+    order is requested. In that case pagination can be applied by the directory services cache.
+    """
+    return options.get('order_by', []) in ([], ['id'])
+
+
+def ds_accounts_page_options(options, local_count):
+    """
+    `directoryservices.cache.query` options that retrieve the part of the requested page that follows `local_count`
+    local accounts matching the query. Returns `None` if local accounts fill the whole page.
+    """
+    if options.get('count'):
+        return {'count': True}
+
+    if options.get('get'):
+        offset, limit = 0, 1
+    else:
+        offset, limit = options.get('offset', 0), options.get('limit', 0)
+
+    ds_offset = max(offset - local_count, 0)
+    if not limit:
+        return {'offset': ds_offset}
+
+    if (ds_limit := limit - max(local_count - offset, 0)) <= 0:
+        return None
+
+    return {'offset': ds_offset, 'limit': ds_limit}
+
+
+def ds_accounts_page(local_accounts, ds_accounts, options):
+    """
+    Combine `local_accounts` matching the query with the page of directory services accounts retrieved using
+    `ds_accounts_page_options`.
+    """
+    if options.get('get'):
+        offset, limit = 0, 1
+    else:
+        offset, limit = options.get('offset', 0), options.get('limit', 0)
+
+    local_accounts = local_accounts[offset:offset + limit] if limit else local_accounts[offset:]
+    return filter_list(
+        local_accounts + ds_accounts, [], {'select': options.get('select', []), 'get': options.get('get', False)}
+    )
+
+
 class GroupMembershipModel(sa.Model):
     __tablename__ = 'account_bsdgroupmembership'
 
@@ -215,6 +262,7 @@ class UserService(CRUDService):
         datastore = 'account.bsdusers'
         datastore_extend = 'user.user_extend'
         datastore_extend_context = 'user.user_extend_context'
+        datastore_extend_batch = True
         datastore_prefix = 'bsdusr_'
         cli_namespace = 'account.user'
         role_prefix = 'ACCOUNT'
@@ -253,15 +301,32 @@ class UserService(CRUDService):
                     self.logger.warning('Invalid encoding detected in authorized_keys file')
 
     @private
-    async def user_extend(self, user, ctx):
+    def _read_all_authorized_keys(self, homedirs):
+        return [self._read_authorized_keys(homedir) for homedir in homedirs]
+
+    @private
+    async def user_extend(self, users, ctx, fields):
+        if fields is None or 'sshpubkey' in fields:
+            # Read all authorized keys files in a single thread
+            sshpubkeys = await self.middleware.run_in_thread(
+                self._read_all_authorized_keys, [user['home'] for user in users]
+            )
+        else:
+            sshpubkeys = [None] * len(users)
+
+        for user, sshpubkey in zip(users, sshpubkeys):
+            self._user_extend(user, sshpubkey, ctx)
+
+        return users
+
+    def _user_extend(self, user, sshpubkey, ctx):
         user['groups'] = [g['id'] for g in user['groups']]
 
         # Normalize email, empty is really null
         if user['email'] == '':
             user['email'] = None
 
-        # Get authorized keys
-        user['sshpubkey'] = await self.middleware.run_in_thread(self._read_authorized_keys, user['home'])
+        user['sshpubkey'] = sshpubkey
 
         user['immutable'] = user['builtin'] or (user['uid'] == ADMIN_UID)
         user['twofactor_auth_configured'] = bool(ctx['user_2fa_mapping'][user['id']])
@@ -293,8 +358,6 @@ class UserService(CRUDService):
                 'smbhash': '*'
             })
 
-        return user
-
     @private
     def user_compress(self, user):
         to_remove = [
@@ -324,6 +387,7 @@ class UserService(CRUDService):
         options = options or {}
         options['extend'] = self._config.datastore_extend
         options['extend_context'] = self._config.datastore_extend_context
+        options['extend_batch'] = self._config.datastore_extend_batch
         options['prefix'] = self._config.datastore_prefix
 
         datastore_options = options.copy()
@@ -332,13 +396,28 @@ class UserService(CRUDService):
         datastore_options.pop('limit', None)
         datastore_options.pop('offset', None)
         datastore_options.pop('select', None)
+        if (fields := query_fields(filters, options)) is not None:
+            datastore_options['extend_fields'] = sorted({field[0] for field in fields})
+
+        result = await self.middleware.call(
+            'datastore.query', self._config.datastore, [], datastore_options
+        )
 
         if filters_include_ds_accounts(filters):
             ds = await self.middleware.call('directoryservices.status')
             if ds['type'] is not None and ds['status'] == DSStatus.HEALTHY.name:
-                ds_users = await self.middleware.call(
-                    'directoryservices.cache.query', 'USER', filters, options.copy()
-                )
+                if ds_paginated := ds_accounts_paginated(options):
+                    # Only retrieve the part of the page that is not filled by local users
+                    result = await self.middleware.run_in_thread(filter_list, result, filters)
+                    if (ds_options := ds_accounts_page_options(options, len(result))) is not None:
+                        ds_users = await self.middleware.call(
+                            'directoryservices.cache.query', 'USER', filters, ds_options
+                        )
+
+                    if options.get('count'):
+                        return len(result) + (ds_users or 0)
+                else:
+                    ds_users = await self.middleware.call('directoryservices.cache.query', 'USER', filters, {})
 
                 match DSType(ds['type']):
                     case DSType.AD:
@@ -352,9 +431,8 @@ class UserService(CRUDService):
                         # FIXME - map twofactor_auth_configured hint for LDAP users
                         pass
 
-        result = await self.middleware.call(
-            'datastore.query', self._config.datastore, [], datastore_options
-        )
+                if ds_paginated:
+                    return await self.middleware.run_in_thread(ds_accounts_page, result, ds_users, options)
 
         return await self.middleware.run_in_thread(
             filter_list, result + ds_users, filters, options
@@ -1227,6 +1305,10 @@ class UserService(CRUDService):
 
         await run('truenas-set-authentication-method.py', check=True, encoding='utf-8', errors='ignore',
                   input=json.dumps({'username': username, 'password': password}))
+        # The script writes to the database using its own connection
+        await self.middleware.call('datastore.invalidate', [
+            'account_bsdusers', 'account_bsdgroups', 'account_bsdgroupmembership', 'account_twofactor_user_auth',
+        ])
         await self.middleware.call('failover.datastore.force_send')
         await self.middleware.call('etc.generate', 'user')
 
@@ -1255,7 +1337,9 @@ class UserService(CRUDService):
 
         perm_job.wait_sync()
 
-        return asdict(copytree(home_old, home_new, CopyTreeConfig(exist_ok=True, job=job)))
+        return asdict(copytree(home_old, home_new, CopyTreeConfig(
+            exist_ok=True, job=job, workers=COPYTREE_PARALLEL_WORKERS
+        )))
 
     @private
     async def common_validation(self, verrors, data, schema, group_ids, old=None):
@@ -1702,14 +1786,27 @@ class GroupService(CRUDService):
         datastore_options.pop('offset', None)
         datastore_options.pop('select', None)
 
+        result = await self.middleware.call(
+            'datastore.query', self._config.datastore, [], datastore_options
+        )
+
         if filters_include_ds_accounts(filters):
             ds = await self.middleware.call('directoryservices.status')
             if ds['type'] is not None and ds['status'] == DSStatus.HEALTHY.name:
-                ds_groups = await self.middleware.call('directoryservices.cache.query', 'GROUP', filters, options)
+                if ds_accounts_paginated(options):
+                    # Only retrieve the part of the page that is not filled by local groups
+                    result = await self.middleware.run_in_thread(filter_list, result, filters)
+                    if (ds_options := ds_accounts_page_options(options, len(result))) is not None:
+                        ds_groups = await self.middleware.call(
+                            'directoryservices.cache.query', 'GROUP', filters, ds_options
+                        )
 
-        result = await self.middleware.call(
-            'datastore.query', self._config.datastore, [], datastore_options
-        )
+                    if options.get('count'):
+                        return len(result) + (ds_groups or 0)
+
+                    return await self.middleware.run_in_thread(ds_accounts_page, result, ds_groups, options)
+
+                ds_groups = await self.middleware.call('directoryservices.cache.query', 'GROUP', filters, {})
 
         return await self.middleware.run_in_thread(
             filter_list, result + ds_groups, filters, options
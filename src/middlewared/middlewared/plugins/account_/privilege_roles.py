@@ -1,7 +1,22 @@
+import copy
+
 from middlewared.api.current import PrivilegeRoleEntry
 
 from middlewared.role import ROLES
 from middlewared.service import Service, filterable_api_method, filter_list
+from middlewared.utils import IndexedList
+
+# Roles never change at runtime so their entries (and the `name` index `filter_list` builds on them) are computed once
+ROLE_ENTRIES = IndexedList(
+    {
+        "name": name,
+        "title": name,
+        "includes": role.includes,
+        "builtin": role.builtin,
+        "stig": role.stig,
+    }
+    for name, role in ROLES.items()
+)
 
 
 class PrivilegeService(Service):
@@ -26,15 +41,5 @@ class PrivilegeService(Service):
         `builtin` - role exists for internal backend purposes for access
         control.
         """
-        roles = [
-            {
-                "name": name,
-                "title": name,
-                "includes": role.includes,
-                "builtin": role.builtin,
-                "stig": role.stig,
-            }
-            for name, role in ROLES.items()
-        ]
-
-        return filter_list(roles, filters, options)
+        # `ROLE_ENTRIES` are shared between calls, consumers get copies they are free to modify
+        return copy.deepcopy(filter_list(ROLE_ENTRIES, filters, options))
@@ -1,3 +1,4 @@
+import asyncio
 from dataclasses import dataclass
 from collections import defaultdict, namedtuple
 import copy
@@ -45,7 +46,6 @@ from middlewared.service import (
 from middlewared.service_exception import CallError
 import middlewared.sqlalchemy as sa
 from middlewared.validators import validate_schema
-from middlewared.utils import bisect
 from middlewared.utils.plugins import load_modules, load_classes
 from middlewared.utils.python import get_middlewared_dir
 from middlewared.utils.time_utils import utc_now
@@ -56,6 +56,7 @@ DEFAULT_POLICY = "IMMEDIATELY"
 ALERT_SOURCES = {}
 ALERT_SERVICES_FACTORIES = {}
 SEND_ALERTS_ON_READY = False
+ALERT_SOURCES_CONCURRENCY = 8
 
 AlertSourceLock = namedtuple("AlertSourceLock", ["source_name", "expires_at"])
 
@@ -153,6 +154,152 @@ class AlertPolicy:
         self.last_key_value_alerts.pop(alert.uuid, None)
 
 
+class AlertStore:
+    """
+    Active alerts indexed by `uuid`, by `(node, source, klass, key)` identity, by source and by `(node, klass)`.
+
+    Iteration order is insertion order (re-adding an alert moves it to the end). Alerts that were added, changed or
+    removed since the last `flushed()` call are tracked so that only those have to be written to the database.
+    """
+
+    def __init__(self, alerts=()):
+        self.by_uuid = {}
+        self.keys = {}
+        self.by_identity = {}
+        self.by_source = defaultdict(dict)
+        self.by_node_klass = defaultdict(dict)
+        # uuids of the alerts that were added or changed since the last flush
+        self.dirty = set()
+        # uuids of the alerts that were removed since the last flush
+        self.deleted = set()
+        # the database contents are unknown, everything has to be rewritten on the next flush
+        self.full_flush = True
+
+        for alert in alerts:
+            self.add(alert)
+
+    @staticmethod
+    def identity(alert):
+        return alert.node, alert.source, alert.klass, alert.key
+
+    @staticmethod
+    def signature(alert):
+        """
+        Alert fields that are worth announcing and persisting when they change.
+
+        `last_occurrence` is included: it is exposed by `alert.list` and stored in the database, so an alert that was
+        only seen again still has to reach both.
+        """
+        signature = alert.__dict__.copy()
+        signature.pop("mail", None)
+        return signature
+
+    def __iter__(self):
+        # Iterate over a snapshot so that callers can modify the store while iterating
+        return iter(list(self.by_uuid.values()))
+
+    def __len__(self):
+        return len(self.by_uuid)
+
+    def get(self, uuid):
+        return self.by_uuid.get(uuid)
+
+    def get_by_identity(self, alert):
+        return self.by_identity.get(self.identity(alert))
+
+    def source_alerts(self, source):
+        return list(self.by_source.get(source, {}).values())
+
+    def node_klass_alerts(self, node, klass):
+        return list(self.by_node_klass.get((node, klass), {}).values())
+
+    def add(self, alert):
+        """
+        Add `alert` replacing the existing alert with the same `uuid`.
+
+        :return: whether the alert is new or its contents have changed.
+        """
+        existing = self.by_uuid.get(alert.uuid)
+        if existing is not None:
+            self._unlink(existing)
+
+        self._link(alert)
+
+        changed = existing is None or self.signature(existing) != self.signature(alert)
+        if changed:
+            self.touch(alert)
+
+        return changed
+
+    def remove(self, alert):
+        """
+        :return: whether the alert was present.
+        """
+        existing = self.by_uuid.get(alert.uuid)
+        if existing is None:
+            return False
+
+        self._unlink(existing)
+        self.dirty.discard(existing.uuid)
+        self.deleted.add(existing.uuid)
+        return True
+
+    def touch(self, alert):
+        """
+        Mark `alert` that was modified in place as changed.
+        """
+        self.dirty.add(alert.uuid)
+        self.deleted.discard(alert.uuid)
+
+    def replace_source(self, source, alerts):
+        """
+        Replace all the alerts produced by `source` with `alerts`.
+
+        :return: a tuple of removed, added and changed alerts lists.
+        """
+        previous = self.by_source.get(source, {}).copy()
+        added = []
+        changed = []
+        for alert in alerts:
+            if previous.pop(alert.uuid, None) is None:
+                self.add(alert)
+                added.append(alert)
+            elif self.add(alert):
+                changed.append(alert)
+
+        removed = []
+        for alert in previous.values():
+            if self.remove(alert):
+                removed.append(alert)
+
+        return removed, added, changed
+
+    def flushed(self):
+        self.dirty.clear()
+        self.deleted.clear()
+        self.full_flush = False
+
+    def _link(self, alert):
+        # Index keys are remembered so that the alert can be unlinked even if it was modified in place since
+        keys = self.identity(alert), alert.source, (alert.node, alert.klass)
+        self.by_uuid[alert.uuid] = alert
+        self.keys[alert.uuid] = keys
+        self.by_identity[keys[0]] = alert
+        self.by_source[keys[1]][alert.uuid] = alert
+        self.by_node_klass[keys[2]][alert.uuid] = alert
+
+    def _unlink(self, alert):
+        self.by_uuid.pop(alert.uuid)
+        identity, source, node_klass = self.keys.pop(alert.uuid)
+        if self.by_identity.get(identity) is alert:
+            self.by_identity.pop(identity)
+        for index, key in ((self.by_source, source), (self.by_node_klass, node_klass)):
+            alerts = index[key]
+            alerts.pop(alert.uuid)
+            if not alerts:
+                index.pop(key)
+
+
 def get_alert_level(alert, classes):
     return AlertLevel[classes.get(alert.klass.name, {}).get("level", alert.klass.level.name)]
 
@@ -218,6 +365,7 @@ class AlertService(Service):
 
         self.blocked_sources = defaultdict(set)
         self.sources_locks = {}
+        self.sources_checks = {}
 
         self.blocked_failover_alerts_until = 0
 
@@ -226,6 +374,8 @@ class AlertService(Service):
             "max": 0,
             "total_count": 0,
             "total_time": 0,
+            "timeouts": 0,
+            "skipped": 0,
         })
 
     @private
@@ -256,7 +406,7 @@ class AlertService(Service):
             if await self.middleware.call("failover.node") == "B":
                 self.node = "B"
 
-        self.alerts = []
+        self.alerts = AlertStore()
         if load:
             alerts_uuids = set()
             alerts_by_classes = defaultdict(list)
@@ -288,7 +438,8 @@ class AlertService(Service):
                 if isinstance(alerts[0].klass, OneShotAlertClass):
                     alerts = await alerts[0].klass.load(alerts)
 
-                self.alerts.extend(alerts)
+                for alert in alerts:
+                    self.alerts.add(alert)
         else:
             await self.flush_alerts()
 
@@ -394,41 +545,31 @@ class AlertService(Service):
 
         return nodes
 
-    def __alert_by_uuid(self, uuid):
-        try:
-            return [a for a in self.alerts if a.uuid == uuid][0]
-        except IndexError:
-            return None
-
     @api_method(AlertDismissArgs, AlertDismissResult, roles=['ALERT_LIST_WRITE'])
     async def dismiss(self, uuid):
         """
         Dismiss `id` alert.
         """
 
-        alert = self.__alert_by_uuid(uuid)
+        alert = self.alerts.get(uuid)
         if alert is None:
             return
 
         if issubclass(alert.klass, DismissableAlertClass):
-            related_alerts, unrelated_alerts = bisect(lambda a: (a.node, a.klass) == (alert.node, alert.klass),
-                                                      self.alerts)
-            left_alerts = await alert.klass(self.middleware).dismiss(related_alerts, alert)
+            related_alerts = self.alerts.node_klass_alerts(alert.node, alert.klass)
+            left_alerts = {a.uuid for a in await alert.klass(self.middleware).dismiss(related_alerts, alert)}
             for deleted_alert in related_alerts:
-                if deleted_alert not in left_alerts:
+                if deleted_alert.uuid not in left_alerts:
                     self._delete_on_dismiss(deleted_alert)
         elif issubclass(alert.klass, OneShotAlertClass) and not alert.klass.deleted_automatically:
             self._delete_on_dismiss(alert)
         else:
             alert.dismissed = True
+            self.alerts.touch(alert)
             await self._send_alert_changed_event(alert)
 
     def _delete_on_dismiss(self, alert):
-        try:
-            self.alerts.remove(alert)
-            removed = True
-        except ValueError:
-            removed = False
+        removed = self.alerts.remove(alert)
 
         for policy in self.policies.values():
             policy.delete_alert(alert)
@@ -442,11 +583,12 @@ class AlertService(Service):
         Restore `id` alert which had been dismissed.
         """
 
-        alert = self.__alert_by_uuid(uuid)
+        alert = self.alerts.get(uuid)
         if alert is None:
             return
 
         alert.dismissed = False
+        self.alerts.touch(alert)
 
         await self._send_alert_changed_event(alert)
 
@@ -455,6 +597,11 @@ class AlertService(Service):
         if await as_.should_show_alert(alert):
             self.middleware.send_event("alert.list", "CHANGED", id=alert.uuid, fields=await as_.serialize(alert))
 
+    async def __send_alert_changed_event_if_announced(self, alert):
+        # Alerts that were not announced yet will be sent as `ADDED` by `alert.send_alerts`
+        if alert.uuid in self.policies["IMMEDIATELY"].last_key_value_alerts:
+            await self._send_alert_changed_event(alert)
+
     def _send_alert_deleted_event(self, alert):
         self.middleware.send_event("alert.list", "REMOVED", id=alert.uuid)
 
@@ -472,6 +619,7 @@ class AlertService(Service):
 
         if not await self.__should_run_or_send_alerts():
             self.alerts = valid_alerts
+            self.alerts.full_flush = True
             return
 
         await self.middleware.call("alert.send_alerts")
@@ -674,13 +822,18 @@ class AlertService(Service):
         locked = self.blocked_sources[name]
         if locked:
             self.logger.debug("Not running alert source %r because it is blocked", name)
-            for i in filter(lambda x: x.source == name, self.alerts):
-                if i.node == this_node:
-                    this_node_alerts.append(i)
-                elif i.node == other_node:
-                    other_node_alerts.append(i)
+            this_node_alerts, other_node_alerts = self.__source_alerts(name, this_node, other_node)
         return this_node_alerts, other_node_alerts, locked
 
+    def __source_alerts(self, name, this_node, other_node):
+        this_node_alerts, other_node_alerts = [], []
+        for i in self.alerts.source_alerts(name):
+            if i.node == this_node:
+                this_node_alerts.append(i)
+            elif i.node == other_node:
+                other_node_alerts.append(i)
+        return this_node_alerts, other_node_alerts
+
     async def __run_other_node_alert_source(self, name):
         keys = ("args", "datetime", "last_occurrence", "dismissed", "mail",)
         other_node_alerts = []
@@ -716,6 +869,7 @@ class AlertService(Service):
             if source_lock.expires_at <= time.monotonic():
                 await self.unblock_source(k)
 
+        alert_sources = []
         for alert_source in ALERT_SOURCES.values():
             if product_type not in alert_source.products:
                 continue
@@ -727,20 +881,17 @@ class AlertService(Service):
                 continue
 
             self.alert_source_last_run[alert_source.name] = utc_now()
+            alert_sources.append(alert_source)
 
-            this_node_alerts, other_node_alerts, locked = await self.__handle_locked_alert_source(
-                alert_source.name, fi.this_node, fi.other_node
-            )
-            if not locked:
-                self.logger.trace("Running alert source: %r", alert_source.name)
-                try:
-                    this_node_alerts = await self.__run_source(alert_source.name)
-                except UnavailableException:
-                    pass
-
-                if fi.run_on_backup_node and alert_source.run_on_backup_node:
-                    other_node_alerts = await self.__run_other_node_alert_source(alert_source.name)
+        # Sources are checked concurrently, but their results are applied in registration order so that
+        # alerts handling stays deterministic.
+        semaphore = asyncio.Semaphore(ALERT_SOURCES_CONCURRENCY)
+        results = await asyncio.gather(*[
+            self.__run_alert_source(semaphore, alert_source, fi) for alert_source in alert_sources
+        ])
 
+        changed_alerts = []
+        for alert_source, (this_node_alerts, other_node_alerts) in zip(alert_sources, results):
             for talert, oalert in zip_longest(this_node_alerts, other_node_alerts, fillvalue=None):
                 if talert is not None:
                     talert.node = fi.this_node
@@ -749,18 +900,44 @@ class AlertService(Service):
                     oalert.node = fi.other_node
                     self.__handle_alert(oalert)
 
-            self.alerts = (
-                [a for a in self.alerts if a.source != alert_source.name] + this_node_alerts + other_node_alerts
+            # New and removed alerts are announced by the `IMMEDIATELY` policy in `alert.send_alerts`
+            removed, added, changed = self.alerts.replace_source(
+                alert_source.name, this_node_alerts + other_node_alerts,
             )
+            changed_alerts.extend(changed)
+
+        for alert in changed_alerts:
+            await self.__send_alert_changed_event_if_announced(alert)
+
+    async def __run_alert_source(self, semaphore, alert_source, fi):
+        this_node_alerts, other_node_alerts, locked = await self.__handle_locked_alert_source(
+            alert_source.name, fi.this_node, fi.other_node
+        )
+        if locked:
+            return this_node_alerts, other_node_alerts
+
+        if (task := self.sources_checks.get(alert_source.name)) and not task.done():
+            # Previous check of this source has timed out and is still running, keep the alerts it has produced
+            # before instead of piling up more checks.
+            self.logger.debug("Not running alert source %r because its previous check is still running",
+                              alert_source.name)
+            self.sources_run_times[alert_source.name]["skipped"] += 1
+            return self.__source_alerts(alert_source.name, fi.this_node, fi.other_node)
+
+        async with semaphore:
+            self.logger.trace("Running alert source: %r", alert_source.name)
+            try:
+                this_node_alerts = await self.__run_source(alert_source.name)
+            except UnavailableException:
+                pass
+
+            if fi.run_on_backup_node and alert_source.run_on_backup_node:
+                other_node_alerts = await self.__run_other_node_alert_source(alert_source.name)
+
+        return this_node_alerts, other_node_alerts
 
     def __handle_alert(self, alert):
-        try:
-            existing_alert = [
-                a for a in self.alerts
-                if (a.node, a.source, a.klass, a.key) == (alert.node, alert.source, alert.klass, alert.key)
-            ][0]
-        except IndexError:
-            existing_alert = None
+        existing_alert = self.alerts.get_by_identity(alert)
 
         if existing_alert is None:
             alert.uuid = self.__uuid()
@@ -779,7 +956,9 @@ class AlertService(Service):
             alert.dismissed = existing_alert.dismissed
 
     def __expire_alerts(self):
-        self.alerts = list(filter(lambda alert: not self.__should_expire_alert(alert), self.alerts))
+        for alert in self.alerts:
+            if self.__should_expire_alert(alert):
+                self.alerts.remove(alert)
 
     def __should_expire_alert(self, alert):
         if issubclass(alert.klass, OneShotAlertClass):
@@ -791,7 +970,11 @@ class AlertService(Service):
     @private
     async def sources_stats(self):
         return {
-            k: {"avg": v["total_time"] / v["total_count"] if v["total_count"] != 0 else 0, **v}
+            k: {
+                "avg": v["total_time"] / v["total_count"] if v["total_count"] != 0 else 0,
+                "running": k in self.sources_checks and not self.sources_checks[k].done(),
+                **v,
+            }
             for k, v in sorted(self.sources_run_times.items(), key=lambda t: t[0])
         }
 
@@ -829,9 +1012,19 @@ class AlertService(Service):
 
         start = time.monotonic()
         try:
-            alerts = (await alert_source.check()) or []
+            alerts = (await self.__check_source(alert_source)) or []
         except UnavailableException:
             raise
+        except asyncio.TimeoutError:
+            self.logger.warning("Alert source %r timed out after %d seconds", source_name, alert_source.run_timeout)
+            self.sources_run_times[source_name]["timeouts"] += 1
+            alerts = [
+                Alert(AlertSourceRunFailedAlertClass,
+                      args={
+                          "source_name": alert_source.name,
+                          "traceback": f"Timed out after {alert_source.run_timeout} seconds",
+                      })
+            ]
         except Exception as e:
             if source_name not in self.alert_sources_errors:
                 self.logger.error("Error checking for alert %r", alert_source.name, exc_info=True)
@@ -871,6 +1064,25 @@ class AlertService(Service):
 
         return alerts
 
+    async def __check_source(self, alert_source):
+        # The check runs in its own task so that it is not cancelled when it times out. Threaded sources can not be
+        # interrupted anyway, so the pending check is tracked and the source is skipped until it completes.
+        task = self.sources_checks.get(alert_source.name)
+        if task is None or task.done():
+            task = self.middleware.create_task(alert_source.check())
+            self.sources_checks[alert_source.name] = task
+            task.add_done_callback(lambda t: self.__check_source_done(alert_source.name, t))
+
+        return await asyncio.wait_for(asyncio.shield(task), alert_source.run_timeout)
+
+    def __check_source_done(self, source_name, task):
+        if self.sources_checks.get(source_name) is task:
+            self.sources_checks.pop(source_name)
+
+        if not task.cancelled():
+            # Exception of a check that nobody waits for anymore (it has timed out) must still be retrieved
+            task.exception()
+
     @periodic(3600, run_on_start=False)
     @private
     async def flush_alerts(self):
@@ -878,13 +1090,26 @@ class AlertService(Service):
             if await self.middleware.call('failover.status') == 'BACKUP':
                 return
 
-        await self.middleware.call("datastore.delete", "system.alert", [])
+        if self.alerts.full_flush:
+            await self.middleware.call("datastore.delete", "system.alert", [])
+            alerts = list(self.alerts)
+        else:
+            # Only rewrite the alerts that have changed since the last flush
+            if stale := self.alerts.dirty | self.alerts.deleted:
+                await self.middleware.call("datastore.delete", "system.alert", [["uuid", "in", list(stale)]])
+            alerts = [self.alerts.get(uuid) for uuid in self.alerts.dirty]
 
-        for alert in self.alerts:
-            d = alert.__dict__.copy()
-            d["klass"] = d["klass"].name
-            del d["mail"]
-            await self.middleware.call("datastore.insert", "system.alert", d)
+        self.alerts.flushed()
+
+        try:
+            for alert in alerts:
+                d = alert.__dict__.copy()
+                d["klass"] = d["klass"].name
+                del d["mail"]
+                await self.middleware.call("datastore.insert", "system.alert", d)
+        except Exception:
+            self.alerts.full_flush = True
+            raise
 
     @api_method(AlertOneshotCreateArgs, AlertOneshotCreateResult, private=True)
     @job(lock="process_alerts", transient=True)
@@ -918,7 +1143,8 @@ class AlertService(Service):
 
         self.__handle_alert(alert)
 
-        self.alerts = [a for a in self.alerts if a.uuid != alert.uuid] + [alert]
+        if self.alerts.add(alert):
+            await self.__send_alert_changed_event_if_announced(alert)
 
         await self.middleware.call("alert.send_alerts")
 
@@ -950,11 +1176,10 @@ class AlertService(Service):
             if not issubclass(klass, OneShotAlertClass):
                 raise CallError(f"Alert class {klassname!r} is not a one-shot alert source")
 
-            related_alerts, unrelated_alerts = bisect(lambda a: (a.node, a.klass) == (self.node, klass),
-                                                      self.alerts)
-            left_alerts = await klass(self.middleware).delete(related_alerts, query)
+            related_alerts = self.alerts.node_klass_alerts(self.node, klass)
+            left_alerts = {a.uuid for a in await klass(self.middleware).delete(related_alerts, query)}
             for deleted_alert in related_alerts:
-                if deleted_alert not in left_alerts:
+                if deleted_alert.uuid not in left_alerts:
                     self.alerts.remove(deleted_alert)
                     deleted = True
 
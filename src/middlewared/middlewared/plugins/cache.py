@@ -1,9 +1,34 @@
-from collections import namedtuple
+import asyncio
+from collections import Counter, namedtuple, OrderedDict
 from collections.abc import Callable
+import threading
 from time import monotonic
 from typing import Any
 
-from middlewared.service import Service
+from middlewared.service import Service, periodic
+
+DEFAULT_NAMESPACE = "default"
+# Maximum number of entries per namespace, least recently used entries are evicted once it is exceeded. Namespaces
+# that are not listed here are unbounded (many plugins keep state flags in the cache that must not be evicted).
+CACHE_NAMESPACES = {
+    "catalog": 32,
+}
+CACHE_SWEEP_INTERVAL = 60
+
+CacheEntry = namedtuple("CacheEntry", ["value", "timeout", "namespace"])
+
+
+class CacheFlight:
+    """
+    A value for `key` that is being computed by `get_or_put` right now. Concurrent callers wait for it instead of
+    computing the value again.
+    """
+
+    def __init__(self):
+        self.thread_id = threading.get_ident()
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
 
 
 class CacheService(Service):
@@ -12,12 +37,23 @@ class CacheService(Service):
 
     def __init__(self, *args, **kwargs):
         super(CacheService, self).__init__(*args, **kwargs)
-        self.__cache = {}
-        self.kv_tuple = namedtuple("Cache", ["value", "timeout"])
+        self.__lock = threading.Lock()
+        # namespace -> key -> `CacheEntry` in least recently used first order
+        self.__namespaces = {}
+        # key -> namespace
+        self.__keys = {}
+        self.__flights = {}
+        self.__stats = {}
 
     def has_key(self, key: str):
-        """Check if given `key` is in cache."""
-        return key in self.__cache
+        """Check if given `key` is in cache (and has not expired)."""
+        with self.__lock:
+            try:
+                self.__get(key, count=False)
+            except KeyError:
+                return False
+
+            return True
 
     def get(self, key: str):
         """
@@ -26,36 +62,157 @@ class CacheService(Service):
         Raises:
             KeyError: not found in the cache
         """
-        if self.__cache[key].timeout > 0:
-            self.get_timeout(key)
-        return self.__cache[key].value
+        with self.__lock:
+            return self.__get(key)
 
-    def put(self, key: str, value: Any, timeout: int = 0):
-        """Put `key` of `value` in the cache."""
+    def put(self, key: str, value: Any, timeout: int = 0, namespace: str = DEFAULT_NAMESPACE):
+        """
+        Put `key` of `value` in the cache.
+
+        `namespace` controls the size limit the entry is subject to (see `CACHE_NAMESPACES`). Keys are unique across
+        all namespaces.
+        """
         if timeout != 0:
             timeout = monotonic() + timeout
-        self.__cache[key] = self.kv_tuple(value=value, timeout=timeout)
+
+        with self.__lock:
+            self.__remove(key)
+
+            entries = self.__namespaces.setdefault(namespace, OrderedDict())
+            entries[key] = CacheEntry(value=value, timeout=timeout, namespace=namespace)
+            self.__keys[key] = namespace
+
+            if (max_entries := CACHE_NAMESPACES.get(namespace)) is not None:
+                while len(entries) > max_entries:
+                    evicted_key, _ = entries.popitem(last=False)
+                    del self.__keys[evicted_key]
+                    self.__namespace_stats(namespace)["evictions"] += 1
 
     def pop(self, key: str):
         """Removes and returns `key` from cache."""
-        cache = self.__cache.pop(key, None)
+        with self.__lock:
+            cache = self.__remove(key)
+
         if cache is not None:
             cache = cache.value
         return cache
 
     def get_timeout(self, key: str):
         """Check if 'key' has expired"""
-        now = monotonic()
-        value, timeout = self.__cache[key]
-        if now >= timeout:
-            # Bust the cache
-            del self.__cache[key]
-            raise KeyError(f"{key} has expired")
+        with self.__lock:
+            entry = self.__entry(key)
+            if monotonic() >= entry.timeout:
+                # Bust the cache
+                self.__expire(key)
+                raise KeyError(f"{key} has expired")
+
+    def get_or_put(self, key: str, timeout: int, method: Callable, namespace: str = DEFAULT_NAMESPACE):
+        """
+        Get `key` from cache or put the value returned by `method` (which can also be a coroutine function).
+
+        Concurrent calls for the same missing `key` only call `method` once, the others wait for its result.
+        """
+        with self.__lock:
+            try:
+                return self.__get(key)
+            except KeyError:
+                pass
+
+            flight = self.__flights.get(key)
+            if flight is None or flight.thread_id == threading.get_ident():
+                # Either we are the first one or `method` itself calls `get_or_put` for the same key
+                flight = self.__flights[key] = CacheFlight()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.value
 
-    def get_or_put(self, key: str, timeout: int, method: Callable):
         try:
-            return self.get(key)
-        except KeyError:
             value = method()
-            self.put(key, value, timeout)
+            if asyncio.iscoroutine(value):
+                value = self.middleware.run_coroutine(value)
+
+            self.put(key, value, timeout, namespace)
+            flight.value = value
             return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.__lock:
+                if self.__flights.get(key) is flight:
+                    del self.__flights[key]
+
+            flight.event.set()
+
+    @periodic(CACHE_SWEEP_INTERVAL, run_on_start=False)
+    def sweep(self):
+        """Remove expired entries from the cache."""
+        now = monotonic()
+        with self.__lock:
+            for entries in self.__namespaces.values():
+                for key in [key for key, entry in entries.items() if entry.timeout != 0 and now >= entry.timeout]:
+                    self.__expire(key)
+
+    def stats(self):
+        """
+        Number of entries, hits, misses, evictions and expirations by namespace.
+
+        Misses of keys that are not in the cache at all are accounted to the default namespace.
+        """
+        with self.__lock:
+            return {
+                namespace: {
+                    "entries": len(self.__namespaces.get(namespace, {})),
+                    "max_entries": CACHE_NAMESPACES.get(namespace),
+                    **{
+                        counter: self.__namespace_stats(namespace)[counter]
+                        for counter in ("hits", "misses", "evictions", "expirations")
+                    },
+                }
+                for namespace in self.__namespaces.keys() | self.__stats.keys()
+            }
+
+    def __entry(self, key):
+        return self.__namespaces[self.__keys[key]][key]
+
+    def __get(self, key, count=True):
+        try:
+            entry = self.__entry(key)
+        except KeyError:
+            if count:
+                self.__namespace_stats(DEFAULT_NAMESPACE)["misses"] += 1
+            raise
+
+        stats = self.__namespace_stats(entry.namespace)
+        if entry.timeout > 0 and monotonic() >= entry.timeout:
+            self.__expire(key)
+            if count:
+                stats["misses"] += 1
+            raise KeyError(f"{key} has expired")
+
+        self.__namespaces[entry.namespace].move_to_end(key)
+        if count:
+            stats["hits"] += 1
+        return entry.value
+
+    def __remove(self, key):
+        if (namespace := self.__keys.pop(key, None)) is None:
+            return None
+
+        return self.__namespaces[namespace].pop(key)
+
+    def __expire(self, key):
+        if (entry := self.__remove(key)) is not None:
+            self.__namespace_stats(entry.namespace)["expirations"] += 1
+
+    def __namespace_stats(self, namespace):
+        if (stats := self.__stats.get(namespace)) is None:
+            stats = self.__stats[namespace] = Counter()
+        return stats
@@ -109,7 +109,7 @@ class CatalogService(Service):
             # happens after 24h - which means that for a small amount of time it's possible that user
             # come with a case where system is trying to access cached data but it has expired and it's
             # reading again from disk hence the extra 1 hour.
-            self.middleware.call_sync('cache.put', get_cache_key(catalog['label']), trains, 90000)
+            self.middleware.call_sync('cache.put', get_cache_key(catalog['label']), trains, 90000, 'catalog')
 
         return trains
 
@@ -182,7 +182,7 @@ class CatalogService(Service):
                 return self.middleware.call_sync('cache.get', cache_key)
 
         data = retrieve_recommended_apps(self.middleware.call_sync('catalog.config')['location'])
-        self.middleware.call_sync('cache.put', cache_key, data)
+        self.middleware.call_sync('cache.put', cache_key, data, 0, 'catalog')
         return data
 
     @private
@@ -24,7 +24,7 @@ class CatalogService(Service):
         with open(path, 'r') as f:
             mapping = json.loads(f.read())
 
-        self.middleware.call_sync('cache.put', 'catalog_feature_map', mapping, 86400)
+        self.middleware.call_sync('cache.put', 'catalog_feature_map', mapping, 86400, 'catalog')
 
         return mapping
 
@@ -122,7 +122,8 @@ class CloudBackupService(Service):
 
     @item_method
     @api_method(CloudBackupSyncArgs, CloudBackupSyncResult, roles=['CLOUD_BACKUP_WRITE'])
-    @job(lock=lambda args: "cloud_backup:{}".format(args[-1]), lock_queue_size=1, logs=True, abortable=True)
+    @job(lock=lambda args: "cloud_backup:{}".format(args[-1]), lock_queue_size=1, logs=True, abortable=True,
+         priority="LOW")
     async def sync(self, job, id_, options):
         """
         Run the cloud backup job `id`.
@@ -984,7 +984,7 @@ class CloudSyncService(TaskPathService, CloudTaskServiceMixin, TaskStateMixin):
         roles=["CLOUD_SYNC_WRITE"],
     )
     @job(lock=lambda args: "cloud_sync:{}".format(args[-1]), lock_queue_size=1, logs=True, abortable=True,
-         read_roles=["CLOUD_SYNC_READ"])
+         read_roles=["CLOUD_SYNC_READ"], priority="LOW")
     async def sync(self, job, id_, options):
         """
         Run the cloud_sync job `id`, syncing the local data to remote.
@@ -1002,7 +1002,7 @@ class CloudSyncService(TaskPathService, CloudTaskServiceMixin, TaskStateMixin):
         Patch("cloud_sync_sync_options", "cloud_sync_sync_onetime_options"),
         roles=["CLOUD_SYNC_WRITE"],
     )
-    @job(logs=True, abortable=True)
+    @job(logs=True, abortable=True, priority="LOW")
     async def sync_onetime(self, job, cloud_sync, options):
         """
         Run cloud sync task without creating it.
@@ -0,0 +1,112 @@
+from collections import defaultdict, OrderedDict
+import copy
+import json
+import re
+import threading
+
+DATASTORE_CACHE_MAX_ENTRIES = 1024
+RE_WRITE_TABLE = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+[`\"\[]?(\w+)",
+    re.IGNORECASE,
+)
+RE_READ = re.compile(r"^\s*(SELECT|PRAGMA\s+\w+\s*(\(|$))", re.IGNORECASE)
+
+
+class DatastoreCache:
+    """
+    Results of `datastore.query` (before `extend`) keyed by table name and query arguments.
+
+    Every table has a generation number that is incremented each time the table is written to. An entry remembers the
+    generations of all the tables it was read from and is only valid while none of them has changed. Generations are
+    captured before the query is sent to the database thread, so a write that happens while the query is running
+    invalidates its result too.
+
+    Entries are stored and returned as deep copies: the cached snapshot itself is never modified, and callers (and
+    `extend` methods) are free to modify the rows they receive.
+    """
+
+    def __init__(self, max_entries=DATASTORE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.epoch = 0
+        self.generations = defaultdict(int)
+        self.entries = OrderedDict()
+        # table name -> names of the tables its query results depend on
+        self.dependencies = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, name, filters, options, fields):
+        return json.dumps([
+            name,
+            filters,
+            [options[k] for k in ('relationships', 'prefix', 'order_by', 'offset', 'limit', 'count')],
+            sorted(fields) if fields is not None else None,
+        ], default=repr)
+
+    def snapshot(self, tables):
+        """
+        Current generations of `tables`. Must be called before the query is executed.
+        """
+        with self.lock:
+            return self.epoch, {table: self.generations[table] for table in tables}
+
+    def get(self, key):
+        """
+        Returns a copy of a valid cached result for `key`. Raises `KeyError` if there is none.
+        """
+        with self.lock:
+            try:
+                entry = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                raise
+
+            (epoch, generations), result = entry
+            if epoch != self.epoch or any(self.generations[table] != g for table, g in generations.items()):
+                del self.entries[key]
+                self.misses += 1
+                raise KeyError(key)
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        return copy.deepcopy(result)
+
+    def put(self, key, snapshot, result):
+        result = copy.deepcopy(result)
+        with self.lock:
+            self.entries[key] = (snapshot, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, table):
+        with self.lock:
+            self.generations[table] += 1
+
+    def invalidate_sql(self, sql):
+        """
+        Invalidates results that might have been affected by raw SQL statement `sql`.
+        """
+        if m := RE_WRITE_TABLE.match(sql):
+            self.invalidate(m.group(1).lower())
+        elif not RE_READ.match(sql):
+            self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+            self.dependencies.clear()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+datastore_cache = DatastoreCache()
@@ -1,15 +1,25 @@
 from concurrent.futures import ThreadPoolExecutor
 import re
 import shutil
+import threading
 import time
 
 from sqlalchemy import create_engine
+from sqlalchemy.sql.dml import Insert
 
-from middlewared.service import private, Service
+from middlewared.service import private, Service, threaded
 
 from middlewared.plugins.config import FREENAS_DATABASE
 
+from .cache import datastore_cache
+
+DATASTORE_READERS = 4
+
+# All writes (and the schema setup) happen in this thread using a single connection
 thread_pool = ThreadPoolExecutor(1)
+# Queries are executed using read-only connections (one per thread) so they can run in parallel with each other.
+# A write is committed before `execute_write` returns, so every query that is started after that will see it.
+read_thread_pool = ThreadPoolExecutor(DATASTORE_READERS)
 
 
 def regexp(expr, item):
@@ -28,6 +38,8 @@ class DatastoreService(Service):
 
     engine = None
     connection = None
+    read_engine = None
+    readers = None
 
     @private
     def handle_constraint_violation(self, row, journal):
@@ -80,9 +92,30 @@ class DatastoreService(Service):
 
         self.connection.connection.execute("VACUUM")
 
+        if self.read_engine is not None:
+            self.read_engine.dispose()
+
+        if FREENAS_DATABASE == ':memory:':
+            # Each connection to an in-memory database would see its own empty database
+            self.read_engine = None
+        else:
+            self.read_engine = create_engine(f'sqlite:///file:{FREENAS_DATABASE}?mode=ro&uri=true')
+
+        # Reader threads will open new connections (the old ones are closed once they are garbage collected)
+        self.readers = threading.local()
+
+        # The database might have been replaced (i.e. received from the other controller)
+        datastore_cache.clear()
+
     @private
     def execute(self, *args):
-        return self.connection.execute(*args)
+        try:
+            return self.connection.execute(*args)
+        finally:
+            if isinstance(args[0], str):
+                datastore_cache.invalidate_sql(args[0])
+            else:
+                datastore_cache.clear()
 
     @private
     def execute_write(self, stmt, options=None):
@@ -90,6 +123,59 @@ class DatastoreService(Service):
         options.setdefault('ha_sync', True)
         options.setdefault('return_last_insert_rowid', False)
 
+        sql, binds = self._compile(stmt)
+
+        try:
+            result = self.connection.execute(sql, binds)
+        finally:
+            datastore_cache.invalidate(stmt.table.name)
+
+        self.middleware.call_hook_inline("datastore.post_execute_write", sql, binds, options)
+
+        if options['return_last_insert_rowid']:
+            return self._fetchall(self.connection, "SELECT last_insert_rowid()")[0][0]
+
+        return result
+
+    @private
+    def execute_write_many(self, statements, options=None):
+        """
+        Execute write `statements` in a single transaction. If any of them fails, none of them are applied.
+
+        `statements` is a list of `(stmt, expected_rowcount)`. The transaction is rolled back (and `RuntimeError` is
+        raised) if a statement with non-null `expected_rowcount` affects a different number of rows.
+
+        The `datastore.post_execute_write_many` hook is called once for the whole transaction.
+
+        Returns the `last_insert_rowid()` for insert statements and the number of affected rows for the others.
+        """
+        options = options or {}
+        options.setdefault('ha_sync', True)
+
+        queries = [self._compile(stmt) for stmt, expected_rowcount in statements]
+
+        results = []
+        try:
+            with self.connection.begin():
+                for (stmt, expected_rowcount), (sql, binds) in zip(statements, queries):
+                    result = self.connection.execute(sql, binds)
+                    if isinstance(stmt, Insert):
+                        results.append(self._fetchall(self.connection, "SELECT last_insert_rowid()")[0][0])
+                    else:
+                        if expected_rowcount is not None and result.rowcount != expected_rowcount:
+                            raise RuntimeError(f'{result.rowcount} rows were affected by {sql!r}, expected '
+                                               f'{expected_rowcount}')
+
+                        results.append(result.rowcount)
+        finally:
+            for table in {stmt.table.name for stmt, expected_rowcount in statements}:
+                datastore_cache.invalidate(table)
+
+        self.middleware.call_hook_inline("datastore.post_execute_write_many", queries, options)
+
+        return results
+
+    def _compile(self, stmt):
         compiled = stmt.compile(self.engine, compile_kwargs={"render_postcompile": True})
 
         sql = compiled.string
@@ -103,19 +189,53 @@ class DatastoreService(Service):
             else:
                 binds.append(value)
 
-        result = self.connection.execute(sql, binds)
-
-        self.middleware.call_hook_inline("datastore.post_execute_write", sql, binds, options)
+        return sql, binds
 
-        if options['return_last_insert_rowid']:
-            return self.fetchall("SELECT last_insert_rowid()")[0][0]
+    @private
+    def execute_many(self, queries):
+        """
+        Execute raw `queries` (a list of `(sql, params)`) in a single transaction.
+        """
+        try:
+            with self.connection.begin():
+                for sql, params in queries:
+                    self.connection.execute(sql, params)
+        finally:
+            datastore_cache.clear()
 
-        return result
+    @private
+    def invalidate(self, tables=None):
+        """
+        Invalidate cached `datastore.query` results after the database was modified bypassing the datastore (i.e. by
+        a script using its own connection). `tables` are raw table names (e.g. `account_bsdusers`); all cached
+        results are dropped if they are not specified.
+        """
+        if tables is None:
+            datastore_cache.clear()
+        else:
+            for table in tables:
+                datastore_cache.invalidate(table)
 
     @private
+    @threaded(read_thread_pool)
     def fetchall(self, query, params=None):
-        cursor = self.connection.execute(query, params or [])
+        if self.read_engine is None:
+            # The writer connection is the only one that sees the database, and it can only be used from its own thread
+            return thread_pool.submit(self._fetchall, self.connection, query, params).result()
+
+        return self._fetchall(self._read_connection(), query, params)
+
+    def _fetchall(self, connection, query, params=None):
+        cursor = connection.execute(query, params or [])
         try:
             return cursor.fetchall()
         finally:
             cursor.close()
+
+    def _read_connection(self):
+        readers = self.readers
+        if (connection := getattr(readers, 'connection', None)) is None:
+            connection = readers.connection = self.read_engine.connect()
+            connection.connection.create_function("REGEXP", 2, regexp)
+
+        return connection
@@ -10,9 +10,10 @@ from sqlalchemy.sql.operators import desc_op, nullsfirst_op, nullslast_op
 from middlewared.schema import accepts, Bool, Dict, Int, List, Ref, Str
 from middlewared.service import Service
 from middlewared.service_exception import MatchNotFound
-from middlewared.utils import filters
+from middlewared.utils import filters, query_fields
 from middlewared.validators import QueryFilters, QueryOptions
 
+from .cache import datastore_cache
 from .filter import FilterMixin
 from .schema import SchemaMixin
 
@@ -38,6 +39,8 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
             Bool('relationships', default=True),
             Str('extend', default=None, null=True),
             Str('extend_context', default=None, null=True),
+            Bool('extend_batch', default=False),
+            List('extend_fields', default=None, null=True),
             Str('prefix', default=None, null=True),
             Dict('extra', additional_attrs=True),
             List('order_by'),
@@ -81,6 +84,15 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
               "method": "datastore.query",
               "params": ["account.bsdusers", [ ["username", "=", "root" ] ], {"get": true}]
             }
+
+        `extend` is a method that is called for every row (with the result of the `extend_context` method, if
+        specified). If `extend_batch` is set, it is called only once with the list of all rows instead, followed by
+        the context (if `extend_context` is specified) and by `extend_fields`, and it must return the list of extended
+        rows.
+
+        `extend_fields` lists top-level fields that the caller needs (`null` means all of them). A batch `extend`
+        method can skip computing the other fields. Without `extend`, it defaults to the fields listed in `select` and
+        relationships that are not needed are not fetched.
         """
         table = self._get_table(name)
 
@@ -88,6 +100,41 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         # which might happen with "prefix"
         options = options.copy()
 
+        fields = None
+        if not options['extend']:
+            # Relationships that are not selected can only be skipped when no `extend` method might need them
+            if select_fields := options['extend_fields'] or options['select']:
+                # Foreign keys referenced by filters must be joined as well
+                fields = {
+                    field[0].split('__', 1)[0]
+                    for field in query_fields(filters, {'select': select_fields})
+                }
+
+        key = datastore_cache.key(name, filters, options, fields)
+        try:
+            result = datastore_cache.get(key)
+        except KeyError:
+            snapshot = datastore_cache.snapshot(self._get_dependencies(table))
+            result = await self._fetch(table, filters, options, fields)
+            datastore_cache.put(key, snapshot, result)
+
+        if options['count']:
+            return result
+
+        result = await self._queryset_extend(
+            result, options['extend'], options['extend_context'], options['select'], options['extra'],
+            options['extend_batch'], options['extend_fields'],
+        )
+
+        if options['get']:
+            try:
+                return result[0]
+            except IndexError:
+                raise MatchNotFound() from None
+
+        return result
+
+    async def _fetch(self, table, filters, options, fields):
         aliases = {}
         if options['count']:
             qs = select([func.count(self._get_pk(table))])
@@ -95,7 +142,7 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
             columns = list(table.c)
             from_ = table
             if options['relationships']:
-                aliases = self._get_queryset_joins(table)
+                aliases = self._get_queryset_joins(table, fields, options['prefix'])
                 for foreign_key, alias in aliases.items():
                     columns.extend(list(alias.c))
                     from_ = from_.outerjoin(alias, alias.c[foreign_key.column.name] == foreign_key.parent)
@@ -144,21 +191,12 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         relationships = [{} for row in result]
         if options['relationships']:
             # This will only fetch many-to-many relationships for primary table, not for joins, but that's enough
-            relationships = await self._fetch_many_to_many(table, result)
-
-        result = await self._queryset_serialize(
-            result,
-            table, aliases, relationships, options['extend'], options['extend_context'], options['prefix'],
-            options['select'], options['extra'],
-        )
-
-        if options['get']:
-            try:
-                return result[0]
-            except IndexError:
-                raise MatchNotFound() from None
+            relationships = await self._fetch_many_to_many(table, result, fields, options['prefix'])
 
-        return result
+        return [
+            self._serialize(row, table, aliases, relationships[i], options['prefix'])
+            for i, row in enumerate(result)
+        ]
 
     @accepts(Str('name'), Ref('query-options'))
     async def config(self, name, options):
@@ -170,13 +208,16 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         options['get'] = True
         return await self.query(name, [], options)
 
-    def _get_queryset_joins(self, table):
+    def _get_queryset_joins(self, table, fields=None, prefix=None):
         result = {}
         for column in table.c:
             if column.foreign_keys:
                 if len(column.foreign_keys) > 1:
                     raise RuntimeError('Multiple foreign keys are not supported')
 
+                if fields is not None and self._strip_prefix(column.name.removesuffix('_id'), prefix) not in fields:
+                    continue
+
                 foreign_key = list(column.foreign_keys)[0]
                 alias = foreign_key.column.table.alias(foreign_key.name)
 
@@ -186,22 +227,50 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
 
         return result
 
-    async def _queryset_serialize(
-        self, qs, table, aliases, relationships, extend, extend_context, field_prefix, select, extra_options,
-    ):
-        rows = []
-        for i, row in enumerate(qs):
-            rows.append(self._serialize(row, table, aliases, relationships[i], field_prefix))
+    def _get_dependencies(self, table):
+        """
+        Names of the tables that `query` results for `table` are read from.
+        """
+        try:
+            return datastore_cache.dependencies[table.name]
+        except KeyError:
+            pass
+
+        # Many-to-many relationships are only fetched for the primary table
+        pending = [table] + [
+            relationship.secondary
+            for relationship in self._get_relationships(table).values()
+            if relationship.secondary is not None
+        ]
+        result = set()
+        while pending:
+            t = pending.pop()
+            if t.name not in result:
+                result.add(t.name)
+                for column in t.c:
+                    pending.extend(foreign_key.column.table for foreign_key in column.foreign_keys)
+
+        datastore_cache.dependencies[table.name] = result
+        return result
 
+    async def _queryset_extend(
+        self, rows, extend, extend_context, select, extra_options, extend_batch=False, extend_fields=None,
+    ):
         if extend_context:
             extend_context_value = await self.middleware.call(extend_context, rows, extra_options)
         else:
             extend_context_value = None
 
-        return [
-            await self._extend(data, extend, extend_context, extend_context_value, select)
-            for data in rows
-        ]
+        if extend and extend_batch:
+            args = [rows] + ([extend_context_value] if extend_context else []) + [extend_fields]
+            rows = await self.middleware.call(extend, *args)
+        elif extend:
+            rows = [await self._extend(data, extend, extend_context, extend_context_value) for data in rows]
+
+        if select:
+            rows = do_select(rows, select)
+
+        return rows
 
     def _serialize(self, obj, table, aliases, relationships, field_prefix):
         data = self._serialize_row(obj, table, aliases)
@@ -209,17 +278,11 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
 
         return {self._strip_prefix(k, field_prefix): v for k, v in data.items()}
 
-    async def _extend(self, data, extend, extend_context, extend_context_value, select):
-        if extend:
-            if extend_context:
-                data = await self.middleware.call(extend, data, extend_context_value)
-            else:
-                data = await self.middleware.call(extend, data)
-
-        if not select:
-            return data
+    async def _extend(self, data, extend, extend_context, extend_context_value):
+        if extend_context:
+            return await self.middleware.call(extend, data, extend_context_value)
         else:
-            return do_select([data], select)[0]
+            return await self.middleware.call(extend, data)
 
     def _strip_prefix(self, k, field_prefix):
         return k[len(field_prefix):] if field_prefix and k.startswith(field_prefix) else k
@@ -249,13 +312,16 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
 
         return data
 
-    async def _fetch_many_to_many(self, table, rows):
+    async def _fetch_many_to_many(self, table, rows, fields=None, prefix=None):
         pk = self._get_pk(table)
         pk_values = [row[pk] for row in rows]
 
         relationships = [{} for row in rows]
         if pk_values:
             for relationship_name, relationship in self._get_relationships(table).items():
+                if fields is not None and self._strip_prefix(relationship_name, prefix) not in fields:
+                    continue
+
                 # We can only join by single primary key
                 assert len(relationship.synchronize_pairs) == 1
                 assert len(relationship.secondary_synchronize_pairs) == 1
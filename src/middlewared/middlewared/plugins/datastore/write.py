@@ -1,7 +1,7 @@
 from sqlalchemy import and_, types
 from sqlalchemy.sql import sqltypes
 
-from middlewared.schema import accepts, Any, Bool, Dict, Str
+from middlewared.schema import accepts, Any, Bool, Dict, List, Str
 from middlewared.service import Service
 
 from .filter import FilterMixin
@@ -48,14 +48,7 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         Insert a new entry to `name`.
         """
         table = self._get_table(name)
-        insert, relationships = self._extract_relationships(table, options['prefix'], data)
-
-        for column in table.c:
-            if column.default is not None:
-                insert.setdefault(column.name, column.default.arg)
-            if not column.nullable:
-                if isinstance(column.type, (types.String, types.Text)):
-                    insert.setdefault(column.name, '')
+        insert, relationships = self._insert_values(table, options['prefix'], data)
 
         pk_column = self._get_pk(table)
         return_last_insert_rowid = type(pk_column.type) == sqltypes.Integer
@@ -106,12 +99,7 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         else:
             id_ = id_or_filters
 
-        for column in table.c:
-            if column.foreign_keys:
-                if column.name[:-3] in data:
-                    data[column.name] = data.pop(column.name[:-3])
-
-        update, relationships = self._extract_relationships(table, options['prefix'], data)
+        update, relationships = self._update_values(table, options['prefix'], data)
 
         if update:
             result = await self.middleware.call(
@@ -131,6 +119,104 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
 
         return id_
 
+    @accepts(
+        Str('name'),
+        List('operations'),
+        Dict(
+            'options',
+            Bool('ha_sync', default=True),
+            Str('prefix', default=''),
+            Bool('send_events', default=True),
+        ),
+    )
+    async def bulk_write(self, name, operations, options):
+        """
+        Apply many `operations` to `name` in a single transaction (either all of them are applied or none).
+
+        Each operation is one of:
+        * `["insert", data]`
+        * `["update", id, data]`
+        * `["delete", id]`
+
+        Many-to-many relationships can't be written this way.
+
+        Returns the list of operation results: the primary key of the inserted entry for `insert`, `id` for `update`
+        and `True` for `delete`.
+        """
+        table = self._get_table(name)
+        pk_column = self._get_pk(table)
+
+        statements = []
+        rows = []
+        for operation, *args in operations:
+            if operation == 'insert':
+                data, = args
+                id_ = None
+                values, relationships = self._insert_values(table, options['prefix'], data)
+                statements.append((table.insert().values(**values), None))
+            elif operation == 'update':
+                id_, data = args
+                values, relationships = self._update_values(table, options['prefix'], data.copy())
+                if values:
+                    statements.append((table.update().values(**values).where(pk_column == id_), 1))
+            elif operation == 'delete':
+                id_, = args
+                values, relationships = None, None
+                statements.append((table.delete().where(pk_column == id_), None))
+            else:
+                raise ValueError(f'Invalid bulk write operation: {operation!r}')
+
+            if relationships:
+                raise ValueError('Many-to-many relationships can not be written using bulk write')
+
+            rows.append((operation, id_, values))
+
+        results = iter(await self.middleware.call(
+            'datastore.execute_write_many', statements, {'ha_sync': options['ha_sync']},
+        ))
+
+        return_last_insert_rowid = type(pk_column.type) is sqltypes.Integer
+        ids = []
+        for operation, id_, values in rows:
+            if operation == 'insert':
+                rowid = next(results)
+                id_ = rowid if return_last_insert_rowid else values[pk_column.name]
+                if options['send_events']:
+                    await self.middleware.call('datastore.send_insert_events', name, values)
+            elif operation == 'update':
+                if values:
+                    next(results)
+                    if options['send_events']:
+                        await self.middleware.call('datastore.send_update_events', name, id_)
+            else:
+                next(results)
+                if options['send_events']:
+                    await self.middleware.call('datastore.send_delete_events', name, id_)
+
+            ids.append(True if operation == 'delete' else id_)
+
+        return ids
+
+    def _insert_values(self, table, prefix, data):
+        insert, relationships = self._extract_relationships(table, prefix, data)
+
+        for column in table.c:
+            if column.default is not None:
+                insert.setdefault(column.name, column.default.arg)
+            if not column.nullable:
+                if isinstance(column.type, (types.String, types.Text)):
+                    insert.setdefault(column.name, '')
+
+        return insert, relationships
+
+    def _update_values(self, table, prefix, data):
+        for column in table.c:
+            if column.foreign_keys:
+                if column.name[:-3] in data:
+                    data[column.name] = data.pop(column.name[:-3])
+
+        return self._extract_relationships(table, prefix, data)
+
     def _extract_relationships(self, table, prefix, data):
         relationships = self._get_relationships(table)
 
@@ -24,6 +24,14 @@ def is_iscsi_device(dev):
     return ISCSI_DEV_PATH.match(dev.device_path) is not None
 
 
+def is_ignored_disk(dev):
+    """Return True if the specified pyudev device is not reported by `device.get_disks`."""
+    return (
+        dev.sys_name.startswith(DISKS_TO_IGNORE) or RE_NVME_PRIV.match(dev.sys_name) is not None or
+        is_iscsi_device(dev)
+    )
+
+
 class DeviceService(Service):
 
     DISK_ROTATION_ERROR_LOG_CACHE = set()
@@ -59,9 +67,7 @@ class DeviceService(Service):
         ctx = pyudev.Context()
         disks = {}
         for dev in ctx.list_devices(subsystem='block', DEVTYPE='disk'):
-            if dev.sys_name.startswith(DISKS_TO_IGNORE) or RE_NVME_PRIV.match(dev.sys_name):
-                continue
-            if is_iscsi_device(dev):
+            if is_ignored_disk(dev):
                 continue
 
             try:
@@ -216,6 +222,22 @@ class DeviceService(Service):
         except Exception:
             self.logger.debug('Failed to retrieve disk details for %s', name, exc_info=True)
 
+    @private
+    def get_system_disk(self, name, get_partitions=False):
+        """
+        Same as `get_disk` but only returns the disks that are reported by `get_disks`.
+        """
+        context = pyudev.Context()
+        try:
+            block_device = pyudev.Devices.from_name(context, 'block', name)
+            if block_device.device_type != 'disk' or is_ignored_disk(block_device):
+                return
+            return self.get_disk_details(context, block_device, get_partitions)
+        except pyudev.DeviceNotFoundByNameError:
+            return
+        except Exception:
+            self.logger.debug('Failed to retrieve disk details for %s', name, exc_info=True)
+
     def _get_type_and_rotation_rate(self, disk_data, device_path):
         if disk_data['rota']:
             if self.HOST_TYPE == 'QEMU':
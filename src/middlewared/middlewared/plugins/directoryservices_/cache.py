@@ -1,6 +1,7 @@
 from middlewared.schema import Str, Ref, Int, Dict, Bool, accepts
 from middlewared.service import Service, job
 from middlewared.service_exception import CallError, MatchNotFound
+from middlewared.utils import filter_list
 from middlewared.utils.directoryservices.constants import (
     DSStatus, DSType
 )
@@ -139,13 +140,13 @@ class DSCache(Service):
         Query User / Group cache with `query-filters` and `query-options`.
 
         NOTE: only consumers for this endpoint should be user.query and group.query.
-        query-options (apart from determining whether to include "SMB" information)
-        are not evaluated here because user.query and group.query applies pagination
-        on full results.
+        Results are ordered by id unless `order_by` is specified. user.query and
+        group.query use `offset` / `limit` to retrieve only the part of the requested page
+        that is not filled by local accounts so that only the returned entries are decoded.
         """
         ds = self.middleware.call_sync('directoryservices.status')
         if ds['type'] is None:
-            return []
+            return filter_list([], [], options)
 
         is_name_check = bool(filters and len(filters) == 1 and filters[0][0] in ['username', 'name', 'group'])
         is_id_check = bool(filters and len(filters) == 1 and filters[0][0] in ['uid', 'gid'])
@@ -161,11 +162,9 @@ class DSCache(Service):
                 key: filters[0][2],
             }, {'smb': True})
 
-            return [entry] if entry else []
+            return filter_list([entry] if entry else [], [], options)
 
-        # options must be omitted to defer pagination logic to caller
-        entries = query_cache_entries(IDType[id_type], filters, {})
-        return sorted(entries, key=lambda i: i['id'])
+        return query_cache_entries(IDType[id_type], filters, options)
 
     def idmap_online_check_wait_wbclient(self, job):
         """
@@ -231,8 +230,9 @@ class DSCache(Service):
 
         raise CallError('Timed out while waiting for domain to come online')
 
+    @accepts(Bool('incremental', default=False))
     @job(lock="directoryservices_cache_fill", lock_queue_size=1)
-    def refresh_impl(self, job):
+    def refresh_impl(self, job, incremental):
         """
         Rebuild the directory services cache. This is performed in the following
         situations:
@@ -240,6 +240,10 @@ class DSCache(Service):
         1. User starts a directory service
         2. User triggers manually through API or webui
         3. Once every 24 hours via cronjob
+
+        `incremental` reuses SIDs of users and groups that are already cached rather
+        than resolving every account through the domain controllers again. This is used
+        by the daily cronjob.
         """
 
         ds = self.middleware.call_sync('directoryservices.status')
@@ -271,7 +275,7 @@ class DSCache(Service):
 
         with DSCacheFill() as dc:
             job.set_progress(15, 'Filling cache')
-            dc.fill_cache(job, ds_type, dom_by_sid)
+            dc.fill_cache(job, ds_type, dom_by_sid, incremental)
 
     async def abort_refresh(self):
         cache_job = await self.middleware.call('core.get_jobs', [
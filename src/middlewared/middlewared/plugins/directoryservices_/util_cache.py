@@ -1,12 +1,16 @@
+import bisect
 import enum
 import os
 
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from collections.abc import Iterable
+from dataclasses import dataclass
 from middlewared.utils.directoryservices.constants import (
     DSType
 )
 from middlewared.job import Job
+from middlewared.service_exception import MatchNotFound
 from middlewared.utils import filter_list
 from middlewared.utils.itertools import batched
 from middlewared.utils.nss import pwd, grp
@@ -29,7 +33,7 @@ from middlewared.utils.tdb import (
     TDBHandle,
     TDBOptions
 )
-from threading import Lock
+from threading import local, Lock
 from uuid import uuid4
 
 # Update progress of job every nth user / group, we expect possibly hundreds to
@@ -39,10 +43,27 @@ from uuid import uuid4
 # first is as expensive as generating the cache itself.
 LOG_CACHE_ENTRY_INTERVAL = 10  # Update progress of job every nth user / group
 
+# Number of threads resolving SIDs for batches of NSS entries during cache fill. Every
+# thread uses its own idmap client.
+FILL_WORKERS = 4
+
 TDB_LOCKS = defaultdict(Lock)
 
 CACHE_OPTIONS = TDBOptions(TDBPathType.PERSISTENT, TDBDataType.JSON)
 
+# Cache files written by older versions lack `SID_` index keys
+CACHE_VERSION_KEY = 'CACHE_VERSION'
+CACHE_VERSION = 2
+
+# Number of cache entries that are decoded and filtered at once while looking for a page of results
+QUERY_BATCH_SIZE = 100
+
+ID_FIELDS = {IDType.USER: 'uid', IDType.GROUP: 'gid'}
+NAME_FIELDS = {IDType.USER: ('username',), IDType.GROUP: ('name', 'group')}
+
+# DSCacheFile -> (TDBHandle, sorted list of all ids in the cache file)
+ID_INDEXES = {}
+
 
 class DSCacheFile(enum.Enum):
     USER = 'directoryservice_cache_user'
@@ -67,8 +88,10 @@ class DSCacheFill:
     """
     users_handle = None
     groups_handle = None
+    idmap_cls = None
 
     def __enter__(self):
+        self.thread_state = local()
         file_prefix = f'directory_service_cache_tmp_{uuid4()}'
         self.users_handle = TDBHandle(f'{file_prefix}_user', CACHE_OPTIONS)
         self.groups_handle = TDBHandle(f'{file_prefix}_group', CACHE_OPTIONS)
@@ -164,17 +187,56 @@ class DSCacheFill:
 
         return nss_entries
 
+    def _resolve_sids(
+        self,
+        nss_entries: list,
+        dom_by_sid: dict,
+        previous: dict
+    ) -> list[dict]:
+        """
+        Add SID information to a batch of entries. This runs in the thread pool of
+        `fill_cache()`.
+
+        `previous` - entries of the cache that is being refreshed keyed by id. Entries
+        whose id and name have not changed since then keep their SID and are not
+        looked up again.
+        """
+        to_resolve = []
+        reused = []
+        for entry in nss_entries:
+            cached = previous.get(entry['id'])
+            if cached is not None and cached['name'] == entry['name'] and cached['sid']:
+                entry['sid'] = cached['sid']
+                entry['id_type_both'] = cached['id_type_both']
+                reused.append(entry)
+            else:
+                to_resolve.append(entry)
+
+        if to_resolve:
+            if (idmap_ctx := getattr(self.thread_state, 'idmap_ctx', None)) is None:
+                idmap_ctx = self.thread_state.idmap_ctx = self.idmap_cls()
+
+            for entry in self._add_sid_info_to_entries(idmap_ctx, to_resolve, dom_by_sid):
+                if entry['domain_info']:
+                    entry['id_type_both'] = entry['domain_info']['idmap_backend'] in ('AUTORID', 'RID')
+
+                reused.append(entry)
+
+        return reused
+
     def _get_entries_for_cache(
         self,
-        idmap_ctx: idmap_winbind.WBClient | idmap_sss.SSSClient | None,
+        executor: ThreadPoolExecutor | None,
         nss_module: NssModule,
         entry_type: IDType,
-        dom_by_sid: dict
+        dom_by_sid: dict,
+        previous: dict
     ) -> Iterable[dict]:
         """
         This method yields the users or groups in batches of 100 entries.
         If the directory service supports SIDs then these will also be added
-        to the results.
+        to the results. SID lookups for up to `FILL_WORKERS` batches are
+        performed in parallel while further entries are read from NSS.
         """
         match entry_type:
             case IDType.USER:
@@ -184,44 +246,97 @@ class DSCacheFill:
             case _:
                 raise ValueError(f'{entry_type}: unexpected `entry_type`')
 
+        pending = deque()
         nss = nss_fn(module=nss_module.name)
         for entries in batched(nss, MAX_REQUEST_LENGTH):
             out = []
             for entry in entries:
                 out.append({
                     'id': entry.pw_uid if entry_type is IDType.USER else entry.gr_gid,
+                    'name': entry.pw_name if entry_type is IDType.USER else entry.gr_name,
                     'sid': None,
                     'nss': entry,
                     'id_type': entry_type.name,
-                    'domain_info': None
+                    'domain_info': None,
+                    'id_type_both': False,
                 })
 
             # Depending on the directory sevice we may need to add SID
             # information to the NSS entries.
-            if idmap_ctx is None:
+            if executor is None:
                 yield out
-            else:
-                yield self._add_sid_info_to_entries(idmap_ctx, out, dom_by_sid)
+                continue
+
+            pending.append(executor.submit(self._resolve_sids, out, dom_by_sid, previous))
+            if len(pending) > FILL_WORKERS:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
 
     def fill_cache(
         self,
         job: Job,
         ds_type: DSType,
-        dom_by_sid: dict
+        dom_by_sid: dict,
+        incremental: bool = False
     ) -> None:
+        """
+        Fill the temporary caches from NSS and rename them over the ones in-use by
+        middleware.
+
+        `incremental` - reuse SIDs of the accounts in the current caches whose id and
+        name have not changed instead of resolving them again. Accounts that were
+        added, renamed or removed in the directory are still picked up because NSS
+        is always enumerated in full.
+        """
         match ds_type:
             case DSType.AD:
                 nss_module = NssModule.WINBIND
-                idmap_ctx = idmap_winbind.WBClient()
+                self.idmap_cls = idmap_winbind.WBClient
             case DSType.LDAP:
                 nss_module = NssModule.SSS
-                idmap_ctx = None
+                self.idmap_cls = None
             case DSType.IPA:
                 nss_module = NssModule.SSS
-                idmap_ctx = idmap_sss.SSSClient()
+                self.idmap_cls = idmap_sss.SSSClient
             case _:
                 raise ValueError(f'{ds_type}: unknown DSType')
 
+        if incremental and self.idmap_cls is not None:
+            job.set_progress(30, 'Reading current cache')
+            previous_users = _get_previous_entries(IDType.USER)
+            previous_groups = _get_previous_entries(IDType.GROUP)
+        else:
+            previous_users = previous_groups = {}
+
+        if self.idmap_cls is not None:
+            executor = ThreadPoolExecutor(FILL_WORKERS, thread_name_prefix='dscache_fill')
+        else:
+            executor = None
+
+        try:
+            user_count, group_count = self._fill_cache_entries(
+                job, executor, nss_module, dom_by_sid, previous_users, previous_groups
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        self.users_handle.store(CACHE_VERSION_KEY, CACHE_VERSION)
+        self.groups_handle.store(CACHE_VERSION_KEY, CACHE_VERSION)
+        job.set_progress(100, f'Cached {user_count} users and {group_count} groups.')
+        self._commit()
+
+    def _fill_cache_entries(
+        self,
+        job: Job,
+        executor: ThreadPoolExecutor | None,
+        nss_module: NssModule,
+        dom_by_sid: dict,
+        previous_users: dict,
+        previous_groups: dict
+    ) -> tuple[int, int]:
         user_count = 0
         group_count = 0
 
@@ -229,18 +344,15 @@ class DSCacheFill:
 
         # First grab batches of 100 entries
         for users in self._get_entries_for_cache(
-            idmap_ctx,
+            executor,
             nss_module,
             IDType.USER,
-            dom_by_sid
+            dom_by_sid,
+            previous_users
         ):
+            ops = []
             # Now iterate members of 100 for insertion
             for u in users:
-                if u['domain_info']:
-                    id_type_both = u['domain_info']['idmap_backend'] in ('AUTORID', 'RID')
-                else:
-                    id_type_both = False
-
                 user_data = u['nss']
                 entry = {
                     'id': BASE_SYNTHETIC_DATASTORE_ID + user_data.pw_uid,
@@ -263,7 +375,7 @@ class DSCacheFill:
                     'immutable': True,
                     'twofactor_auth_configured': False,
                     'local': False,
-                    'id_type_both': id_type_both,
+                    'id_type_both': u['id_type_both'],
                     'smb': u['sid'] is not None,
                     'sid': u['sid'],
                     'roles': [],
@@ -274,23 +386,23 @@ class DSCacheFill:
                     job.set_progress(50, f'{user_data.pw_name}: adding user to cache. User count: {user_count}')
 
                 # Store forward and reverse entries
-                _tdb_add_entry(self.users_handle, user_data.pw_uid, user_data.pw_name, entry)
+                ops.extend(_cache_entry_ops(user_data.pw_uid, user_data.pw_name, entry))
                 user_count += 1
 
+            # Write the whole batch in a single transaction
+            self.users_handle.batch_op(ops)
+
         job.set_progress(70, 'Preparing to add groups to cache')
         # First grab batches of 100 entries
         for groups in self._get_entries_for_cache(
-            idmap_ctx,
+            executor,
             nss_module,
             IDType.GROUP,
-            dom_by_sid
+            dom_by_sid,
+            previous_groups
         ):
+            ops = []
             for g in groups:
-                if g['domain_info']:
-                    id_type_both = g['domain_info']['idmap_backend'] in ('AUTORID', 'RID')
-                else:
-                    id_type_both = False
-
                 group_data = g['nss']
                 entry = {
                     'id': BASE_SYNTHETIC_DATASTORE_ID + group_data.gr_gid,
@@ -302,7 +414,7 @@ class DSCacheFill:
                     'sudo_commands_nopasswd': [],
                     'users': [],
                     'local': False,
-                    'id_type_both': id_type_both,
+                    'id_type_both': g['id_type_both'],
                     'smb': g['sid'] is not None,
                     'sid': g['sid'],
                     'roles': []
@@ -311,28 +423,41 @@ class DSCacheFill:
                 if group_count % LOG_CACHE_ENTRY_INTERVAL == 0:
                     job.set_progress(80, f'{group_data.gr_name}: adding group to cache. Group count: {group_count}')
 
-                _tdb_add_entry(self.groups_handle, group_data.gr_gid, group_data.gr_name, entry)
+                ops.extend(_cache_entry_ops(group_data.gr_gid, group_data.gr_name, entry))
                 group_count += 1
 
-        job.set_progress(100, f'Cached {user_count} users and {group_count} groups.')
-        self._commit()
+            self.groups_handle.batch_op(ops)
 
+        return user_count, group_count
 
-def _tdb_add_entry(
-    handle: TDBHandle,
-    xid: int,
-    name: str,
-    entry: dict
-) -> None:
-    """
-    Unlocked variant of adding cache entries. Should only be performed during initial cache fill.
-    Performed without transaction as well because file will be removed in case of failure.
 
-    Raises:
-        RuntimeError via `tdb` library
+def _get_previous_entries(id_type: IDType) -> dict:
+    """
+    SID information of the entries in the cache file in-use by middleware keyed by id. Used
+    for incremental cache refresh.
     """
-    handle.store(f'ID_{xid}', entry)
-    handle.store(f'NAME_{name}', entry)
+    id_field = ID_FIELDS[id_type]
+    name_field = NAME_FIELDS[id_type][0]
+    with get_tdb_handle(DSCacheFile[id_type.name].value, CACHE_OPTIONS) as handle:
+        return {
+            entry[id_field]: {
+                'name': entry[name_field],
+                'sid': entry['sid'],
+                'id_type_both': entry.get('id_type_both', False),
+            }
+            for entry in handle.entries(include_keys=False, key_prefix='ID_')
+        }
+
+
+def _cache_entry_ops(xid: int, name: str, entry: dict) -> list[TDBBatchOperation]:
+    ops = [
+        TDBBatchOperation(action=TDBBatchAction.SET, key=f'ID_{xid}', value=entry),
+        TDBBatchOperation(action=TDBBatchAction.SET, key=f'NAME_{name}', value=entry),
+    ]
+    if entry['sid']:
+        ops.append(TDBBatchOperation(action=TDBBatchAction.SET, key=f'SID_{entry["sid"]}', value=xid))
+
+    return ops
 
 
 def insert_cache_entry(
@@ -348,11 +473,15 @@ def insert_cache_entry(
     Raises:
         RuntimeError via `tdb` library
     """
+    ops = _cache_entry_ops(xid, name, entry)
+
     with get_tdb_handle(DSCacheFile[id_type.name].value, CACHE_OPTIONS) as handle:
-        handle.batch_op([
-            TDBBatchOperation(action=TDBBatchAction.SET, key=f'ID_{xid}', value=entry),
-            TDBBatchOperation(action=TDBBatchAction.SET, key=f'NAME_{xid}', value=entry),
-        ])
+        handle.batch_op(ops)
+
+        if (index := ID_INDEXES.get(DSCacheFile[id_type.name])) is not None and index[0] is handle:
+            ids = index[1]
+            if (i := bisect.bisect_left(ids, xid)) == len(ids) or ids[i] != xid:
+                ids.insert(i, xid)
 
 
 def retrieve_cache_entry(
@@ -376,10 +505,209 @@ def retrieve_cache_entry(
         return handle.get(key)
 
 
+@dataclass(slots=True)
+class CacheQueryPlan:
+    """
+    Constraints on cache entries that can be resolved using the cache indexes. `None` means no constraint.
+    """
+    ids: set | None = None
+    min_id: int | None = None
+    max_id: int | None = None
+    names: set | None = None
+    sids: set | None = None
+
+    def intersect(self, attr, values):
+        current = getattr(self, attr)
+        setattr(self, attr, set(values) if current is None else current & set(values))
+
+    def matches_id(self, xid):
+        return (
+            (self.ids is None or xid in self.ids) and
+            (self.min_id is None or xid >= self.min_id) and
+            (self.max_id is None or xid <= self.max_id)
+        )
+
+    def matches(self, xid, name, sid):
+        return (
+            self.matches_id(xid) and
+            (self.names is None or name in self.names) and
+            (self.sids is None or sid in self.sids)
+        )
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _plan_query(id_type: IDType, filters: list) -> tuple[CacheQueryPlan | None, list]:
+    """
+    Split top-level `filters` into constraints that can be resolved using the cache indexes and the remaining filters
+    that have to be evaluated on decoded entries.
+
+    Returns `None` instead of the plan if the filters can not match any directory services entry.
+    """
+    plan = CacheQueryPlan()
+    remaining = []
+    for f in filters:
+        if len(f) != 3:
+            remaining.append(f)
+            continue
+
+        field, op, value = f
+        offset = 0
+        if field == 'id':
+            # Synthetic datastore id
+            field, offset = ID_FIELDS[id_type], BASE_SYNTHETIC_DATASTORE_ID
+
+        if field == ID_FIELDS[id_type] and _is_int(value):
+            value -= offset
+            match op:
+                case '=':
+                    plan.intersect('ids', [value])
+                case '>':
+                    plan.min_id = max(plan.min_id or 0, value + 1)
+                case '>=':
+                    plan.min_id = max(plan.min_id or 0, value)
+                case '<':
+                    plan.max_id = value - 1 if plan.max_id is None else min(plan.max_id, value - 1)
+                case '<=':
+                    plan.max_id = value if plan.max_id is None else min(plan.max_id, value)
+                case _:
+                    remaining.append(f)
+        elif field == ID_FIELDS[id_type] and op == 'in' and isinstance(value, list) and all(map(_is_int, value)):
+            plan.intersect('ids', [v - offset for v in value])
+        elif field in NAME_FIELDS[id_type] and op == '=' and isinstance(value, str):
+            plan.intersect('names', [value])
+        elif field in NAME_FIELDS[id_type] and op == 'in' and isinstance(value, list):
+            plan.intersect('names', value)
+        elif field == 'sid' and op == '=' and isinstance(value, str):
+            plan.intersect('sids', [value])
+        elif field == 'sid' and op == 'in' and isinstance(value, list):
+            plan.intersect('sids', value)
+        elif field in ('local', 'builtin') and op in ('=', '!=') and isinstance(value, bool):
+            # Directory services entries are neither local nor builtin
+            if (op == '=') == value:
+                return None, []
+        else:
+            remaining.append(f)
+
+    return plan, remaining
+
+
+def _id_index(id_type: IDType, handle: TDBHandle) -> list:
+    """
+    Sorted ids of all entries in the cache file. The index is built from the TDB keys (no entries are decoded) once
+    per cache file and is kept up to date by `insert_cache_entry`. Must be called with the TDB handle lock held.
+    """
+    cache_file = DSCacheFile[id_type.name]
+    if (index := ID_INDEXES.get(cache_file)) is not None and index[0] is handle:
+        return index[1]
+
+    ids = sorted(int(key[len('ID_'):]) for key in handle.keys(key_prefix='ID_'))
+    ID_INDEXES[cache_file] = (handle, ids)
+    return ids
+
+
+def _candidate_ids(id_type: IDType, handle: TDBHandle, plan: CacheQueryPlan) -> tuple[list | None, bool]:
+    """
+    Sorted ids of cache entries that can match `plan` (or `None` if they can only be found by name) and whether all of
+    these entries are known to match it.
+    """
+    if plan.names is not None:
+        return None, False
+
+    if plan.sids is not None:
+        try:
+            has_sid_index = handle.get(CACHE_VERSION_KEY) >= CACHE_VERSION
+        except MatchNotFound:
+            has_sid_index = False
+
+        if has_sid_index:
+            ids = set()
+            for sid in plan.sids:
+                try:
+                    ids.add(handle.get(f'SID_{sid}'))
+                except MatchNotFound:
+                    pass
+
+            return sorted(filter(plan.matches_id, ids)), True
+
+    index = _id_index(id_type, handle)
+    exact = plan.sids is None
+    if plan.ids is not None:
+        ids = []
+        for xid in sorted(filter(plan.matches_id, plan.ids)):
+            if (i := bisect.bisect_left(index, xid)) < len(index) and index[i] == xid:
+                ids.append(xid)
+
+        return ids, exact
+
+    start = 0 if plan.min_id is None else bisect.bisect_left(index, plan.min_id)
+    end = len(index) if plan.max_id is None else bisect.bisect_right(index, plan.max_id)
+    return index[start:end], exact
+
+
+def _candidate_entries(id_type: IDType, handle: TDBHandle, plan: CacheQueryPlan, ids: list | None) -> Iterable[dict]:
+    """
+    Decode cache entries that match `plan` ordered by id.
+    """
+    id_field = ID_FIELDS[id_type]
+    name_field = NAME_FIELDS[id_type][0]
+    if ids is None:
+        entries = []
+        for name in plan.names:
+            try:
+                entries.append(handle.get(f'NAME_{name}'))
+            except MatchNotFound:
+                pass
+
+        entries.sort(key=lambda entry: entry[id_field])
+    else:
+        entries = (handle.get(f'ID_{xid}') for xid in ids)
+
+    for entry in entries:
+        if plan.matches(entry[id_field], entry[name_field], entry['sid']):
+            yield entry
+
+
 def query_cache_entries(
     id_type: IDType,
     filters: list,
     options: dict
-) -> list:
+) -> list | dict | int:
+    """
+    Query the `id_type` cache with `query-filters` and `query-options`. Entries are ordered by id unless `order_by`
+    is specified.
+
+    Filters on id, name, SID and local / builtin flags are resolved using cache indexes and only the entries that can
+    match them are decoded. If results are ordered by id then decoding stops as soon as the requested page is complete.
+    """
+    options = options or {}
+    id_field = ID_FIELDS[id_type]
+    plan, filters = _plan_query(id_type, filters)
+
     with get_tdb_handle(DSCacheFile[id_type.name].value, CACHE_OPTIONS) as handle:
-        return filter_list(handle.entries(include_keys=False, key_prefix='ID_'), filters, options)
+        if plan is None:
+            return filter_list([], [], options)
+
+        ids, exact = _candidate_ids(id_type, handle, plan)
+        if options.get('count') and not filters and exact:
+            return len(ids)
+
+        entries = _candidate_entries(id_type, handle, plan, ids)
+        if options.get('count') or options.get('order_by', []) not in ([], ['id'], [id_field]):
+            return filter_list(entries, filters, options)
+
+        if options.get('get'):
+            offset, limit = 0, 1
+        else:
+            offset, limit = options.get('offset', 0), options.get('limit', 0)
+
+        matched = []
+        for batch in batched(entries, QUERY_BATCH_SIZE):
+            matched.extend(filter_list(batch, filters) if filters else batch)
+            if limit and len(matched) >= offset + limit:
+                break
+
+    page = matched[offset:offset + limit] if limit else matched[offset:]
+    return filter_list(page, [], {'select': options.get('select', []), 'get': options.get('get', False)})
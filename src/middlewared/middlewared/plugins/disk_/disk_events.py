@@ -1,5 +1,10 @@
 from middlewared.utils.disks import DISKS_TO_IGNORE
 
+# Properties of the disk `change` events that are sent when the disk itself might have changed (i.e. it was resized or
+# reformatted). Other `change` events are sent when the partition table is re-read (i.e. after formatting the disk) and
+# don't affect anything that is synced.
+CHANGE_EVENT_PROPERTIES = ('DISK_MEDIA_CHANGE', 'RESIZE')
+
 
 async def added_disk(middleware, disk_name):
     await middleware.call('disk.sync', disk_name)
@@ -7,8 +12,12 @@ async def added_disk(middleware, disk_name):
     await middleware.call('alert.oneshot_delete', 'SMART', disk_name)
 
 
+async def changed_disk(middleware, disk_name):
+    await middleware.call('disk.sync', disk_name)
+
+
 async def remove_disk(middleware, disk_name):
-    await (await middleware.call('disk.sync_all')).wait()
+    await middleware.call('disk.sync_removed', disk_name)
     await middleware.call('alert.oneshot_delete', 'SMART', disk_name)
 
 
@@ -22,6 +31,9 @@ async def udev_block_devices_hook(middleware, data):
 
     if data['ACTION'] == 'add':
         await added_disk(middleware, data['SYS_NAME'])
+    elif data['ACTION'] == 'change':
+        if any(data.get(k) == '1' for k in CHANGE_EVENT_PROPERTIES):
+            await changed_disk(middleware, data['SYS_NAME'])
     elif data['ACTION'] == 'remove':
         await remove_disk(middleware, data['SYS_NAME'])
 
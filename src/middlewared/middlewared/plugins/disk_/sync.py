@@ -1,3 +1,4 @@
+import asyncio
 import re
 from datetime import timedelta
 
@@ -10,55 +11,170 @@ from middlewared.utils.time_utils import utc_now
 RE_IDENT = re.compile(r'^\{(?P<type>.+?)\}(?P<value>.+)$')
 
 
+class DiskInventory:
+    """
+    Index of the disks that are present in the system: device name <-> database identifier.
+    """
+
+    def __init__(self, names):
+        self.names = dict(names)
+        self.identifiers = {ident: name for name, ident in self.names.items()}
+
+    def get_identifier(self, name):
+        return self.names.get(name)
+
+    def add(self, name, ident):
+        self.remove(name)
+        self.remove(self.identifiers.get(ident))
+        self.names[name] = ident
+        self.identifiers[ident] = name
+
+    def remove(self, name):
+        if (ident := self.names.pop(name, None)) is not None:
+            self.identifiers.pop(ident, None)
+
+
 class DiskService(Service, ServiceChangeMixin):
 
     DISK_EXPIRECACHE_DAYS = 7
+    # Database fields the services restarted by `restart_services_after_sync` depend on
+    SERVICES_FIELDS = ('disk_name', 'disk_serial', 'disk_lunid', 'disk_subsystem', 'disk_bus', 'disk_expiretime')
+
+    # `DiskInventory` of the disks that are present in the system. Loaded from the database on first use and updated
+    # by every disk sync.
+    inventory = None
+    inventory_lock = asyncio.Lock()
+    # Names of the present disks that are formatted with DIF (reported by a single `DifFormatted` alert). Replaced
+    # (never modified in place) by every disk sync.
+    dif_formatted = set()
 
     @private
     @accepts(Str('name'))
     async def sync(self, name):
         """
         Syncs a disk `name` with the database cache.
+
+        Only the database entries of this disk are written and the services are only restarted if the fields they
+        depend on have changed.
         """
         if await self.middleware.call('failover.licensed'):
             if await self.middleware.call('failover.status') == 'BACKUP':
                 return
 
-        disks = await self.middleware.call('device.get_disks')
-        # Abort if the disk is not recognized as an available disk
-        if name not in disks:
-            return
-        ident = await self.middleware.call('disk.device_to_identifier', name, disks)
-        qs = await self.middleware.call(
-            'datastore.query', 'storage.disk', [('disk_identifier', '=', ident)], {'order_by': ['disk_expiretime']}
-        )
-        if ident and qs:
-            disk = qs[0]
-            new = False
-        else:
-            new = True
-            qs = await self.middleware.call('datastore.query', 'storage.disk', [('disk_name', '=', name)])
+        async with self.inventory_lock:
+            device = await self.middleware.call('device.get_system_disk', name, True)
+            # Abort if the disk is not recognized as an available disk
+            if device is None:
+                return
+
+            inventory = await self.get_inventory()
+            ident = dev_to_ident(name, {name: device})
+            qs = await self.middleware.call(
+                'datastore.query', 'storage.disk',
+                [['OR', [('disk_identifier', '=', ident), ('disk_name', '=', name)]]],
+                {'order_by': ['disk_expiretime']},
+            )
+
+            operations = []
+            expired = False
+            disk = None
             for i in qs:
-                i['disk_expiretime'] = utc_now() + timedelta(days=self.DISK_EXPIRECACHE_DAYS)
-                await self.middleware.call('datastore.update', 'storage.disk', i['disk_identifier'], i)
-            disk = {'disk_identifier': ident}
+                if ident and i['disk_identifier'] == ident:
+                    disk = disk or i
+                elif not i['disk_expiretime']:
+                    # Another disk was known by this name (e.g. it was replaced)
+                    i['disk_expiretime'] = utc_now() + timedelta(days=self.DISK_EXPIRECACHE_DAYS)
+                    operations.append(['update', i['disk_identifier'], i])
+                    inventory.remove(i['disk_name'])
+                    expired = True
+
+            if disk is not None:
+                new = False
+            else:
+                new = True
+                disk = {'disk_identifier': ident}
 
-        disk.update({'disk_name': name, 'disk_expiretime': None})
+            original_disk = disk.copy()
+            disk.update({'disk_name': name, 'disk_expiretime': None})
+            self._map_device_disk_to_db(disk, device)
 
-        self._map_device_disk_to_db(disk, disks[name])
+            if new:
+                operations.append(['insert', disk])
+            elif self._disk_changed(disk, original_disk):
+                operations.append(['update', disk['disk_identifier'], disk])
 
-        if not new:
-            await self.middleware.call('datastore.update', 'storage.disk', disk['disk_identifier'], disk)
-        else:
-            disk['disk_identifier'] = await self.middleware.call('datastore.insert', 'storage.disk', disk)
+            if operations:
+                await self.middleware.call('datastore.bulk_write', 'storage.disk', operations, {})
 
-        if disks[name]['dif']:
-            await self.middleware.call('alert.oneshot_create', 'DifFormatted', [name])
-        else:
-            await self.middleware.call('alert.oneshot_delete', 'DifFormatted', None)
+            inventory.add(name, disk['disk_identifier'])
+
+            if device['dif']:
+                await self.set_dif_formatted(self.dif_formatted | {name})
+            else:
+                await self.set_dif_formatted(self.dif_formatted - {name})
+
+        if new or expired or self._services_fields_changed(disk, original_disk):
+            await self.restart_services_after_sync()
+
+    @private
+    async def sync_removed(self, name):
+        """
+        Marks disk `name` that has been removed from the system to expire in the database cache.
+        """
+        if await self.middleware.call('failover.licensed'):
+            if await self.middleware.call('failover.status') == 'BACKUP':
+                return
+
+        async with self.inventory_lock:
+            inventory = await self.get_inventory()
+            if (ident := inventory.get_identifier(name)) is None:
+                return
+
+            if await self.middleware.call('device.get_system_disk', name) is not None:
+                # The name has already been taken by another disk that will be synced on its own
+                return
+
+            inventory.remove(name)
+            await self.set_dif_formatted(self.dif_formatted - {name})
+
+            qs = await self.middleware.call(
+                'datastore.query', 'storage.disk', [('disk_identifier', '=', ident), ('disk_expiretime', '=', None)],
+            )
+            if not qs:
+                return
+
+            disk = qs[0]
+            disk['disk_expiretime'] = utc_now() + timedelta(days=self.DISK_EXPIRECACHE_DAYS)
+            await self.middleware.call('datastore.bulk_write', 'storage.disk', [['update', ident, disk]], {})
 
         await self.restart_services_after_sync()
 
+    @private
+    async def get_inventory(self):
+        if self.inventory is None:
+            self.inventory = DiskInventory({
+                disk['disk_name']: disk['disk_identifier']
+                for disk in await self.middleware.call(
+                    'datastore.query', 'storage.disk', [('disk_expiretime', '=', None), ('disk_name', '!=', None)],
+                )
+            })
+
+        return self.inventory
+
+    @private
+    async def set_dif_formatted(self, dif_formatted):
+        """
+        Updates the `DifFormatted` alert if the set of DIF formatted disks has changed.
+        """
+        if dif_formatted == self.dif_formatted:
+            return
+
+        self.dif_formatted = dif_formatted
+        if dif_formatted:
+            await self.middleware.call('alert.oneshot_create', 'DifFormatted', sorted(dif_formatted))
+        else:
+            await self.middleware.call('alert.oneshot_delete', 'DifFormatted', None)
+
     @private
     def log_disk_info(self, sys_disks):
         number_of_disks = len(sys_disks)
@@ -115,6 +231,41 @@ class DiskService(Service, ServiceChangeMixin):
             if status == 'BACKUP':
                 return
 
+        # Single disk syncs must not run between reading and writing the disks (and the inventory) here
+        self.middleware.run_coroutine(self.inventory_lock.acquire())
+        try:
+            changed, deleted = self._sync_all_disks(job)
+        finally:
+            self.middleware.loop.call_soon_threadsafe(self.inventory_lock.release)
+
+        if changed or deleted:
+            job.set_progress(92, 'Restarting necessary services')
+            self.middleware.call_sync('disk.restart_services_after_sync')
+
+            # we query the db again since we've made changes to it
+            job.set_progress(94, 'Emitting disk events')
+            disks = {i['disk_identifier']: i for i in self.middleware.call_sync('datastore.query', 'storage.disk')}
+            for change in changed:
+                self.middleware.send_event('disk.query', 'CHANGED', id=change, fields=disks[change])
+            for delete in deleted:
+                self.middleware.send_event('disk.query', 'REMOVED', id=delete)
+
+        if opts['zfs_guid']:
+            job.set_progress(95, 'Synchronizing ZFS GUIDs')
+            self.middleware.call_sync('disk.sync_all_zfs_guid')
+
+        if licensed and status == 'MASTER':
+            job.set_progress(96, 'Synchronizing database to standby controller')
+            # there could be, literally, > 1k database changes in this method on large systems
+            # so we're not sync'ing these db changes synchronously. Instead we're sync'ing the
+            # entire database to the remote node after we're done. The (potential) speed
+            # improvement this provides is substantial
+            self.middleware.call_sync('failover.datastore.force_send')
+
+        job.set_progress(100, 'Syncing all disks complete')
+        return 'OK'
+
+    def _sync_all_disks(self, job):
         job.set_progress(10, 'Enumerating system disks')
         sys_disks = self.middleware.call_sync('device.get_disks', True)
         number_of_disks = self.log_disk_info(sys_disks)
@@ -123,6 +274,10 @@ class DiskService(Service, ServiceChangeMixin):
         db_disks = self.middleware.call_sync('datastore.query', 'storage.disk', [], {'order_by': ['disk_expiretime']})
 
         options = {'send_events': False, 'ha_sync': False}
+        # All database changes are written at once in a single transaction
+        operations = []
+        # Database disks that have not been deleted, by identifier
+        idents = {}
         seen_disks = {}
         changed = set()
         deleted = set()
@@ -141,9 +296,7 @@ class DiskService(Service, ServiceChangeMixin):
                 # 2. or can't translate device to identifier
                 if not disk['disk_expiretime']:
                     disk['disk_expiretime'] = utc_now() + timedelta(days=self.DISK_EXPIRECACHE_DAYS)
-                    self.middleware.call_sync(
-                        'datastore.update', 'storage.disk', disk['disk_identifier'], disk, options
-                    )
+                    operations.append(['update', disk['disk_identifier'], disk.copy()])
                     changed.add(disk['disk_identifier'])
                 elif disk['disk_expiretime'] < utc_now():
                     # Disk expire time has surpassed, go ahead and remove it
@@ -152,8 +305,11 @@ class DiskService(Service, ServiceChangeMixin):
                             'kmip.reset_sed_disk_password', disk['disk_identifier'], disk['disk_kmip_uuid'],
                             background=True
                         )
-                    self.middleware.call_sync('datastore.delete', 'storage.disk', disk['disk_identifier'], options)
+                    operations.append(['delete', disk['disk_identifier']])
                     deleted.add(disk['disk_identifier'])
+                    continue
+
+                idents[disk['disk_identifier']] = disk
                 continue
             else:
                 disk['disk_expiretime'] = None
@@ -170,22 +326,19 @@ class DiskService(Service, ServiceChangeMixin):
                 disk['disk_expiretime'] = utc_now() + timedelta(days=self.DISK_EXPIRECACHE_DAYS)
 
             if self._disk_changed(disk, original_disk):
-                self.middleware.call_sync('datastore.update', 'storage.disk', disk['disk_identifier'], disk, options)
+                operations.append(['update', disk['disk_identifier'], disk.copy()])
                 changed.add(disk['disk_identifier'])
 
+            idents[disk['disk_identifier']] = disk
             seen_disks[name] = disk
 
-        qs = None
         progress_percent = 70
         for name in filter(lambda x: x not in seen_disks, sys_disks):
             progress_percent += increment
             disk_identifier = self.dev_to_ident(name, sys_disks)
-            if qs is None:
-                qs = self.middleware.call_sync('datastore.query', 'storage.disk')
 
-            if disk := [i for i in qs if i['disk_identifier'] == disk_identifier]:
+            if (disk := idents.get(disk_identifier)) is not None:
                 new = False
-                disk = disk[0]
                 job.set_progress(progress_percent, f'Updating disk {name!r}')
             else:
                 new = True
@@ -201,50 +354,41 @@ class DiskService(Service, ServiceChangeMixin):
 
             if not new:
                 if self._disk_changed(disk, original_disk):
-                    self.middleware.call_sync(
-                        'datastore.update', 'storage.disk', disk['disk_identifier'], disk, options
-                    )
+                    operations.append(['update', disk['disk_identifier'], disk.copy()])
                     changed.add(disk['disk_identifier'])
             else:
-                self.middleware.call_sync('datastore.insert', 'storage.disk', disk, options)
+                operations.append(['insert', disk.copy()])
+                idents[disk['disk_identifier']] = disk
                 changed.add(disk['disk_identifier'])
 
+        if operations:
+            job.set_progress(90, f'Writing {len(operations)} disk changes to the database')
+            self.middleware.call_sync('datastore.bulk_write', 'storage.disk', operations, options)
+
+        self.inventory = DiskInventory({
+            disk['disk_name']: ident for ident, disk in idents.items()
+            if disk['disk_name'] and not disk.get('disk_expiretime')
+        })
+        self.dif_formatted = set(dif_formatted_disks)
+
         if dif_formatted_disks:
             self.middleware.call_sync('alert.oneshot_create', 'DifFormatted', dif_formatted_disks)
         else:
             self.middleware.call_sync('alert.oneshot_delete', 'DifFormatted', None)
 
-        if changed or deleted:
-            job.set_progress(92, 'Restarting necessary services')
-            self.middleware.call_sync('disk.restart_services_after_sync')
-
-            # we query the db again since we've made changes to it
-            job.set_progress(94, 'Emitting disk events')
-            disks = {i['disk_identifier']: i for i in self.middleware.call_sync('datastore.query', 'storage.disk')}
-            for change in changed:
-                self.middleware.send_event('disk.query', 'CHANGED', id=change, fields=disks[change])
-            for delete in deleted:
-                self.middleware.send_event('disk.query', 'REMOVED', id=delete)
-
-        if opts['zfs_guid']:
-            job.set_progress(95, 'Synchronizing ZFS GUIDs')
-            self.middleware.call_sync('disk.sync_all_zfs_guid')
-
-        if licensed and status == 'MASTER':
-            job.set_progress(96, 'Synchronizing database to standby controller')
-            # there could be, literally, > 1k database changes in this method on large systems
-            # so we're not sync'ing these db changes synchronously. Instead we're sync'ing the
-            # entire database to the remote node after we're done. The (potential) speed
-            # improvement this provides is substantial
-            self.middleware.call_sync('failover.datastore.force_send')
-
-        job.set_progress(100, 'Syncing all disks complete')
-        return 'OK'
+        return changed, deleted
 
     def _disk_changed(self, disk, original_disk):
         # storage_disk.disk_size is a string
         return dict(disk, disk_size=None if disk.get('disk_size') is None else str(disk['disk_size'])) != original_disk
 
+    def _services_fields_changed(self, disk, original_disk):
+        return any(
+            (disk.get(k) is None) != (original_disk.get(k) is None) if k == 'disk_expiretime'
+            else disk.get(k) != original_disk.get(k)
+            for k in self.SERVICES_FIELDS
+        )
+
     def _map_device_disk_to_db(self, db_disk, disk):
         only_update_if_true = ('size',)
         update_keys = ('serial', 'lunid', 'rotationrate', 'type', 'size', 'subsystem', 'number', 'model', 'bus')
@@ -1,7 +1,10 @@
 import asyncio
 from collections import defaultdict
+import copy
 import imp
+import json
 import os
+import time
 
 from mako import exceptions
 from middlewared.service import CallError, Service
@@ -50,11 +53,27 @@ class PyRenderer(object):
 
     def __init__(self, service):
         self.service = service
+        # path -> (mtime of the source file, loaded module)
+        self.modules = {}
 
-    async def render(self, path, ctx):
+    def load_module(self, path):
         name = os.path.basename(path)
         find = imp.find_module(name, [os.path.dirname(path)])
-        mod = imp.load_module(name, *find)
+        try:
+            mtime = os.stat(find[1]).st_mtime_ns
+            if (cached := self.modules.get(path)) is not None and cached[0] == mtime:
+                return cached[1]
+
+            mod = imp.load_module(name, *find)
+        finally:
+            if find[0]:
+                find[0].close()
+
+        self.modules[path] = (mtime, mod)
+        return mod
+
+    async def render(self, path, ctx):
+        mod = self.load_module(path)
         args = [self.service, self.service.middleware]
         if ctx is not None:
             args.append(ctx)
@@ -388,39 +407,59 @@ class EtcService(Service):
             'mako': MakoRenderer(self),
             'py': PyRenderer(self),
         }
-
-    async def gather_ctx(self, methods):
-        rv = {}
+        self.render_times = {}
+
+    async def gather_ctx(self, methods, ctx_cache=None):
+        """
+        Call context `methods` of a group concurrently. `ctx_cache` maps method calls to their
+        (possibly still running) tasks and allows results to be shared by all the groups
+        generated within a single pass. Every group gets its own copy of shared results since
+        templates are allowed to modify their context.
+        """
+        shared = ctx_cache is not None
+        if ctx_cache is None:
+            ctx_cache = {}
+
+        keys = []
+        tasks = []
         for m in methods:
             method = m['method']
             args = m.get('args', [])
             prefix = m.get('ctx_prefix', None)
-            key = f'{prefix}.{method}' if prefix else method
-            rv[key] = await self.middleware.call(method, *args)
+            keys.append(f'{prefix}.{method}' if prefix else method)
 
-        return rv
+            call_key = json.dumps([method, args], default=str)
+            if (task := ctx_cache.get(call_key)) is None:
+                task = ctx_cache[call_key] = self.middleware.create_task(self.middleware.call(method, *args))
 
-    def get_perms_and_ownership(self, entry):
+            tasks.append(task)
+
+        # Tasks may be shared with other groups, so they must not be cancelled if one of them fails
+        results = await asyncio.gather(*[asyncio.shield(task) for task in tasks], return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        if shared:
+            results = copy.deepcopy(results)
+
+        return dict(zip(keys, results))
+
+    async def get_perms_and_ownership(self, entry):
         user_name = entry.get('owner')
         group_name = entry.get('group')
         mode = entry.get('mode', DEFAULT_ETC_PERMS)
 
-        uid = self.middleware.call_sync('user.get_builtin_user_id', user_name) if user_name else DEFAULT_ETC_XID
-        gid = self.middleware.call_sync('group.get_builtin_group_id', group_name) if group_name else DEFAULT_ETC_XID
+        uid = await self.middleware.call('user.get_builtin_user_id', user_name) if user_name else DEFAULT_ETC_XID
+        gid = await self.middleware.call('group.get_builtin_group_id', group_name) if group_name else DEFAULT_ETC_XID
 
         return {'uid': uid, 'gid': gid, 'perms': mode}
 
-    def make_changes(self, full_path, entry, rendered):
-        mode = entry.get('mode', DEFAULT_ETC_PERMS)
-
-        def opener(path, flags):
-            return os.open(path, os.O_CREAT | os.O_RDWR, mode=mode)
-
+    def make_changes(self, full_path, entry, rendered, payload):
         outfile_dirname = os.path.dirname(full_path)
         if outfile_dirname != '/etc':
             os.makedirs(outfile_dirname, exist_ok=True)
 
-        payload = self.get_perms_and_ownership(entry)
         try:
             changes = write_if_changed(full_path, rendered, **payload)
         except Exception:
@@ -436,7 +475,35 @@ class EtcService(Service):
 
         return changes
 
-    async def generate(self, name, checkpoint=None):
+    def render_stages(self, entries):
+        """
+        Split `entries` into lists of entries that may be rendered concurrently. Python
+        renderers may have side effects (some of them write files themselves) and so each
+        of them gets a stage of its own that starts once everything before it is written.
+        """
+        stages = []
+        for entry in entries:
+            if entry['type'] == 'mako' and stages and stages[-1][-1]['type'] == 'mako':
+                stages[-1].append(entry)
+            else:
+                stages.append([entry])
+
+        return stages
+
+    async def render_entry(self, name, entry, ctx):
+        renderer = self._renderers[entry['type']]
+        path = os.path.join(self.files_dir, entry.get('local_path') or entry['path'])
+        start = time.monotonic()
+        try:
+            return await renderer.render(path, ctx)
+        finally:
+            self.render_times[f'{entry["type"]}:{entry["path"]}'] = {
+                'group': name,
+                'time': time.monotonic() - start,
+                'rendered_at': time.time(),
+            }
+
+    async def generate(self, name, checkpoint=None, ctx_cache=None):
         group = self.GROUPS.get(name)
         if group is None:
             raise ValueError('{0} group not found'.format(name))
@@ -444,74 +511,95 @@ class EtcService(Service):
         output = []
         async with self.LOCKS[name]:
             if isinstance(group, dict):
-                ctx = await self.gather_ctx(group['ctx'])
+                ctx = await self.gather_ctx(group['ctx'], ctx_cache)
                 entries = group['entries']
             else:
                 ctx = None
                 entries = group
 
             for entry in entries:
-                renderer = self._renderers.get(entry['type'])
-                if renderer is None:
+                if entry['type'] not in self._renderers:
                     raise ValueError(f'Unknown type: {entry["type"]}')
 
-                if checkpoint:
-                    entry_checkpoint = entry.get('checkpoint', 'initial')
-                    if entry_checkpoint != checkpoint:
-                        continue
-
-                path = os.path.join(self.files_dir, entry.get('local_path') or entry['path'])
-                entry_path = entry['path']
-                if entry_path.startswith('local/'):
-                    entry_path = entry_path[len('local/'):]
-                outfile = f'/etc/{entry_path}'
-
-                try:
-                    rendered = await renderer.render(path, ctx)
-                except FileShouldNotExist:
-                    try:
-                        await self.middleware.run_in_thread(os.unlink, outfile)
-                        self.logger.debug(f'{entry["type"]}:{entry["path"]} file removed.')
-                        output.append({
-                            'path': outfile,
-                            'status': 'REMOVED',
-                            'changes': FileChanges.dump(FileChanges.CONTENTS)
-                        })
-                    except FileNotFoundError:
-                        # Nothing to log
-                        pass
-
-                    continue
-                except Exception:
-                    self.logger.error(f'Failed to render {entry["type"]}:{entry["path"]}', exc_info=True)
-                    continue
-
-                if rendered is None:
-                    # TODO: scripts that write config files internally should be refacorted
-                    # to return bytes or str so that we can properly monitor for changes
-                    continue
-
-                changes = await self.middleware.run_in_thread(self.make_changes, outfile, entry, rendered)
-
-                if not changes:
-                    self.logger.trace('No new changes for %s', outfile)
-
-                else:
-                    output.append({
-                        'path': outfile,
-                        'status': 'CHANGED',
-                        'changes': FileChanges.dump(changes)
-                    })
+            if checkpoint:
+                entries = [entry for entry in entries if entry.get('checkpoint', 'initial') == checkpoint]
+
+            for stage in self.render_stages(entries):
+                # Entries of a stage are rendered concurrently, each one gets its own copy of the context so that
+                # templates that add or replace context keys don't affect each other. Values are still shared and must
+                # not be modified in place.
+                results = await asyncio.gather(
+                    *[
+                        self.render_entry(name, entry, None if ctx is None else dict(ctx))
+                        for entry in stage
+                    ],
+                    return_exceptions=True,
+                )
+                for entry, rendered in zip(stage, results):
+                    if (result := await self.write_entry(entry, rendered)) is not None:
+                        output.append(result)
 
         return output
 
+    async def write_entry(self, entry, rendered):
+        entry_path = entry['path']
+        if entry_path.startswith('local/'):
+            entry_path = entry_path[len('local/'):]
+        outfile = f'/etc/{entry_path}'
+
+        if isinstance(rendered, FileShouldNotExist):
+            try:
+                await self.middleware.run_in_thread(os.unlink, outfile)
+                self.logger.debug(f'{entry["type"]}:{entry["path"]} file removed.')
+                return {
+                    'path': outfile,
+                    'status': 'REMOVED',
+                    'changes': FileChanges.dump(FileChanges.CONTENTS)
+                }
+            except FileNotFoundError:
+                # Nothing to log
+                return
+        elif isinstance(rendered, Exception):
+            self.logger.error(f'Failed to render {entry["type"]}:{entry["path"]}', exc_info=rendered)
+            return
+        elif isinstance(rendered, BaseException):
+            raise rendered
+
+        if rendered is None:
+            # TODO: scripts that write config files internally should be refacorted
+            # to return bytes or str so that we can properly monitor for changes
+            return
+
+        payload = await self.get_perms_and_ownership(entry)
+        changes = await self.middleware.run_in_thread(self.make_changes, outfile, entry, rendered, payload)
+
+        if not changes:
+            self.logger.trace('No new changes for %s', outfile)
+        else:
+            return {
+                'path': outfile,
+                'status': 'CHANGED',
+                'changes': FileChanges.dump(changes)
+            }
+
+    async def render_stats(self):
+        """
+        Time it took to render each configuration file the last time it was generated, slowest first.
+        """
+        return sorted(
+            [{'entry': entry, **stats} for entry, stats in self.render_times.items()],
+            key=lambda stats: stats['time'], reverse=True
+        )
+
     async def generate_checkpoint(self, checkpoint):
         if checkpoint not in await self.get_checkpoints():
             raise CallError(f'"{checkpoint}" not recognised')
 
+        # Context methods are called once for all the groups
+        ctx_cache = {}
         for name in self.GROUPS.keys():
             try:
-                await self.generate(name, checkpoint)
+                await self.generate(name, checkpoint, ctx_cache)
             except Exception:
                 self.logger.error(f'Failed to generate {name} group', exc_info=True)
 
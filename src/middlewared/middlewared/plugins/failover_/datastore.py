@@ -34,6 +34,15 @@ class FailoverDatastoreService(Service):
 
         await self.middleware.call('datastore.execute', sql, params)
 
+    async def sql_many(self, data, queries):
+        if await self.middleware.call('system.version') != data['version']:
+            return
+
+        if await self.middleware.call('failover.status') != 'BACKUP':
+            return
+
+        await self.middleware.call('datastore.execute_many', queries)
+
     failure = False
 
     def is_failure(self):
@@ -138,6 +147,15 @@ class FailoverDatastoreService(Service):
 
 
 def hook_datastore_execute_write(middleware, sql, params, options):
+    replicate(middleware, 'failover.datastore.sql', [sql, params], options)
+
+
+def hook_datastore_execute_write_many(middleware, queries, options):
+    # The whole transaction is replicated at once and applied in a single transaction on the other node
+    replicate(middleware, 'failover.datastore.sql_many', [queries], options)
+
+
+def replicate(middleware, method, args, options):
     # This code is executed in SQLite thread and blocks it (in order to avoid replication query race conditions)
     # No switching to the async context that will yield to database queries is allowed here as it will result in
     # a deadlock. That's why we can't query failover status and will always try to replicate all queries to the other
@@ -155,13 +173,12 @@ def hook_datastore_execute_write(middleware, sql, params, options):
     try:
         middleware.call_sync(
             'failover.call_remote',
-            'failover.datastore.sql',
+            method,
             [
                 {
                     'version': middleware.call_sync('system.version'),
                 },
-                sql,
-                params,
+                *args,
             ],
             {
                 'timeout': 10,
@@ -177,3 +194,4 @@ async def setup(middleware):
         return
 
     middleware.register_hook('datastore.post_execute_write', hook_datastore_execute_write, inline=True)
+    middleware.register_hook('datastore.post_execute_write_many', hook_datastore_execute_write_many, inline=True)
@@ -62,7 +62,7 @@ class JobsCopyService(Service):
 
 
 async def on_job_change(middleware, event_type, args):
-    if event_type == "CHANGED" and args["fields"]["state"] in ["SUCCESS", "FAILED", "ABORTED"]:
+    if event_type == "CHANGED" and args["fields"].get("state") in ["SUCCESS", "FAILED", "ABORTED"]:
         await middleware.call("failover.jobs_copy.on_job_complete", args["fields"])
 
 
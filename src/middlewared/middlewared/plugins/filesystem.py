@@ -1,6 +1,7 @@
 import binascii
 import errno
 import functools
+import json
 import os
 import pathlib
 import shutil
@@ -9,10 +10,13 @@ import time
 
 import pyinotify
 
-from itertools import product
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, product
 from middlewared.api import api_method
 from middlewared.api.current import (
     FilesystemListdirArgs, FilesystemListdirResult,
+    FilesystemListdirPageArgs, FilesystemListdirPageResult,
+    FilesystemListdirStreamArgs, FilesystemListdirStreamResult,
     FilesystemMkdirArgs, FilesystemMkdirResult,
     FilesystemStatArgs, FilesystemStatResult,
     FilesystemStatfsArgs, FilesystemStatfsResult,
@@ -30,12 +34,25 @@ from middlewared.utils import filter_list
 from middlewared.utils.filesystem import attrs, stat_x
 from middlewared.utils.filesystem.acl import acl_is_present
 from middlewared.utils.filesystem.constants import FileType
-from middlewared.utils.filesystem.directory import DirectoryIterator, DirectoryRequestMask
+from middlewared.utils.filesystem.directory import DirectoryIterator, DirectoryRequestMask, iter_directory_parallel
 from middlewared.utils.filesystem.utils import timespec_convert_float
 from middlewared.utils.mount import getmntinfo
 from middlewared.utils.nss import pwd, grp
 from middlewared.utils.path import FSLocation, path_location, is_child_realpath
 
+# Threads collecting metadata (statx, xattrs, ZFS attributes) for directory entries in `filesystem.listdir*`
+LISTDIR_WORKERS = 8
+listdir_thread_pool = ThreadPoolExecutor(LISTDIR_WORKERS, thread_name_prefix='listdir')
+
+
+def listdir_matching(d_iter, filters):
+    """
+    Yield `(position, entry)` for the entries of `d_iter` that match `filters`.
+    """
+    for position, entry in iter_directory_parallel(d_iter, listdir_thread_pool):
+        if not filters or filter_list([entry], filters):
+            yield position, entry
+
 
 class FilesystemService(Service):
 
@@ -241,6 +258,104 @@ class FilesystemService(Service):
           zfs_attrs(list): list of ZFS file attributes on file
         """
 
+        path, filters, file_type, request_mask = self.listdir_prepare(path, filters, options)
+        with DirectoryIterator(path, file_type=file_type, request_mask=request_mask) as d_iter:
+            if options.get('limit') and not options.get('order_by') and not options.get('count'):
+                # Stop reading the directory as soon as the requested page is complete rather
+                # than collecting metadata for all of its entries.
+                offset = options.get('offset', 0)
+                entries = islice(
+                    (entry for position, entry in listdir_matching(d_iter, filters)), offset, offset + options['limit']
+                )
+                return filter_list(entries, [], {'select': options.get('select', []), 'get': options.get('get')})
+
+            return filter_list(
+                (entry for position, entry in iter_directory_parallel(d_iter, listdir_thread_pool)), filters, options
+            )
+
+    @api_method(FilesystemListdirPageArgs, FilesystemListdirPageResult, roles=['FILESYSTEM_ATTRS_READ'])
+    def listdir_page(self, path, filters, options):
+        """
+        Get up to `options.limit` entries of a directory in directory order. Only the entries
+        that are returned are read from the filesystem, so this is suitable for directories
+        with millions of files.
+
+        The returned `cursor` is passed to the next call to get the entries that follow.
+        Entries added to or removed from the directory in the meantime may be skipped or
+        returned twice.
+
+        Entries and the meaning of `select` are the same as for `filesystem.listdir`.
+        """
+        path, filters, file_type, request_mask = self.listdir_prepare(path, filters, options)
+        start, cursor_ino = self.listdir_parse_cursor(options['cursor'])
+        with DirectoryIterator(path, file_type=file_type, request_mask=request_mask, start=start) as d_iter:
+            dir_ino = d_iter.stat.stx_ino
+            if cursor_ino is not None and cursor_ino != dir_ino:
+                raise CallError(f'{path}: cursor was returned for a different directory', errno.EINVAL)
+
+            entries = []
+            for position, entry in listdir_matching(d_iter, filters):
+                entries.append(entry)
+                if len(entries) == options['limit']:
+                    cursor = f'{dir_ino}:{position}'
+                    break
+            else:
+                cursor = None
+
+        return {'entries': filter_list(entries, [], {'select': options['select']}), 'cursor': cursor}
+
+    @private
+    def listdir_parse_cursor(self, cursor):
+        if cursor is None:
+            return 0, None
+
+        try:
+            ino, position = map(int, cursor.split(':'))
+        except ValueError:
+            raise CallError(f'{cursor}: invalid cursor', errno.EINVAL)
+
+        return position, ino
+
+    @api_method(FilesystemListdirStreamArgs, FilesystemListdirStreamResult, roles=['FILESYSTEM_ATTRS_READ'])
+    @job(pipes=['output'])
+    def listdir_stream(self, job, path, filters, options):
+        """
+        Write the contents of a directory to the job output pipe as newline-delimited JSON
+        (one `filesystem.listdir` entry per line) while the directory is being read.
+
+        `order_by`, `count` and `get` options are not supported since they require reading
+        the whole directory first. Returns the number of entries written.
+        """
+        for option in ('order_by', 'count', 'get'):
+            if options.get(option):
+                raise CallError(f'{option}: option is not supported by streaming directory listing', errno.EINVAL)
+
+        path, filters, file_type, request_mask = self.listdir_prepare(path, filters, options)
+        with DirectoryIterator(path, file_type=file_type, request_mask=request_mask) as d_iter:
+            entries = (entry for position, entry in listdir_matching(d_iter, filters))
+            if options['limit']:
+                entries = islice(entries, options['offset'], options['offset'] + options['limit'])
+            elif options['offset']:
+                entries = islice(entries, options['offset'], None)
+
+            count = 0
+            for entry in entries:
+                if options['select']:
+                    entry = filter_list([entry], [], {'select': options['select'], 'get': True})
+
+                job.pipes.output.w.write(json.dumps(entry).encode() + b'\n')
+                count += 1
+
+        return count
+
+    @private
+    def listdir_prepare(self, path, filters, options):
+        """
+        Validate `path` and work out the arguments for `DirectoryIterator` that are needed
+        to satisfy `filters` and `options`.
+
+        Returns (path, filters, file_type, request_mask).
+        """
         path = pathlib.Path(path)
         if not path.exists():
             raise CallError(f'Directory {path} does not exist', errno.ENOENT)
@@ -288,8 +403,7 @@ class FilesystemService(Service):
             # filter these here.
             filters.extend([['is_mountpoint', '=', True], ['name', '!=', IX_APPS_DIR_NAME]])
 
-        with DirectoryIterator(path, file_type=file_type, request_mask=request_mask) as d_iter:
-            return filter_list(d_iter, filters, options)
+        return path, filters, file_type, request_mask
 
     @api_method(FilesystemStatArgs, FilesystemStatResult, roles=['FILESYSTEM_ATTRS_READ'])
     def stat(self, _path):
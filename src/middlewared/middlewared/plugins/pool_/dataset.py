@@ -12,7 +12,7 @@ from middlewared.schema import (
 from middlewared.service import (
     CallError, CRUDService, filterable, InstanceNotFound, item_method, job, private, ValidationErrors
 )
-from middlewared.utils import filter_list
+from middlewared.utils import filter_list, query_fields
 from middlewared.validators import Exact, Match, Or, Range
 
 from .utils import (
@@ -117,48 +117,85 @@ class PoolDatasetService(CRUDService):
     def _internal_user_props(self):
         return TNUserProp.values()
 
-    def __transform(self, datasets, retrieve_children, children_filters, retrieve_user_props):
+    def __transform(self, dataset, retrieve_user_props):
         """
         We need to transform the data zfs gives us to make it consistent/user-friendly,
         making it match whatever pool.dataset.{create,update} uses as input.
         """
+        for orig_name, new_name, method in get_props_of_interest_mapping():
+            if orig_name not in dataset['properties']:
+                continue
+            i = new_name or orig_name
+            dataset[i] = dataset['properties'][orig_name]
+            if method:
+                dataset[i]['value'] = method(dataset[i]['value'])
+
+        if 'mountpoint' in dataset:
+            # This is treated specially to keep backwards compatibility with API
+            dataset['mountpoint'] = dataset['mountpoint']['value']
+        if dataset['type'] == 'VOLUME':
+            dataset['mountpoint'] = None
+
+        if retrieve_user_props:
+            dataset['user_properties'] = {
+                k: v for k, v in dataset['properties'].items() if ':' in k and k not in self._internal_user_props()
+            }
+        del dataset['properties']
 
-        def transform(dataset):
-            for orig_name, new_name, method in get_props_of_interest_mapping():
-                if orig_name not in dataset['properties']:
-                    continue
-                i = new_name or orig_name
-                dataset[i] = dataset['properties'][orig_name]
-                if method:
-                    dataset[i]['value'] = method(dataset[i]['value'])
-
-            if 'mountpoint' in dataset:
-                # This is treated specially to keep backwards compatibility with API
-                dataset['mountpoint'] = dataset['mountpoint']['value']
-            if dataset['type'] == 'VOLUME':
-                dataset['mountpoint'] = None
-
-            if retrieve_user_props:
-                dataset['user_properties'] = {
-                    k: v for k, v in dataset['properties'].items() if ':' in k and k not in self._internal_user_props()
-                }
-            del dataset['properties']
+        if all(k in dataset for k in ('encrypted', 'key_loaded')):
+            dataset['locked'] = dataset['encrypted'] and not dataset['key_loaded']
 
-            if all(k in dataset for k in ('encrypted', 'key_loaded')):
-                dataset['locked'] = dataset['encrypted'] and not dataset['key_loaded']
+        return dataset
 
-            if retrieve_children:
-                rv = []
-                for child in filter_list(dataset['children'], children_filters):
-                    rv.append(transform(child))
-                dataset['children'] = rv
+    def __build(self, rows, flat, retrieve_children, children_filters, retrieve_user_props):
+        """
+        Build `pool.dataset.query` result from `zfs.dataset.query` rows. Each dataset is transformed once and
+        referenced (not copied) from its parent's `children`, so in flat mode a dataset is shared between its own entry
+        and all of its ancestors' entries.
+        """
+        datasets = {}
+        result = []
+        for row in rows:
+            parent = datasets.get(row.pop('parent'))
+            dataset = self.__transform(row, retrieve_user_props)
+            dataset['children'] = []
+            datasets[dataset['id']] = dataset
+
+            if parent is None:
+                result.append(dataset)
+            else:
+                if retrieve_children and filter_list([dataset], children_filters):
+                    parent['children'].append(dataset)
+                if flat:
+                    result.append(dataset)
 
-            return dataset
+        return result
 
-        rv = []
-        for dataset in datasets:
-            rv.append(transform(dataset))
-        return rv
+    def __query_properties(self, filters, options):
+        """
+        ZFS properties (and whether user properties) needed to evaluate `filters` and `options` of a query, or `None`
+        if the query needs all of them.
+        """
+        if (fields := query_fields(filters, options)) is None:
+            return None
+
+        mapping = {new_name or orig_name: orig_name for orig_name, new_name, method in get_props_of_interest_mapping()}
+        props = set()
+        user_props = False
+        for field in fields:
+            name = field[0]
+            if name in mapping:
+                props.add(mapping[name])
+                user_props |= ':' in mapping[name]
+            elif name in ('encrypted', 'encryption_root', 'key_loaded', 'locked'):
+                props.update(['encryption', 'encryptionroot', 'keyformat', 'keystatus'])
+            elif name == 'user_properties':
+                user_props = True
+            elif name not in ('id', 'name', 'pool', 'type', 'snapshot_count', 'snapshots'):
+                # `children` or some field we don't know about
+                return None
+
+        return sorted(props), user_props
 
     @private
     async def internal_datasets_filters(self):
@@ -183,9 +220,8 @@ class PoolDatasetService(CRUDService):
 
         We provide two ways to retrieve datasets. The first is a flat structure (default), where
         all datasets in the system are returned as separate objects which contain all data
-        there is for their children. This retrieval type is slightly slower because of duplicates in each object.
-        The second type is hierarchical, where only top level datasets are returned in the list. They contain all the
-        children in the `children` key. This retrieval type is slightly faster.
+        there is for their children. The second type is hierarchical, where only top level datasets are returned in
+        the list. They contain all the children in the `children` key.
         These options are controlled by the `query-options.extra.flat` attribute (default true).
 
         In some cases it might be desirable to only retrieve details of a dataset itself and not it's children, in this
@@ -224,22 +260,30 @@ class PoolDatasetService(CRUDService):
         snapshots_recursive = extra.get('snapshots_recursive')
         snapshots_count = extra.get('snapshots_count')
         retrieve_user_props = extra.get('retrieve_user_props', True)
-        return filter_list(
-            self.__transform(self.middleware.call_sync(
-                'zfs.dataset.query', zfsfilters, {
-                    'extra': {
-                        'flat': extra.get('flat', True),
-                        'retrieve_children': retrieve_children,
-                        'properties': props,
-                        'snapshots': snapshots,
-                        'snapshots_recursive': snapshots_recursive,
-                        'snapshots_count': snapshots_count,
-                        'snapshots_properties': extra.get('snapshots_properties', []),
-                        'user_properties': retrieve_user_props,
-                    }
+        user_props = retrieve_user_props
+        if props is None and (query_props := self.__query_properties(filters, options)) is not None:
+            # Only retrieve the properties that the query needs
+            props, needs_user_props = query_props
+            user_props = retrieve_user_props and needs_user_props
+
+        # Datasets are transferred from the process pool only once (as rows) and are only transformed once
+        rows = self.middleware.call_sync(
+            'zfs.dataset.query', zfsfilters, {
+                'extra': {
+                    'rows': True,
+                    'retrieve_children': retrieve_children,
+                    'properties': props,
+                    'snapshots': snapshots,
+                    'snapshots_recursive': snapshots_recursive,
+                    'snapshots_count': snapshots_count,
+                    'snapshots_properties': extra.get('snapshots_properties', []),
+                    'user_properties': user_props,
                 }
-            ), retrieve_children, internal_datasets_filters, retrieve_user_props,
-            ), filters, options
+            }
+        )
+        return filter_list(
+            self.__build(rows, extra.get('flat', True), retrieve_children, internal_datasets_filters, user_props),
+            filters, options,
         )
 
     @private
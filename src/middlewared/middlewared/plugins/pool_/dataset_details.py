@@ -1,3 +1,4 @@
+import collections
 import os
 import pathlib
 
@@ -7,6 +8,59 @@ from middlewared.schema import accepts, List, returns
 from middlewared.utils.mount import getmntinfo
 
 
+class AttachmentIndex:
+    """
+    Consumers (shares, VM devices, apps...) of a single kind indexed by the keys that attach them to a dataset:
+    `('path', mountpoint)`, `('dataset', name)` (the dataset the consumer's path resides on) and `('zvol', name)`.
+
+    Each dataset then looks up its consumers directly instead of checking every consumer.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.index = collections.defaultdict(list)
+
+    def add(self, entry, path=None, dataset=None, zvol=None):
+        position = len(self.entries)
+        self.entries.append(entry)
+        for key in (('path', path), ('dataset', dataset), ('zvol', zvol)):
+            if key[1] is not None:
+                self.index[key].append(position)
+
+    def find(self, ds, zvol=False):
+        keys = [('path', ds['mountpoint']), ('dataset', ds['id'])]
+        if zvol:
+            keys.append(('zvol', ds['id']))
+
+        # consumer matching by more than one key is only reported once and in its original order
+        positions = set()
+        for key in keys:
+            positions.update(self.index.get(key, []))
+
+        return [self.entries[position].copy() for position in sorted(positions)]
+
+
+class PushTasksIndex:
+    """
+    Number of PUSH tasks by (normalized) source path. A dataset is consumed by all the tasks whose path is either
+    its mountpoint or one of its parent directories.
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def add(self, task):
+        if task['direction'] == 'PUSH':
+            self.counts[str(pathlib.PurePath(task['path']))] += 1
+
+    def count(self, ds):
+        if not ds['mountpoint'] or not self.counts:
+            return 0
+
+        mountpoint = pathlib.PurePath(ds['mountpoint'])
+        return sum(self.counts.get(str(path), 0) for path in (mountpoint, *mountpoint.parents))
+
+
 class PoolDatasetService(Service):
 
     class Config:
@@ -206,14 +260,15 @@ class PoolDatasetService(Service):
         datasets = self.middleware.call_sync('pool.dataset.query', [], options)
         mnt_info = getmntinfo()
         info = self.build_details(mnt_info)
+        normalized = set()
         for dataset in datasets:
-            self.collapse_datasets(dataset, info, mnt_info)
+            self.collapse_datasets(dataset, info, mnt_info, normalized)
 
         return datasets
 
     @private
     def normalize_dataset(self, dataset, info, mnt_info):
-        atime, case, readonly = self.get_mntinfo(dataset, mnt_info)
+        atime, case, readonly = self.get_mntinfo(dataset, info['mountpoints'])
         dataset['locked'] = dataset['locked']
         dataset['atime'] = atime
         dataset['casesensitive'] = case
@@ -231,10 +286,16 @@ class PoolDatasetService(Service):
         dataset['rsync_tasks_count'] = self.get_rsync_tasks_count(dataset, info['rsync'])
 
     @private
-    def collapse_datasets(self, dataset, info, mnt_info):
+    def collapse_datasets(self, dataset, info, mnt_info, normalized=None):
+        # `pool.dataset.query` shares child datasets between the flat list entries and their ancestors' `children`
+        if normalized is not None:
+            if dataset['id'] in normalized:
+                return
+            normalized.add(dataset['id'])
+
         self.normalize_dataset(dataset, info, mnt_info)
         for child in dataset.get('children', []):
-            self.collapse_datasets(child, info, mnt_info)
+            self.collapse_datasets(child, info, mnt_info, normalized)
 
     @private
     def get_mount_info(self, path, mntinfo):
@@ -251,10 +312,14 @@ class PoolDatasetService(Service):
         return mount_info
 
     @private
-    def get_mntinfo(self, ds, mntinfo):
+    def get_mount_source(self, path, mntinfo):
+        return self.get_mount_info(path, mntinfo).get('mount_source')
+
+    @private
+    def get_mntinfo(self, ds, mountpoints):
         atime = case = True
         readonly = False
-        for devid, info in filter(lambda x: x[1]['mountpoint'] == ds['mountpoint'], mntinfo.items()):
+        if (info := mountpoints.get(ds['mountpoint'])) is not None:
             atime = not ('NOATIME' in info['mount_opts'])
             readonly = 'RO' in info['mount_opts']
             case = any((i for i in ('CASESENSITIVE', 'CASEMIXED') if i in info['super_opts']))
@@ -268,10 +333,12 @@ class PoolDatasetService(Service):
     @private
     def build_details(self, mntinfo):
         results = {
-            'iscsi': [], 'nfs': [], 'smb': [],
-            'repl': [], 'snap': [], 'cloud': [],
-            'rsync': [], 'vm': [], 'app': [],
-            'virt_instance': [],
+            'iscsi': AttachmentIndex(), 'nfs': AttachmentIndex(), 'smb': AttachmentIndex(),
+            'repl': collections.Counter(), 'snap': collections.Counter(), 'cloud': PushTasksIndex(),
+            'rsync': PushTasksIndex(), 'vm': AttachmentIndex(), 'app': AttachmentIndex(),
+            'virt_instance': AttachmentIndex(),
+            # if a mountpoint is listed more than once, the last entry wins
+            'mountpoints': {info['mountpoint']: info for info in mntinfo.values()},
         }
 
         # iscsi
@@ -284,60 +351,76 @@ class PoolDatasetService(Service):
             2. make sure the target has `groups` entry since, without it, it's impossible
                 that it's being shared via iscsi
             """
-            results['iscsi'].append({
-                'extent': e[i['extent']],
-                'target': t[i['target']],
-                'mount_info': self.get_mount_info(e[i['extent']]['path'], mntinfo),
-            })
+            extent = e[i['extent']]
+            if extent['type'] == 'DISK':
+                # we store extent information prefixed with `zvol/` (i.e. zvol/tank/zvol01).
+                results['iscsi'].add(
+                    {'enabled': extent['enabled'], 'type': 'DISK', 'path': f'/dev/{extent["path"]}'},
+                    zvol=extent['path'].removeprefix('zvol/'),
+                )
+            elif extent['type'] == 'FILE':
+                # this isn't common but possible, you can share a "file"
+                # via iscsi which means it's not a dataset but a file inside
+                # a dataset so we need to find the source dataset for the file
+                results['iscsi'].add(
+                    {'enabled': extent['enabled'], 'type': 'FILE', 'path': extent['path']},
+                    dataset=self.get_mount_source(extent['path'], mntinfo),
+                )
 
         # nfs and smb
-        for key in ('nfs', 'smb'):
-            for share in self.middleware.call_sync(f'sharing.{key}.query'):
-                share['mount_info'] = self.get_mount_info(share['path'], mntinfo)
-                results[key].append(share)
+        for share in self.middleware.call_sync('sharing.nfs.query'):
+            results['nfs'].add(
+                {'enabled': share['enabled'], 'path': share['path']},
+                path=share['path'], dataset=self.get_mount_source(share['path'], mntinfo),
+            )
+
+        for share in self.middleware.call_sync('sharing.smb.query'):
+            results['smb'].add(
+                {'enabled': share['enabled'], 'path': share['path'], 'share_name': share['name']},
+                path=share['path'], dataset=self.get_mount_source(share['path'], mntinfo),
+            )
 
         # replication
         options = {'prefix': 'repl_'}
         for task in self.middleware.call_sync('datastore.query', 'storage.replication', [], options):
             # replication can only be configured on a dataset so getting mount info is unnecessary
-            results['repl'].append(task)
+            if task['direction'] == 'PUSH':
+                # we only care about replication tasks that are configured to push
+                results['repl'].update(task['source_datasets'])
 
         # snapshots
         for task in self.middleware.call_sync('datastore.query', 'storage.task', [], {'prefix': 'task_'}):
             # snapshots can only be configured on a dataset so getting mount info is unnecessary
-            results['snap'].append(task)
+            results['snap'][task['dataset']] += 1
 
         # cloud sync
         for task in self.middleware.call_sync('datastore.query', 'tasks.cloudsync'):
-            task['mount_info'] = self.get_mount_info(task['path'], mntinfo)
-            results['cloud'].append(task)
+            results['cloud'].add(task)
 
         # rsync
         for task in self.middleware.call_sync('rsynctask.query'):
-            task['mount_info'] = self.get_mount_info(task['path'], mntinfo)
-            results['rsync'].append(task)
+            results['rsync'].add(task)
 
         # vm
+        vms_mapping = {vm['id']: vm['name'] for vm in self.middleware.call_sync('datastore.query', 'vm.vm')}
         for vm in self.middleware.call_sync('vm.device.query', [['attributes.dtype', 'in', ['RAW', 'DISK']]]):
+            entry = {'name': vms_mapping[vm['vm']], 'path': vm['attributes']['path']}
             if vm['attributes']['dtype'] == 'DISK':
                 # disk type is always a zvol
-                vm['zvol'] = zvol_path_to_name(vm['attributes']['path'])
+                results['vm'].add(entry, path=entry['path'], zvol=zvol_path_to_name(entry['path']))
             else:
                 # raw type is always a file
-                vm['mount_info'] = self.get_mount_info(vm['attributes']['path'], mntinfo)
-
-            results['vm'].append(vm)
+                results['vm'].add(entry, path=entry['path'], dataset=self.get_mount_source(entry['path'], mntinfo))
 
         for app in self.middleware.call_sync('app.query'):
             for path_config in filter(
                 lambda p: p.get('source', '').startswith('/mnt/') and not p['source'].startswith('/mnt/.ix-'),
                 app['active_workloads']['volumes']
             ):
-                results['app'].append({
-                    'name': app['name'],
-                    'path': path_config['source'],
-                    'mount_info': self.get_mount_info(path_config['source'], mntinfo),
-                })
+                results['app'].add(
+                    {'name': app['name'], 'path': path_config['source']},
+                    path=path_config['source'], dataset=self.get_mount_source(path_config['source'], mntinfo),
+                )
 
         # virt instance
         for instance in self.middleware.call_sync('virt.instance.query'):
@@ -346,126 +429,54 @@ class PoolDatasetService(Service):
                     continue
                 if not device['source']:
                     continue
-                device['instance'] = instance['id']
+                entry = {'name': instance['id'], 'path': device['source']}
                 if device['source'].startswith('/dev/zvol/'):
                     # disk type is always a zvol
-                    device['zvol'] = zvol_path_to_name(device['source'])
+                    results['virt_instance'].add(entry, path=entry['path'], zvol=zvol_path_to_name(entry['path']))
                 else:
                     # raw type is always a file
-                    device['mount_info'] = self.get_mount_info(device['source'], mntinfo)
-                results['virt_instance'].append(device)
+                    results['virt_instance'].add(
+                        entry, path=entry['path'], dataset=self.get_mount_source(entry['path'], mntinfo),
+                    )
 
         return results
 
     @private
     def get_nfs_shares(self, ds, nfsshares):
-        nfs_shares = []
-        for share in nfsshares:
-            if share['path'] == ds['mountpoint'] or share['mount_info'].get('mount_source') == ds['id']:
-                nfs_shares.append({'enabled': share['enabled'], 'path': share['path']})
-
-        return nfs_shares
+        return nfsshares.find(ds)
 
     @private
     def get_smb_shares(self, ds, smbshares):
-        smb_shares = []
-        for share in smbshares:
-            if share['path'] == ds['mountpoint'] or share['mount_info'].get('mount_source') == ds['id']:
-                smb_shares.append({
-                    'enabled': share['enabled'],
-                    'path': share['path'],
-                    'share_name': share['name']
-                })
-
-        return smb_shares
+        return smbshares.find(ds)
 
     @private
     def get_iscsi_shares(self, ds, iscsishares):
-        iscsi_shares = []
-        for share in iscsishares:
-            if share['extent']['type'] == 'DISK' and share['extent']['path'].removeprefix('zvol/') == ds['id']:
-                # we store extent information prefixed with `zvol/` (i.e. zvol/tank/zvol01).
-                iscsi_shares.append({
-                    'enabled': share['extent']['enabled'],
-                    'type': 'DISK',
-                    'path': f'/dev/{share["extent"]["path"]}',
-                })
-            elif share['extent']['type'] == 'FILE' and share['mount_info'].get('mount_source') == ds['id']:
-                # this isn't common but possible, you can share a "file"
-                # via iscsi which means it's not a dataset but a file inside
-                # a dataset so we need to find the source dataset for the file
-                iscsi_shares.append({
-                    'enabled': share['extent']['enabled'],
-                    'type': 'FILE',
-                    'path': share['extent']['path'],
-                })
-
-        return iscsi_shares
+        return iscsishares.find(ds, zvol=True)
 
     @private
     def get_repl_tasks_count(self, ds, repltasks):
-        count = 0
-        for repl in filter(lambda x: x['direction'] == 'PUSH', repltasks):
-            # we only care about replication tasks that are configured to push
-            for src_ds in filter(lambda x: x == ds['id'], repl['source_datasets']):
-                count += 1
-
-        return count
+        return repltasks[ds['id']]
 
     @private
     def get_snapshot_tasks_count(self, ds, snaptasks):
-        return len([i for i in snaptasks if i['dataset'] == ds['id']])
+        return snaptasks[ds['id']]
 
     @private
     def get_cloudsync_tasks_count(self, ds, cldtasks):
-        return self._get_push_tasks_count(ds, cldtasks)
+        return cldtasks.count(ds)
 
     @private
     def get_rsync_tasks_count(self, ds, rsynctasks):
-        return self._get_push_tasks_count(ds, rsynctasks)
-
-    def _get_push_tasks_count(self, ds, tasks):
-        count = 0
-        if ds['mountpoint']:
-            for i in filter(lambda x: x['direction'] == 'PUSH', tasks):
-                # we only care about cloud sync tasks that are configured to push
-                if pathlib.Path(ds['mountpoint']).is_relative_to(i['path']):
-                    count += 1
-
-        return count
+        return rsynctasks.count(ds)
 
     @private
     def get_vms(self, ds, _vms):
-        vms = []
-        vms_mapping = {vm['id']: vm for vm in self.middleware.call_sync('datastore.query', 'vm.vm')}
-        for i in _vms:
-            if (
-                'zvol' in i and i['zvol'] == ds['id'] or
-                i['attributes']['path'] == ds['mountpoint'] or
-                i.get('mount_info', {}).get('mount_source') == ds['id']
-            ):
-                vms.append({'name': vms_mapping[i['vm']]['name'], 'path': i['attributes']['path']})
-
-        return vms
+        return _vms.find(ds, zvol=True)
 
     @private
     def get_virt_instances(self, ds, _instances):
-        instances = []
-        for i in _instances:
-            if (
-                'zvol' in i and i['zvol'] == ds['id'] or
-                i['source'] == ds['mountpoint'] or
-                i.get('mount_info', {}).get('mount_source') == ds['id']
-            ):
-                instances.append({'name': i['instance'], 'path': i['source']})
-
-        return instances
+        return _instances.find(ds, zvol=True)
 
     @private
     def get_apps(self, ds, _apps):
-        apps = []
-        for app in _apps:
-            if app['path'] == ds['mountpoint'] or app['mount_info'].get('mount_source') == ds['id']:
-                apps.append({'name': app['name'], 'path': app['path']})
-
-        return apps
+        return _apps.find(ds)
@@ -471,7 +471,10 @@ class ReplicationService(CRUDService):
         Bool("really_run", default=True, hidden=True),
         roles=["REPLICATION_TASK_WRITE"],
     )
-    @job(logs=True, read_roles=["REPLICATION_TASK_READ"])
+    # When `really_run` is false, zettarepl is already replicating and the job only reports its progress, so it must
+    # not wait for other transfers to finish
+    @job(logs=True, read_roles=["REPLICATION_TASK_READ"],
+         priority=lambda args: "LOW" if len(args) < 2 or args[1] else "NORMAL")
     async def run(self, job, id_, really_run):
         """
         Run Replication Task of `id`.
@@ -503,7 +506,7 @@ class ReplicationService(CRUDService):
             ("add", Bool("only_from_scratch", default=False)),
         ),
     )
-    @job(logs=True)
+    @job(logs=True, priority="LOW")
     async def run_onetime(self, job, data):
         """
         Run replication task without creating it.
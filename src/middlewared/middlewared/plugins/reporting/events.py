@@ -1,12 +1,8 @@
-import time
-
 from middlewared.event import EventSource
 from middlewared.schema import Dict, Float, Int
-from middlewared.utils.disks import get_disk_names, get_disks_with_identifiers
 from middlewared.validators import Range
 
-from .realtime_reporting import get_arc_stats, get_cpu_stats, get_disk_stats, get_interface_stats, get_memory_info
-from .realtime_reporting.utils import safely_retrieve_dimension
+from .realtime_sampler import samplers
 
 
 class RealtimeEventSource(EventSource):
@@ -64,55 +60,31 @@ class RealtimeEventSource(EventSource):
         )
     )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sampler_error = None
+
     def run_sync(self):
         interval = self.arg['interval']
-        disk_mapping = get_disks_with_identifiers()
-
-        while not self._cancel_sync.is_set():
-            # this gathers the most recent metric recorded via netdata (for all charts)
-            retries = 2
-            while retries > 0:
-                try:
-                    netdata_metrics = self.middleware.call_sync('netdata.get_all_metrics')
-                except Exception:
-                    retries -= 1
-                    if retries <= 0:
-                        raise
-
-                    time.sleep(0.5)
-                else:
-                    break
+        samplers.subscribe(self.middleware, self, interval)
+        try:
+            self._cancel_sync.wait()
+        finally:
+            samplers.unsubscribe(self, interval)
 
-            if failed_to_connect := not bool(netdata_metrics):
-                data = {'failed_to_connect': failed_to_connect}
-            else:
-                disks = get_disk_names()
-                if len(disks) != len(disk_mapping):
-                    disk_mapping = get_disks_with_identifiers()
+        if self.sampler_error is not None:
+            raise self.sampler_error
 
-                data = {
-                    'zfs': get_arc_stats(netdata_metrics),  # ZFS ARC Size
-                    'memory': get_memory_info(netdata_metrics),
-                    'cpu': get_cpu_stats(netdata_metrics),
-                    'disks': get_disk_stats(netdata_metrics, disks, disk_mapping),
-                    'interfaces': get_interface_stats(
-                        netdata_metrics, [
-                            iface['name'] for iface in self.middleware.call_sync(
-                                'interface.query', [], {'extra': {'retrieve_names_only': True}}
-                            )
-                        ]
-                    ),
-                    'failed_to_connect': False,
-                }
+    def sampler_failed(self, error):
+        self.sampler_error = error
+        self._cancel_sync.set()
 
-                # CPU temperature
-                data['cpu']['temperature_celsius'] = safely_retrieve_dimension(
-                    netdata_metrics, 'cputemp.temp', 'cpu_temp',
-                ) or None
 
-            self.send_event('ADDED', fields=data)
-            time.sleep(interval)
+async def udev_block_devices_hook(middleware, data):
+    if data.get('SUBSYSTEM') == 'block' and data.get('DEVTYPE') == 'disk':
+        samplers.disks_cache.invalidate()
 
 
 def setup(middleware):
     middleware.register_event_source('reporting.realtime', RealtimeEventSource, roles=['REPORTING_READ'])
+    middleware.register_hook('udev.block', udev_block_devices_hook)
@@ -1,3 +1,4 @@
+import time
 import typing
 
 import aiohttp
@@ -6,16 +7,140 @@ import asyncio
 import contextlib
 import json
 import logging
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
 
 from .exceptions import ApiException, ClientConnectError
-from .utils import NETDATA_URI, NETDATA_REQUEST_TIMEOUT
+from .utils import (
+    NETDATA_MAX_CONNECTIONS, NETDATA_KEEPALIVE_TIMEOUT, NETDATA_REQUEST_TIMEOUT, NETDATA_RESPONSE_CACHE_SIZE,
+    NETDATA_RESPONSE_CACHE_TTL, NETDATA_UPDATE_EVERY, NETDATA_URI,
+)
 
 
 logger = logging.getLogger('netdata_api')
 
 
+class ChartResponseCache:
+    """
+    Cache of decoded `data` endpoint responses keyed by uri.
+
+    Netdata only updates a chart once every `NETDATA_UPDATE_EVERY` seconds, so a response is reused for as long
+    as the collection cycle it was retrieved in has not elapsed. Responses for queries which end in the past can
+    not change anymore and are kept until they are evicted or `NETDATA_RESPONSE_CACHE_TTL` expires.
+    """
+
+    def __init__(self, size=NETDATA_RESPONSE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def last_updated(now):
+        return int(now // NETDATA_UPDATE_EVERY)
+
+    def validity(self, uri, now):
+        """
+        Returns the `last_updated` collection cycle the response for `uri` is valid for (None when final).
+        """
+        try:
+            before = int(parse_qs(urlsplit(uri).query).get('before', [0])[0])
+        except ValueError:
+            before = 0
+
+        if before > 0 and before < now - NETDATA_UPDATE_EVERY:
+            return None
+
+        return self.last_updated(now)
+
+    def get(self, uri):
+        if (entry := self.entries.get(uri)) is None:
+            return None
+
+        now = time.time()
+        last_updated, created, data = entry
+        if (
+            (last_updated is not None and last_updated != self.last_updated(now)) or
+            now - created > NETDATA_RESPONSE_CACHE_TTL
+        ):
+            self.entries.pop(uri)
+            return None
+
+        self.entries.move_to_end(uri)
+        return self.copy(data)
+
+    def put(self, uri, data):
+        now = time.time()
+        self.entries[uri] = (self.validity(uri, now), now, data)
+        self.entries.move_to_end(uri)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+        return self.copy(data)
+
+    def clear(self):
+        self.entries.clear()
+
+    @staticmethod
+    def copy(data):
+        # Consumers pop `labels` and trailing rows from the response, the rows themselves are never modified
+        data = dict(data)
+        if isinstance(data.get('data'), list):
+            data['data'] = list(data['data'])
+
+        return data
+
+
 class ClientMixin:
 
+    SESSION = None
+    SESSION_LOOP = None
+    CHART_CACHE = ChartResponseCache()
+
+    @classmethod
+    async def session(cls) -> aiohttp.ClientSession:
+        """
+        Long-lived session for all requests to the local netdata instance so that connections are kept alive
+        and re-used instead of being established for every single call.
+        """
+        loop = asyncio.get_running_loop()
+        if cls.SESSION is None or cls.SESSION.closed or cls.SESSION_LOOP is not loop:
+            await cls.close_session()
+            # Another request might have created the session while the previous one was being closed
+            if cls.SESSION is None:
+                ClientMixin.SESSION = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+                    limit=NETDATA_MAX_CONNECTIONS, keepalive_timeout=NETDATA_KEEPALIVE_TIMEOUT,
+                ))
+                ClientMixin.SESSION_LOOP = loop
+
+        return cls.SESSION
+
+    @classmethod
+    async def close_session(cls):
+        session, loop = cls.SESSION, cls.SESSION_LOOP
+        ClientMixin.SESSION = ClientMixin.SESSION_LOOP = None
+        if session is None or session.closed:
+            return
+
+        if loop is asyncio.get_running_loop() or loop.is_closed():
+            # Connections of a session whose event loop has been closed can't be used anymore, this only marks it
+            # as closed
+            await session.close()
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            logger.debug('Unable to close netdata session of an event loop that is not running')
+
+    @classmethod
+    async def reset(cls):
+        """
+        Close pooled connections and drop cached responses, e.g. because netdata is being stopped or restarted.
+        """
+        await cls.close_session()
+        cls.CHART_CACHE.clear()
+
+    @staticmethod
+    def decode(body: bytes):
+        return json.loads(body.decode(errors='ignore'))
+
     @classmethod
     @contextlib.asynccontextmanager
     async def request(
@@ -26,41 +151,44 @@ class ClientMixin:
         resource = resource.removeprefix('/')
         uri = f'{NETDATA_URI}/{version}/{resource}'
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
-                async with session.get(uri) as resp:
-                    if resp.status != 200:
-                        raise ApiException(f'Received {resp.status!r} response code from {uri!r}')
+            async with (await cls.session()).get(uri, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                if resp.status != 200:
+                    raise ApiException(f'Received {resp.status!r} response code from {uri!r}')
 
-                    yield resp
+                yield resp
         except (asyncio.TimeoutError, aiohttp.ClientResponseError) as e:
             raise ApiException(f'Failed {resource!r} call: {e!r}')
-        except (aiohttp.client_exceptions.ClientConnectorError, aiohttp.client_exceptions.ClientOSError) as e:
+        except (
+            aiohttp.client_exceptions.ClientConnectorError,
+            aiohttp.client_exceptions.ClientOSError,
+            aiohttp.client_exceptions.ServerDisconnectedError,
+        ) as e:
             raise ClientConnectError(f'Failed to connect to {uri!r}: {e!r}')
 
     @classmethod
     async def api_call(cls, resource: str, timeout: int = NETDATA_REQUEST_TIMEOUT, version: str = 'v1') -> dict:
         try:
             async with cls.request(resource, timeout, version) as resp:
-                output = ''
-                async for line in resp.content.iter_any():
-                    output += line.decode(errors='ignore')
-                return json.loads(output)
+                return cls.decode(await resp.read())
         except aiohttp.client_exceptions.ContentTypeError as e:
             raise ApiException(f'Malformed response received from {resource!r} endpoint: {e}')
 
     @classmethod
-    async def fetch(cls, uri: str, session: aiohttp.ClientSession, identifier: typing.Optional[str]) -> dict:
-        output = ''
+    async def fetch(
+        cls, uri: str, session: aiohttp.ClientSession, identifier: typing.Optional[str],
+        timeout: int = NETDATA_REQUEST_TIMEOUT,
+    ) -> dict:
         response = {'error': None, 'data': None, 'uri': uri, 'identifier': identifier}
-        async with session.get(uri) as call_resp:
+        if (cached := cls.CHART_CACHE.get(uri)) is not None:
+            response['data'] = cached
+            return response
+
+        async with session.get(uri, timeout=aiohttp.ClientTimeout(total=timeout)) as call_resp:
             if call_resp.status != 200:
                 response['error'] = f'Received {call_resp.status!r} response code from {uri!r}'
             else:
                 try:
-                    async for line in call_resp.content.iter_any():
-                        output += line.decode(errors='ignore')
-
-                    response['data'] = json.loads(output)
+                    response['data'] = cls.CHART_CACHE.put(uri, cls.decode(await call_resp.read()))
                 except aiohttp.client_exceptions.ContentTypeError as e:
                     response['error'] = f'Malformed response received from {uri!r} endpoint: {e}'
                 except json.JSONDecodeError:
@@ -78,18 +206,37 @@ class ClientMixin:
         uri = f'{NETDATA_URI}/{version}'
         tasks = []
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
-                for identifier, resource in resources:
-                    resource = resource.removeprefix('/')
-                    tasks.append(cls.fetch(f'{uri}/{resource}', session, identifier))
+            # Requests beyond `NETDATA_MAX_CONNECTIONS` wait for a pooled connection to become available
+            session = await cls.session()
+            pending = {}
+            for identifier, resource in resources:
+                resource_uri = f'{uri}/{resource.removeprefix("/")}'
+                if resource_uri not in pending:
+                    # Same chart requested more than once in a batch is only retrieved once
+                    pending[resource_uri] = len(tasks)
+                    tasks.append(cls.fetch(resource_uri, session, identifier, timeout))
 
-                yield await asyncio.gather(*tasks)
+            fetched = await asyncio.gather(*tasks)
+            responses = []
+            for identifier, resource in resources:
+                response = fetched[pending[f'{uri}/{resource.removeprefix("/")}']]
+                if response['identifier'] != identifier:
+                    response = response | {'identifier': identifier}
+                    if response['data'] is not None:
+                        response['data'] = ChartResponseCache.copy(response['data'])
 
+                responses.append(response)
         except (asyncio.TimeoutError, aiohttp.ClientResponseError) as e:
             raise ApiException(f'Failed {resources!r} call: {e!r}')
-        except (aiohttp.client_exceptions.ClientConnectorError, aiohttp.client_exceptions.ClientOSError) as e:
+        except (
+            aiohttp.client_exceptions.ClientConnectorError,
+            aiohttp.client_exceptions.ClientOSError,
+            aiohttp.client_exceptions.ServerDisconnectedError,
+        ) as e:
             raise ClientConnectError(f'Failed to connect to {uri!r}: {e!r}')
 
+        yield responses
+
     @classmethod
     async def api_calls(
         cls, resources: typing.List[typing.Tuple[str, str]], timeout: int = NETDATA_REQUEST_TIMEOUT, version: str = 'v1'
@@ -5,6 +5,10 @@ NETDATA_PORT = 6999
 NETDATA_REQUEST_TIMEOUT = 30  # seconds
 NETDATA_URI = f'http://127.0.0.1:{NETDATA_PORT}/api'
 NETDATA_UPDATE_EVERY = 2  # seconds
+NETDATA_MAX_CONNECTIONS = 16
+NETDATA_KEEPALIVE_TIMEOUT = 30  # seconds
+NETDATA_RESPONSE_CACHE_SIZE = 1024  # chart responses
+NETDATA_RESPONSE_CACHE_TTL = 300  # seconds
 
 
 def get_query_parameters(query_params: dict | None, prefix: str = '&') -> str:
@@ -3,6 +3,7 @@ import os
 from middlewared.service import private, Service
 from middlewared.utils.filesystem.copy import copytree, CopyTreeConfig
 
+from .netdata.client import ClientMixin
 from .utils import get_netdata_state_path
 
 
@@ -45,3 +46,7 @@ class ReportingService(Service):
             return
 
         await self.middleware.call('service.start', 'netdata')
+
+    @private
+    async def terminate(self):
+        await ClientMixin.reset()
@@ -0,0 +1,166 @@
+import threading
+import time
+
+from middlewared.utils.disks import get_disk_names, get_disks_with_identifiers
+from middlewared.utils.threading import set_thread_name, start_daemon_thread
+
+from .realtime_reporting import get_arc_stats, get_cpu_stats, get_disk_stats, get_interface_stats, get_memory_info
+from .realtime_reporting.utils import safely_retrieve_dimension
+
+
+class DiskIdentifiersCache:
+    """
+    Disk names and their identifiers used to look up per-disk netdata charts. These only change
+    when disks come and go so they are refreshed lazily after a udev block device event rather than
+    being recomputed on every sample.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.disks = None
+        self.mapping = None
+
+    def invalidate(self):
+        with self.lock:
+            self.disks = self.mapping = None
+
+    def get(self):
+        with self.lock:
+            if self.disks is None:
+                self.disks = get_disk_names()
+                self.mapping = get_disks_with_identifiers()
+
+            return self.disks, self.mapping
+
+
+class RealtimeSampler:
+    """
+    A single sampling thread for all `reporting.realtime` event sources sharing the same interval.
+
+    Each sample retrieves netdata metrics once, computes the resulting structure once and sends it to
+    every subscribed event source. The thread exits as soon as the last event source unsubscribes.
+    """
+
+    def __init__(self, middleware, interval, disks_cache, on_exit):
+        self.middleware = middleware
+        self.interval = interval
+        self.disks_cache = disks_cache
+        self.on_exit = on_exit
+        self.subscribers = set()
+        self.last_sample = None
+        self.thread = None
+
+    def subscribe(self, event_source):
+        # Called with `RealtimeSamplers.lock` held
+        self.subscribers.add(event_source)
+        if self.last_sample is not None:
+            # Don't make the new subscriber wait for a whole interval
+            event_source.send_event('ADDED', fields=self.last_sample)
+
+        if self.thread is None:
+            self.thread = start_daemon_thread(name=f'RealtimeSampler_{self.interval}', target=self.run)
+
+    def unsubscribe(self, event_source):
+        # Called with `RealtimeSamplers.lock` held
+        self.subscribers.discard(event_source)
+
+    def run(self):
+        set_thread_name(f'realtime_{self.interval}')
+        error = None
+        try:
+            while self.subscribers:
+                data = self.sample()
+                self.last_sample = data
+                for event_source in list(self.subscribers):
+                    event_source.send_event('ADDED', fields=data)
+
+                time.sleep(self.interval)
+        except Exception as e:
+            error = e
+        finally:
+            self.on_exit(self, error)
+
+    def sample(self):
+        # this gathers the most recent metric recorded via netdata (for all charts)
+        retries = 2
+        while retries > 0:
+            try:
+                netdata_metrics = self.middleware.call_sync('netdata.get_all_metrics')
+            except Exception:
+                retries -= 1
+                if retries <= 0:
+                    raise
+
+                time.sleep(0.5)
+            else:
+                break
+
+        if failed_to_connect := not bool(netdata_metrics):
+            return {'failed_to_connect': failed_to_connect}
+
+        disks, disk_mapping = self.disks_cache.get()
+        data = {
+            'zfs': get_arc_stats(netdata_metrics),  # ZFS ARC Size
+            'memory': get_memory_info(netdata_metrics),
+            'cpu': get_cpu_stats(netdata_metrics),
+            'disks': get_disk_stats(netdata_metrics, disks, disk_mapping),
+            'interfaces': get_interface_stats(
+                netdata_metrics, [
+                    iface['name'] for iface in self.middleware.call_sync(
+                        'interface.query', [], {'extra': {'retrieve_names_only': True}}
+                    )
+                ]
+            ),
+            'failed_to_connect': False,
+        }
+
+        # CPU temperature
+        data['cpu']['temperature_celsius'] = safely_retrieve_dimension(
+            netdata_metrics, 'cputemp.temp', 'cpu_temp',
+        ) or None
+
+        return data
+
+
+class RealtimeSamplers:
+    """
+    Registry of running `RealtimeSampler` instances keyed by interval.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samplers = {}
+        self.disks_cache = DiskIdentifiersCache()
+
+    def subscribe(self, middleware, event_source, interval):
+        with self.lock:
+            if (sampler := self.samplers.get(interval)) is None:
+                sampler = self.samplers[interval] = RealtimeSampler(
+                    middleware, interval, self.disks_cache, self._sampler_exited,
+                )
+
+            sampler.subscribe(event_source)
+
+    def unsubscribe(self, event_source, interval):
+        with self.lock:
+            if sampler := self.samplers.get(interval):
+                sampler.unsubscribe(event_source)
+
+    def _sampler_exited(self, sampler, error):
+        with self.lock:
+            if self.samplers.get(sampler.interval) is sampler:
+                self.samplers.pop(sampler.interval)
+
+            subscribers = list(sampler.subscribers)
+            sampler.subscribers.clear()
+
+        if error is None and subscribers:
+            # Someone subscribed while the thread was exiting, hand them over to a new sampler
+            for event_source in subscribers:
+                self.subscribe(sampler.middleware, event_source, sampler.interval)
+        else:
+            for event_source in subscribers:
+                event_source.sampler_failed(error)
+
+
+samplers = RealtimeSamplers()
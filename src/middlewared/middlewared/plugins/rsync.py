@@ -635,7 +635,7 @@ class RsyncTaskService(TaskPathService, TaskStateMixin):
     @item_method
     @accepts(Int('id'))
     @returns()
-    @job(lock=lambda args: args[-1], lock_queue_size=1, logs=True)
+    @job(lock=lambda args: args[-1], lock_queue_size=1, logs=True, priority='LOW')
     def run(self, job, id_):
         """
         Job to run rsync task of `id`.
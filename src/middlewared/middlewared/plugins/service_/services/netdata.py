@@ -1,3 +1,4 @@
+from middlewared.plugins.reporting.netdata.client import ClientMixin
 from middlewared.plugins.service_.services.base import SimpleService
 
 
@@ -8,3 +9,10 @@ class NetdataService(SimpleService):
     restartable = True
 
     systemd_unit = 'netdata'
+
+    async def after_stop(self):
+        # Pooled connections and cached chart responses belong to the netdata instance that was stopped
+        await ClientMixin.reset()
+
+    async def after_restart(self):
+        await ClientMixin.reset()
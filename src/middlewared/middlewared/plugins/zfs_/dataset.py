@@ -6,7 +6,7 @@ from middlewared.schema import accepts, Bool, Dict, Str
 from middlewared.service import CallError, CRUDService, filterable, ValidationErrors
 from middlewared.utils import filter_list
 
-from .dataset_utils import flatten_datasets
+from .dataset_utils import dataset_rows, flatten_datasets, query_properties
 from .utils import get_snapshot_count_cached
 
 
@@ -44,6 +44,15 @@ class ZFSDatasetService(CRUDService):
         children there are for them in `children` key. This retrieval type is slightly faster.
         These options are controlled by `query-options.extra.flat` attribute which defaults to true.
 
+        `query-options.extra.rows` selects a third, compact format which takes precedence over `flat`: every dataset
+        is returned exactly once, without `children`, and with a `parent` key that holds the name of its parent
+        dataset (or null for the top-level datasets retrieved). This avoids duplicating each dataset in all of its
+        ancestors and is what internal consumers should use to rebuild the hierarchy themselves. In this format,
+        `query-filters` are matched against the top-level datasets and select them along with their descendants.
+
+        If `query-options.extra.properties` is not specified but `query-options.select` is, only the properties
+        referenced by `query-filters`, `query-options.select` and `query-options.order_by` are retrieved.
+
         `query-options.extra.user_properties` controls if user defined properties of datasets should be retrieved
         or not.
 
@@ -55,6 +64,7 @@ class ZFSDatasetService(CRUDService):
         extra = options.get('extra', {}).copy()
         props = extra.get('properties', None)
         flat = extra.get('flat', True)
+        rows = extra.get('rows', False)
         user_properties = extra.get('user_properties', True)
         retrieve_properties = extra.get('retrieve_properties', True)
         retrieve_children = extra.get('retrieve_children', True)
@@ -67,6 +77,9 @@ class ZFSDatasetService(CRUDService):
             # be retrieved
             user_properties = False
             props = []
+        elif props is None and (props := query_properties(filters, options)) is not None:
+            # Only retrieve what is needed for the query
+            user_properties = user_properties and any(':' in prop for prop in props)
 
         with libzfs.ZFS() as zfs:
             # Handle `id` or `name` filter specially to avoiding getting all datasets
@@ -86,7 +99,12 @@ class ZFSDatasetService(CRUDService):
                     kwargs['datasets'] = filters[0][2]
 
             datasets = zfs.datasets_serialized(**kwargs)
-            if flat:
+            if rows:
+                # Filters select top-level datasets along with all of their descendants, otherwise the hierarchy
+                # could not be rebuilt from the rows
+                datasets = dataset_rows(filter_list(datasets, filters))
+                filters = []
+            elif flat:
                 datasets = flatten_datasets(datasets)
             else:
                 datasets = list(datasets)
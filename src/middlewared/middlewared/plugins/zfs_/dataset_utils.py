@@ -1,5 +1,50 @@
 from copy import deepcopy
 
+from middlewared.utils import query_fields
+
 
 def flatten_datasets(datasets):
-    return sum([[deepcopy(ds)] + flatten_datasets(ds.get('children') or []) for ds in datasets], [])
+    flat = []
+    for ds in datasets:
+        flat.append(deepcopy(ds))
+        flat.extend(flatten_datasets(ds.get('children') or []))
+
+    return flat
+
+
+def dataset_rows(datasets):
+    """
+    Flatten `datasets` hierarchy in place into a list of rows (in pre-order, same as `flatten_datasets`).
+
+    Each dataset is only present once: its `children` key is replaced with `parent` which is the name of its parent
+    dataset (or `None` for the top-level datasets of the hierarchy).
+    """
+    rows = []
+    stack = [(ds, None) for ds in reversed(datasets)]
+    while stack:
+        ds, parent = stack.pop()
+        children = ds.pop('children', None) or []
+        ds['parent'] = parent
+        rows.append(ds)
+        stack.extend((child, ds['name']) for child in reversed(children))
+
+    return rows
+
+
+def query_properties(filters, options):
+    """
+    ZFS properties that `zfs.dataset.query` needs to retrieve to evaluate `filters` and `options` or `None` if all of
+    them are needed.
+    """
+    if (fields := query_fields(filters, options)) is None:
+        return None
+
+    props = set()
+    for field in fields:
+        if field[0] == 'children' or (field[0] == 'properties' and len(field) == 1):
+            return None
+
+        if field[0] == 'properties':
+            props.add(field[1])
+
+    return sorted(props)
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import Mock
+
+import pytest
+from truenas_api_client import json
+
+from middlewared.api.base.server.ws_handler import serializer
+from middlewared.api.base.server.ws_handler.rpc import RpcWebSocketApp
+
+
+@pytest.mark.parametrize("data", [
+    {"id": 1, "name": "tank", "children": [{"id": 2}], "used": 2 ** 63 + 1},
+    {"date": datetime(2024, 1, 1, tzinfo=timezone.utc), "set": {1}, "keys": {1: "a"}},
+    ["a", None, True, 1.5, "ü"],
+])
+def test_orjson_serializer_is_compatible(data):
+    pytest.importorskip("orjson")
+
+    assert json.loads(serializer.OrjsonSerializer().dumps(data)) == json.loads(serializer.JSONSerializer().dumps(data))
+
+
+def test_serializer_stats():
+    stats = serializer.SerializerStats(offload_threshold=100)
+    assert not stats.should_offload("pool.dataset.query")
+
+    stats.record("pool.dataset.query", 1000, 0.5, False)
+    assert stats.should_offload("pool.dataset.query")
+
+    stats.record("pool.dataset.query", 10, 0.1, True)
+    assert not stats.should_offload("pool.dataset.query")
+
+    assert stats.get_stats() == {
+        "pool.dataset.query": {
+            "count": 2,
+            "offloaded": 1,
+            "max_size": 1000,
+            "avg_size": 505,
+            "max_time": 0.5,
+            "avg_time": 0.3,
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_large_responses_are_serialized_in_thread(monkeypatch):
+    stats = serializer.SerializerStats(offload_threshold=100)
+    monkeypatch.setattr("middlewared.api.base.server.ws_handler.rpc.serializer_stats", stats)
+
+    async def run_in_thread(method, *args):
+        return await asyncio.to_thread(method, *args)
+
+    app = RpcWebSocketApp(Mock(run_in_thread=Mock(side_effect=run_in_thread)), None, Mock())
+    response = {"jsonrpc": "2.0", "result": ["x" * 100], "id": 1}
+    for i in range(2):
+        assert json.loads(await app.serialize_response("disk.query", response)) == response
+
+    assert app.middleware.run_in_thread.call_count == 1
+    assert stats.get_stats()["disk.query"]["offloaded"] == 1
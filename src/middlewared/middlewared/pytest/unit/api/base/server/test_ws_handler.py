@@ -1,6 +1,12 @@
+import asyncio
+import json
+from unittest.mock import Mock
+
 import pytest
+from truenas_api_client.jsonrpc import JSONRPCError
 
-from middlewared.api.base.server.ws_handler.rpc import RpcWebSocketHandler
+from middlewared.api.base.server.ws_handler.rpc import RpcWebSocketApp, RpcWebSocketHandler
+from middlewared.service_exception import CallError
 
 
 @pytest.mark.parametrize(
@@ -97,3 +103,150 @@ async def test_validate_message(ws_msg, error_type):
             await RpcWebSocketHandler.validate_message(ws_msg)
     else:
         await RpcWebSocketHandler.validate_message(ws_msg)
+
+
+class FakeWebSocket:
+    closed = False
+
+    def __init__(self):
+        self.frames = []
+
+    async def send_str(self, data):
+        self.frames.append(json.loads(data))
+
+
+class FakeMethod:
+    name = "test.method"
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def call(self, app, params):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.running -= 1
+
+        if params == ["fail"]:
+            raise CallError("failed")
+
+        return params
+
+
+def make_rpc():
+    loop = asyncio.get_running_loop()
+    middleware = Mock(loop=loop, create_task=loop.create_task)
+    handler = RpcWebSocketHandler(middleware, [])
+    handler.methods = {"test.method": FakeMethod()}
+    app = RpcWebSocketApp(middleware, None, FakeWebSocket())
+    return handler, app
+
+
+async def wait_frames(app, count):
+    while len(app.ws.frames) < count:
+        await asyncio.sleep(0.01)
+
+    return app.ws.frames
+
+
+@pytest.mark.asyncio
+async def test_batch():
+    handler, app = make_rpc()
+    await handler.process_batch(app, [
+        {"jsonrpc": "2.0", "method": "test.method", "params": [1], "id": 1},
+        {"jsonrpc": "2.0", "method": "test.method", "params": [2]},
+        {"jsonrpc": "2.0", "method": "test.method", "params": ["fail"], "id": 3},
+        {"jsonrpc": "2.0", "method": "test.missing", "id": 4},
+        5,
+    ])
+
+    [frame] = await wait_frames(app, 1)
+    assert frame[0] == {"jsonrpc": "2.0", "result": [1], "id": 1}
+    assert frame[1]["id"] == 3
+    assert frame[1]["error"]["code"] == JSONRPCError.TRUENAS_CALL_ERROR.value
+    assert frame[2]["error"]["code"] == JSONRPCError.METHOD_NOT_FOUND.value
+    assert frame[3] == {"jsonrpc": "2.0", "error": {"code": JSONRPCError.INVALID_REQUEST.value,
+                                                    "message": "Invalid Request"}, "id": None}
+
+
+@pytest.mark.asyncio
+async def test_batch_empty():
+    handler, app = make_rpc()
+    await handler.process_batch(app, [])
+
+    [frame] = await wait_frames(app, 1)
+    assert frame["error"]["code"] == JSONRPCError.INVALID_REQUEST.value
+
+
+@pytest.mark.asyncio
+async def test_batch_notifications():
+    handler, app = make_rpc()
+    await handler.process_batch(app, [{"jsonrpc": "2.0", "method": "test.method"}])
+    await asyncio.sleep(0.05)
+
+    assert app.ws.frames == []
+
+
+@pytest.mark.asyncio
+async def test_batch_respects_soft_limit():
+    handler, app = make_rpc()
+    await handler.process_batch(app, [
+        {"jsonrpc": "2.0", "method": "test.method", "params": [i], "id": i} for i in range(50)
+    ])
+
+    [frame] = await wait_frames(app, 1)
+    assert [response["result"] for response in frame] == [[i] for i in range(50)]
+    assert handler.methods["test.method"].max_running == app.softhardsemaphore.softlimit
+
+
+@pytest.mark.asyncio
+async def test_send_keeps_order():
+    handler, app = make_rpc()
+    for i in range(100):
+        app.send(i)
+
+    assert await wait_frames(app, 100) == list(range(100))
+    assert not app.outbox_writing
+
+
+@pytest.mark.asyncio
+async def test_queued_message_fails_when_connection_fails():
+    handler, app = make_rpc()
+    app.ws.send_str = Mock(side_effect=ConnectionResetError())
+
+    written = asyncio.get_running_loop().create_future()
+    app.queue_outbox("{}", written)
+    with pytest.raises(ConnectionResetError):
+        await written
+
+    assert not app.outbox
+    assert not app.outbox_writing
+
+
+@pytest.mark.asyncio
+async def test_events_and_responses_share_outbox():
+    handler, app = make_rpc()
+    app.subscriptions["1"] = "*"
+    app.send({"id": 1})
+    app.send_event("core.get_jobs", "CHANGED", id=1, fields={"state": "RUNNING"})
+    event = asyncio.create_task(app.send_frame(json.dumps({"id": 2})))
+    await asyncio.sleep(0)
+    app.send({"id": 3})
+
+    await event
+    frames = await wait_frames(app, 4)
+    assert frames[0] == {"id": 1}
+    assert frames[1]["params"]["msg"] == "changed"
+    assert frames[2:] == [{"id": 2}, {"id": 3}]
+
+
+@pytest.mark.asyncio
+async def test_send_frame_fails_when_connection_fails():
+    handler, app = make_rpc()
+    app.ws.send_str = Mock(side_effect=ConnectionResetError())
+
+    with pytest.raises(ConnectionResetError):
+        await app.send_frame("{}")
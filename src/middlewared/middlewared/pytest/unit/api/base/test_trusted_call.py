@@ -0,0 +1,78 @@
+import types
+
+import pytest
+
+from middlewared.api.base import BaseModel
+from middlewared.api.base.decorator import api_method
+from middlewared.api.base.handler.accept import accept_params, trusted_params
+from middlewared.api.base.handler.stats import validation_stats
+from middlewared.api.current import QueryArgs
+from middlewared.service_exception import CallError, ValidationErrors
+from middlewared.utils.service.call import ServiceCallMixin
+
+
+class MethodArgs(BaseModel):
+    number: int
+    options: QueryArgs = QueryArgs()
+
+
+class MethodResult(BaseModel):
+    result: list
+
+
+class Service:
+    @api_method(MethodArgs, MethodResult, private=True)
+    def method(self, number, options):
+        return [number, options]
+
+    @api_method(MethodArgs, MethodResult, audit="Method", audit_callback=True, private=True)
+    def audited_method(self, audit_callback, number, options):
+        audit_callback(str(number))
+        return [number, options]
+
+
+def test_trusted_params_defaults():
+    assert trusted_params(MethodArgs, [1]) == accept_params(MethodArgs, [1])
+
+
+def test_trusted_params_does_not_validate():
+    assert trusted_params(MethodArgs, ["1", {"filters": []}]) == ["1", {"filters": []}]
+
+
+def test_trusted_params_defaults_are_not_shared():
+    trusted_params(MethodArgs, [1])[1]["options"]["select"].append("name")
+    assert trusted_params(MethodArgs, [1])[1]["options"]["select"] == []
+
+
+def test_trusted_params_required():
+    with pytest.raises(ValidationErrors):
+        trusted_params(MethodArgs, [])
+
+    with pytest.raises(CallError):
+        trusted_params(MethodArgs, [1, {}, 2])
+
+
+def test_get_trusted_method():
+    service = Service()
+    trusted = ServiceCallMixin().get_trusted_method(service.method)
+    assert isinstance(trusted, types.MethodType)
+
+    assert trusted("1") == ["1", accept_params(MethodArgs, [1])[1]]
+    with pytest.raises(ValidationErrors):
+        service.method("x")
+
+    stats = validation_stats.get_stats()["Service.method"]
+    assert stats["trusted"]["count"] == 1
+    assert stats["accept"]["count"] == 1
+
+
+def test_get_trusted_method_audit_callback():
+    service = Service()
+    trusted = ServiceCallMixin().get_trusted_method(service.audited_method)
+
+    for attr in ("audit", "audit_callback", "audit_extended", "rate_limit", "roles", "_private", "new_style_accepts"):
+        assert getattr(trusted, attr) == getattr(service.audited_method, attr)
+
+    audit = []
+    assert trusted(audit.append, "1") == ["1", accept_params(MethodArgs, [1])[1]]
+    assert audit == ["1"]
@@ -50,6 +50,12 @@ class Middleware(SchemasMixin, dict):
     async def run_in_thread(self, method, *args, **kwargs):
         return method(*args, **kwargs)
 
+    def run_coroutine(self, coro, wait=True):
+        fut = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if not wait:
+            return fut
+        return fut.result()
+
     def _query_filter(self, lst):
         def query(filters=None, options=None):
             return filter_list(lst, filters, options)
@@ -0,0 +1,26 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+from middlewared.plugins.disk_.disk_events import udev_block_devices_hook
+from middlewared.pytest.unit.middleware import Middleware
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data,synced", [
+    ({"ACTION": "change", "RESIZE": "1"}, True),
+    ({"ACTION": "change", "DISK_MEDIA_CHANGE": "1"}, True),
+    # Partition table was re-read
+    ({"ACTION": "change"}, False),
+    ({"ACTION": "change", "SYNTH_UUID": "0"}, False),
+])
+async def test_change_event(data, synced):
+    m = Middleware()
+    m["disk.sync"] = AsyncMock()
+
+    await udev_block_devices_hook(m, {"SUBSYSTEM": "block", "DEVTYPE": "disk", "SYS_NAME": "sda", **data})
+
+    if synced:
+        m["disk.sync"].assert_called_once_with("sda")
+    else:
+        m["disk.sync"].assert_not_called()
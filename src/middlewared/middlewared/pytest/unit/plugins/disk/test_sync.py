@@ -0,0 +1,125 @@
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from middlewared.plugins.disk_.sync import DiskInventory, DiskService
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.pytest.unit.plugins.disk.test_sync_all import db_disk, sys_disk
+
+
+def disk_service(m, inventory):
+    m["datastore.bulk_write"] = Mock()
+    m["alert.oneshot_create"] = Mock()
+    m["alert.oneshot_delete"] = Mock()
+
+    service = DiskService(m)
+    service.inventory = DiskInventory(inventory)
+    service.restart_services_after_sync = AsyncMock()
+    return service
+
+
+@pytest.mark.asyncio
+async def test_sync_replaced_disk():
+    m = Middleware()
+    m["device.get_system_disk"] = Mock(return_value=sys_disk("nvme1n1", "C"))
+    m["datastore.query"] = Mock(return_value=[db_disk("nvme1n1", "B")])
+    service = disk_service(m, {"nvme0n1": "{serial}A", "nvme1n1": "{serial}B"})
+
+    await service.sync("nvme1n1")
+
+    [(name, operations, options)] = [c.args for c in m["datastore.bulk_write"].call_args_list]
+    assert [operation[:2] for operation in operations] == [
+        ["update", "{serial}B"],
+        ["insert", {**operations[1][1], "disk_identifier": "{serial}C", "disk_name": "nvme1n1"}],
+    ]
+    assert operations[0][2]["disk_expiretime"] is not None
+    assert service.inventory.names == {"nvme0n1": "{serial}A", "nvme1n1": "{serial}C"}
+    service.restart_services_after_sync.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_sync_unchanged_disk():
+    m = Middleware()
+    m["device.get_system_disk"] = Mock(return_value=sys_disk("nvme0n1", "A"))
+    m["datastore.query"] = Mock(return_value=[db_disk("nvme0n1", "A")])
+    service = disk_service(m, {"nvme0n1": "{serial}A"})
+
+    await service.sync("nvme0n1")
+
+    m["datastore.bulk_write"].assert_not_called()
+    service.restart_services_after_sync.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_sync_does_not_restart_services_for_irrelevant_changes():
+    m = Middleware()
+    m["device.get_system_disk"] = Mock(return_value={**sys_disk("nvme0n1", "A"), "size": 2048})
+    m["datastore.query"] = Mock(return_value=[db_disk("nvme0n1", "A")])
+    service = disk_service(m, {"nvme0n1": "{serial}A"})
+
+    await service.sync("nvme0n1")
+
+    [(name, operations, options)] = [c.args for c in m["datastore.bulk_write"].call_args_list]
+    assert [operation[:2] for operation in operations] == [["update", "{serial}A"]]
+    assert operations[0][2]["disk_size"] == 2048
+    service.restart_services_after_sync.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_sync_removed():
+    m = Middleware()
+    m["device.get_system_disk"] = Mock(return_value=None)
+    m["datastore.query"] = Mock(return_value=[db_disk("nvme1n1", "B")])
+    service = disk_service(m, {"nvme0n1": "{serial}A", "nvme1n1": "{serial}B"})
+
+    await service.sync_removed("nvme1n1")
+
+    [(name, operations, options)] = [c.args for c in m["datastore.bulk_write"].call_args_list]
+    assert [operation[:2] for operation in operations] == [["update", "{serial}B"]]
+    assert operations[0][2]["disk_expiretime"] is not None
+    assert service.inventory.names == {"nvme0n1": "{serial}A"}
+    service.restart_services_after_sync.assert_called_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name,device", [
+    ("nvme2n1", None),  # unknown disk
+    ("nvme1n1", sys_disk("nvme1n1", "C")),  # the name was already reused by another disk
+])
+async def test_sync_removed_noop(name, device):
+    m = Middleware()
+    m["device.get_system_disk"] = Mock(return_value=device)
+    m["datastore.query"] = Mock()
+    service = disk_service(m, {"nvme0n1": "{serial}A", "nvme1n1": "{serial}B"})
+
+    await service.sync_removed(name)
+
+    m["datastore.query"].assert_not_called()
+    m["datastore.bulk_write"].assert_not_called()
+    service.restart_services_after_sync.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name,dif,dif_formatted", [
+    ("nvme1n1", True, ["nvme0n1", "nvme1n1"]),  # DIF disks that were not synced are still reported
+    ("nvme0n1", False, []),  # the only DIF disk was reformatted
+    ("nvme1n1", False, None),  # nothing changed
+])
+async def test_sync_dif_formatted(name, dif, dif_formatted):
+    m = Middleware()
+    m["device.get_system_disk"] = Mock(return_value={**sys_disk(name, "A"), "dif": dif})
+    m["datastore.query"] = Mock(return_value=[])
+    service = disk_service(m, {})
+    service.dif_formatted = {"nvme0n1"}
+
+    await service.sync(name)
+
+    if dif_formatted:
+        m["alert.oneshot_create"].assert_called_once_with("DifFormatted", dif_formatted)
+        m["alert.oneshot_delete"].assert_not_called()
+    elif dif_formatted == []:
+        m["alert.oneshot_create"].assert_not_called()
+        m["alert.oneshot_delete"].assert_called_once_with("DifFormatted", None)
+    else:
+        m["alert.oneshot_create"].assert_not_called()
+        m["alert.oneshot_delete"].assert_not_called()
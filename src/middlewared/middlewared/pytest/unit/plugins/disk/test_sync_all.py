@@ -0,0 +1,92 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import Mock
+
+import pytest
+
+from middlewared.plugins.disk_.sync import DiskService
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.utils.time_utils import utc_now
+
+
+def sys_disk(name, serial):
+    return {
+        "name": name, "serial": serial, "serial_lunid": None, "lunid": None, "rotationrate": None, "type": "SSD",
+        "size": 1024, "subsystem": "nvme", "number": 0, "model": "Model", "bus": "NVME", "dif": False, "parts": [],
+    }
+
+
+def db_disk(name, serial, expiretime=None):
+    return {
+        "disk_identifier": f"{{serial}}{serial}", "disk_name": name, "disk_serial": serial, "disk_lunid": None,
+        "disk_rotationrate": None, "disk_type": "SSD", "disk_size": "1024", "disk_subsystem": "nvme",
+        "disk_number": 0, "disk_model": "Model", "disk_bus": "NVME", "disk_expiretime": expiretime,
+        "disk_kmip_uid": None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_sync_all_writes_changes_at_once():
+    m = Middleware()
+    m.loop = asyncio.get_running_loop()
+    m["failover.licensed"] = Mock(return_value=False)
+    m["device.get_disks"] = Mock(return_value={
+        "nvme0n1": sys_disk("nvme0n1", "A"),
+        "nvme1n1": sys_disk("nvme1n1", "B"),
+        "nvme2n1": sys_disk("nvme2n1", "C"),
+        "nvme3n1": sys_disk("nvme3n1", "E"),
+    })
+    expired = utc_now() - timedelta(days=1)
+    db_disks = [
+        db_disk("nvme0n1", "A"),  # unchanged
+        db_disk("nvme2n1", "B"),  # renamed
+        db_disk("nvme5n1", "D"),  # gone
+        db_disk("nvme6n1", "F", expired),  # expired
+        db_disk("nvme3n1", "E", expired),  # expired, but then found
+    ]
+    m["datastore.query"] = Mock(side_effect=[db_disks, db_disks + [db_disk("nvme2n1", "C")]])
+    m["datastore.bulk_write"] = Mock()
+    m["alert.oneshot_delete"] = Mock()
+    m["disk.restart_services_after_sync"] = Mock()
+
+    service = DiskService(m)
+    await asyncio.to_thread(service.sync_all, Mock(), {"zfs_guid": False})
+
+    [(name, operations, options)] = [c.args for c in m["datastore.bulk_write"].call_args_list]
+    assert name == "storage.disk"
+    assert [operation[:2] for operation in operations] == [
+        ["update", "{serial}B"],
+        ["update", "{serial}D"],
+        ["delete", "{serial}F"],
+        ["update", "{serial}E"],
+        ["insert", {**operations[4][1], "disk_identifier": "{serial}C", "disk_name": "nvme2n1"}],
+    ]
+    assert operations[0][2]["disk_name"] == "nvme1n1"
+    assert operations[1][2]["disk_expiretime"] is not None
+    assert operations[3][2]["disk_expiretime"] is None
+    assert options == {"send_events": False, "ha_sync": False}
+    assert service.inventory.names == {
+        "nvme0n1": "{serial}A", "nvme1n1": "{serial}B", "nvme2n1": "{serial}C", "nvme3n1": "{serial}E",
+    }
+
+
+@pytest.mark.asyncio
+async def test_sync_all_waits_for_single_disk_sync():
+    m = Middleware()
+    m.loop = asyncio.get_running_loop()
+    m["failover.licensed"] = Mock(return_value=False)
+    m["device.get_disks"] = Mock(return_value={"nvme0n1": sys_disk("nvme0n1", "A")})
+    m["datastore.query"] = Mock(return_value=[db_disk("nvme0n1", "A")])
+    m["alert.oneshot_delete"] = Mock()
+
+    service = DiskService(m)
+    # A lock that waited for something is bound to the event loop of the test
+    service.inventory_lock = asyncio.Lock()
+    async with service.inventory_lock:
+        sync_all = asyncio.create_task(asyncio.to_thread(service.sync_all, Mock(), {"zfs_guid": False}))
+        await asyncio.sleep(0.1)
+        m["device.get_disks"].assert_not_called()
+
+    await sync_all
+    assert service.inventory.names == {"nvme0n1": "{serial}A"}
+    assert not service.inventory_lock.locked()
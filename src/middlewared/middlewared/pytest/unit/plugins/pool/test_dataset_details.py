@@ -0,0 +1,125 @@
+from unittest.mock import Mock, patch
+
+from middlewared.plugins.pool_.dataset_details import PoolDatasetService
+
+
+MNTINFO = {
+    1: {'mountpoint': '/mnt/tank', 'mount_source': 'tank', 'mount_opts': ['RW'], 'super_opts': ['CASESENSITIVE']},
+    2: {
+        'mountpoint': '/mnt/tank/data', 'mount_source': 'tank/data', 'mount_opts': ['RO', 'NOATIME'],
+        'super_opts': ['CASEINSENSITIVE'],
+    },
+}
+MOUNT_SOURCES = {
+    '/mnt/tank/data/smb': 'tank/data',
+    '/mnt/tank/data/file.img': 'tank/data',
+    '/mnt/tank/data/vm.raw': 'tank/data',
+}
+CALLS = {
+    'iscsi.targetextent.query': [{'target': 1, 'extent': 1}, {'target': 1, 'extent': 2}, {'target': 2, 'extent': 3}],
+    'iscsi.target.query': [{'id': 1, 'groups': [{}]}, {'id': 2, 'groups': []}],
+    'iscsi.extent.query': [
+        {'id': 1, 'type': 'DISK', 'path': 'zvol/tank/zvol', 'enabled': True},
+        {'id': 2, 'type': 'FILE', 'path': '/mnt/tank/data/file.img', 'enabled': False},
+        {'id': 3, 'type': 'DISK', 'path': 'zvol/tank/zvol', 'enabled': True},
+    ],
+    'sharing.nfs.query': [
+        {'path': '/mnt/tank/data', 'enabled': True},
+        {'path': '/mnt/tank', 'enabled': False},
+    ],
+    'sharing.smb.query': [
+        {'path': '/mnt/tank/data/smb', 'enabled': True, 'name': 'smb'},
+        {'path': '/mnt/tank/data', 'enabled': True, 'name': 'data'},
+    ],
+    'storage.replication': [
+        {'direction': 'PUSH', 'source_datasets': ['tank/data', 'tank']},
+        {'direction': 'PULL', 'source_datasets': ['tank/data']},
+    ],
+    'storage.task': [{'dataset': 'tank/data'}, {'dataset': 'tank/data'}],
+    'tasks.cloudsync': [
+        {'direction': 'PUSH', 'path': '/mnt/tank/'},
+        {'direction': 'PUSH', 'path': '/mnt/tank/data/smb'},
+        {'direction': 'PULL', 'path': '/mnt/tank'},
+    ],
+    'rsynctask.query': [{'direction': 'PUSH', 'path': '/mnt'}],
+    'vm.vm': [{'id': 1, 'name': 'vm1'}],
+    'vm.device.query': [
+        {'vm': 1, 'attributes': {'dtype': 'DISK', 'path': '/dev/zvol/tank/zvol'}},
+        {'vm': 1, 'attributes': {'dtype': 'RAW', 'path': '/mnt/tank/data/vm.raw'}},
+    ],
+    'app.query': [
+        {'name': 'app1', 'active_workloads': {'volumes': [
+            {'source': '/mnt/tank/data'}, {'source': '/mnt/.ix-apps/app1'}, {'source': '/var/log'},
+        ]}},
+    ],
+    'virt.instance.query': [{'id': 'instance1'}],
+    'virt.instance.device_list': [
+        {'dev_type': 'DISK', 'source': '/dev/zvol/tank/zvol'},
+        {'dev_type': 'DISK', 'source': None},
+        {'dev_type': 'NIC', 'source': '/mnt/tank'},
+    ],
+}
+
+
+def call_sync(method, *args):
+    if method == 'datastore.query':
+        method = args[0]
+    return [entry.copy() for entry in CALLS[method]]
+
+
+def dataset(name, mountpoint):
+    return {
+        'id': name,
+        'mountpoint': mountpoint,
+        'locked': False,
+        'reservation': {'value': None},
+        'refreservation': {'value': None},
+    }
+
+
+def test__dataset_details_consumers():
+    service = PoolDatasetService(Mock(call_sync=call_sync))
+    with patch.object(service, 'get_mount_source', side_effect=lambda path, mntinfo: MOUNT_SOURCES.get(path)):
+        info = service.build_details(MNTINFO)
+
+    tank = dataset('tank', '/mnt/tank')
+    data = dataset('tank/data', '/mnt/tank/data')
+    zvol = dataset('tank/zvol', None)
+    for ds in (tank, data, zvol):
+        service.normalize_dataset(ds, info, MNTINFO)
+
+    assert (tank['atime'], tank['casesensitive'], tank['readonly']) == (True, True, False)
+    assert (data['atime'], data['casesensitive'], data['readonly']) == (False, False, True)
+
+    assert tank['nfs_shares'] == [{'enabled': False, 'path': '/mnt/tank'}]
+    assert data['nfs_shares'] == [{'enabled': True, 'path': '/mnt/tank/data'}]
+    assert data['smb_shares'] == [
+        {'enabled': True, 'path': '/mnt/tank/data/smb', 'share_name': 'smb'},
+        {'enabled': True, 'path': '/mnt/tank/data', 'share_name': 'data'},
+    ]
+    assert data['iscsi_shares'] == [{'enabled': False, 'type': 'FILE', 'path': '/mnt/tank/data/file.img'}]
+    assert zvol['iscsi_shares'] == [{'enabled': True, 'type': 'DISK', 'path': '/dev/zvol/tank/zvol'}]
+    assert zvol['vms'] == [{'name': 'vm1', 'path': '/dev/zvol/tank/zvol'}]
+    assert data['vms'] == [{'name': 'vm1', 'path': '/mnt/tank/data/vm.raw'}]
+    assert zvol['virt_instances'] == [{'name': 'instance1', 'path': '/dev/zvol/tank/zvol'}]
+    assert data['apps'] == [{'name': 'app1', 'path': '/mnt/tank/data'}]
+    assert tank['apps'] == []
+
+    assert (tank['replication_tasks_count'], data['replication_tasks_count']) == (1, 1)
+    assert (tank['snapshot_tasks_count'], data['snapshot_tasks_count']) == (0, 2)
+    assert (tank['cloudsync_tasks_count'], data['cloudsync_tasks_count'], zvol['cloudsync_tasks_count']) == (1, 1, 0)
+    assert (tank['rsync_tasks_count'], data['rsync_tasks_count']) == (1, 1)
+
+
+def test__dataset_details_entries_not_shared():
+    service = PoolDatasetService(Mock(call_sync=call_sync))
+    with patch.object(service, 'get_mount_source', return_value=None):
+        info = service.build_details(MNTINFO)
+
+    first = dataset('tank', '/mnt/tank')
+    second = dataset('tank', '/mnt/tank')
+    for ds in (first, second):
+        service.normalize_dataset(ds, info, MNTINFO)
+
+    first['nfs_shares'][0]['enabled'] = True
+    assert second['nfs_shares'] == [{'enabled': False, 'path': '/mnt/tank'}]
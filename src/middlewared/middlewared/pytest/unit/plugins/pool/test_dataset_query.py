@@ -0,0 +1,123 @@
+import copy
+from unittest.mock import Mock
+
+import pytest
+
+from middlewared.plugins.pool_.dataset import PoolDatasetService
+from middlewared.plugins.zfs_.dataset_utils import dataset_rows, query_properties
+from middlewared.pytest.unit.middleware import Middleware
+
+# Bypass `query-filters`/`query-options` schema validation that needs the full middleware
+query = PoolDatasetService.query.wraps.wraps
+
+
+def zfs_dataset(name, children=None):
+    return {
+        'id': name,
+        'name': name,
+        'pool': name.split('/')[0],
+        'type': 'FILESYSTEM',
+        'encrypted': False,
+        'encryption_root': None,
+        'key_loaded': False,
+        'properties': {
+            'used': {'value': name},
+            'dedup': {'value': 'off'},
+            'org.freenas:description': {'value': f'{name} description'},
+            'custom:prop': {'value': name},
+        },
+        'children': children or [],
+    }
+
+
+ZFS_DATASETS = [
+    zfs_dataset('tank', [
+        zfs_dataset('tank/a', [zfs_dataset('tank/a/b')]),
+        zfs_dataset('tank/.system', [zfs_dataset('tank/.system/cores')]),
+        zfs_dataset('tank/c'),
+    ]),
+]
+
+
+def test__dataset_rows():
+    rows = dataset_rows(copy.deepcopy(ZFS_DATASETS))
+
+    assert [(row['name'], row['parent']) for row in rows] == [
+        ('tank', None),
+        ('tank/a', 'tank'),
+        ('tank/a/b', 'tank/a'),
+        ('tank/.system', 'tank'),
+        ('tank/.system/cores', 'tank/.system'),
+        ('tank/c', 'tank'),
+    ]
+    assert all('children' not in row for row in rows)
+
+
+@pytest.mark.parametrize('filters,options,result', [
+    ([], {}, None),
+    ([['properties.used.value', '>', 0]], {}, None),
+    ([['name', '=', 'tank']], {'select': ['name', 'properties.used']}, ['used']),
+    (
+        [['OR', [['properties.quota.value', '=', 0], [['properties.refquota.value', '=', 0]]]]],
+        {'select': [['properties.used', 'used']], 'order_by': ['-properties.available.value']},
+        ['available', 'quota', 'refquota', 'used'],
+    ),
+    ([], {'select': ['name', 'properties']}, None),
+    ([], {'select': ['name', 'children']}, None),
+])
+def test__query_properties(filters, options, result):
+    assert query_properties(filters, options) == result
+
+
+@pytest.fixture
+def service():
+    m = Middleware()
+    m['pool.dataset.internal_datasets_filters'] = lambda: [['id', 'rnin', '/.system']]
+    m['zfs.dataset.query'] = Mock(side_effect=lambda filters, options: dataset_rows(copy.deepcopy(ZFS_DATASETS)))
+    return PoolDatasetService(m)
+
+
+def test__query_flat(service):
+    datasets = query(service, [], {})
+
+    assert [ds['id'] for ds in datasets] == ['tank', 'tank/a', 'tank/a/b', 'tank/c']
+    tank, a, b, c = datasets
+    # Internal datasets are filtered from children too and children are shared with their own entries
+    assert tank['children'] == [a, c]
+    assert tank['children'][0] is a
+    assert a['children'][0] is b
+    assert b['children'] == []
+    assert tank['deduplication'] == {'value': 'OFF'}
+    assert tank['comments'] == {'value': 'tank description'}
+    assert tank['user_properties'] == {'custom:prop': {'value': 'tank'}}
+    assert tank['locked'] is False
+    assert 'properties' not in tank
+    assert 'parent' not in tank
+
+
+def test__query_hierarchical(service):
+    datasets = query(service, [], {'extra': {'flat': False}})
+
+    assert [ds['id'] for ds in datasets] == ['tank']
+    assert [ds['id'] for ds in datasets[0]['children']] == ['tank/a', 'tank/c']
+    assert [ds['id'] for ds in datasets[0]['children'][0]['children']] == ['tank/a/b']
+
+
+@pytest.mark.parametrize('options,props,user_props', [
+    ({}, None, True),
+    ({'extra': {'properties': ['used']}}, ['used'], True),
+    ({'select': ['id', 'used']}, ['used'], False),
+    ({'select': ['id', 'deduplication'], 'order_by': ['-id']}, ['dedup'], False),
+    ({'select': ['id', 'comments']}, ['org.freenas:description'], True),
+    ({'select': ['id', 'locked']}, ['encryption', 'encryptionroot', 'keyformat', 'keystatus'], False),
+    ({'select': ['id', 'user_properties']}, [], True),
+    ({'select': ['id', 'children']}, None, True),
+    ({'select': ['id', 'used'], 'extra': {'retrieve_user_props': False}}, ['used'], False),
+])
+def test__query_pushes_down_properties(service, options, props, user_props):
+    query(service, [], options)
+
+    extra = service.middleware['zfs.dataset.query'].call_args[0][1]['extra']
+    assert extra['rows'] is True
+    assert extra['properties'] == props
+    assert extra['user_properties'] is user_props
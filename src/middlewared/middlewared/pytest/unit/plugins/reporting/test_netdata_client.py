@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.plugins.reporting.netdata.client import ChartResponseCache, ClientMixin
+from middlewared.plugins.reporting.netdata.utils import NETDATA_UPDATE_EVERY
+
+
+RESPONSE = {'labels': ['time', 'value'], 'data': [[1, 10], [2, 0]]}
+
+
+def test_cache_returns_independent_copies():
+    cache = ChartResponseCache()
+    uri = f'http://127.0.0.1/api/v1/data?chart=cpu.cpu&before={int(time.time()) - 3600}'
+    first = cache.put(uri, RESPONSE)
+    first.pop('labels')
+    first['data'].pop()
+
+    assert cache.get(uri) == RESPONSE
+
+
+def test_cache_live_query_expires_with_collection_cycle():
+    cache = ChartResponseCache()
+    uri = 'http://127.0.0.1/api/v1/data?chart=cpu.cpu&before=0'
+    now = time.time()
+    with patch('middlewared.plugins.reporting.netdata.client.time.time', return_value=now):
+        cache.put(uri, RESPONSE)
+        assert cache.get(uri) == RESPONSE
+
+    with patch(
+        'middlewared.plugins.reporting.netdata.client.time.time', return_value=now + NETDATA_UPDATE_EVERY,
+    ):
+        assert cache.get(uri) is None
+
+
+def test_cache_historical_query_is_final():
+    cache = ChartResponseCache()
+    now = time.time()
+    uri = f'http://127.0.0.1/api/v1/data?chart=cpu.cpu&before={int(now) - 3600}'
+    cache.put(uri, RESPONSE)
+    with patch(
+        'middlewared.plugins.reporting.netdata.client.time.time', return_value=now + NETDATA_UPDATE_EVERY * 10,
+    ):
+        assert cache.get(uri) == RESPONSE
+
+
+def test_cache_is_bounded():
+    cache = ChartResponseCache(size=2)
+    for i in range(3):
+        cache.put(f'http://127.0.0.1/api/v1/data?chart=disk.sd{i}', RESPONSE)
+
+    assert cache.get('http://127.0.0.1/api/v1/data?chart=disk.sd0') is None
+    assert cache.get('http://127.0.0.1/api/v1/data?chart=disk.sd2') == RESPONSE
+
+
+def test_session_of_previous_loop_is_closed():
+    async def get_session():
+        return await ClientMixin.session()
+
+    first = asyncio.run(get_session())
+    second = asyncio.run(get_session())
+    try:
+        assert first is not second
+        assert first.closed
+    finally:
+        asyncio.run(ClientMixin.close_session())
+
+
+@pytest.mark.asyncio
+async def test_reset():
+    session = await ClientMixin.session()
+    ClientMixin.CHART_CACHE.put('http://127.0.0.1/api/v1/data?chart=cpu.cpu', RESPONSE)
+
+    await ClientMixin.reset()
+
+    assert session.closed
+    assert ClientMixin.SESSION is None
+    assert ClientMixin.CHART_CACHE.get('http://127.0.0.1/api/v1/data?chart=cpu.cpu') is None
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from unittest.mock import Mock
+
+from middlewared.plugins.reporting.realtime_sampler import RealtimeSamplers
+
+
+class EventSource:
+    def __init__(self):
+        self.events = []
+        self.received = threading.Event()
+        self.error = None
+
+    def send_event(self, event_type, **kwargs):
+        self.events.append((event_type, kwargs))
+        self.received.set()
+
+    def sampler_failed(self, error):
+        self.error = error
+        self.received.set()
+
+
+def test__subscribers_share_samples():
+    middleware = Mock()
+    middleware.call_sync = Mock(return_value={})
+    samplers = RealtimeSamplers()
+    sources = [EventSource() for i in range(10)]
+
+    for source in sources:
+        samplers.subscribe(middleware, source, 60)
+
+    for source in sources:
+        assert source.received.wait(5)
+        assert source.events[0] == ('ADDED', {'fields': {'failed_to_connect': True}})
+
+    assert middleware.call_sync.call_count == 1
+    assert list(samplers.samplers) == [60]
+
+
+def test__sampler_exits_with_last_subscriber():
+    middleware = Mock()
+    middleware.call_sync = Mock(return_value={})
+    samplers = RealtimeSamplers()
+    source = EventSource()
+
+    samplers.subscribe(middleware, source, 0.1)
+    assert source.received.wait(5)
+    sampler = samplers.samplers[0.1]
+    samplers.unsubscribe(source, 0.1)
+    sampler.thread.join(5)
+
+    assert not sampler.thread.is_alive()
+    assert samplers.samplers == {}
+
+
+def test__sampler_failure_propagates():
+    middleware = Mock()
+    middleware.call_sync = Mock(side_effect=RuntimeError('netdata is down'))
+    samplers = RealtimeSamplers()
+    sources = [EventSource() for i in range(2)]
+
+    start = time.monotonic()
+    for source in sources:
+        samplers.subscribe(middleware, source, 60)
+
+    for source in sources:
+        assert source.received.wait(5)
+        assert isinstance(source.error, RuntimeError)
+
+    assert time.monotonic() - start < 5
+    assert samplers.samplers == {}
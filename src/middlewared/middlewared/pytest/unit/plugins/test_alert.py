@@ -0,0 +1,243 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from middlewared.alert.base import Alert, AlertCategory, AlertClass, AlertLevel, AlertSource
+from middlewared.alert.source.jbof import JBOFAlertSource
+from middlewared.plugins.alert import AlertPolicy, AlertService, AlertStore
+from middlewared.pytest.unit.middleware import Middleware
+
+
+class SchedulerTestAlertClass(AlertClass):
+    category = AlertCategory.SYSTEM
+    level = AlertLevel.WARNING
+    title = "Scheduler test"
+    text = "%(source)s"
+
+
+class SlowAlertSource(AlertSource):
+    run_timeout = 0.5
+
+    async def check(self):
+        await asyncio.sleep(2)
+        return Alert(SchedulerTestAlertClass, {"source": "slow"})
+
+
+class FastAlertSource(AlertSource):
+    async def check(self):
+        await asyncio.sleep(0.1)
+        return Alert(SchedulerTestAlertClass, {"source": "fast"})
+
+
+class OtherFastAlertSource(FastAlertSource):
+    pass
+
+
+class CountingAlertClass(AlertClass):
+    category = AlertCategory.SYSTEM
+    level = AlertLevel.WARNING
+    title = "Counting test"
+    text = "%(name)s: %(count)d"
+
+
+class CountingAlertSource(AlertSource):
+    counts = {"a": 1, "b": 1}
+
+    async def check(self):
+        return [
+            Alert(CountingAlertClass, {"name": name, "count": count}, key=name)
+            for name, count in self.counts.items()
+        ]
+
+
+def alert_service():
+    middleware = Middleware()
+    middleware["alert.product_type"] = AsyncMock(return_value="SCALE")
+    middleware.create_task = asyncio.ensure_future
+
+    svc = AlertService(middleware)
+    svc.alerts = AlertStore()
+    svc.node = "A"
+    svc.alert_source_last_run = defaultdict(lambda: datetime.min)
+    svc.policies = {"IMMEDIATELY": AlertPolicy()}
+    return svc
+
+
+@pytest.fixture
+def sources():
+    sources = {cls.__name__.removesuffix("AlertSource"): cls(None) for cls in (
+        SlowAlertSource, FastAlertSource, OtherFastAlertSource,
+    )}
+    with patch("middlewared.plugins.alert.ALERT_SOURCES", sources):
+        yield sources
+
+
+@pytest.mark.asyncio
+async def test_alert_sources_run_concurrently(sources):
+    svc = alert_service()
+    start = time.monotonic()
+    await svc._AlertService__run_alerts()
+    elapsed = time.monotonic() - start
+
+    # Fast sources don't wait for each other nor for the slow one to finish
+    assert elapsed < 1.5
+    by_source = {alert.source: alert for alert in svc.alerts}
+    assert by_source["Fast"].klass is SchedulerTestAlertClass
+    assert by_source["OtherFast"].klass is SchedulerTestAlertClass
+    assert by_source["Slow"].klass.name == "AlertSourceRunFailed"
+
+    stats = await svc.sources_stats()
+    assert stats["Slow"]["timeouts"] == 1
+    assert stats["Slow"]["running"] is True
+    assert stats["Fast"]["timeouts"] == 0
+
+
+@pytest.mark.asyncio
+async def test_timed_out_alert_source_is_skipped_until_finished(sources):
+    svc = alert_service()
+    await svc._AlertService__run_alerts()
+    failed_alert = [alert for alert in svc.alerts if alert.source == "Slow"][0]
+
+    svc.alert_source_last_run.clear()
+    await svc._AlertService__run_alerts()
+
+    # The previous alert is kept while the check is still running
+    assert [alert for alert in svc.alerts if alert.source == "Slow"] == [failed_alert]
+    assert (await svc.sources_stats())["Slow"]["skipped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hardware_alert_source_timeout_does_not_block_others():
+    class HangingJBOFAlertSource(JBOFAlertSource):
+        products = AlertSource.products
+        run_timeout = 0.5
+
+        async def check(self):
+            await asyncio.sleep(2)
+
+    assert JBOFAlertSource.run_timeout < AlertSource.run_timeout
+
+    svc = alert_service()
+    sources = {"HangingJBOF": HangingJBOFAlertSource(None), "Fast": FastAlertSource(None)}
+    with patch("middlewared.plugins.alert.ALERT_SOURCES", sources):
+        start = time.monotonic()
+        await svc._AlertService__run_alerts()
+        assert time.monotonic() - start < 1.5
+
+    by_source = {alert.source: alert for alert in svc.alerts}
+    assert by_source["Fast"].klass is SchedulerTestAlertClass
+    assert by_source["HangingJBOF"].klass.name == "AlertSourceRunFailed"
+
+
+def test_alert_store_indexes():
+    alerts = [
+        Alert(CountingAlertClass, {"name": name, "count": 1}, key=name, node="A", _uuid=name, _source="Counting")
+        for name in ("a", "b")
+    ]
+    store = AlertStore(alerts)
+
+    assert store.get("a") is alerts[0]
+    assert store.get_by_identity(Alert(CountingAlertClass, {}, key="b", node="A", _source="Counting")) is alerts[1]
+    assert store.node_klass_alerts("A", CountingAlertClass) == alerts
+    assert store.source_alerts("Counting") == alerts
+
+    assert store.remove(alerts[0])
+    assert not store.remove(alerts[0])
+    assert list(store) == [alerts[1]]
+    assert store.node_klass_alerts("A", CountingAlertClass) == [alerts[1]]
+    assert store.deleted == {"a"}
+
+
+def test_alert_store_replace_source():
+    store = AlertStore([
+        Alert(CountingAlertClass, {"name": name, "count": 1}, key=name, node="A", _uuid=name, _source="Counting")
+        for name in ("a", "b", "c")
+    ])
+    store.flushed()
+
+    removed, added, changed = store.replace_source("Counting", [
+        Alert(CountingAlertClass, {"name": "a", "count": 1}, key="a", node="A", _uuid="a", _source="Counting"),
+        Alert(CountingAlertClass, {"name": "b", "count": 2}, key="b", node="A", _uuid="b", _source="Counting"),
+        Alert(CountingAlertClass, {"name": "d", "count": 1}, key="d", node="A", _uuid="d", _source="Counting"),
+    ])
+
+    assert [alert.uuid for alert in removed] == ["c"]
+    assert [alert.uuid for alert in added] == ["d"]
+    assert [alert.uuid for alert in changed] == ["b"]
+    assert store.dirty == {"b", "d"}
+    assert store.deleted == {"c"}
+
+
+@pytest.mark.asyncio
+async def test_only_changed_alerts_are_announced_and_flushed():
+    svc = alert_service()
+    svc.middleware["failover.licensed"] = AsyncMock(return_value=False)
+    svc.middleware["datastore.delete"] = AsyncMock()
+    svc.middleware["datastore.insert"] = AsyncMock()
+    counting = CountingAlertSource(None)
+    counting.counts = {"a": 1, "b": 1}
+    now = datetime(2024, 1, 1)
+    with (
+        patch("middlewared.plugins.alert.ALERT_SOURCES", {"Counting": counting}),
+        patch("middlewared.plugins.alert.utc_now", lambda: now),
+    ):
+        await svc._AlertService__run_alerts()
+        svc.policies["IMMEDIATELY"].receive_alerts(datetime.utcnow(), svc.alerts)
+        await svc.flush_alerts()
+        assert svc.middleware["datastore.insert"].call_count == 2
+
+        svc.middleware["datastore.delete"].reset_mock()
+        svc.middleware["datastore.insert"].reset_mock()
+        svc.alert_source_last_run.clear()
+        counting.counts = {"a": 1, "b": 2}
+        with patch("middlewared.plugins.alert.AlertSerializer") as serializer:
+            serializer.return_value.should_show_alert = AsyncMock(return_value=True)
+            serializer.return_value.serialize = AsyncMock(side_effect=lambda alert: alert.args)
+            await svc._AlertService__run_alerts()
+
+        svc.middleware.send_event.assert_called_once_with(
+            "alert.list", "CHANGED", id=svc.alerts.get_by_identity(
+                Alert(CountingAlertClass, {}, key="b", node="A", _source="Counting")
+            ).uuid, fields={"name": "b", "count": 2},
+        )
+
+        await svc.flush_alerts()
+        assert svc.middleware["datastore.insert"].call_count == 1
+        assert svc.middleware["datastore.insert"].call_args[0][1]["args"] == {"name": "b", "count": 2}
+        svc.middleware["datastore.delete"].assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_last_occurrence_change_is_announced_and_flushed():
+    svc = alert_service()
+    svc.middleware["failover.licensed"] = AsyncMock(return_value=False)
+    svc.middleware["datastore.delete"] = AsyncMock()
+    svc.middleware["datastore.insert"] = AsyncMock()
+    counting = CountingAlertSource(None)
+    counting.counts = {"a": 1}
+    now = datetime(2024, 1, 1)
+    with (
+        patch("middlewared.plugins.alert.ALERT_SOURCES", {"Counting": counting}),
+        patch("middlewared.plugins.alert.utc_now", lambda: now),
+    ):
+        await svc._AlertService__run_alerts()
+        svc.policies["IMMEDIATELY"].receive_alerts(datetime.utcnow(), svc.alerts)
+        await svc.flush_alerts()
+
+        svc.middleware["datastore.insert"].reset_mock()
+        svc.alert_source_last_run.clear()
+        now = datetime(2024, 1, 1, 0, 1)
+        with patch("middlewared.plugins.alert.AlertSerializer") as serializer:
+            serializer.return_value.should_show_alert = AsyncMock(return_value=True)
+            serializer.return_value.serialize = AsyncMock(side_effect=lambda alert: alert.last_occurrence)
+            await svc._AlertService__run_alerts()
+
+        svc.middleware.send_event.assert_called_once()
+        assert svc.middleware.send_event.call_args[1]["fields"] == now
+
+        await svc.flush_alerts()
+        assert svc.middleware["datastore.insert"].call_args[0][1]["last_occurrence"] == now
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from middlewared.plugins.cache import CacheService
+
+
+@pytest.fixture
+def cache():
+    with patch('middlewared.plugins.cache.CACHE_NAMESPACES', {'small': 2}):
+        yield CacheService(Mock())
+
+
+def test__get_put_pop(cache):
+    cache.put('key', 'value')
+    assert cache.has_key('key')
+    assert cache.get('key') == 'value'
+    assert cache.pop('key') == 'value'
+    assert cache.pop('key') is None
+    with pytest.raises(KeyError):
+        cache.get('key')
+
+
+def test__expired_entries_are_swept(cache):
+    cache.put('short', 1, 0.01)
+    cache.put('long', 2, 3600)
+    cache.put('forever', 3)
+    time.sleep(0.02)
+
+    assert cache.has_key('short') is False
+    cache.put('short', 1, 0.01)
+    time.sleep(0.02)
+    cache.sweep()
+
+    assert cache.stats()['default']['entries'] == 2
+    assert cache.stats()['default']['expirations'] == 2
+    assert cache.get('long') == 2
+    assert cache.get('forever') == 3
+
+
+def test__namespace_lru_eviction(cache):
+    cache.put('a', 1, 0, 'small')
+    cache.put('b', 2, 0, 'small')
+    cache.get('a')
+    cache.put('c', 3, 0, 'small')
+    for i in range(5):
+        cache.put(f'default{i}', i)
+
+    assert cache.has_key('a')
+    assert not cache.has_key('b')
+    assert cache.has_key('c')
+    assert cache.stats()['small'] == {
+        'entries': 2, 'max_entries': 2, 'hits': 1, 'misses': 0, 'evictions': 1, 'expirations': 0,
+    }
+    assert cache.stats()['default']['entries'] == 5
+
+
+def test__put_moves_key_between_namespaces(cache):
+    cache.put('a', 1, 0, 'small')
+    cache.put('a', 2)
+    cache.put('b', 1, 0, 'small')
+    cache.put('c', 1, 0, 'small')
+
+    assert cache.get('a') == 2
+    assert cache.stats()['small']['evictions'] == 0
+
+
+def test__get_or_put_single_flight(cache):
+    calls = []
+    started = threading.Event()
+
+    def method():
+        calls.append(None)
+        started.set()
+        time.sleep(0.1)
+        return 'value'
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_put('key', 0, method)))
+        for i in range(5)
+    ]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ['value'] * 5
+    assert len(calls) == 1
+
+
+def test__get_or_put_error_is_shared(cache):
+    started = threading.Event()
+
+    def method():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError('canary')
+
+    errors = []
+
+    def target():
+        try:
+            cache.get_or_put('key', 0, method)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target) for i in range(3)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 3
+    assert not cache.has_key('key')
+
+
+def test__get_or_put_coroutine(cache):
+    async def method():
+        return 'value'
+
+    cache.middleware.run_coroutine = asyncio.run
+    assert cache.get_or_put('key', 0, method) == 'value'
+    assert cache.get('key') == 'value'
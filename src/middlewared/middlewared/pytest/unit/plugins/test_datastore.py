@@ -1,6 +1,9 @@
+import asyncio
 from contextlib import asynccontextmanager
 import datetime
-from unittest.mock import ANY, patch
+import sqlite3
+import threading
+from unittest.mock import ANY, Mock, patch
 
 import pytest
 import sqlalchemy as sa
@@ -12,8 +15,12 @@ from middlewared.sqlalchemy import EncryptedText, JSON, Time
 
 import middlewared.plugins.datastore  # noqa
 import middlewared.plugins.datastore.connection  # noqa
+from middlewared.plugins.datastore.connection import (
+    DatastoreService as ConnectionService, read_thread_pool, thread_pool,
+)
 import middlewared.plugins.datastore.schema  # noqa
 import middlewared.plugins.datastore.util  # noqa
+from middlewared.plugins.datastore.cache import DatastoreCache, datastore_cache
 
 from middlewared.pytest.unit.helpers import load_compound_service
 from middlewared.pytest.unit.middleware import Middleware
@@ -24,9 +31,9 @@ Model = declarative_base()
 
 
 @asynccontextmanager
-async def datastore_test():
+async def datastore_test(database=":memory:"):
     m = Middleware()
-    with patch("middlewared.plugins.datastore.connection.FREENAS_DATABASE", ":memory:"):
+    with patch("middlewared.plugins.datastore.connection.FREENAS_DATABASE", database):
         with patch("middlewared.plugins.datastore.schema.Model", Model):
             with patch("middlewared.plugins.datastore.util.Model", Model):
                 ds = DatastoreService(m)
@@ -41,6 +48,7 @@ async def datastore_test():
 
                 m["datastore.execute"] = ds.execute
                 m["datastore.execute_write"] = ds.execute_write
+                m["datastore.execute_write_many"] = ds.execute_write_many
                 m["datastore.fetchall"] = ds.fetchall
 
                 m["datastore.query"] = ds.query
@@ -51,6 +59,7 @@ async def datastore_test():
                 m["datastore.insert"] = ds.insert
                 m["datastore.update"] = ds.update
                 m["datastore.delete"] = ds.delete
+                m["datastore.bulk_write"] = ds.bulk_write
 
                 yield ds
 
@@ -591,6 +600,63 @@ async def test__delete_by_filter():
         assert await ds.query("test.custompk", [], {"count": True}) == 1
 
 
+@pytest.mark.asyncio
+async def test__bulk_write():
+    async with datastore_test() as ds:
+        ds.execute("INSERT INTO test_custompk VALUES ('ID1', 'Test 1')")
+        ds.execute("INSERT INTO test_custompk VALUES ('ID2', 'Test 2')")
+
+        assert await ds.bulk_write("test.custompk", [
+            ["update", "ID1", {"name": "Updated"}],
+            ["delete", "ID2"],
+            ["insert", {"identifier": "ID3", "name": "Test 3"}],
+        ], {"prefix": "custom_"}) == ["ID1", True, "ID3"]
+
+        assert await ds.query("test.custompk", [], {"prefix": "custom_", "order_by": ["identifier"]}) == [
+            {"identifier": "ID1", "name": "Updated"},
+            {"identifier": "ID3", "name": "Test 3"},
+        ]
+
+        ds.middleware.call_hook_inline.assert_called_once_with(
+            "datastore.post_execute_write_many",
+            [
+                (
+                    "UPDATE test_custompk SET custom_name=? WHERE test_custompk.custom_identifier = ?",
+                    ["Updated", "ID1"],
+                ),
+                ("DELETE FROM test_custompk WHERE test_custompk.custom_identifier = ?", ["ID2"]),
+                ("INSERT INTO test_custompk (custom_identifier, custom_name) VALUES (?, ?)", ["ID3", "Test 3"]),
+            ],
+            ANY,
+        )
+
+
+@pytest.mark.asyncio
+async def test__bulk_write_integer_pk():
+    async with datastore_test() as ds:
+        ds.execute("INSERT INTO `account_bsdgroups` VALUES (20, 2020)")
+
+        assert await ds.bulk_write("account.bsdgroups", [
+            ["insert", {"gid": 3030}],
+            ["insert", {"gid": 4040}],
+        ], {"prefix": "bsdgrp_"}) == [21, 22]
+
+
+@pytest.mark.asyncio
+async def test__bulk_write_is_atomic():
+    async with datastore_test() as ds:
+        ds.execute("INSERT INTO test_custompk VALUES ('ID1', 'Test 1')")
+
+        with pytest.raises(RuntimeError):
+            await ds.bulk_write("test.custompk", [
+                ["update", "ID1", {"name": "Updated"}],
+                ["update", "ID2", {"name": "Updated"}],
+            ], {"prefix": "custom_"})
+
+        assert await ds.query("test.custompk", [], {"prefix": "custom_"}) == [{"identifier": "ID1", "name": "Test 1"}]
+        ds.middleware.call_hook_inline.assert_not_called()
+
+
 class DiskModel(Model):
     __tablename__ = 'storage_disk'
 
@@ -668,6 +734,72 @@ async def test__mtm_update():
         ]
 
 
+@pytest.mark.asyncio
+async def test__select_skips_unused_relationships():
+    async with datastore_test() as ds:
+        ds.execute("INSERT INTO storage_disk VALUES (10)")
+        ds.execute("INSERT INTO tasks_smarttest VALUES (100)")
+        ds.execute("INSERT INTO tasks_smarttest_smarttest_disks VALUES (NULL, 100, 10)")
+        ds.execute("INSERT INTO account_bsdgroups VALUES (20, 2020)")
+        ds.execute("INSERT INTO account_bsdusers VALUES (5, 55, 20)")
+
+        assert await ds.query("tasks.smarttest", [], {"prefix": "smarttest_", "select": ["id"]}) == [{"id": 100}]
+        assert await ds.query("tasks.smarttest", [], {"prefix": "smarttest_", "select": ["disks"]}) == [
+            {"disks": [{"id": 10}]},
+        ]
+
+        assert await ds.query(
+            "account.bsdusers", [["group__bsdgrp_gid", "=", 2020]], {"prefix": "bsdusr_", "select": ["uid"]},
+        ) == [{"uid": 55}]
+        assert await ds.query("account.bsdusers", [], {"prefix": "bsdusr_", "select": ["group.bsdgrp_gid"]}) == [
+            {"group": {"bsdgrp_gid": 2020}},
+        ]
+
+
+@pytest.mark.asyncio
+async def test__extend():
+    async with datastore_test() as ds:
+        ds.execute("INSERT INTO account_bsdgroups VALUES (10, 1010)")
+        ds.execute("INSERT INTO account_bsdgroups VALUES (20, 2020)")
+
+        def extend(row, context):
+            row["name"] = context[row["gid"]]
+            return row
+
+        ds.middleware["test.extend_context"] = lambda rows, extra: {1010: "wheel", 2020: "users"}
+        ds.middleware["test.extend"] = Mock(side_effect=extend)
+
+        assert await ds.query("account.bsdgroups", [], {
+            "prefix": "bsdgrp_", "extend": "test.extend", "extend_context": "test.extend_context", "select": ["name"],
+        }) == [{"name": "wheel"}, {"name": "users"}]
+        assert ds.middleware["test.extend"].call_count == 2
+
+
+@pytest.mark.asyncio
+async def test__extend_batch():
+    async with datastore_test() as ds:
+        ds.execute("INSERT INTO account_bsdgroups VALUES (10, 1010)")
+        ds.execute("INSERT INTO account_bsdgroups VALUES (20, 2020)")
+
+        def extend(rows, context, fields):
+            for row in rows:
+                row["name"] = context[row["gid"]]
+            return rows
+
+        ds.middleware["test.extend_context"] = lambda rows, extra: {1010: "wheel", 2020: "users"}
+        ds.middleware["test.extend"] = Mock(side_effect=extend)
+
+        assert await ds.query("account.bsdgroups", [], {
+            "prefix": "bsdgrp_", "extend": "test.extend", "extend_context": "test.extend_context",
+            "extend_batch": True, "extend_fields": ["name"], "select": ["name"],
+        }) == [{"name": "wheel"}, {"name": "users"}]
+        ds.middleware["test.extend"].assert_called_once_with(
+            [{"id": 10, "gid": 1010, "name": "wheel"}, {"id": 20, "gid": 2020, "name": "users"}],
+            {1010: "wheel", 2020: "users"},
+            ["name"],
+        )
+
+
 class DefaultModel(Model):
     __tablename__ = "test_default"
 
@@ -792,3 +924,117 @@ async def test__null_order_by(order_by, result):
         await ds.insert("test.null", {"value": 1})
 
         assert [row["id"] for row in await ds.query("test.null", [], {"order_by": order_by})] == result
+
+
+@pytest.mark.asyncio
+async def test__query_cache():
+    async with datastore_test() as ds:
+        ds.execute("INSERT INTO account_bsdgroups VALUES (10, 1010)")
+        ds.execute("INSERT INTO account_bsdusers VALUES (5, 55, 10)")
+
+        with patch.object(datastore_cache, "hits", 0):
+            user = await ds.query("account.bsdusers", [], {"prefix": "bsdusr_", "get": True})
+            user["group"]["bsdgrp_gid"] = 0
+            # Cached results can't be modified by the caller
+            assert await ds.query("account.bsdusers", [], {"prefix": "bsdusr_", "get": True}) == {
+                "id": 5, "uid": 55, "group": {"id": 10, "bsdgrp_gid": 1010},
+            }
+            assert datastore_cache.hits == 1
+
+            # Writing to a joined table invalidates the result
+            await ds.update("account.bsdgroups", 10, {"bsdgrp_gid": 2020})
+            assert (await ds.query("account.bsdusers", [], {"prefix": "bsdusr_", "get": True}))["group"] == {
+                "id": 10, "bsdgrp_gid": 2020,
+            }
+            assert datastore_cache.hits == 1
+
+            # Raw SQL (i.e. replicated from the other controller) invalidates it as well
+            ds.execute("UPDATE account_bsdusers SET bsdusr_uid = 66")
+            assert await ds.query("account.bsdusers", [], {"prefix": "bsdusr_", "count": True}) == 1
+            assert (await ds.query("account.bsdusers", [], {"prefix": "bsdusr_", "get": True}))["uid"] == 66
+            assert datastore_cache.hits == 1
+
+
+@pytest.mark.parametrize("sql,invalidated", [
+    ("INSERT INTO account_bsdusers VALUES (5, 55, 10)", {"account_bsdusers"}),
+    ("insert or replace into `account_bsdgroups` (id) values (1)", {"account_bsdgroups"}),
+    ("DELETE FROM account_bsdgroups WHERE id = 1", {"account_bsdgroups"}),
+    ("SELECT * FROM account_bsdusers", set()),
+    ("PRAGMA table_info('account_bsdusers')", set()),
+    ("DROP TABLE account_bsdusers", {"account_bsdusers", "account_bsdgroups"}),
+])
+def test__cache_invalidate_sql(sql, invalidated):
+    cache = DatastoreCache()
+    for table in ("account_bsdusers", "account_bsdgroups"):
+        cache.put(table, cache.snapshot([table]), [])
+
+    cache.invalidate_sql(sql)
+
+    for table in ("account_bsdusers", "account_bsdgroups"):
+        if table in invalidated:
+            with pytest.raises(KeyError):
+                cache.get(table)
+        else:
+            assert cache.get(table) == []
+
+
+@pytest.mark.asyncio
+async def test__read_connections(tmp_path):
+    async with datastore_test(str(tmp_path / "freenas-v1.db")) as ds:
+        await ds.insert("account.bsdgroups", {"bsdgrp_gid": 1010})
+        assert await ds.query("account.bsdgroups", [], {"count": True}) == 1
+
+        # Queries use a separate read-only connection
+        with pytest.raises(Exception, match="readonly"):
+            await ds.fetchall("INSERT INTO account_bsdgroups VALUES (20, 2020)")
+
+        # Writes are visible to the queries that are started after them
+        await ds.insert("account.bsdgroups", {"bsdgrp_gid": 2020})
+        assert [row["bsdgrp_gid"] for row in await ds.query("account.bsdgroups")] == [1010, 2020]
+
+        # The database file is replaced
+        (tmp_path / "replicated.db").write_bytes((tmp_path / "freenas-v1.db").read_bytes())
+        ds.execute("DELETE FROM account_bsdgroups WHERE bsdgrp_gid = 1010")
+        (tmp_path / "replicated.db").rename(tmp_path / "freenas-v1.db")
+        ds.setup()
+
+        assert [row["bsdgrp_gid"] for row in await ds.query("account.bsdgroups")] == [1010, 2020]
+
+
+@pytest.mark.asyncio
+async def test__in_memory_reads_use_writer_thread():
+    async with datastore_test() as ds:
+        await ds.insert("account.bsdgroups", {"bsdgrp_gid": 1010})
+
+        writer_thread = thread_pool.submit(threading.current_thread).result()
+        threads = []
+        fetchall = ConnectionService._fetchall
+
+        def _fetchall(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return fetchall(*args, **kwargs)
+
+        with patch.object(ConnectionService, "_fetchall", _fetchall):
+            await asyncio.get_running_loop().run_in_executor(
+                read_thread_pool, ds.fetchall, "SELECT bsdgrp_gid FROM account_bsdgroups",
+            )
+
+        assert threads == [writer_thread]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tables", [["account_bsdgroups"], None])
+async def test__invalidate(tmp_path, tables):
+    async with datastore_test(str(tmp_path / "freenas-v1.db")) as ds:
+        await ds.insert("account.bsdgroups", {"bsdgrp_gid": 1010})
+        assert [row["bsdgrp_gid"] for row in await ds.query("account.bsdgroups")] == [1010]
+
+        # A script writes to the database using its own connection
+        conn = sqlite3.connect(tmp_path / "freenas-v1.db")
+        with conn:
+            conn.execute("UPDATE account_bsdgroups SET bsdgrp_gid = 2020")
+        conn.close()
+
+        assert [row["bsdgrp_gid"] for row in await ds.query("account.bsdgroups")] == [1010]
+        ds.invalidate(tables)
+        assert [row["bsdgrp_gid"] for row in await ds.query("account.bsdgroups")] == [2020]
@@ -0,0 +1,101 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from middlewared.plugins.etc import EtcService
+from middlewared.pytest.unit.middleware import Middleware
+
+
+def test__render_stages():
+    entries = [
+        {'type': 'mako', 'path': 'a'},
+        {'type': 'mako', 'path': 'b'},
+        {'type': 'py', 'path': 'c'},
+        {'type': 'py', 'path': 'd'},
+        {'type': 'mako', 'path': 'e'},
+    ]
+    stages = EtcService(Middleware()).render_stages(entries)
+    assert [[entry['path'] for entry in stage] for stage in stages] == [['a', 'b'], ['c'], ['d'], ['e']]
+
+
+@pytest.mark.asyncio
+async def test__gather_ctx_is_shared_between_groups():
+    middleware = Middleware()
+    middleware.create_task = asyncio.ensure_future
+    middleware['system.general.config'] = Mock(return_value={'timezone': 'UTC'})
+    middleware['network.configuration.config'] = Mock(return_value={'hostname': 'truenas'})
+    etc = EtcService(middleware)
+
+    ctx_cache = {}
+    first = await etc.gather_ctx([
+        {'method': 'system.general.config'},
+        {'method': 'network.configuration.config', 'ctx_prefix': 'network'},
+    ], ctx_cache)
+    second = await etc.gather_ctx([{'method': 'system.general.config'}], ctx_cache)
+
+    assert first == {
+        'system.general.config': {'timezone': 'UTC'},
+        'network.network.configuration.config': {'hostname': 'truenas'},
+    }
+    middleware['system.general.config'].assert_called_once()
+
+    # Templates may modify their context without affecting other groups
+    first['system.general.config']['timezone'] = 'Europe/Kyiv'
+    assert second == {'system.general.config': {'timezone': 'UTC'}}
+
+
+@pytest.mark.asyncio
+async def test__generate_renders_group_concurrently():
+    middleware = Middleware()
+    etc = EtcService(middleware)
+    etc.GROUPS = {'test': [
+        {'type': 'mako', 'path': 'a'},
+        {'type': 'mako', 'path': 'b'},
+        {'type': 'mako', 'path': 'c', 'checkpoint': 'post_init'},
+    ]}
+
+    running = 0
+    max_running = 0
+
+    async def render(path, ctx):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return path
+
+    etc._renderers['mako'] = Mock(render=render)
+    etc.write_entry = AsyncMock(side_effect=lambda entry, rendered: {'path': rendered})
+
+    result = await etc.generate('test', 'initial')
+
+    assert [r['path'].rsplit('/', 1)[-1] for r in result] == ['a', 'b']
+    assert max_running == 2
+    assert {stats['entry'] for stats in await etc.render_stats()} == {'mako:a', 'mako:b'}
+
+
+@pytest.mark.asyncio
+async def test__generate_concurrent_renders_get_own_context():
+    middleware = Middleware()
+    middleware.create_task = asyncio.ensure_future
+    middleware['system.general.config'] = Mock(return_value={'timezone': 'UTC'})
+    etc = EtcService(middleware)
+    etc.GROUPS = {'test': {
+        'ctx': [{'method': 'system.general.config'}],
+        'entries': [{'type': 'mako', 'path': 'a'}, {'type': 'mako', 'path': 'b'}],
+    }}
+
+    async def render(path, ctx):
+        ctx['path'] = path
+        await asyncio.sleep(0.01)
+        return ctx
+
+    etc._renderers['mako'] = Mock(render=render)
+    etc.write_entry = AsyncMock(side_effect=lambda entry, rendered: rendered)
+
+    result = await etc.generate('test')
+
+    assert [ctx['path'].rsplit('/', 1)[-1] for ctx in result] == ['a', 'b']
+    assert all(ctx['system.general.config'] == {'timezone': 'UTC'} for ctx in result)
@@ -0,0 +1,15 @@
+import pytest
+
+from middlewared.plugins.account_.privilege_roles import PrivilegeService, ROLE_ENTRIES
+from middlewared.pytest.unit.middleware import Middleware
+
+
+@pytest.mark.asyncio
+async def test_roles_by_name():
+    service = PrivilegeService(Middleware())
+    role = await service.roles([["name", "=", "READONLY_ADMIN"]], {"get": True})
+    assert role["name"] == "READONLY_ADMIN"
+    assert ROLE_ENTRIES.index_for("name") is not None
+
+    role["includes"].clear()
+    assert (await service.roles([["name", "=", "READONLY_ADMIN"]], {"get": True}))["includes"]
@@ -0,0 +1,118 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from middlewared.job import Job
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.service import job
+
+
+def create_job(middleware):
+    def method(job):
+        pass
+
+    j = Job(middleware, 'test.job', None, method, [], job()(method)._job, None, None, None, None)
+    j.set_id(1)
+    j.progress_publisher.interval = 0.05
+    return j
+
+
+@pytest.mark.asyncio
+async def test__progress_events_are_merged():
+    middleware = Middleware()
+    middleware.loop = asyncio.get_running_loop()
+    middleware.dump_args = Mock(return_value=[])
+    j = create_job(middleware)
+
+    for i in range(10):
+        j.set_progress(i, f'Step {i}')
+    j.set_progress(9, 'Step 9')
+
+    def sent_fields():
+        return [call.kwargs['fields'] for call in middleware.send_event.call_args_list]
+
+    assert sent_fields() == [{'id': 1, 'progress': {'percent': 0, 'description': 'Step 0', 'extra': None}}]
+
+    await asyncio.sleep(0.1)
+    assert sent_fields()[1:] == [{'id': 1, 'progress': {'percent': 9, 'description': 'Step 9', 'extra': None}}]
+    # Progress events don't encode the job
+    middleware.dump_args.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test__no_progress_events_after_final_event():
+    middleware = Middleware()
+    middleware.loop = asyncio.get_running_loop()
+    middleware.dump_args = Mock(return_value=[])
+    middleware.dump_result = Mock(return_value=None)
+
+    def method(job):
+        job.set_progress(10)
+        job.set_progress(20)
+
+    j = Job(middleware, 'test.job', None, method, [], job()(method)._job, None, None, None, None)
+    j.set_id(1)
+    j.progress_publisher.interval = 0.05
+
+    await j.run(Mock())
+    await asyncio.sleep(0.1)
+
+    events = [call.kwargs['fields'] for call in middleware.send_event.call_args_list]
+    assert events[-1]['state'] == 'SUCCESS'
+    assert events[-1]['progress']['percent'] == 100
+
+
+@pytest.mark.asyncio
+async def test__encoded_arguments_are_cached():
+    middleware = Middleware()
+    middleware.loop = asyncio.get_running_loop()
+    middleware.dump_args = Mock(return_value=['redacted'])
+    middleware.dump_result = Mock()
+    j = create_job(middleware)
+
+    assert j.__encode__()['arguments'] == ['redacted']
+    assert j.__encode__()['arguments'] == ['redacted']
+    middleware.dump_args.assert_called_once()
+
+
+def progress_event(middleware):
+    create_job(middleware).set_progress(50, 'Half way')
+    [call] = middleware.send_event.call_args_list
+    return call.args[1], {'id': call.kwargs['id'], 'fields': call.kwargs['fields']}
+
+
+@pytest.mark.asyncio
+async def test__task_state_subscriber_ignores_progress_events():
+    from middlewared.utils.service.task_state import TaskStateMixin
+
+    class TaskService(TaskStateMixin):
+        task_state_methods = ['test.job']
+
+    middleware = Middleware()
+    middleware.loop = asyncio.get_running_loop()
+    middleware.dump_args = Mock(return_value=[])
+    middleware.event_subscribe = Mock()
+    middleware['datastore.update'] = Mock()
+    service = TaskService()
+    service.middleware = middleware
+    await service.persist_task_state_on_job_complete()
+    [(name, on_job_change)] = [call.args for call in middleware.event_subscribe.call_args_list]
+
+    await on_job_change(middleware, *progress_event(middleware))
+
+    middleware['datastore.update'].assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test__jobs_copy_subscriber_ignores_progress_events():
+    from middlewared.plugins.failover_.jobs_copy import on_job_change
+
+    middleware = Middleware()
+    middleware.loop = asyncio.get_running_loop()
+    middleware.dump_args = Mock(return_value=[])
+    middleware['failover.jobs_copy.on_job_complete'] = Mock()
+
+    await on_job_change(middleware, *progress_event(middleware))
+
+    middleware['failover.jobs_copy.on_job_complete'].assert_not_called()
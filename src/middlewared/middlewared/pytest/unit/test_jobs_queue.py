@@ -0,0 +1,178 @@
+import asyncio
+import contextlib
+import pytest
+
+from middlewared.job import Job, JobsQueue, State
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.service import job
+from middlewared.service_exception import CallError
+
+
+def create_job(middleware, method, *args, **options):
+    return Job(middleware, 'test.job', None, method, list(args), job(**options)(method)._job, None, None, None, None)
+
+
+@contextlib.asynccontextmanager
+async def jobs_queue():
+    middleware = Middleware()
+    middleware.loop = asyncio.get_running_loop()
+    middleware.create_task = middleware.loop.create_task
+    middleware.dump_args = lambda args, method: args
+    middleware.dump_result = lambda *args, **kwargs: None
+    queue = JobsQueue(middleware)
+    task = middleware.loop.create_task(queue.run())
+    try:
+        yield queue
+    finally:
+        task.cancel()
+
+
+async def wait_for_state(jobs, state):
+    for i in range(100):
+        if all(j.state == state for j in jobs):
+            return
+        await asyncio.sleep(0.01)
+
+    raise AssertionError(f'{[j.state for j in jobs]} != {state}')
+
+
+@pytest.mark.asyncio
+async def test__lock_wakes_next_waiter():
+    async with jobs_queue() as queue:
+        order = []
+        events = [asyncio.Event() for i in range(3)]
+
+        async def method(job, i):
+            order.append(i)
+            await events[i].wait()
+
+        jobs = [queue.add(create_job(queue.middleware, method, i, lock='lock', lock_queue_size=None)) for i in range(3)]
+        unlocked = queue.add(create_job(queue.middleware, method, 2))
+        await wait_for_state([jobs[0], unlocked], State.RUNNING)
+
+        assert [j.state for j in jobs[1:]] == [State.WAITING, State.WAITING]
+        assert queue.get_stats()['locks'] == {'lock': {'waiting': 2, 'locked': True}}
+
+        events[0].set()
+        await wait_for_state([jobs[1]], State.RUNNING)
+        assert jobs[2].state == State.WAITING
+
+        events[1].set()
+        events[2].set()
+        await wait_for_state(jobs, State.SUCCESS)
+        assert order == [0, 2, 1, 2]
+        assert queue.job_locks == {}
+        assert queue.get_stats()['lock_wait_time']['count'] == 2
+
+
+@pytest.mark.asyncio
+async def test__lock_queue_size():
+    async with jobs_queue() as queue:
+        event = asyncio.Event()
+
+        async def method(job):
+            await event.wait()
+
+        running = queue.add(create_job(queue.middleware, method, lock='lock', lock_queue_size=1))
+        await wait_for_state([running], State.RUNNING)
+        waiting = queue.add(create_job(queue.middleware, method, lock='lock', lock_queue_size=1))
+
+        assert queue.add(create_job(queue.middleware, method, lock='lock', lock_queue_size=1)) is waiting
+        with pytest.raises(CallError):
+            queue.add(create_job(queue.middleware, method, lock='lock', lock_queue_size=0))
+
+        event.set()
+        await wait_for_state([running, waiting], State.SUCCESS)
+
+
+@pytest.mark.asyncio
+async def test__max_running_and_priorities():
+    async with jobs_queue() as queue:
+        queue.max_running = 1
+        order = []
+        event = asyncio.Event()
+
+        async def method(job, name):
+            order.append(name)
+            await event.wait()
+
+        first = queue.add(create_job(queue.middleware, method, 'first'))
+        await wait_for_state([first], State.RUNNING)
+        jobs = [
+            queue.add(create_job(queue.middleware, method, 'low', priority='LOW')),
+            queue.add(create_job(queue.middleware, method, 'normal')),
+            queue.add(create_job(queue.middleware, method, 'high', priority='HIGH')),
+        ]
+        await asyncio.sleep(0.05)
+
+        assert order == ['first']
+        assert queue.get_stats()['ready'] == {'HIGH': 1, 'NORMAL': 1, 'LOW': 1}
+
+        event.set()
+        await wait_for_state(jobs, State.SUCCESS)
+        assert order == ['first', 'high', 'normal', 'low']
+        assert queue.running == 0
+
+
+@pytest.mark.asyncio
+async def test__max_running_low_priority():
+    async with jobs_queue() as queue:
+        queue.max_running_low_priority = 1
+        event = asyncio.Event()
+
+        async def method(job):
+            await event.wait()
+
+        low = [queue.add(create_job(queue.middleware, method, priority='LOW')) for i in range(2)]
+        normal = queue.add(create_job(queue.middleware, method))
+        await wait_for_state([low[0], normal], State.RUNNING)
+        await asyncio.sleep(0.05)
+
+        assert low[1].state == State.WAITING
+        assert queue.get_stats()['ready']['LOW'] == 1
+        assert queue.running_low_priority == 1
+
+        event.set()
+        await wait_for_state(low + [normal], State.SUCCESS)
+        assert queue.running == queue.running_low_priority == 0
+
+
+@pytest.mark.asyncio
+async def test__low_priority_unlimited_by_default():
+    async with jobs_queue() as queue:
+        event = asyncio.Event()
+
+        async def method(job):
+            await event.wait()
+
+        low = [queue.add(create_job(queue.middleware, method, priority='LOW')) for i in range(10)]
+        await wait_for_state(low, State.RUNNING)
+        assert queue.running_low_priority == 10
+
+        event.set()
+        await wait_for_state(low, State.SUCCESS)
+
+
+@pytest.mark.asyncio
+async def test__priority_depends_on_arguments():
+    async with jobs_queue() as queue:
+        queue.set_limits(None, 1)
+        event = asyncio.Event()
+
+        async def method(job, really_run):
+            await event.wait()
+
+        def priority(args):
+            return 'LOW' if args[0] else 'NORMAL'
+
+        low = [queue.add(create_job(queue.middleware, method, True, priority=priority)) for i in range(2)]
+        report = queue.add(create_job(queue.middleware, method, False, priority=priority))
+        await wait_for_state([low[0], report], State.RUNNING)
+        assert low[1].state == State.WAITING
+
+        # Raising the limit starts the waiting job
+        queue.set_limits(None, None)
+        await wait_for_state(low, State.RUNNING)
+
+        event.set()
+        await wait_for_state(low + [report], State.SUCCESS)
@@ -0,0 +1,114 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from middlewared.utils.event_fanout import EventFanout
+
+
+class Client:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.ws = Mock(closed=False)
+        self.sent = []
+        self.unblocked = asyncio.Event()
+        self.unblocked.set()
+        self.closed = False
+
+    async def send_frame(self, data):
+        await self.unblocked.wait()
+        self.sent.append(data)
+
+    async def close_slow(self):
+        self.closed = True
+
+
+async def publish(fanout, name, event_type, id_, targets, fields=('id', 'state')):
+    fanout.publish(name, event_type, id_, fields, targets)
+    # Let `call_soon_threadsafe` callback and the drain tasks run
+    for i in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test__slow_client_does_not_delay_others():
+    fanout = EventFanout(asyncio.get_running_loop())
+    slow, fast = Client('slow'), Client('fast')
+    slow.unblocked.clear()
+    fanout.add(slow)
+    fanout.add(fast)
+
+    for i in range(3):
+        await publish(fanout, 'pool.query', 'CHANGED', 1, [(slow, f'event{i}'), (fast, f'event{i}')])
+
+    assert fast.sent == ['event0', 'event1', 'event2']
+    assert slow.sent == []
+    assert fanout.get_stats()['slow']['queued'] == 2
+    assert fanout.get_stats()['slow']['lag'] > 0
+
+    slow.unblocked.set()
+    await publish(fanout, 'pool.query', 'CHANGED', 1, [])
+    assert slow.sent == ['event0', 'event1', 'event2']
+    assert fanout.get_stats()['slow']['queued'] == 0
+
+
+@pytest.mark.asyncio
+async def test__coalesce_pending_changes():
+    fanout = EventFanout(asyncio.get_running_loop())
+    client = Client('client')
+    client.unblocked.clear()
+    fanout.add(client)
+
+    await publish(fanout, 'core.get_jobs', 'ADDED', 1, [(client, 'added1')])
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 1, [(client, 'changed1-a')])
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 2, [(client, 'changed2')])
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 1, [(client, 'changed1-b')])
+    await publish(fanout, 'core.get_jobs', 'REMOVED', 1, [(client, 'removed1')])
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 1, [(client, 'changed1-c')])
+
+    client.unblocked.set()
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 3, [])
+    # `added1` was already being sent when the others were queued
+    assert client.sent == ['added1', 'changed1-b', 'changed2', 'removed1', 'changed1-c']
+    assert fanout.get_stats()['client']['coalesced'] == 1
+
+
+@pytest.mark.asyncio
+async def test__coalesce_only_superseding_changes():
+    fanout = EventFanout(asyncio.get_running_loop())
+    client = Client('client')
+    client.unblocked.clear()
+    fanout.add(client)
+    full = ('id', 'state', 'progress')
+    progress = ('id', 'progress')
+
+    await publish(fanout, 'core.get_jobs', 'ADDED', 1, [(client, 'added')], full)
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 1, [(client, 'full-a')], full)
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 1, [(client, 'progress-a')], progress)
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 1, [(client, 'progress-b')], progress)
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 2, [(client, 'progress-c')], progress)
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 2, [(client, 'full-c')], full)
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 2, [(client, 'progress-d')], progress)
+
+    client.unblocked.set()
+    await publish(fanout, 'core.get_jobs', 'CHANGED', 3, [])
+    assert client.sent == ['added', 'full-a', 'progress-b', 'full-c', 'progress-d']
+
+
+@pytest.mark.asyncio
+async def test__overflow():
+    fanout = EventFanout(asyncio.get_running_loop(), max_frames=2)
+    client = Client('client')
+    client.unblocked.clear()
+    fanout.add(client)
+
+    for i in range(4):
+        await publish(fanout, 'zfs.pool.scan', 'CHANGED', None, [(client, f'scan{i}')])
+
+    assert fanout.get_stats()['client']['dropped'] == 1
+    assert not client.closed
+
+    await publish(fanout, 'pool.query', 'CHANGED', 1, [(client, 'pool')])
+
+    assert client.closed
+    assert fanout.get_stats() == {}
@@ -0,0 +1,216 @@
+import datetime
+import time
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.service_exception import MatchNotFound
+from middlewared.utils import filters, filter_list, IndexedList
+
+
+SNAPSHOT_COUNT = 50000
+USER_COUNT = 10000
+
+DATA = [
+    {'id': 1, 'name': 'foo1', 'number': 1, 'list': [1], 'nested': {'value': 'a'}, 'foo.bar': 1},
+    {'id': 2, 'name': 'foo2', 'number': 2, 'list': [2], 'nested': {'value': 'B'}, 'foo.bar': 2},
+    {'id': 3, 'name': '_foo_', 'number': 3, 'list': [3], 'nested': {'value': 'c'}, 'foo.bar': 3},
+    {'id': 4, 'name': None, 'number': 4, 'list': [{'number': 4}, 'canary'], 'nested': None},
+    {'id': 5, 'number': 5, 'list': [{'number': 5}]},
+]
+
+CASES = [
+    ([], {}),
+    ([['name', '=', 'foo1']], {}),
+    ([['id', '=', 3]], {'get': True}),
+    ([['id', 'in', [1, 3, 5]]], {'order_by': ['-number']}),
+    ([['name', 'C=', 'FOO2']], {}),
+    ([['name', '^', 'foo']], {'select': ['id', ['nested.value', 'value']]}),
+    ([['nested.value', 'C=', 'b']], {}),
+    ([['list.*.number', '=', 4]], {}),
+    ([['foo\\.bar', '>', 1]], {}),
+    ([['OR', [['id', '=', 1], [['number', '>', 2], ['number', '<', 5]]]]], {}),
+    ([['number', '>=', 2]], {'order_by': ['nulls_first:-name'], 'offset': 1, 'limit': 2}),
+    ([['number', '>=', 2]], {'order_by': ['nulls_last:name']}),
+    ([['missing', '=', None]], {}),
+    ([], {'select': ['id', 'nested.value'], 'order_by': ['-id']}),
+    ([['number', '!=', 1]], {'count': True}),
+]
+
+
+def legacy_filter_list(_list, filters_=None, options=None):
+    """
+    Reference implementation built on the uncompiled `filters` primitives.
+    """
+    f = filters()
+    options, select, order_by = f.validate_options(options)
+    do_shortcircuit = options.get('get') and not order_by
+    if filters_:
+        maps = {}
+        f.validate_filters(filters_, value_maps=maps)
+        rv = f.do_filters(_list, filters_, select, do_shortcircuit, value_maps=maps)
+        if do_shortcircuit:
+            return f.do_get(rv)
+    elif select:
+        rv = f.do_select(_list, select)
+    else:
+        rv = list(_list)
+
+    if options.get('count') is True:
+        return f.do_count(rv)
+
+    rv = f.do_order(rv, order_by)
+    if options.get('get') is True:
+        return f.do_get(rv)
+
+    if options.get('offset'):
+        rv = rv[options['offset']:]
+
+    if options.get('limit'):
+        return rv[:options['limit']]
+
+    return rv
+
+
+@pytest.mark.parametrize('filters_,options', CASES)
+def test__compiled_matches_legacy(filters_, options):
+    assert filter_list(DATA, filters_, options) == legacy_filter_list(DATA, filters_, options)
+
+
+@pytest.mark.parametrize('filters_,options', CASES)
+def test__indexed_list_matches_legacy(filters_, options):
+    assert filter_list(IndexedList(DATA), filters_, options) == legacy_filter_list(DATA, filters_, options)
+
+
+def test__compiled_query_cached():
+    f = filters()
+    first = f.compile_query([['id', '=', 1]], [], [])
+    assert f.compile_query([['id', '=', 1]], [], []) is first
+    # values of different types must not share compiled queries
+    assert f.compile_query([['id', '=', True]], [], []) is not first
+    assert f.compile_query([['id', '=', 2]], [], []) is not first
+
+
+def test__compiled_query_cache_size_limit():
+    f = filters()
+    with patch('middlewared.utils.COMPILED_QUERY_CACHE_MAX_BYTES', 64 * 1024):
+        # Too large to be cached at all
+        large = f.compile_query([['id', 'in', list(range(10000))]], [], [])
+        assert f.compile_query([['id', 'in', list(range(10000))]], [], []) is not large
+        assert not f._compiled
+
+        for i in range(100):
+            f.compile_query([['name', 'in', [str(i) * 100] * 10]], [], [])
+
+        assert f._compiled_size == sum(size for query, size in f._compiled.values()) <= 64 * 1024
+        assert 0 < len(f._compiled) < 100
+
+
+def test__compiled_query_operand_modified_by_caller():
+    data = [{'id': 1}, {'id': 2}, {'id': 3}]
+    ids = [1, 2]
+    assert filter_list(data, [['id', 'in', ids]]) == data[:2]
+    ids.append(3)
+    assert filter_list(data, [['id', 'in', [1, 2]]]) == data[:2]
+    assert filter_list(data, [['id', 'in', ids]]) == data
+
+
+def test__compiled_query_invalid_filters_not_cached():
+    f = filters()
+    for i in range(2):
+        with pytest.raises(ValueError, match='Invalid operation'):
+            f.compile_query([['id', 'canary', 1]], [], [])
+
+
+def test__unhashable_filters():
+    data = [{'id': 1, 'tags': {'a'}}, {'id': 2, 'tags': {'b'}}]
+    assert filter_list(data, [['tags', '=', {'a'}]]) == [data[0]]
+
+
+def test__timestamp_filters():
+    data = [
+        {'id': 1, 'timestamp': datetime.datetime(2023, 12, 18, 16, 10, 30, tzinfo=datetime.timezone.utc)},
+        {'id': 2, 'timestamp': datetime.datetime(2023, 12, 18, 16, 15, 55, tzinfo=datetime.timezone.utc)},
+    ]
+    assert filter_list(data, [['timestamp.$date', '>', '2023-12-18T16:15:35+00:00']]) == [data[1]]
+
+
+def test__indexed_list_invalidation():
+    data = IndexedList([{'id': 1}, {'id': 2}])
+    assert filter_list(data, [['id', '=', 3]]) == []
+    data.append({'id': 3})
+    assert filter_list(data, [['id', '=', 3]]) == [{'id': 3}]
+    data[0] = {'id': 3}
+    assert filter_list(data, [['id', '=', 3]]) == [{'id': 3}, {'id': 3}]
+    with pytest.raises(MatchNotFound):
+        filter_list(data, [['id', '=', 1]], {'get': True})
+
+
+def test__indexed_list_unindexable():
+    data = IndexedList([{'id': 1, 'name': ['a']}, {'id': 2, 'name': ['b']}])
+    assert data.index_for('name') is None
+    assert filter_list(data, [['name', '=', ['b']]]) == [data[1]]
+
+
+def snapshots():
+    return [
+        {
+            'id': f'tank/ds{i % 500}@auto-{i}',
+            'name': f'tank/ds{i % 500}@auto-{i}',
+            'pool': 'tank',
+            'dataset': f'tank/ds{i % 500}',
+            'snapshot_name': f'auto-{i}',
+            'properties': {'used': {'parsed': i * 4096}},
+            'holds': {} if i % 10 else {'replication': 1},
+        }
+        for i in range(SNAPSHOT_COUNT)
+    ]
+
+
+def users():
+    return [
+        {
+            'id': i,
+            'uid': 3000 + i,
+            'username': f'user{i}',
+            'full_name': f'User Number {i}',
+            'builtin': i < 50,
+            'local': i % 3 != 0,
+            'group': {'bsdgrp_gid': 3000 + i % 20},
+        }
+        for i in range(USER_COUNT)
+    ]
+
+
+BENCHMARK_CASES = [
+    (snapshots, [['dataset', '=', 'tank/ds42'], ['snapshot_name', '^', 'auto-']], {'order_by': ['-snapshot_name']}),
+    (snapshots, [['pool', '=', 'tank'], ['properties.used.parsed', '>', 1024]], {'count': True}),
+    (snapshots, [['id', '=', 'tank/ds7@auto-4007']], {'get': True}),
+    (users, [['builtin', '=', False], ['username', 'C^', 'USER1']], {'select': ['id', 'username']}),
+    (users, [['OR', [['uid', '<', 3100], ['group.bsdgrp_gid', '=', 3005]]]], {'limit': 50, 'offset': 10}),
+]
+
+
+@pytest.mark.parametrize('source,filters_,options', BENCHMARK_CASES)
+def test__benchmark_compiled_filter_list(source, filters_, options):
+    data = source()
+
+    start = time.perf_counter()
+    expected = legacy_filter_list(data, filters_, options)
+    legacy_time = time.perf_counter() - start
+
+    # First call compiles and caches the query
+    start = time.perf_counter()
+    assert filter_list(data, filters_, options) == expected
+    compiled_time = time.perf_counter() - start
+
+    indexed = IndexedList(data)
+    indexed.index_for('id')
+    start = time.perf_counter()
+    assert filter_list(indexed, filters_, options) == expected
+    indexed_time = time.perf_counter() - start
+
+    print(
+        f'{source.__name__} {filters_!r}: legacy {legacy_time:.4f}s, '
+        f'compiled {compiled_time:.4f}s, indexed {indexed_time:.4f}s'
+    )
@@ -60,8 +60,16 @@ def test__invalid_type(value):
     assert ve.value.args[0] == "Invalid Message Format"
 
 
-def test__invalid_type__list():
-    with pytest.raises(ValueError) as ve:
-        limits.parse_message(True, json.dumps([]))
+def test__batch_parse():
+    data = [{'jsonrpc': '2.0', 'method': 'canary', 'id': i} for i in range(3)]
+    assert limits.parse_message(True, json.dumps(data)) == data
+
+
+def test__limit_batch_extended_method_exception():
+    data = json.dumps([
+        {'jsonrpc': '2.0', 'method': 'filesystem.file_receive', 'params': ['x' * limits.MsgSizeLimit.AUTHENTICATED]},
+    ])
+    with pytest.raises(limits.MsgSizeError) as err:
+        limits.parse_message(True, data)
 
-    assert ve.value.args[0] == "Batch messages are not supported at this time"
+    assert err.value.limit is limits.MsgSizeLimit.AUTHENTICATED
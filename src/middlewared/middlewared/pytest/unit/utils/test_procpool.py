@@ -0,0 +1,114 @@
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.utils.procpool import Histogram, ProcessPool
+
+
+def thread_pool_executor(max_workers, max_tasks_per_child, initializer):
+    return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, initializer=initializer)
+
+
+@pytest.fixture
+def thread_pool():
+    with patch('middlewared.utils.procpool.concurrent.futures.ProcessPoolExecutor', thread_pool_executor):
+        yield
+
+
+def record(order, lock, name):
+    time.sleep(0.05)
+    with lock:
+        order.append(name)
+    return name
+
+
+@pytest.mark.asyncio
+async def test__queues_are_served_round_robin(thread_pool):
+    pool = ProcessPool(None, min_workers=1, max_workers=1)
+    order = []
+    lock = threading.Lock()
+
+    calls = [
+        asyncio.ensure_future(pool.run('zfs.snapshot', record, order, lock, f'snapshot{i}'))
+        for i in range(5)
+    ]
+    await asyncio.sleep(0)
+    calls.append(asyncio.ensure_future(pool.run('zfs.pool', record, order, lock, 'pool')))
+
+    assert await asyncio.gather(*calls) == [f'snapshot{i}' for i in range(5)] + ['pool']
+    # Only one snapshot call was running when the pool call was queued, it is not stuck behind the other four
+    assert order.index('pool') == 1
+
+
+@pytest.mark.asyncio
+async def test__concurrency_is_bounded(thread_pool):
+    pool = ProcessPool(None, min_workers=1, max_workers=3)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running.append(None)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    await asyncio.gather(*[pool.run('zfs.snapshot', work) for i in range(10)])
+
+    assert max(peak) == 3
+    assert pool.running == 0
+
+
+@pytest.mark.asyncio
+async def test__stats(thread_pool):
+    pool = ProcessPool(None, min_workers=1, max_workers=1)
+    await asyncio.gather(*[pool.run('zfs.snapshot', time.sleep, 0.01) for i in range(3)])
+    with pytest.raises(ZeroDivisionError):
+        await pool.run('zfs.pool', functools.partial(divmod, 1, 0))
+
+    stats = pool.get_stats()
+    assert stats['running'] == 0
+    assert stats['queued'] == {}
+    assert stats['queues']['zfs.snapshot']['queue_wait']['count'] == 3
+    assert stats['queues']['zfs.snapshot']['execution']['count'] == 3
+    assert stats['queues']['zfs.snapshot']['execution']['sum'] >= 0.03
+    assert stats['queues']['zfs.pool']['execution']['count'] == 1
+
+
+@pytest.mark.asyncio
+async def test__cancelled_queued_call_is_skipped(thread_pool):
+    pool = ProcessPool(None, min_workers=1, max_workers=1)
+    calls = []
+
+    first = asyncio.ensure_future(pool.run('a', time.sleep, 0.1))
+    second = asyncio.ensure_future(pool.run('a', calls.append, 'second'))
+    await asyncio.sleep(0.01)
+    second.cancel()
+    await first
+    await pool.run('a', calls.append, 'third')
+
+    assert calls == ['third']
+
+
+def test__histogram():
+    histogram = Histogram((1, 10))
+    for value in (0.5, 1, 5, 100):
+        histogram.observe(value)
+
+    assert histogram.to_dict() == {'buckets': {'1': 2, '10': 1, '+Inf': 1}, 'count': 4, 'sum': 106.5}
+
+
+@pytest.mark.asyncio
+async def test__process_pool():
+    pool = ProcessPool(None, min_workers=1, max_workers=2)
+    try:
+        assert await asyncio.gather(*[pool.run('math', pow, 2, i) for i in range(4)]) == [1, 2, 4, 8]
+    finally:
+        pool.executor.shutdown()
@@ -9,6 +9,7 @@ def service_config(klass, config):
         'datastore_prefix': '',
         'datastore_extend': None,
         'datastore_extend_context': None,
+        'datastore_extend_batch': False,
         'datastore_primary_key': 'id',
         'datastore_primary_key_type': 'integer',
         'entry': None,
@@ -54,6 +55,8 @@ class ServiceBase(type):
     Currently the following options are allowed:
       - datastore: name of the datastore mainly used in the service
       - datastore_extend: datastore `extend` option used in common `query` method
+      - datastore_extend_batch: `datastore_extend` method is called once with the list of all rows (and the list of
+                                fields that are needed) instead of being called for every row
       - datastore_prefix: datastore `prefix` option used in helper methods
       - service: system service `name` option used by `SystemServiceService`
       - service_verb: verb to be used on update (default to `reload`)
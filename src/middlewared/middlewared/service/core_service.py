@@ -17,7 +17,9 @@ from subprocess import run
 import middlewared.main
 
 from middlewared.api import api_method
+from middlewared.api.base.handler.stats import validation_stats
 from middlewared.api.base.jsonschema import get_json_schema
+from middlewared.api.base.server.ws_handler.serializer import serializer_stats
 from middlewared.api.current import (
     CorePingArgs,
     CorePingResult,
@@ -732,6 +734,51 @@ class CoreService(Service):
     def threads_stacks(self):
         return get_threads_stacks()
 
+    @private
+    async def procpool_stats(self):
+        """
+        Process pool workers limits, per-service queue depth and queue wait/execution time histograms.
+        """
+        return self.middleware.get_procpool_stats()
+
+    @private
+    async def event_fanout_stats(self):
+        """
+        Per-client event queue depth, lag (age of the oldest queued event, in seconds) and sent/coalesced/dropped
+        event counters.
+        """
+        return self.middleware.get_event_fanout_stats()
+
+    @private
+    async def serializer_stats(self):
+        """
+        Per-method count, size (in characters) and serialization time of the websocket API responses, and the number of
+        responses that were serialized in a thread.
+        """
+        return serializer_stats.get_stats()
+
+    @private
+    async def validation_stats(self):
+        """
+        Per-method number of calls and time spent validating their arguments (`accept`), results (`result`) and
+        preparing the arguments of calls from trusted callers (`trusted`).
+        """
+        return validation_stats.get_stats()
+
+    @private
+    async def jobs_queue_stats(self):
+        """
+        Number of running and ready jobs, per-lock queue depth and job wait time histograms.
+        """
+        return self.middleware.jobs.get_stats()
+
+    @private
+    async def set_jobs_queue_limits(self, max_running, max_running_low_priority):
+        """
+        Limit the number of jobs (and of `LOW` priority jobs) running at the same time. `None` means unlimited.
+        """
+        self.middleware.jobs.set_limits(max_running, max_running_low_priority)
+
     @private
     def get_pid(self):
         return os.getpid()
@@ -10,7 +10,7 @@ from middlewared.api.base.model import BaseModel, query_result, query_result_ite
 from middlewared.api.current import QueryArgs, QueryOptions
 from middlewared.service_exception import CallError, InstanceNotFound
 from middlewared.schema import accepts, Any, Bool, convert_schema, Dict, Int, List, OROperator, Patch, Ref, returns
-from middlewared.utils import filter_list
+from middlewared.utils import filter_list, query_fields
 from middlewared.utils.type import copy_function_metadata
 
 from .base import ServiceBase
@@ -202,6 +202,7 @@ class CRUDService(ServiceChangeMixin, Service, metaclass=CRUDServiceMetabase):
         options = options or {}
         options['extend'] = self._config.datastore_extend
         options['extend_context'] = self._config.datastore_extend_context
+        options['extend_batch'] = self._config.datastore_extend_batch
         options['prefix'] = self._config.datastore_prefix
         return options
 
@@ -225,6 +226,9 @@ class CRUDService(ServiceChangeMixin, Service, metaclass=CRUDServiceMetabase):
             datastore_options = options.copy()
             for option in PAGINATION_OPTS:
                 datastore_options.pop(option, None)
+            if (fields := query_fields(filters, options)) is not None:
+                # Batch `extend` methods can skip computing the fields that are neither selected nor filtered by
+                datastore_options['extend_fields'] = sorted({field[0] for field in fields})
             result = await self.middleware.call(
                 'datastore.query', self._config.datastore, [], datastore_options
             )
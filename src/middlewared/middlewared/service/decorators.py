@@ -91,7 +91,7 @@ def item_method(fn):
 
 def job(
     lock=None, lock_queue_size=5, logs=False, process=False, pipes=None, check_pipes=True, transient=False,
-    description=None, abortable=False, read_roles: list[str] | None = None,
+    description=None, abortable=False, read_roles: list[str] | None = None, priority='NORMAL',
 ):
     """
     Flag method as a long-running job. This must be the first decorator to be applied (meaning that it must be specified
@@ -175,6 +175,12 @@ def job(
 
         By default, non-full-admin users already can see their own jobs and download their logs, so this only should
         be used when the job is launched externally (i.e., using crontab).
+
+    :param priority: `"HIGH"`, `"NORMAL"` or `"LOW"` (or a callable that returns one of these from the job arguments).
+        When the number of concurrently running jobs is limited, jobs that are ready to run are started in the order of
+        their priority. The number of `"LOW"` priority jobs running at the same time can be limited separately: it is
+        meant for long-running bulk transfers that never wait for other `"LOW"` priority jobs. By default, the priority
+        is `"NORMAL"`.
     """
     def check_job(fn):
         fn._job = {
@@ -188,6 +194,7 @@ def job(
             'description': description,
             'abortable': abortable,
             'read_roles': read_roles or [],
+            'priority': priority,
         }
         return fn
     return check_job
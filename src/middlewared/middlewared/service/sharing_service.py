@@ -104,20 +104,21 @@ class SharingTaskService(CRUDService):
         )
 
     @private
-    async def sharing_task_extend(self, data, context):
-        args = [data] + ([context['service_extend']] if self._config.datastore_extend_context else [])
-
+    async def sharing_task_extend(self, rows, context, fields):
         if self._config.datastore_extend:
-            data = await self.middleware.call(self._config.datastore_extend, *args)
+            args = [context['service_extend']] if self._config.datastore_extend_context else []
+            if self._config.datastore_extend_batch:
+                rows = await self.middleware.call(self._config.datastore_extend, rows, *args, fields)
+            else:
+                rows = [await self.middleware.call(self._config.datastore_extend, row, *args) for row in rows]
 
-        if context['retrieve_locked_info']:
-            data[self.locked_field] = await self.middleware.call(
-                f'{self._config.namespace}.sharing_task_determine_locked', data, context['locked_datasets']
-            )
-        else:
-            data[self.locked_field] = None
+        for row in rows:
+            if context['retrieve_locked_info']:
+                row[self.locked_field] = await self.sharing_task_determine_locked(row, context['locked_datasets'])
+            else:
+                row[self.locked_field] = None
 
-        return data
+        return rows
 
     @private
     async def get_options(self, options):
@@ -125,6 +126,7 @@ class SharingTaskService(CRUDService):
             **(await super().get_options(options)),
             'extend': f'{self._config.namespace}.sharing_task_extend',
             'extend_context': f'{self._config.namespace}.sharing_task_extend_context',
+            'extend_batch': True,
         }
 
     @private
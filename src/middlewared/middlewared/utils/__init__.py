@@ -1,15 +1,18 @@
 import asyncio
+import copy
 import errno
 import functools
 import logging
 import operator
 import re
 import subprocess
+import sys
 import time
 import json
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from dataclasses import dataclass
 from datetime import datetime
+from threading import Lock
 
 from middlewared.service_exception import MatchNotFound
 from .lang import undefined
@@ -44,6 +47,10 @@ NULLS_LAST = 'nulls_last:'
 REVERSE_CHAR = '-'
 MAX_FILTERS_DEPTH = 3
 TIMESTAMP_DESIGNATOR = '.$date'
+COMPILED_QUERY_CACHE_SIZE = 512
+# Approximate total size (in bytes) of the filter / option values held by the compiled query cache
+COMPILED_QUERY_CACHE_MAX_BYTES = 8 * 1024 * 1024
+INDEXED_FIELDS = ('id', 'name')
 
 logger = logging.getLogger(__name__)
 
@@ -192,7 +199,155 @@ def casefold(obj):
     raise ValueError(f'{type(obj)}: support for casefolding object type not implemented.')
 
 
+def freeze_query(obj):
+    """
+    Convert `query-filters` / `query-options` components into a hashable key describing
+    both their shape and their values. Value types are kept so that e.g. `1`, `True`
+    and `1.0` (or a list and a tuple) do not share a compiled query.
+
+    Raises TypeError if some value cannot be hashed.
+    """
+    if isinstance(obj, (list, tuple)):
+        return (obj.__class__, tuple(freeze_query(i) for i in obj))
+
+    if isinstance(obj, dict):
+        return (dict, tuple((k, freeze_query(v)) for k, v in obj.items()))
+
+    hash(obj)
+    return (obj.__class__, obj)
+
+
+def frozen_query_size(key):
+    """
+    Approximate size (in bytes) of the values in the `freeze_query` result `key`.
+    """
+    cls, value = key
+    if cls is dict:
+        return sum(sys.getsizeof(k) + frozen_query_size(v) for k, v in value)
+
+    if issubclass(cls, (list, tuple)):
+        return sum(frozen_query_size(i) for i in value)
+
+    return sys.getsizeof(value)
+
+
+class IndexedList(list):
+    """
+    A list of query results that lazily builds equality indexes on `INDEXED_FIELDS`.
+
+    Callers that repeatedly filter the same large data source (e.g. a cached list of
+    snapshots or users) may wrap it in an IndexedList so that `filter_list` resolves
+    filters such as ["id", "=", <value>] or ["name", "=", <value>] with a dictionary
+    lookup instead of evaluating every entry. Indexes are discarded whenever the list
+    itself is modified, entries must not be modified in place once indexed.
+    """
+    __slots__ = ('_indexes',)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._indexes = {}
+
+    def index_for(self, field):
+        """
+        Returns a dictionary mapping `field` values to list positions (in list order)
+        or None if the list can not be indexed on `field`.
+        """
+        try:
+            return self._indexes[field]
+        except KeyError:
+            pass
+
+        index = {}
+        for idx, entry in enumerate(self):
+            if not isinstance(entry, dict):
+                index = None
+                break
+
+            value = entry.get(field, undefined)
+            if value is undefined:
+                continue
+
+            try:
+                index.setdefault(value, []).append(idx)
+            except TypeError:
+                # unhashable value
+                index = None
+                break
+
+        self._indexes[field] = index
+        return index
+
+
+def _drop_indexes(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._indexes.clear()
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+for _method in (
+    'append', 'extend', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse',
+    '__setitem__', '__delitem__', '__iadd__', '__imul__',
+):
+    setattr(IndexedList, _method, _drop_indexes(getattr(list, _method)))
+
+del _method
+
+
+class CompiledQuery:
+    """
+    Reusable result of `filters.compile_query`. Instances are shared between callers
+    through a cache keyed on the frozen filters / select / order_by and must be treated
+    as read-only.
+    """
+    __slots__ = ('predicate', 'lookup', 'select', 'order_by')
+
+    def __init__(self, predicate, lookup, select, order_by):
+        # callable(entry, getter) -> bool or None if there are no filters
+        self.predicate = predicate
+        # (field, value) for a top-level equality filter usable with `IndexedList`
+        self.lookup = lookup
+        # list of (path components, new name) or None if there is no projection
+        self.select = select
+        # list of (nulls placement, key function, reverse)
+        self.order_by = order_by
+
+
+def select_path_parts(obj, parts):
+    """
+    Same as `select_path` but with `path` already split into its components.
+    """
+    keys = []
+    cur = obj
+    for left in parts:
+        if isinstance(cur, dict):
+            cur = cur.get(left, MatchNotFound)
+            keys.append(left)
+        elif isinstance(cur, (list, tuple)):
+            raise ValueError('Selecting by list index is not supported')
+
+    return (keys, cur)
+
+
+def split_path(path):
+    parts = []
+    right = path
+    while right:
+        left, right = partition(right)
+        parts.append(left)
+
+    return parts
+
+
 class filters(object):
+    def __init__(self):
+        # key -> (`CompiledQuery`, size)
+        self._compiled = OrderedDict()
+        self._compiled_size = 0
+        self._compiled_lock = Lock()
+
     def op_in(x, y):
         return operator.contains(y, x)
 
@@ -359,6 +514,15 @@ class filters(object):
         if options is None:
             return ({}, [], [])
 
+        self.validate_get(options)
+        select = options.get('select', [])
+        self.validate_select(select)
+        order_by = options.get('order_by', [])
+        self.validate_order_by(order_by)
+
+        return (options, select, order_by)
+
+    def validate_get(self, options):
         if options.get('get') and options.get('limit', 0) > 1:
             raise ValueError(
                 'Invalid options combination. `get` implies a single result.'
@@ -369,13 +533,6 @@ class filters(object):
                 'Invalid options combination. `get` implies a single result.'
             )
 
-        select = options.get('select', [])
-        self.validate_select(select)
-        order_by = options.get('order_by', [])
-        self.validate_order_by(order_by)
-
-        return (options, select, order_by)
-
     def filterop(self, i, f, source_getter):
         name, op, value = f
         data = source_getter(i, name)
@@ -579,20 +736,293 @@ class filters(object):
         except IndexError:
             raise MatchNotFound() from None
 
-    def filter_list(self, _list, filters=None, options=None):
-        options, select, order_by = self.validate_options(options)
+    def compile_leaf(self, the_filter, value_maps):
+        """
+        Build a predicate for a single [<a>, <opcode>, <b>] condition. Operators,
+        casefolded operands and timestamp operands are resolved once here rather than
+        for every list item. Plain (non-dotted) keys on dictionaries are looked up
+        directly, anything else goes through the generic `filterop` path.
 
-        do_shortcircuit = options.get('get') and not order_by
+        The operand is copied as the compiled predicate is cached and must not change if
+        the caller later modifies the list (or any other container) it passed.
+        """
+        if value_maps:
+            name = self.map_operand(the_filter[0], value_maps)
+            value = self.map_operand(copy.deepcopy(the_filter[2]), value_maps)
+        else:
+            name, value = the_filter[0], copy.deepcopy(the_filter[2])
+
+        op = the_filter[1]
+        generic = (name, op, value)
+        filterop = self.filterop
+
+        def generic_leaf(item, getter):
+            return filterop(item, generic, getter)
+
+        if not isinstance(name, str) or not name or '.' in name:
+            return generic_leaf
+
+        if op[0] == 'C':
+            fn = self.opmap[op[1:]]
+            try:
+                value = casefold(value)
+            except ValueError:
+                # Let `filterop` raise the error if (and when) an entry gets evaluated
+                return generic_leaf
+
+            fold = True
+        else:
+            fn = self.opmap[op]
+            fold = False
+
+        def leaf(item, getter):
+            if getter is not get_impl or not isinstance(item, dict):
+                return filterop(item, generic, getter)
+
+            source = item.get(name, undefined)
+            if source is undefined:
+                return False
+
+            if fold:
+                source = casefold(source)
+
+            if fn(source, value):
+                return True
+
+            return False
 
+        return leaf
+
+    def map_operand(self, operand, value_maps):
+        try:
+            return value_maps.get(operand) or operand
+        except TypeError:
+            # unhashable operand (e.g. list for `in` operations) can not be a timestamp
+            return operand
+
+    def compile_filter(self, the_filter, value_maps):
+        """
+        Compile a single condition of either the form [<a>, <opcode>, <b>] or
+        ["OR", [<condition>, <condition>, ...]] into a `predicate(entry, getter)`.
+        Semantics match `eval_filter`.
+        """
+        if len(the_filter) != 2:
+            return self.compile_leaf(the_filter, value_maps)
+
+        branches = []
+        for branch in the_filter[1]:
+            if isinstance(branch[0], list):
+                branches.append(self.compile_conjunction(branch, value_maps))
+            else:
+                branches.append(self.compile_filter(branch, value_maps))
+
+        def disjunction(item, getter):
+            for branch in branches:
+                if branch(item, getter):
+                    return True
+
+            return False
+
+        return disjunction
+
+    def compile_conjunction(self, filters, value_maps):
+        predicates = [self.compile_filter(f, value_maps) for f in filters]
+        if len(predicates) == 1:
+            return predicates[0]
+
+        def conjunction(item, getter):
+            for predicate in predicates:
+                if not predicate(item, getter):
+                    return False
+
+            return True
+
+        return conjunction
+
+    def compile_lookup(self, filters, value_maps):
+        """
+        Find a top-level equality condition on one of `INDEXED_FIELDS` that can be
+        resolved through `IndexedList.index_for`.
+        """
+        for f in filters:
+            if len(f) != 3 or f[0] not in INDEXED_FIELDS or f[1] != '=':
+                continue
+
+            value = self.map_operand(f[2], value_maps) if value_maps else f[2]
+            try:
+                hash(value)
+            except TypeError:
+                continue
+
+            return (f[0], value)
+
+        return None
+
+    def compile_order(self, order_by):
+        rv = []
+        for o in order_by:
+            if o.startswith(NULLS_FIRST):
+                nulls = NULLS_FIRST
+                o = o[len(NULLS_FIRST):]
+            elif o.startswith(NULLS_LAST):
+                nulls = NULLS_LAST
+                o = o[len(NULLS_LAST):]
+            else:
+                nulls = None
+
+            if o.startswith(REVERSE_CHAR):
+                o = o[1:]
+                reverse = True
+            else:
+                reverse = False
+
+            if o and '.' not in o:
+                def key(x, o=o):
+                    if isinstance(x, dict):
+                        return x.get(o)
+
+                    return get(x, o)
+            else:
+                def key(x, o=o):
+                    return get(x, o)
+
+            rv.append((nulls, o, key, reverse))
+
+        return rv
+
+    def compile_query(self, filters, select, order_by):
+        """
+        Turn `query-filters` and the `select` / `order_by` members of `query-options`
+        into a validated `CompiledQuery`. Results are cached by the frozen shape and
+        values of the arguments, so that repeated queries skip both validation and
+        compilation.
+        """
+        try:
+            key = freeze_query((filters or [], select, order_by))
+        except TypeError:
+            key = None
+
+        if key is not None:
+            with self._compiled_lock:
+                if (cached := self._compiled.get(key)) is not None:
+                    self._compiled.move_to_end(key)
+                    return cached[0]
+
+        predicate = lookup = None
         if filters:
             maps = {}
             self.validate_filters(filters, value_maps=maps)
-            rv = self.do_filters(_list, filters, select, do_shortcircuit, value_maps=maps)
+            predicate = self.compile_conjunction(filters, maps)
+            lookup = self.compile_lookup(filters, maps)
+
+        self.validate_select(select)
+        self.validate_order_by(order_by)
+        query = CompiledQuery(
+            predicate,
+            lookup,
+            [
+                (split_path(s[0]), s[1]) if isinstance(s, list) else (split_path(s), None)
+                for s in select
+            ] or None,
+            self.compile_order(order_by),
+        )
+
+        # Entries hold both the frozen key and the compiled copy of every operand
+        if key is not None and (size := 2 * frozen_query_size(key)) <= COMPILED_QUERY_CACHE_MAX_BYTES:
+            with self._compiled_lock:
+                if (cached := self._compiled.pop(key, None)) is not None:
+                    self._compiled_size -= cached[1]
+
+                self._compiled[key] = (query, size)
+                self._compiled_size += size
+                while (
+                    len(self._compiled) > COMPILED_QUERY_CACHE_SIZE or
+                    self._compiled_size > COMPILED_QUERY_CACHE_MAX_BYTES
+                ):
+                    self._compiled_size -= self._compiled.popitem(last=False)[1][1]
+
+        return query
+
+    def select_entry(self, entry, select):
+        rv = {}
+        for parts, new_name in select:
+            keys, value = select_path_parts(entry, parts)
+            if value is MatchNotFound:
+                continue
+
+            if new_name is not None:
+                rv[new_name] = value
+                continue
+
+            last = keys.pop(-1)
+            obj = rv
+            for k in keys:
+                obj = obj.setdefault(k, {})
+
+            obj[last] = value
+
+        return rv
+
+    def do_compiled_filters(self, _list, query, shortcircuit):
+        source = _list
+        if query.lookup is not None and isinstance(_list, IndexedList):
+            field, value = query.lookup
+            if (index := _list.index_for(field)) is not None:
+                source = [_list[idx] for idx in index.get(value, ())]
+
+        rv = []
+        predicate = query.predicate
+        select = query.select
+
+        # we may be filtering output from a generator and so delay
+        # evaluation of what "getter" to use until we begin iteration
+        getter = None
+
+        for i in source:
+            if getter is None:
+                getter = self.getter_fn(i)
+
+            if not predicate(i, getter):
+                continue
+
+            rv.append(self.select_entry(i, select) if select else i)
+            if shortcircuit:
+                break
+
+        return rv
+
+    def do_compiled_order(self, rv, order_by):
+        for nulls, field, key, reverse in order_by:
+            if nulls is None:
+                rv = sorted(rv, key=key, reverse=reverse)
+                continue
+
+            null_entries, non_nulls = bisect(lambda entry: entry.get(field) is None, rv)
+            non_nulls.sort(key=key, reverse=reverse)
+            if nulls == NULLS_FIRST:
+                rv = null_entries + non_nulls
+            else:
+                rv = non_nulls + null_entries
+
+        return rv
+
+    def filter_list(self, _list, filters=None, options=None):
+        if options is None:
+            options = {}
+
+        self.validate_get(options)
+        order_by = options.get('order_by', [])
+        query = self.compile_query(filters, options.get('select', []), order_by)
+
+        do_shortcircuit = options.get('get') and not order_by
+
+        if query.predicate is not None:
+            rv = self.do_compiled_filters(_list, query, do_shortcircuit)
             if do_shortcircuit:
                 return self.do_get(rv)
 
-        elif select:
-            rv = self.do_select(_list, select)
+        elif query.select is not None:
+            rv = [self.select_entry(i, query.select) for i in _list]
         else:
             # Normalize the output to a list. Caller may have passed
             # a generator into this method.
@@ -601,7 +1031,7 @@ class filters(object):
         if options.get('count') is True:
             return self.do_count(rv)
 
-        rv = self.do_order(rv, order_by)
+        rv = self.do_compiled_order(rv, query.order_by)
 
         if options.get('get') is True:
             return self.do_get(rv)
@@ -638,6 +1068,37 @@ def filter_getattrs(filters):
     return attrs
 
 
+def query_fields(filters, options):
+    """
+    Top-level and second-level field names referenced by `filters`, `options.select` and `options.order_by` as
+    a list of path components lists (i.e. `[['properties', 'used'], ['name']]`). Returns `None` if the query does not
+    select specific fields (so all of them are needed).
+    """
+    if not options.get('select'):
+        return None
+
+    fields = []
+    for entry in options['select']:
+        fields.append(split_path(entry[0] if isinstance(entry, list) else entry)[:2])
+
+    for entry in options.get('order_by') or []:
+        for prefix in ('nulls_first:', 'nulls_last:'):
+            entry = entry.removeprefix(prefix)
+        fields.append(split_path(entry.removeprefix('-'))[:2])
+
+    def walk(filters_):
+        for f in filters_:
+            if len(f) == 2 and f[0] == 'OR':
+                for branch in f[1]:
+                    # Each branch is either a single filter or a list of filters
+                    walk([branch] if branch and isinstance(branch[0], str) else branch)
+            elif len(f) == 3:
+                fields.append(split_path(f[0])[:2])
+
+    walk(filters or [])
+    return fields
+
+
 @functools.cache
 def sw_info():
     """Returns the various software information from the manifest file."""
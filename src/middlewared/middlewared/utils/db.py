@@ -36,6 +36,10 @@ def query_table(table, database_path=None, prefix=None):
 
 
 def update_table(query, params, database_path=None):
+    """
+    Executes a write `query` bypassing middleware. If middleware is running, the caller must call
+    `datastore.invalidate` afterwards so that it does not keep serving cached results.
+    """
     database_path = database_path or FREENAS_DATABASE
     conn = sqlite3.connect(database_path)
     try:
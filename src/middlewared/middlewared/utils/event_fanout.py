@@ -0,0 +1,189 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+import enum
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+__all__ = ["EventFanout", "EventQueuePolicy"]
+
+# Maximum number of serialized events waiting to be written to a single client
+EVENT_QUEUE_MAX_FRAMES = 1024
+
+
+class EventQueuePolicy(enum.Enum):
+    # Every event is delivered. A client that lets its queue overflow is disconnected (it will re-sync its collections
+    # once it reconnects)
+    QUEUE = enum.auto()
+    # The last pending CHANGED event for a collection item is replaced with a newer one if the newer one updates (at
+    # least) the same fields
+    COALESCE = enum.auto()
+    # Events are dropped while the client's queue is full (each event supersedes the previous ones anyway)
+    DROP = enum.auto()
+
+
+EVENT_QUEUE_POLICIES = {
+    "core.get_jobs": EventQueuePolicy.COALESCE,
+    "disk.query": EventQueuePolicy.COALESCE,
+    "zfs.pool.scan": EventQueuePolicy.DROP,
+}
+
+
+@dataclass(slots=True)
+class EventFrame:
+    key: tuple | None
+    fields: frozenset
+    data: str
+    queued_at: float
+
+
+class EventQueue:
+    """
+    Bounded queue of serialized events for a single client, drained by a task that only exists while the queue is not
+    empty.
+    """
+
+    def __init__(self, client, max_frames):
+        self.client = client
+        self.max_frames = max_frames
+        self.frames = deque()
+        # coalesce key -> last pending frame for that key
+        self.pending = {}
+        self.task = None
+        self.closed = False
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, key, fields, data, policy):
+        """
+        Queue serialized event `data` that updates `fields` of collection item `key`. Returns `False` if the queue has
+        overflown and the client should be dropped.
+        """
+        if self.closed:
+            return True
+
+        if (
+            policy == EventQueuePolicy.COALESCE and
+            (frame := self.pending.get(key)) is not None and
+            frame.fields <= fields
+        ):
+            # Keep the original position (and age) so that coalescing does not delay the update indefinitely
+            frame.fields = fields
+            frame.data = data
+            self.coalesced += 1
+            return True
+
+        if policy != EventQueuePolicy.COALESCE:
+            # Changes that follow this event must not be merged into the ones that precede it
+            self.pending.pop(key, None)
+
+        if len(self.frames) >= self.max_frames:
+            if policy == EventQueuePolicy.DROP:
+                self.dropped += 1
+                return True
+
+            return False
+
+        frame = EventFrame(key if policy == EventQueuePolicy.COALESCE else None, fields, data, time.monotonic())
+        self.frames.append(frame)
+        if frame.key is not None:
+            self.pending[frame.key] = frame
+
+        self.max_depth = max(self.max_depth, len(self.frames))
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.drain())
+
+        return True
+
+    async def drain(self):
+        try:
+            while self.frames:
+                frame = self.frames.popleft()
+                if frame.key is not None and self.pending.get(frame.key) is frame:
+                    del self.pending[frame.key]
+
+                await self.client.send_frame(frame.data)
+                self.sent += 1
+        except Exception as e:
+            if not self.client.ws.closed:
+                logger.warning("Failed to send events to %s: %r", self.client.session_id, e)
+            self.close()
+        finally:
+            self.task = None
+
+    def close(self):
+        self.closed = True
+        self.frames.clear()
+        self.pending.clear()
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+
+    def lag(self):
+        """Number of seconds the oldest queued event has been waiting for."""
+        if self.frames:
+            return time.monotonic() - self.frames[0].queued_at
+
+        return 0
+
+    def get_stats(self):
+        return {
+            "queued": len(self.frames),
+            "max_queued": self.max_depth,
+            "lag": self.lag(),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
+
+
+class EventFanout:
+    """
+    Delivers serialized events to websocket clients.
+
+    `Middleware.send_event` serializes an event once per client class and calls `publish` from whatever thread it runs
+    in. The frames are then queued per client on the event loop, so a slow client only delays itself and the sender
+    never waits for socket writes.
+    """
+
+    def __init__(self, loop, max_frames=EVENT_QUEUE_MAX_FRAMES):
+        self.loop = loop
+        self.max_frames = max_frames
+        self.queues = {}
+
+    def add(self, client):
+        self.queues[client.session_id] = EventQueue(client, self.max_frames)
+
+    def remove(self, client):
+        if (queue := self.queues.pop(client.session_id, None)) is not None:
+            queue.close()
+
+    def publish(self, name, event_type, id_, fields, targets):
+        """
+        Queue `targets` (a list of `(client, serialized event)`) from any thread. `fields` are the names of the
+        collection item fields that the event updates.
+        """
+        policy = EVENT_QUEUE_POLICIES.get(name, EventQueuePolicy.QUEUE)
+        if policy == EventQueuePolicy.COALESCE and event_type != "CHANGED":
+            # Additions and removals must be delivered in order with the changes
+            policy = EventQueuePolicy.QUEUE
+
+        self.loop.call_soon_threadsafe(self._enqueue, (name, id_), frozenset(fields), policy, targets)
+
+    def _enqueue(self, key, fields, policy, targets):
+        for client, data in targets:
+            if (queue := self.queues.get(client.session_id)) is None:
+                # Disconnected in the meantime
+                continue
+
+            if not queue.put(key, fields, data, policy):
+                logger.warning(
+                    "Disconnecting %s: %d events are waiting to be sent to it", client.session_id, len(queue.frames),
+                )
+                self.remove(client)
+                self.loop.create_task(client.close_slow())
+
+    def get_stats(self):
+        return {session_id: queue.get_stats() for session_id, queue in self.queues.items()}
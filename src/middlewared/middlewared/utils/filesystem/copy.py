@@ -3,9 +3,13 @@
 
 import enum
 import os
+import threading
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
-from errno import EXDEV
+from errno import ESTALE, EXDEV
 from middlewared.job import Job
 from os import open as posix_open
 from os import (
@@ -47,6 +51,7 @@ from .stat_x import StatxEtype
 from .utils import path_in_ctldir, timespec_convert_int
 
 CLONETREE_ROOT_DEPTH = 0
+COPYTREE_PARALLEL_WORKERS = 8  # suggested number of workers for copies of large trees
 MAX_RW_SZ = 2147483647 & ~4096  # maximum size of read/write in kernel
 
 
@@ -97,6 +102,9 @@ class CopyTreeConfig:
     op: copy tree operation that will be performed (see CopyTreeOp class)
 
     flags: bitmask of metadata to preserve as part of copy
+
+    workers: number of threads copying directories in parallel. The default of 1
+        copies the whole tree on the calling thread.
     """
     job: Job | None = None
     job_msg_prefix: str = ''
@@ -106,6 +114,7 @@ class CopyTreeConfig:
     traverse: bool = False
     op: CopyTreeOp = CopyTreeOp.DEFAULT
     flags: CopyFlags = DEF_CP_FLAGS  # flags specifying which metadata to copy
+    workers: int = 1
 
 
 @dataclass(slots=True)
@@ -402,6 +411,116 @@ def _do_mkdir(
     return new_dir_hdl
 
 
+def _copy_fn(op: CopyTreeOp) -> callable:
+    """ internal method to convert CopyTreeOp to the function used to write file data """
+    match op:
+        case CopyTreeOp.DEFAULT:
+            return clone_or_copy_file
+        case CopyTreeOp.CLONE:
+            return clone_file
+        case CopyTreeOp.SENDFILE:
+            return copy_sendfile
+        case CopyTreeOp.USERSPACE:
+            return copy_file_userspace
+        case _:
+            raise ValueError(f'{op}: unexpected copy operation')
+
+
+def _skip_dir(
+    entry: dirent_struct,
+    d_iter: DirectoryIterator,
+    config: CopyTreeConfig,
+    target_st: stat_result
+) -> bool:
+    """ internal method to determine whether directory `entry` should not be copied """
+    if not config.traverse:
+        if entry.stat.stx_mnt_id != d_iter.stat.stx_mnt_id:
+            # traversal is disabled and entry is in different filesystem
+            # continue here prevents entering the directory / filesystem
+            return True
+
+    if entry.name == '.zfs':
+        # User may have visible snapdir. We definitely don't want to try to copy this
+        # path_in_ctldir checks inode number to verify it's not reserved number for
+        # these special paths (definitive indication it's ctldir as opposed to random
+        # dir user named '.zfs')
+        if path_in_ctldir(entry.path):
+            return True
+
+    if entry.stat.stx_ino == target_st.st_ino:
+        # We use makedev / dev_t in this case to catch potential edge cases where bind mount
+        # in path (since bind mounts of same filesystem will have same st_dev, but different
+        # stx_mnt_id.
+        if makedev(entry.stat.stx_dev_major, entry.stat.stx_dev_minor) == target_st.st_dev:
+            return True
+
+    return False
+
+
+def _copy_dir_timestamps(entry: dirent_struct, dst_fd: int, config: CopyTreeConfig) -> None:
+    """ internal method to set timestamps of a directory once all of its contents were copied """
+    if config.flags.value & CopyFlags.TIMESTAMPS.value:
+        ns_ts = (
+            timespec_convert_int(entry.stat.stx_atime),
+            timespec_convert_int(entry.stat.stx_mtime)
+        )
+        try:
+            utime(dst_fd, ns=ns_ts)
+        except Exception:
+            if config.raise_error:
+                raise
+
+
+def _copy_file(
+    entry: dirent_struct,
+    src_dir_fd: int,
+    dst_fd: int,
+    config: CopyTreeConfig,
+    stats: CopyTreeStats,
+    c_fn: callable
+) -> None:
+    """ internal method to copy regular file `entry` from `src_dir_fd` into `dst_fd` """
+    entry_fd = posix_open(entry.name, O_RDONLY | O_NOFOLLOW, dir_fd=src_dir_fd)
+    try:
+        flags = O_RDWR | O_NOFOLLOW | O_CREAT | O_TRUNC
+        if not config.exist_ok:
+            flags |= O_EXCL
+
+        dst = posix_open(entry.name, flags, dir_fd=dst_fd)
+        try:
+            _do_mkfile(entry, entry_fd, dst, config, stats, c_fn)
+        finally:
+            close(dst)
+    finally:
+        close(entry_fd)
+
+    stats.files += 1
+
+
+def _copy_symlink(
+    entry: dirent_struct,
+    src_dir_fd: int,
+    dst_fd: int,
+    config: CopyTreeConfig,
+    stats: CopyTreeStats
+) -> None:
+    """ internal method to copy symlink `entry` from `src_dir_fd` into `dst_fd` """
+    stats.symlinks += 1
+    dst = readlink(entry.name, dir_fd=src_dir_fd)
+    try:
+        symlink(dst, entry.name, dir_fd=dst_fd)
+    except FileExistsError:
+        if not config.exist_ok:
+            raise
+
+
+def _report_progress(config: CopyTreeConfig, entry: dirent_struct, dst_str: str) -> None:
+    config.job.set_progress(100, (
+        f'{config.job_msg_prefix}'
+        f'Copied {entry.path} -> {os.path.join(dst_str, entry.name)}.'
+    ))
+
+
 def _copytree_impl(
     d_iter: DirectoryIterator,
     dst_str: str,
@@ -434,18 +553,7 @@ def _copytree_impl(
         OSError
         PermissionError
     """
-
-    match config.op:
-        case CopyTreeOp.DEFAULT:
-            c_fn = clone_or_copy_file
-        case CopyTreeOp.CLONE:
-            c_fn = clone_file
-        case CopyTreeOp.SENDFILE:
-            c_fn = copy_sendfile
-        case CopyTreeOp.USERSPACE:
-            c_fn = copy_file_userspace
-        case _:
-            raise ValueError(f'{config.op}: unexpected copy operation')
+    c_fn = _copy_fn(config.op)
 
     for entry in d_iter:
         # We match on `etype` key because our statx wrapper will initially lstat a file
@@ -453,26 +561,8 @@ def _copytree_impl(
         # This means that S_ISLNK on mode will fail to detect whether it's a symlink.
         match entry.etype:
             case StatxEtype.DIRECTORY.name:
-                if not config.traverse:
-                    if entry.stat.stx_mnt_id != d_iter.stat.stx_mnt_id:
-                        # traversal is disabled and entry is in different filesystem
-                        # continue here prevents entering the directory / filesystem
-                        continue
-
-                if entry.name == '.zfs':
-                    # User may have visible snapdir. We definitely don't want to try to copy this
-                    # path_in_ctldir checks inode number to verify it's not reserved number for
-                    # these special paths (definitive indication it's ctldir as opposed to random
-                    # dir user named '.zfs')
-                    if path_in_ctldir(entry.path):
-                        continue
-
-                if entry.stat.stx_ino == target_st.st_ino:
-                    # We use makedev / dev_t in this case to catch potential edge cases where bind mount
-                    # in path (since bind mounts of same filesystem will have same st_dev, but different
-                    # stx_mnt_id.
-                    if makedev(entry.stat.stx_dev_major, entry.stat.stx_dev_minor) == target_st.st_dev:
-                        continue
+                if _skip_dir(entry, d_iter, config, target_st):
+                    continue
 
                 # This can fail with OSError and errno set to ELOOP if target was maliciously
                 # replaced with symlink between our first stat and the open call
@@ -502,17 +592,7 @@ def _copytree_impl(
                             stats
                         )
 
-                    if config.flags.value & CopyFlags.TIMESTAMPS.value:
-                        ns_ts = (
-                            timespec_convert_int(entry.stat.stx_atime),
-                            timespec_convert_int(entry.stat.stx_mtime)
-                        )
-                        try:
-                            utime(new_dst_fd, ns=ns_ts)
-                        except Exception:
-                            if config.raise_error:
-                                raise
-
+                    _copy_dir_timestamps(entry, new_dst_fd, config)
                 finally:
                     close(new_dst_fd)
                     close(entry_fd)
@@ -520,41 +600,236 @@ def _copytree_impl(
                 stats.dirs += 1
 
             case StatxEtype.FILE.name:
-                entry_fd = posix_open(entry.name, O_RDONLY | O_NOFOLLOW, dir_fd=d_iter.dir_fd)
-                try:
-                    flags = O_RDWR | O_NOFOLLOW | O_CREAT | O_TRUNC
-                    if not config.exist_ok:
-                        flags |= O_EXCL
-
-                    dst = posix_open(entry.name, flags, dir_fd=dst_fd)
-                    try:
-                        _do_mkfile(entry, entry_fd, dst, config, stats, c_fn)
-                    finally:
-                        close(dst)
-                finally:
-                    close(entry_fd)
-
-                stats.files += 1
+                _copy_file(entry, d_iter.dir_fd, dst_fd, config, stats, c_fn)
 
             case StatxEtype.SYMLINK.name:
-                stats.symlinks += 1
-                dst = readlink(entry.name, dir_fd=d_iter.dir_fd)
-                try:
-                    symlink(dst, entry.name, dir_fd=dst_fd)
-                except FileExistsError:
-                    if not config.exist_ok:
-                        raise
-
+                _copy_symlink(entry, d_iter.dir_fd, dst_fd, config, stats)
                 continue
 
             case _:
                 continue
 
         if config.job and ((stats.dirs + stats.files) % config.job_msg_inc) == 0:
-            config.job.set_progress(100, (
-                f'{config.job_msg_prefix}'
-                f'Copied {entry.path} -> {os.path.join(dst_str, entry.name)}.'
-            ))
+            _report_progress(config, entry, dst_str)
+
+
+@dataclass(slots=True, eq=False)
+class _CopyTreeDir:
+    """
+    Unit of work of the parallel copytree: a single directory that was already created in the
+    destination. Its entries are copied by one worker, subdirectories become new units.
+    Directory timestamps are set once `pending` (the directory itself plus its subdirectories
+    that are not finished yet) drops to zero.
+    """
+    entry: dirent_struct | None  # None for the root of the copy
+    parent: '_CopyTreeDir | None'
+    dst_str: str
+    src_fd: int | None = None
+    dst_fd: int | None = None
+    # (st_dev, st_ino) of the directory that was created in the destination
+    dst_id: tuple[int, int] | None = None
+    pending: int = 1
+
+
+class _ParallelCopyTree:
+    """
+    Copy a tree using `workers` threads. Every worker has its own deque of directories: it
+    takes the most recently found directory from its own deque (depth-first, keeping the
+    number of open directories low) and when it runs out of work it steals the oldest
+    directory from another worker (which is usually the largest remaining subtree).
+
+    Entries of every directory are created in the same order as by `_copytree_impl`, only
+    different directories are filled concurrently.
+    """
+
+    def __init__(
+        self,
+        config: CopyTreeConfig,
+        request_mask: int,
+        target_st: stat_result,
+        workers: int
+    ):
+        self.config = config
+        self.request_mask = request_mask
+        self.target_st = target_st
+        self.c_fn = _copy_fn(config.op)
+        self.cond = threading.Condition()
+        self.queues = [deque() for i in range(workers)]
+        self.outstanding = 0  # directories that are queued or being copied
+        self.opened = set()  # directories with open file descriptors
+        self.copied = 0  # files + dirs copied by all workers
+        self.error = None
+        self.root_iter = None
+
+    def run(self, d_iter: DirectoryIterator, dst_str: str, dst_fd: int) -> CopyTreeStats:
+        self.root_iter = d_iter
+        root = _CopyTreeDir(None, None, dst_str, d_iter.dir_fd, dst_fd)
+        self.push(0, root)
+
+        with ThreadPoolExecutor(len(self.queues), thread_name_prefix='copytree') as executor:
+            worker_stats = list(executor.map(self.worker, range(len(self.queues))))
+
+        # Directories that were started but not finished because of an error
+        for unit in self.opened:
+            close(unit.src_fd)
+            close(unit.dst_fd)
+
+        if self.error is not None:
+            raise self.error
+
+        stats = CopyTreeStats()
+        for ws in worker_stats:
+            stats.dirs += ws.dirs
+            stats.files += ws.files
+            stats.symlinks += ws.symlinks
+            stats.bytes += ws.bytes
+
+        return stats
+
+    def push(self, idx: int, unit: _CopyTreeDir) -> None:
+        with self.cond:
+            self.queues[idx].append(unit)
+            self.outstanding += 1
+            self.cond.notify()
+
+    def take(self, idx: int) -> _CopyTreeDir | None:
+        with self.cond:
+            while self.error is None:
+                if self.queues[idx]:
+                    return self.queues[idx].pop()
+
+                for offset in range(1, len(self.queues)):
+                    if victim := self.queues[(idx + offset) % len(self.queues)]:
+                        return victim.popleft()
+
+                if self.outstanding == 0:
+                    break
+
+                self.cond.wait()
+
+            return None
+
+    def worker(self, idx: int) -> CopyTreeStats:
+        stats = CopyTreeStats()
+        while (unit := self.take(idx)) is not None:
+            try:
+                self.copy_dir(idx, unit, stats)
+            except BaseException as exc:
+                with self.cond:
+                    if self.error is None:
+                        self.error = exc
+
+                    self.cond.notify_all()
+            finally:
+                with self.cond:
+                    self.outstanding -= 1
+                    if self.outstanding == 0:
+                        self.cond.notify_all()
+
+        return stats
+
+    def count(self, entry: dirent_struct, dst_str: str) -> None:
+        if not self.config.job:
+            return
+
+        with self.cond:
+            self.copied += 1
+            report = self.copied % self.config.job_msg_inc == 0
+
+        if report:
+            _report_progress(self.config, entry, dst_str)
+
+    def copy_dir(self, idx: int, unit: _CopyTreeDir, stats: CopyTreeStats) -> None:
+        config = self.config
+        parent = unit.parent
+        if parent is not None:
+            # Directory was already created by the worker that found it
+            src_fd = posix_open(unit.entry.name, O_DIRECTORY | O_NOFOLLOW, dir_fd=parent.src_fd)
+            try:
+                # The destination might have been replaced (i.e. with a symlink) since we created it
+                dst_fd = posix_open(unit.entry.name, O_DIRECTORY | O_NOFOLLOW, dir_fd=parent.dst_fd)
+            except Exception:
+                close(src_fd)
+                raise
+
+            st = fstat(dst_fd)
+            if (st.st_dev, st.st_ino) != unit.dst_id:
+                close(src_fd)
+                close(dst_fd)
+                raise OSError(ESTALE, f'{unit.dst_str}: directory was replaced during copy')
+
+            with self.cond:
+                unit.src_fd = src_fd
+                unit.dst_fd = dst_fd
+                self.opened.add(unit)
+
+            c_iter = DirectoryIterator(
+                unit.entry.name,
+                request_mask=self.request_mask,
+                dir_fd=parent.src_fd,
+                as_dict=False
+            )
+        else:
+            # Iterator of the root is owned by copytree() which still needs it afterwards
+            c_iter = self.root_iter
+
+        dst_str = unit.dst_str
+        with c_iter if parent is not None else nullcontext():
+            for entry in c_iter:
+                match entry.etype:
+                    case StatxEtype.DIRECTORY.name:
+                        if _skip_dir(entry, c_iter, config, self.target_st):
+                            continue
+
+                        # Create the directory right away (as `_copytree_impl` does) so that the order
+                        # of entries in the destination does not depend on scheduling. It is reopened
+                        # (and checked to be the same directory) once some worker gets to copy its contents.
+                        entry_fd = posix_open(entry.name, O_DIRECTORY | O_NOFOLLOW, dir_fd=c_iter.dir_fd)
+                        try:
+                            new_dst_fd = _do_mkdir(entry, entry_fd, unit.dst_fd, config)
+                        finally:
+                            close(entry_fd)
+
+                        try:
+                            st = fstat(new_dst_fd)
+                        finally:
+                            close(new_dst_fd)
+
+                        with self.cond:
+                            unit.pending += 1
+
+                        self.push(idx, _CopyTreeDir(
+                            entry, unit, path.join(dst_str, entry.name), dst_id=(st.st_dev, st.st_ino),
+                        ))
+
+                    case StatxEtype.FILE.name:
+                        _copy_file(entry, c_iter.dir_fd, unit.dst_fd, config, stats, self.c_fn)
+                        self.count(entry, dst_str)
+
+                    case StatxEtype.SYMLINK.name:
+                        _copy_symlink(entry, c_iter.dir_fd, unit.dst_fd, config, stats)
+
+        self.finish(unit, stats)
+
+    def finish(self, unit: _CopyTreeDir, stats: CopyTreeStats) -> None:
+        """ Mark `unit` as done, and finalize it and its parents that have nothing left to copy """
+        while unit.parent is not None:
+            with self.cond:
+                unit.pending -= 1
+                if unit.pending or self.error is not None:
+                    return
+
+                self.opened.remove(unit)
+
+            try:
+                _copy_dir_timestamps(unit.entry, unit.dst_fd, self.config)
+            finally:
+                close(unit.dst_fd)
+                close(unit.src_fd)
+
+            stats.dirs += 1
+            self.count(unit.entry, unit.parent.dst_str)
+            unit = unit.parent
 
 
 def copytree(
@@ -600,11 +875,15 @@ def copytree(
 
     dst_fd = posix_open(dst, O_DIRECTORY)
 
-    stats = CopyTreeStats()
-
     try:
         with DirectoryIterator(src, request_mask=int(dir_request_mask), as_dict=False) as d_iter:
-            _copytree_impl(d_iter, dst, dst_fd, CLONETREE_ROOT_DEPTH, config, fstat(dst_fd), stats)
+            if config.workers > 1:
+                stats = _ParallelCopyTree(
+                    config, int(dir_request_mask), fstat(dst_fd), config.workers
+                ).run(d_iter, dst, dst_fd)
+            else:
+                stats = CopyTreeStats()
+                _copytree_impl(d_iter, dst, dst_fd, CLONETREE_ROOT_DEPTH, config, fstat(dst_fd), stats)
 
             # Ensure that root level directory also gets metadata copied
             try:
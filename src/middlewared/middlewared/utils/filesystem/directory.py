@@ -13,6 +13,8 @@ import os
 import pathlib
 
 from collections import namedtuple
+from concurrent.futures import wait
+from itertools import islice
 from .acl import acl_is_present
 from .attrs import fget_zfs_file_attributes, zfs_attributes_dump
 from .constants import FileType
@@ -55,6 +57,9 @@ ALL_ATTRS = (
     DirectoryRequestMask.ZFS_ATTRS
 )
 
+# Number of directory entries for which metadata is collected at once by `iter_directory_parallel()`
+DIRECTORY_BATCH_SIZE = 256
+
 dirent_struct = namedtuple('struct_dirent', [
     'name', 'path', 'realpath', 'stat', 'etype', 'acl', 'xattrs', 'zfs_attrs', 'is_in_ctldir'
 ])
@@ -108,6 +113,10 @@ class DirectoryIterator():
     `as_dict` - yield entries in dictionary expected by `filesystem.listdir`.
     When set to False, then struct_direct (see above) is returned. Default is True
 
+    `start` - number of directory entries (in directory order) to skip without
+    collecting any metadata for them. Used together with `position` to resume
+    iterating a large directory.
+
     Context manager protocol is supported and preferred for most cases as it
     will more aggressively free resources.
 
@@ -124,7 +133,7 @@ class DirectoryIterator():
        entries.
     """
 
-    def __init__(self, path, file_type=None, request_mask=None, dir_fd=None, as_dict=True):
+    def __init__(self, path, file_type=None, request_mask=None, dir_fd=None, as_dict=True, start=0):
         self.__dir_fd = None
         self.__path_iter = None
         self.__path = path
@@ -139,6 +148,10 @@ class DirectoryIterator():
 
         self.__return_fn = self.__return_dict if as_dict else self.__return_dirent
 
+        self.__position = 0
+        while self.__position < start and self.next_dirents(min(start - self.__position, DIRECTORY_BATCH_SIZE)):
+            pass
+
     def __repr__(self):
         return (
             f"<DirectoryIterator path='{self.__path}' "
@@ -213,9 +226,34 @@ class DirectoryIterator():
 
     def __next__(self):
         # dirent here is os.DirEntry yielded from os.scandir()
+        while (entry := self.get_entry(self.__next_dirent())) is None:
+            pass
+
+        return entry
+
+    def __next_dirent(self):
         dirent = next(self.__path_iter)
-        while (st := self.__check_dir_entry(dirent)) is None:
-            dirent = next(self.__path_iter)
+        self.__position += 1
+        return dirent
+
+    def next_dirents(self, count):
+        """
+        Read up to `count` raw directory entries without collecting any metadata for them.
+        Entries are passed to `get_entry()`. An empty list is returned once the directory
+        is exhausted.
+        """
+        dirents = list(islice(self.__path_iter, count))
+        self.__position += len(dirents)
+        return dirents
+
+    def get_entry(self, dirent):
+        """
+        Collect metadata for directory entry `dirent`. Returns None if entry should be
+        skipped (it was removed or does not match `file_type`). Only *at syscalls relative
+        to `dir_fd` are used so that this may be called from multiple threads at once.
+        """
+        if (st := self.__check_dir_entry(dirent)) is None:
+            return None
 
         if self.__request_mask == 0:
             # Skip an unnecessary file open/close if we only need stat info
@@ -226,11 +264,11 @@ class DirectoryIterator():
         except FileNotFoundError:
             # `dirent` was most likely deleted while we were generating listing
             # There's not point in logging an error. Just keep moving on.
-            return self.__next__()
+            return None
         except OSError as err:
             if err.errno in (errno.ENXIO, errno.ENODEV):
                 # this can happen for broken symlinks
-                return self.__next__()
+                return None
 
             raise
 
@@ -285,6 +323,13 @@ class DirectoryIterator():
 
         return self.__dir_fd.fileno
 
+    @property
+    def position(self) -> int:
+        """
+        Number of directory entries (including the skipped ones) read so far.
+        """
+        return self.__position
+
     @property
     def request_mask(self) -> DirectoryRequestMask:
         return self.__request_mask
@@ -311,6 +356,35 @@ class DirectoryIterator():
             self.__dir_fd = None
 
 
+def iter_directory_parallel(d_iter, executor, batch_size=DIRECTORY_BATCH_SIZE):
+    """
+    Yield `(position, entry)` tuples for the entries of DirectoryIterator `d_iter`.
+    Metadata for batches of `batch_size` directory entries is collected concurrently
+    using `executor`. `position` may be passed as `start` to a new DirectoryIterator
+    to resume iteration right after `entry`.
+
+    Entries are yielded in directory order and nothing is read past the current batch,
+    so the caller may stop iterating at any time. The whole batch is collected before
+    its first entry is yielded, so no metadata is being read once the caller stops and
+    closes `d_iter` (which would make the remaining lookups relative to the current
+    working directory).
+    """
+    while dirents := d_iter.next_dirents(batch_size):
+        first = d_iter.position - len(dirents) + 1
+        futures = [executor.submit(d_iter.get_entry, dirent) for dirent in dirents]
+        try:
+            entries = [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+            wait(futures)
+
+        for position, entry in enumerate(entries, first):
+            if entry is not None:
+                yield position, entry
+
+
 def directory_is_empty(path):
     """
     This is a more memory-efficient way of determining whether a directory is empty
@@ -37,9 +37,10 @@ class MsgSizeError(Exception):
         return self.errmsg
 
 
-def parse_message(authenticated: bool, msg_data: str) -> dict:
+def parse_message(authenticated: bool, msg_data: str) -> dict | list:
     """
-    Parses the JSON message and ensures that it is a dict, and it does not exceed size limits.
+    Parses the JSON message and ensures that it is a dict (or a list for JSON-RPC batches), and it does not exceed
+    size limits.
 
     WARNING: RFC5424 (syslog) specifies that SDATA of message should never
     exceed 64 KiB. The default syslog-ng configuration will not parse messages
@@ -54,8 +55,11 @@ def parse_message(authenticated: bool, msg_data: str) -> dict:
         authenticated - whether session is authenticated
         msg_data - data sent by client
 
+    Batches are always subject to the authenticated session limit, even if they
+    contain whitelisted methods.
+
     returns:
-        JSON loads output of msg_data (dictionary)
+        JSON loads output of msg_data (dictionary or list of request objects)
 
     raises:
         JSONDecodeError (subclass of ValueError)
@@ -71,12 +75,15 @@ def parse_message(authenticated: bool, msg_data: str) -> dict:
 
     message = ejson.loads(msg_data)
 
+    if isinstance(message, list):
+        if datalen > MsgSizeLimit.AUTHENTICATED:
+            raise MsgSizeError(MsgSizeLimit.AUTHENTICATED, datalen)
+
+        return message
+
     try:
         method = message.get('method')
     except Exception:
-        if isinstance(message, list):
-            raise ValueError('Batch messages are not supported at this time')
-
         raise ValueError('Invalid Message Format')
 
     if method in MSG_SIZE_EXTENDED_METHODS:
@@ -0,0 +1,233 @@
+import asyncio
+from bisect import bisect_left
+from collections import Counter, deque
+import concurrent.futures
+from dataclasses import dataclass, field
+import functools
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+__all__ = ["Histogram", "ProcessPool"]
+
+PROCPOOL_MIN_WORKERS = 5
+PROCPOOL_MAX_WORKERS = 16
+PROCPOOL_MAX_TASKS_PER_CHILD = 20
+# Workers spawned above `PROCPOOL_MIN_WORKERS` during a burst are released after being idle for this many seconds
+PROCPOOL_IDLE_TIMEOUT = 300
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+
+class Histogram:
+    """
+    Latency histogram (in seconds): `buckets[i]` counts observations `<= bounds[i]` that did not fit into a lower
+    bucket, the last bucket counts everything above the last bound.
+    """
+
+    def __init__(self, bounds=HISTOGRAM_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        return {
+            "buckets": {
+                **{str(bound): count for bound, count in zip(self.bounds, self.buckets)},
+                "+Inf": self.buckets[-1],
+            },
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+@dataclass(slots=True)
+class ProcessPoolQueueStats:
+    queue_wait: Histogram = field(default_factory=Histogram)
+    execution: Histogram = field(default_factory=Histogram)
+
+
+@dataclass(slots=True)
+class ProcessPoolCall:
+    queue: str
+    fn: functools.partial
+    future: asyncio.Future
+    queued_at: float
+
+
+def noop():
+    pass
+
+
+class ProcessPool:
+    """
+    Fair, adaptive scheduler in front of a `ProcessPoolExecutor`.
+
+    Calls are queued per `queue` (i.e. per service). A free worker is given to the queue that has the fewest calls
+    running (and, among those, to the one that was served least recently), so a burst of calls for one service can't
+    starve the others. Only as many calls as there are workers are handed to the executor at once, the rest wait here.
+
+    The executor spawns workers on demand: `min_workers` are kept running (and are started ahead of the first call by
+    `prewarm`), more are spawned while the queues are deep, up to `max_workers` (which defaults to the core count).
+    Once the pool has been idle for `idle_timeout` seconds, the extra workers are released.
+    """
+
+    def __init__(self, initializer, min_workers=PROCPOOL_MIN_WORKERS, max_workers=None,
+                 max_tasks_per_child=PROCPOOL_MAX_TASKS_PER_CHILD, idle_timeout=PROCPOOL_IDLE_TIMEOUT):
+        self.initializer = initializer
+        self.min_workers = min_workers
+        self.max_workers = max_workers or max(min_workers, min(os.cpu_count() or 1, PROCPOOL_MAX_WORKERS))
+        self.max_tasks_per_child = max_tasks_per_child
+        self.idle_timeout = idle_timeout
+
+        self.queues = {}
+        self.running = 0
+        self.running_by_queue = Counter()
+        self.dispatched = 0
+        self.last_dispatched = {}
+        # Highest number of concurrently running calls since the executor was created (i.e. how many workers it has)
+        self.peak_running = 0
+        self.idle_handle = None
+        self.stats = {}
+        self.executor = None
+        self.init_executor()
+
+    def init_executor(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            max_tasks_per_child=self.max_tasks_per_child,
+            initializer=self.initializer,
+        )
+        self.peak_running = 0
+
+    def prewarm(self):
+        """
+        Start `min_workers` workers so that plugins are already imported in them when the first call arrives.
+        """
+        for i in range(self.min_workers):
+            self.executor.submit(noop).add_done_callback(self._prewarm_done)
+
+        self.peak_running = max(self.peak_running, self.min_workers)
+
+    def _prewarm_done(self, fut):
+        if (e := fut.exception()) is not None:
+            logger.warning("Failed to start process pool worker: %r", e)
+
+    async def run(self, queue, method, *args, **kwargs):
+        retries = 2
+        for i in range(retries):
+            try:
+                return await self._run(queue, functools.partial(method, *args, **kwargs))
+            except concurrent.futures.process.BrokenProcessPool:
+                if i == retries - 1:
+                    raise
+
+    async def _run(self, queue, fn):
+        call = ProcessPoolCall(queue, fn, asyncio.get_running_loop().create_future(), time.monotonic())
+        if queue not in self.queues:
+            self.queues[queue] = deque()
+        self.queues[queue].append(call)
+
+        self._dispatch()
+        return await call.future
+
+    def _dispatch(self):
+        while self.queues and self.running < self.max_workers:
+            queue = min(self.queues, key=lambda q: (self.running_by_queue[q], self.last_dispatched.get(q, 0)))
+            calls = self.queues[queue]
+            call = calls.popleft()
+            if not calls:
+                del self.queues[queue]
+
+            if call.future.done():
+                # Cancelled while it was waiting in the queue
+                continue
+
+            self._submit(call)
+
+        if self.idle_handle is not None:
+            self.idle_handle.cancel()
+            self.idle_handle = None
+
+        if self.running == 0 and self.peak_running > self.min_workers:
+            self.idle_handle = asyncio.get_running_loop().call_later(self.idle_timeout, self._release_idle_workers)
+
+    def _submit(self, call):
+        started_at = time.monotonic()
+        self._queue_stats(call.queue).queue_wait.observe(started_at - call.queued_at)
+
+        executor = self.executor
+        try:
+            fut = executor.submit(call.fn)
+        except concurrent.futures.process.BrokenProcessPool as e:
+            self._executor_broken(executor)
+            call.future.set_exception(e)
+            return
+
+        self.running += 1
+        self.running_by_queue[call.queue] += 1
+        self.dispatched += 1
+        self.last_dispatched[call.queue] = self.dispatched
+        self.peak_running = max(self.peak_running, self.running)
+        asyncio.wrap_future(fut).add_done_callback(functools.partial(self._done, call, executor, started_at))
+
+    def _done(self, call, executor, started_at, fut):
+        self.running -= 1
+        self.running_by_queue[call.queue] -= 1
+        if not self.running_by_queue[call.queue]:
+            del self.running_by_queue[call.queue]
+        self._queue_stats(call.queue).execution.observe(time.monotonic() - started_at)
+
+        if not call.future.done():
+            if fut.cancelled():
+                call.future.cancel()
+            elif (e := fut.exception()) is not None:
+                if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+                    self._executor_broken(executor)
+                call.future.set_exception(e)
+            else:
+                call.future.set_result(fut.result())
+
+        self._dispatch()
+
+    def _executor_broken(self, executor):
+        # Other calls running in the same executor will fail too, only replace it once
+        if executor is self.executor:
+            logger.warning("Process pool is broken, restarting it")
+            self.init_executor()
+
+    def _release_idle_workers(self):
+        self.idle_handle = None
+        if self.running == 0 and not self.queues:
+            logger.debug("Releasing %d idle process pool workers", self.peak_running - self.min_workers)
+            self.init_executor()
+            self.prewarm()
+
+    def _queue_stats(self, queue):
+        if (stats := self.stats.get(queue)) is None:
+            stats = self.stats[queue] = ProcessPoolQueueStats()
+        return stats
+
+    def get_stats(self):
+        return {
+            "min_workers": self.min_workers,
+            "max_workers": self.max_workers,
+            "running": self.running,
+            "queued": {queue: len(calls) for queue, calls in self.queues.items()},
+            "queues": {
+                queue: {
+                    "queue_wait": stats.queue_wait.to_dict(),
+                    "execution": stats.execution.to_dict(),
+                }
+                for queue, stats in self.stats.items()
+            },
+        }
@@ -1,6 +1,7 @@
 # -*- coding=utf-8 -*-
 import errno
 import logging
+import types
 
 from middlewared.service_exception import CallError
 
@@ -32,3 +33,13 @@ class ServiceCallMixin:
             raise MethodNotFoundError(method_name, service)
 
         return serviceobj, methodobj
+
+    def get_trusted_method(self, methodobj):
+        """
+        Returns the variant of `methodobj` that does not validate its arguments (for calls from trusted callers that
+        already pass well-formed arguments). Jobs and methods without such a variant are returned as is.
+        """
+        if (trusted := getattr(methodobj, '_trusted', None)) is None or hasattr(methodobj, '_job'):
+            return methodobj
+
+        return types.MethodType(trusted, methodobj.__self__)
@@ -34,7 +34,7 @@ class TaskStateMixin:
     @private
     async def persist_task_state_on_job_complete(self):
         async def on_job_change(middleware, event_type, args):
-            if event_type == "CHANGED" and args["fields"]["state"] in ["SUCCESS", "FAILED", "ABORTED"]:
+            if event_type == "CHANGED" and args["fields"].get("state") in ["SUCCESS", "FAILED", "ABORTED"]:
                 job = args["fields"]
 
                 if job["method"] in self.task_state_methods:
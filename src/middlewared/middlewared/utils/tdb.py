@@ -210,14 +210,11 @@ class TDBHandle:
         """
         self.hdl.clear()
 
-    def entries(self, include_keys: bool = True, key_prefix: str = None) -> Iterable[dict]:
+    def keys(self, key_prefix: str = None) -> Iterable[str]:
         """
-        Iterate entries in TDB file:
-
-        include_keys - yield entries as dictionary containing `key` and `value`
-        otherwise only value will be yielded.
+        Iterate keys in TDB file without retrieving their values
 
-        value - may be str or dict
+        key_prefix - only yield keys that start with the specified prefix
 
         Raises:
             RuntimeError
@@ -230,6 +227,21 @@ class TDBHandle:
             if key_prefix and not tdb_key.startswith(key_prefix):
                 continue
 
+            yield tdb_key
+
+    def entries(self, include_keys: bool = True, key_prefix: str = None) -> Iterable[dict]:
+        """
+        Iterate entries in TDB file:
+
+        include_keys - yield entries as dictionary containing `key` and `value`
+        otherwise only value will be yielded.
+
+        value - may be str or dict
+
+        Raises:
+            RuntimeError
+        """
+        for tdb_key in self.keys(key_prefix):
             tdb_val = self.get(tdb_key)
             if include_keys:
                 yield {
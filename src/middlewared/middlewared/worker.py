@@ -45,11 +45,13 @@ class FakeMiddleware(LoadPluginsMixin, ServiceCallMixin):
         serviceobj, methodobj = self.get_method(name)
         return self._call(name, serviceobj, methodobj, args, job=job)
 
-    def call_sync(self, method, *params, timeout=None, **kwargs):
+    def call_sync(self, method, *params, timeout=None, trusted=False, **kwargs):
         """
         Calls a method using middleware client
         """
         serviceobj, methodobj = self.get_method(method)
+        if trusted:
+            methodobj = self.get_trusted_method(methodobj)
 
         if serviceobj._config.process_pool and not hasattr(method, '_job'):
             if asyncio.iscoroutinefunction(methodobj):
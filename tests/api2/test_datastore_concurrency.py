@@ -0,0 +1,44 @@
+import time
+
+import pytest
+
+from middlewared.test.integration.utils import call, mock
+
+SLOW_QUERY = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 2000000) SELECT count(*) FROM c"
+
+
+def run_concurrently(method, count, *args):
+    with mock("test.test1", f"""
+        async def mock(self, *args):
+            import asyncio
+            import time
+
+            start = time.monotonic()
+            await asyncio.gather(*[self.middleware.call({method!r}, *args) for i in range({count})])
+            return time.monotonic() - start
+    """):
+        return call("test.test1", *args)
+
+
+@pytest.mark.flaky(reruns=5, reruns_delay=5)
+def test_queries_run_in_parallel():
+    start = time.monotonic()
+    call("datastore.sql", SLOW_QUERY)
+    single = time.monotonic() - start
+
+    # Queries don't wait for each other
+    assert run_concurrently("datastore.sql", 4, SLOW_QUERY) < single * 3
+
+
+@pytest.mark.parametrize("method", ["user.query", "group.query", "system.general.config", "smb.config"])
+def test_concurrent_queries_are_consistent(method):
+    with mock("test.test1", f"""
+        async def mock(self):
+            import asyncio
+
+            return await asyncio.gather(*[self.middleware.call({method!r}) for i in range(100)])
+    """):
+        results = call("test.test1")
+
+    expected = call(method)
+    assert all(result == expected for result in results)
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+import requests
+
+from middlewared.service_exception import CallError
+from middlewared.test.integration.assets.pool import dataset
+from middlewared.test.integration.utils import call, ssh, url
+
+FILE_COUNT = 250
+
+
+@pytest.fixture(scope="module")
+def directory():
+    with dataset("listdir_page") as ds:
+        path = f"/mnt/{ds}"
+        ssh(f"cd {path} && mkdir subdir && touch $(seq -f 'file%g' 1 {FILE_COUNT})")
+        yield path
+
+
+def test_listdir_page(directory):
+    names = []
+    cursor = None
+    while True:
+        page = call("filesystem.listdir_page", directory, [], {"select": ["name"], "limit": 100, "cursor": cursor})
+        assert len(page["entries"]) <= 100
+        names.extend(entry["name"] for entry in page["entries"])
+        if (cursor := page["cursor"]) is None:
+            break
+
+    assert sorted(names) == sorted(entry["name"] for entry in call("filesystem.listdir", directory))
+
+
+def test_listdir_page_filters(directory):
+    page = call("filesystem.listdir_page", directory, [["type", "=", "DIRECTORY"]], {"limit": 10})
+    assert [entry["name"] for entry in page["entries"]] == ["subdir"]
+    assert page["cursor"] is None
+
+
+def test_listdir_page_foreign_cursor(directory):
+    page = call("filesystem.listdir_page", directory, [], {"limit": 1})
+    with pytest.raises(CallError):
+        call("filesystem.listdir_page", "/mnt", [], {"limit": 1, "cursor": page["cursor"]})
+
+
+def test_listdir_limit(directory):
+    entries = call("filesystem.listdir", directory, [["name", "^", "file"]], {"offset": 10, "limit": 5})
+    assert len(entries) == 5
+
+
+def test_listdir_stream(directory):
+    job_id, path = call(
+        "core.download", "filesystem.listdir_stream", [directory, [], {"select": ["name", "type"]}], "listdir.json"
+    )
+    r = requests.get(f"{url()}{path}")
+    r.raise_for_status()
+    entries = [json.loads(line) for line in r.text.splitlines()]
+    assert len(entries) == FILE_COUNT + 1
+    assert {"name": "subdir", "type": "DIRECTORY"} in entries
@@ -275,12 +275,13 @@ def validate_copy_tree(
     validate_the_things(src, dst, flags)
 
 
-def test__copytree_default(directory_for_test, fd_count):
+@pytest.mark.parametrize('workers', [1, 4])
+def test__copytree_default(directory_for_test, fd_count, workers):
     """ test basic behavior of copytree """
 
     src = os.path.join(directory_for_test, 'SOURCE')
     dst = os.path.join(directory_for_test, 'DEST')
-    config = copy.CopyTreeConfig()
+    config = copy.CopyTreeConfig(workers=workers)
 
     assert config.flags == copy.DEF_CP_FLAGS
 
@@ -325,12 +326,13 @@ def test__copytree_exclude_ctldir(directory_for_test, fd_count, is_ctldir):
 
 
 @pytest.mark.parametrize('existok', [True, False])
-def test__copytree_existok(directory_for_test, fd_count, existok):
+@pytest.mark.parametrize('workers', [1, 4])
+def test__copytree_existok(directory_for_test, fd_count, existok, workers):
     """ test behavior of `exist_ok` configuration option """
 
     src = os.path.join(directory_for_test, 'SOURCE')
     dst = os.path.join(directory_for_test, 'DEST')
-    config = copy.CopyTreeConfig(exist_ok=existok)
+    config = copy.CopyTreeConfig(exist_ok=existok, workers=workers)
     os.mkdir(dst)
 
     if existok:
@@ -350,7 +352,8 @@ def test__copytree_existok(directory_for_test, fd_count, existok):
     copy.CopyFlags.TIMESTAMPS,
     copy.CopyFlags.OWNER
 ])
-def test__copytree_flags(directory_for_test, fd_count, flag):
+@pytest.mark.parametrize('workers', [1, 4])
+def test__copytree_flags(directory_for_test, fd_count, flag, workers):
     """
     copytree allows user to specify what types of metadata to
     preserve on copy similar to robocopy on Windows. This tests
@@ -360,7 +363,7 @@ def test__copytree_flags(directory_for_test, fd_count, flag):
 
     src = os.path.join(directory_for_test, 'SOURCE')
     dst = os.path.join(directory_for_test, 'DEST')
-    copy.copytree(src, dst, copy.CopyTreeConfig(flags=flag))
+    copy.copytree(src, dst, copy.CopyTreeConfig(flags=flag, workers=workers))
 
     validate_copy_tree(src, dst, flag)
 
@@ -399,7 +402,8 @@ def test__copytree_into_itself_simple(directory_for_test, fd_count):
     assert get_fd_count() == fd_count
 
 
-def test__copytree_into_itself_complex(directory_for_test, fd_count):
+@pytest.mark.parametrize('workers', [1, 4])
+def test__copytree_into_itself_complex(directory_for_test, fd_count, workers):
     """ check recursion guard against deeper nested target """
 
     src = os.path.join(directory_for_test, 'SOURCE')
@@ -407,7 +411,7 @@ def test__copytree_into_itself_complex(directory_for_test, fd_count):
 
     os.makedirs(os.path.join(directory_for_test, 'SOURCE', 'FOO', 'BAR'))
 
-    copy.copytree(src, dst, copy.CopyTreeConfig())
+    copy.copytree(src, dst, copy.CopyTreeConfig(workers=workers))
 
     # we expect to copy everything up to the point where we'd start infinite
     # recursion
@@ -419,13 +423,14 @@ def test__copytree_into_itself_complex(directory_for_test, fd_count):
     assert get_fd_count() == fd_count
 
 
-def test__copytree_job_log(directory_for_test, fd_count):
+@pytest.mark.parametrize('workers', [1, 4])
+def test__copytree_job_log(directory_for_test, fd_count, workers):
     """ check that providing job object causes progress to be written properly """
     src = os.path.join(directory_for_test, 'SOURCE')
     dst = os.path.join(directory_for_test, 'DEST')
     job = Job()
 
-    config = copy.CopyTreeConfig(job=job, job_msg_inc=1)
+    config = copy.CopyTreeConfig(job=job, job_msg_inc=1, workers=workers)
     copy.copytree(src, dst, config)
 
     assert job.progress == 100
@@ -451,6 +456,85 @@ def test__copytree_job_log_prefix(directory_for_test, fd_count):
     assert last.startswith('Canary: Successfully copied')
 
 
+def test__copytree_parallel_deep_tree(tmpdir, fd_count):
+    """ parallel copy of a wider and deeper tree produces same result as sequential one """
+    src = os.path.join(tmpdir, 'SOURCE')
+    for i in range(10):
+        for j in range(5):
+            path = os.path.join(src, f'dir{i}', f'subdir{j}', 'leaf')
+            os.makedirs(path)
+            for k in range(3):
+                with open(os.path.join(path, f'file{k}'), 'wb') as f:
+                    f.write(random.randbytes(1024))
+
+            os.utime(path, ns=(JENNY, JENNY + 1))
+
+    sequential = copy.copytree(src, os.path.join(tmpdir, 'DEST1'), copy.CopyTreeConfig())
+    job = Job()
+    parallel = copy.copytree(src, os.path.join(tmpdir, 'DEST2'), copy.CopyTreeConfig(
+        workers=4, job=job, job_msg_inc=10
+    ))
+
+    assert parallel == sequential
+    assert parallel.dirs == 10 * 5 * 2 + 10
+    for dirpath, dirnames, filenames in os.walk(src):
+        for name in [''] + dirnames + filenames:
+            st = os.stat(os.path.join(dirpath, name))
+            st1 = os.stat(os.path.join(tmpdir, 'DEST1', os.path.relpath(dirpath, src), name))
+            st2 = os.stat(os.path.join(tmpdir, 'DEST2', os.path.relpath(dirpath, src), name))
+            assert st.st_mtime_ns == st1.st_mtime_ns == st2.st_mtime_ns
+            assert st.st_size == st1.st_size == st2.st_size
+    # 150 files + 110 directories
+    assert len([msg for msg in job.log if msg.startswith('Copied')]) >= 26
+
+    assert get_fd_count() == fd_count
+
+
+def test__copytree_parallel_error(directory_for_test, fd_count):
+    """ failure in a worker is raised by copytree and no file descriptors are leaked """
+    src = os.path.join(directory_for_test, 'SOURCE')
+    dst = os.path.join(directory_for_test, 'DEST')
+
+    with patch('middlewared.utils.filesystem.copy.clone_or_copy_file', Mock(side_effect=OSError(errno.EIO, 'MOCK'))):
+        with pytest.raises(OSError):
+            copy.copytree(src, dst, copy.CopyTreeConfig(workers=4))
+
+    assert get_fd_count() == fd_count
+
+
+@pytest.mark.parametrize('replacement', ['symlink', 'directory'])
+def test__copytree_parallel_replaced_dst_dir(tmpdir, fd_count, replacement):
+    """ parallel copy does not follow a destination directory that was replaced before it was reopened """
+    src = os.path.join(tmpdir, 'SOURCE')
+    dst = os.path.join(tmpdir, 'DEST')
+    target = os.path.join(tmpdir, 'TARGET')
+    os.makedirs(os.path.join(src, 'dir'))
+    with open(os.path.join(src, 'dir', 'file'), 'w') as f:
+        f.write('canary')
+
+    os.mkdir(target)
+
+    push = copy._ParallelCopyTree.push
+
+    def replace_and_push(self, idx, unit):
+        if unit.parent is not None:
+            os.rmdir(os.path.join(dst, 'dir'))
+            if replacement == 'symlink':
+                os.symlink(target, os.path.join(dst, 'dir'))
+            else:
+                os.rename(target, os.path.join(dst, 'dir'))
+
+        push(self, idx, unit)
+
+    with patch.object(copy._ParallelCopyTree, 'push', replace_and_push):
+        with pytest.raises(OSError) as ve:
+            copy.copytree(src, dst, copy.CopyTreeConfig(workers=2))
+
+    assert ve.value.errno == (errno.ENOTDIR if replacement == 'symlink' else errno.ESTALE)
+    assert os.listdir(os.path.join(dst, 'dir')) == []
+    assert get_fd_count() == fd_count
+
+
 def test__clone_file_somewhat_large(tmpdir):
 
     src_fd = os.open(os.path.join(tmpdir, 'test_large_clone_src'), os.O_CREAT | os.O_RDWR)
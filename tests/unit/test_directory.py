@@ -1,7 +1,12 @@
+import errno
 import gc
 import os
 import pytest
 import stat
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
 from middlewared.utils import filter_list
 from middlewared.utils.filesystem import constants
@@ -183,6 +188,56 @@ def test__directory_acl_request_mask(directory_for_test):
             assert dirent['acl'] is not None
 
 
+def test__iter_directory_parallel(directory_for_test):
+    with directory.DirectoryIterator(directory_for_test, request_mask=0) as d_iter:
+        expected = [entry['name'] for entry in d_iter]
+
+    with ThreadPoolExecutor(4) as executor:
+        with directory.DirectoryIterator(directory_for_test, request_mask=0) as d_iter:
+            entries = list(directory.iter_directory_parallel(d_iter, executor, batch_size=3))
+
+        assert [entry['name'] for position, entry in entries] == expected
+        assert [position for position, entry in entries] == list(range(1, len(expected) + 1))
+
+        # Resume right after the fifth entry
+        with directory.DirectoryIterator(directory_for_test, request_mask=0, start=entries[4][0]) as d_iter:
+            assert d_iter.position == 5
+            assert [entry['name'] for position, entry in directory.iter_directory_parallel(d_iter, executor)] == \
+                expected[5:]
+
+        with directory.DirectoryIterator(
+            directory_for_test, file_type=constants.FileType.DIRECTORY, request_mask=0
+        ) as d_iter:
+            assert len(list(directory.iter_directory_parallel(d_iter, executor, batch_size=2))) == len(TEST_DIRS)
+
+
+def test__iter_directory_parallel_failure(directory_for_test):
+    """ a failure in one of the entries is raised once no other entries of the batch are being read """
+    with ThreadPoolExecutor(4) as executor:
+        with directory.DirectoryIterator(directory_for_test, request_mask=0) as d_iter:
+            get_entry = d_iter.get_entry
+            calls = []
+            running = []
+
+            def failing_get_entry(dirent):
+                calls.append(dirent)
+                if len(calls) == 1:
+                    raise OSError(errno.EIO, 'MOCK')
+
+                running.append(dirent)
+                try:
+                    time.sleep(0.05)
+                    return get_entry(dirent)
+                finally:
+                    running.remove(dirent)
+
+            with patch.object(d_iter, 'get_entry', failing_get_entry):
+                with pytest.raises(OSError):
+                    list(directory.iter_directory_parallel(d_iter, executor, batch_size=8))
+
+                assert running == []
+
+
 def test__directory_request_mask():
     for entry in directory.DirectoryRequestMask:
         assert entry in directory.ALL_ATTRS
@@ -0,0 +1,174 @@
+import os
+import pytest
+
+from middlewared.plugins.account import ds_accounts_page, ds_accounts_page_options
+from middlewared.plugins.directoryservices_ import util_cache
+from middlewared.plugins.idmap_.idmap_constants import BASE_SYNTHETIC_DATASTORE_ID, IDType
+from middlewared.service_exception import MatchNotFound
+from middlewared.utils.tdb import get_tdb_handle, TDBPathType
+
+USER_COUNT = 1000
+DOM_SID = 'S-1-5-21-710078819-430336432-4106732522'
+
+
+def user_entry(uid):
+    return {
+        'id': BASE_SYNTHETIC_DATASTORE_ID + uid,
+        'uid': uid,
+        'username': f'user{uid}',
+        'local': False,
+        'builtin': False,
+        'sid': f'{DOM_SID}-{uid}' if uid % 2 else None,
+        'home': f'/home/user{uid}',
+    }
+
+
+@pytest.fixture(scope='module')
+def user_cache():
+    os.makedirs(TDBPathType.PERSISTENT.value, exist_ok=True)
+    with get_tdb_handle(util_cache.DSCacheFile.USER.value, util_cache.CACHE_OPTIONS) as handle:
+        handle.clear()
+        # Insert in reverse order to make sure results are ordered by id
+        for uid in reversed(range(10000, 10000 + USER_COUNT)):
+            util_cache._tdb_add_entry(handle, uid, f'user{uid}', user_entry(uid))
+
+        handle.store(util_cache.CACHE_VERSION_KEY, util_cache.CACHE_VERSION)
+
+    try:
+        yield
+    finally:
+        with get_tdb_handle(util_cache.DSCacheFile.USER.value, util_cache.CACHE_OPTIONS) as handle:
+            handle.clear()
+
+
+@pytest.fixture
+def decoded(user_cache):
+    """ Count entries decoded from the cache file """
+    counter = {'count': 0}
+    with get_tdb_handle(util_cache.DSCacheFile.USER.value, util_cache.CACHE_OPTIONS) as handle:
+        get = handle.get
+
+        def counting_get(key):
+            counter['count'] += key.startswith(('ID_', 'NAME_'))
+            return get(key)
+
+        handle.get = counting_get
+
+    try:
+        yield counter
+    finally:
+        del handle.get
+
+
+def query(filters, options=None):
+    return util_cache.query_cache_entries(IDType.USER, filters, options or {})
+
+
+def test__query_page(decoded):
+    result = query([], {'offset': 20, 'limit': 10})
+    assert [u['uid'] for u in result] == list(range(10020, 10030))
+    assert decoded['count'] == 30
+
+
+def test__query_residual_filters(decoded):
+    result = query([['home', '$', '5']], {'limit': 3, 'select': ['username']})
+    assert result == [{'username': 'user10005'}, {'username': 'user10015'}, {'username': 'user10025'}]
+    assert decoded['count'] <= util_cache.QUERY_BATCH_SIZE
+
+
+def test__query_count_without_decoding(decoded):
+    assert query([], {'count': True}) == USER_COUNT
+    assert query([['uid', '>=', 10100], ['id', '<', BASE_SYNTHETIC_DATASTORE_ID + 10200]], {'count': True}) == 100
+    assert query([['local', '=', True]], {'count': True}) == 0
+    assert query([['builtin', '=', False]], {'count': True}) == USER_COUNT
+    assert decoded['count'] == 0
+
+
+@pytest.mark.parametrize('filters,uids', [
+    ([['username', '=', 'user10500']], [10500]),
+    ([['username', 'in', ['user10502', 'user10501', 'nobody']]], [10501, 10502]),
+    ([['sid', '=', f'{DOM_SID}-10501']], [10501]),
+    ([['sid', 'in', [f'{DOM_SID}-10503', f'{DOM_SID}-10501']], ['uid', '>', 10501]], [10503]),
+    ([['uid', 'in', [10700, 10600, 99]]], [10600, 10700]),
+    ([['id', '=', BASE_SYNTHETIC_DATASTORE_ID + 10010]], [10010]),
+    ([['local', '!=', False]], []),
+])
+def test__query_indexes(decoded, filters, uids):
+    assert [u['uid'] for u in query(filters)] == uids
+    assert decoded['count'] <= len(uids) + 1
+
+
+def test__query_order_by(user_cache):
+    result = query([['uid', '<', 10005]], {'order_by': ['-username'], 'get': True})
+    assert result['uid'] == 10004
+
+    with pytest.raises(MatchNotFound):
+        query([['uid', '<', 0]], {'get': True})
+
+
+def test__insert_updates_index(user_cache):
+    util_cache.insert_cache_entry(IDType.USER, 5, 'user5', user_entry(5))
+    try:
+        assert query([], {'limit': 1})[0]['uid'] == 5
+        assert query([['username', '=', 'user5']])[0]['uid'] == 5
+        assert query([['sid', '=', f'{DOM_SID}-5']])[0]['uid'] == 5
+    finally:
+        with get_tdb_handle(util_cache.DSCacheFile.USER.value, util_cache.CACHE_OPTIONS) as handle:
+            for key in ('ID_5', 'NAME_user5', f'SID_{DOM_SID}-5'):
+                handle.delete(key)
+
+            util_cache.ID_INDEXES.clear()
+
+
+@pytest.mark.parametrize('options,local_count,ds_options', [
+    ({}, 5, {'offset': 0}),
+    ({'count': True}, 5, {'count': True}),
+    ({'offset': 10, 'limit': 10}, 5, {'offset': 5, 'limit': 10}),
+    ({'offset': 0, 'limit': 10}, 5, {'offset': 0, 'limit': 5}),
+    ({'offset': 0, 'limit': 10}, 10, None),
+    ({'get': True}, 0, {'offset': 0, 'limit': 1}),
+    ({'get': True}, 1, None),
+])
+def test__ds_accounts_page_options(options, local_count, ds_options):
+    assert ds_accounts_page_options(options, local_count) == ds_options
+
+
+def test__ds_accounts_page(user_cache):
+    local = [{'id': i, 'username': f'local{i}'} for i in range(1, 6)]
+    options = {'offset': 3, 'limit': 4, 'select': ['username']}
+    ds = query([], ds_accounts_page_options(options, len(local)))
+    assert ds_accounts_page(local, ds, options) == [
+        {'username': 'local4'}, {'username': 'local5'}, {'username': 'user10000'}, {'username': 'user10001'},
+    ]
+
+
+def test__incremental_fill_reuses_sids(user_cache):
+    resolved = []
+
+    class IdmapClient:
+        def users_and_groups_to_idmap_entries(self, entries):
+            resolved.extend(entry['id'] for entry in entries)
+            return {'mapped': {
+                f'UID:{entry["id"]}': {'id_type': 'USER', 'id': entry['id'], 'sid': f'{DOM_SID}-{entry["id"]}'}
+                for entry in entries
+            }, 'unmapped': {}}
+
+    def nss_entry(uid, name):
+        return {'id': uid, 'name': name, 'sid': None, 'id_type': 'USER', 'domain_info': None, 'id_type_both': False}
+
+    previous = util_cache._get_previous_entries(IDType.USER)
+    assert previous[10001] == {'name': 'user10001', 'sid': f'{DOM_SID}-10001', 'id_type_both': False}
+
+    with util_cache.DSCacheFill() as dc:
+        dc.idmap_cls = IdmapClient
+        entries = dc._resolve_sids([
+            nss_entry(10001, 'user10001'),  # unchanged
+            nss_entry(10002, 'user10002'),  # cached without SID
+            nss_entry(10003, 'renamed'),
+            nss_entry(20000, 'new'),
+        ], None, previous)
+
+    assert resolved == [10002, 10003, 20000]
+    assert {entry['id']: entry['sid'] for entry in entries} == {
+        uid: f'{DOM_SID}-{uid}' for uid in (10001, 10002, 10003, 20000)
+    }